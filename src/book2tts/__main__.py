@@ -89,9 +89,34 @@ def audio_duration(dirname):
     return
 
 
+@click.command()
+@click.argument("filename")
+@click.argument("outdir")
+@click.option("--workers", default=None, type=int, help="Worker processes, 0 to extract in-process")
+def extract_chapters(filename, outdir, workers):
+    from book2tts.epub_chapters import EpubChapterExtractor, extract_book_chapters
+
+    extractor = EpubChapterExtractor(max_workers=workers)
+    try:
+        chapters = extract_book_chapters(filename, extractor=extractor)
+    finally:
+        extractor.shutdown()
+
+    os.makedirs(outdir, exist_ok=True)
+    width = len(str(len(chapters)))
+    for chapter in chapters:
+        name = re.sub(r'[\\/:*?"<>|\s]+', "_", chapter.title).strip("_") or "chapter"
+        path = os.path.join(outdir, f"{chapter.index:0{width}d}-{name[:60]}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(chapter.text)
+        click.echo(f"{path}: {chapter.start}-{chapter.end}")
+    return
+
+
 cli.add_command(book_tts)
 cli.add_command(merge_audio)
 cli.add_command(audio_duration)
+cli.add_command(extract_chapters)
 
 if __name__ == "__main__":
     cli()
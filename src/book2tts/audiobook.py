@@ -1,8 +1,22 @@
-from dataclasses import dataclass
-from enum import Enum
-from typing import List, Optional
+"""整本书有声书的合成与封装。
+
+按目录把全书拆成章节，各章独立合成音频和字幕（可以并行、失败后只重做未完成的章节），
+最后把章节音频拼接为一个带章节标记的 M4B / MP3 文件，并把各章字幕按章节起点平移后
+合并为一份 SRT。章节标记通过 FFMETADATA 文件交给 ffmpeg 写入：M4B 为 MP4 chapter
+atoms，MP3 为 ID3v2 CHAP 帧。
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass, field
 from datetime import datetime
+from enum import Enum
 from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
 
 
 class AudioStatus(Enum):
@@ -16,6 +30,20 @@ class AudioFormat(Enum):
     MP3 = "mp3"
     WAV = "wav"
     OGG = "ogg"
+    M4B = "m4b"
+
+
+# 整本有声书的输出格式 -> ffmpeg 编码参数；语音内容 64kbps 单声道足够
+AUDIOBOOK_OUTPUT_ARGS = {
+    AudioFormat.M4B: ["-c:a", "aac", "-b:a", "64k", "-ac", "1", "-f", "ipod"],
+    AudioFormat.MP3: ["-c:a", "libmp3lame", "-b:a", "64k", "-ac", "1", "-id3v2_version", "3"],
+}
+
+_SRT_TIME_RE = re.compile(r"(\d+):(\d{2}):(\d{2})[,.](\d{3})")
+
+
+class AudioAssemblyError(RuntimeError):
+    """ffmpeg 拼接或封装有声书失败。"""
 
 
 @dataclass
@@ -26,9 +54,15 @@ class AudioConfig:
     speed: float = 1.0  # 语速
     volume: float = 1.0  # 音量
     pitch: float = 1.0  # 音调
-    format: AudioFormat = AudioFormat.MP3
+    format: AudioFormat = AudioFormat.M4B
     sample_rate: int = 44100
-    # 其他 TTS 相关配置...
+    # 同时合成的章节数
+    max_concurrency: int = 4
+
+    @property
+    def rate(self) -> str:
+        """Edge TTS 的语速参数，如 +10%。"""
+        return f"{round((self.speed - 1) * 100):+d}%"
 
 
 @dataclass
@@ -41,10 +75,11 @@ class AudioSegment:
     duration: Optional[float]  # 音频时长（秒）
     start_time: Optional[float]  # 在章节音频中的开始时间
     end_time: Optional[float]  # 在章节音频中的结束时间
+    subtitle_srt: str = ""
     status: AudioStatus = AudioStatus.PENDING
     error_message: Optional[str] = None
-    created_at: datetime = datetime.now()
-    updated_at: datetime = datetime.now()
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
 
 
 @dataclass
@@ -56,10 +91,11 @@ class ChapterAudio:
     segments: List[AudioSegment]  # 音频片段列表
     combined_audio_path: Optional[Path]  # 合并后的章节音频路径
     total_duration: Optional[float]  # 总时长
+    subtitle_srt: str = ""
     status: AudioStatus = AudioStatus.PENDING
     error_message: Optional[str] = None
-    created_at: datetime = datetime.now()
-    updated_at: datetime = datetime.now()
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
 
 
 @dataclass
@@ -71,8 +107,10 @@ class AudioBook:
     chapters: List[ChapterAudio]  # 章节音频列表
     total_duration: Optional[float]  # 总时长
     status: AudioStatus = AudioStatus.PENDING
-    created_at: datetime = datetime.now()
-    updated_at: datetime = datetime.now()
+    output_path: Optional[Path] = None
+    error_message: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
 
     @property
     def progress(self) -> float:
@@ -87,65 +125,228 @@ class AudioBook:
         return completed / total if total > 0 else 0.0
 
 
+@dataclass
+class ChapterMarker:
+    """有声书中的章节标记（秒）"""
+
+    title: str
+    start: float
+    end: float
+
+
+def chapter_markers(chapters: Sequence[Tuple[str, float]]) -> List[ChapterMarker]:
+    """按 (标题, 时长) 顺序排列的章节计算首尾相接的标记。"""
+    markers = []
+    position = 0.0
+    for title, duration in chapters:
+        markers.append(ChapterMarker(title=title, start=position, end=position + max(duration, 0.0)))
+        position += max(duration, 0.0)
+    return markers
+
+
+def _escape_ffmetadata(value: str) -> str:
+    value = re.sub(r"([=;#\\])", r"\\\1", value or "")
+    return value.replace("\n", " ").replace("\r", " ")
+
+
+def build_ffmetadata(markers: Sequence[ChapterMarker], title: str = "", artist: str = "") -> str:
+    """生成 ffmpeg FFMETADATA1 文本，章节时间以毫秒为单位。"""
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append(f"title={_escape_ffmetadata(title)}")
+        lines.append(f"album={_escape_ffmetadata(title)}")
+    if artist:
+        lines.append(f"artist={_escape_ffmetadata(artist)}")
+    lines.append("genre=Audiobook")
+    for marker in markers:
+        lines.extend(
+            [
+                "",
+                "[CHAPTER]",
+                "TIMEBASE=1/1000",
+                f"START={int(round(marker.start * 1000))}",
+                f"END={int(round(marker.end * 1000))}",
+                f"title={_escape_ffmetadata(marker.title)}",
+            ]
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _format_srt_time(seconds: float) -> str:
+    millis = int(round(max(seconds, 0.0) * 1000))
+    hours, millis = divmod(millis, 3600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def _shift_srt_time(match: "re.Match[str]", offset: float) -> str:
+    hours, minutes, secs, millis = (int(part) for part in match.groups())
+    return _format_srt_time(hours * 3600 + minutes * 60 + secs + millis / 1000 + offset)
+
+
+def merge_srt(srt_texts: Sequence[str], offsets: Sequence[float]) -> str:
+    """把各章 SRT 按章节起点平移后合并，并重新编号。"""
+    cues = []
+    for srt, offset in zip(srt_texts, offsets):
+        for block in re.split(r"\n\s*\n", (srt or "").replace("\r\n", "\n").strip()):
+            lines = [line for line in block.split("\n") if line.strip()]
+            timing = next((i for i, line in enumerate(lines) if "-->" in line), None)
+            if timing is None or timing + 1 >= len(lines):
+                continue
+            shifted = _SRT_TIME_RE.sub(lambda m: _shift_srt_time(m, offset), lines[timing])
+            cues.append("\n".join([shifted] + lines[timing + 1:]))
+    return "".join(f"{i}\n{cue}\n\n" for i, cue in enumerate(cues, 1))
+
+
+def _concat_list_line(path: str) -> str:
+    escaped = os.path.abspath(path).replace("\\", "\\\\").replace("'", "\\'")
+    return f"file '{escaped}'"
+
+
+def assemble_audiobook(
+    chapter_files: Sequence[str],
+    markers: Sequence[ChapterMarker],
+    output_file: str,
+    audio_format: AudioFormat = AudioFormat.M4B,
+    title: str = "",
+    artist: str = "",
+) -> None:
+    """
+    拼接各章音频为一个文件并写入章节标记。
+
+    Args:
+        chapter_files: 各章音频文件，顺序与 markers 一致
+        markers: 章节标记
+        output_file: 输出文件路径
+        audio_format: AudioFormat.M4B 或 AudioFormat.MP3
+        title / artist: 写入文件的书名和作者
+
+    Raises:
+        AudioAssemblyError: ffmpeg 执行失败
+    """
+    if audio_format not in AUDIOBOOK_OUTPUT_ARGS:
+        raise ValueError(f"不支持的有声书格式: {audio_format.value}")
+    if not chapter_files:
+        raise ValueError("没有可拼接的章节音频")
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix="audiobook_")
+    try:
+        concat_path = os.path.join(temp_dir, "concat.txt")
+        with open(concat_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(_concat_list_line(path) for path in chapter_files) + "\n")
+        metadata_path = os.path.join(temp_dir, "metadata.txt")
+        with open(metadata_path, "w", encoding="utf-8") as f:
+            f.write(build_ffmetadata(markers, title=title, artist=artist))
+
+        # 第二个输入只提供元数据和章节，不映射其中的流
+        command = [
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", concat_path,
+            "-i", metadata_path,
+            "-map", "0:a", "-map_metadata", "1", "-map_chapters", "1",
+            *AUDIOBOOK_OUTPUT_ARGS[audio_format],
+            output_file,
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise AudioAssemblyError(f"ffmpeg 封装有声书失败: {result.stderr.strip()[-500:]}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 class AudioBookConverter:
-    """音频转换器"""
+    """
+    音频转换器：各章并发合成（最多 config.max_concurrency 章），再封装为整本有声书。
 
-    def __init__(self, book: "Book", config: AudioConfig):
-        self.book = book
+    章节音频和字幕保存在 workdir 中，已经合成的章节再次运行时直接复用。
+    """
+
+    def __init__(
+        self,
+        chapters: Sequence[Tuple[str, str]],
+        config: AudioConfig,
+        workdir: str,
+        book_title: str = "",
+    ):
+        self.chapters = chapters
         self.config = config
+        self.workdir = Path(workdir)
+        self.book_title = book_title
         self.audio_book = self._init_audio_book()
 
     def _init_audio_book(self) -> AudioBook:
-        """初始化AudioBook结构"""
+        """初始化AudioBook结构，每章一个片段（长文本在合成时自动分段）"""
         chapters = []
-        for toc in self.book.table_of_contents:
-            # 获取章节内容
-            chapter_contents = [
-                content
-                for content in self.book.content
-                if content.chapter_index == toc.content_position
-            ]
-
-            # 创建音频片段
-            segments = [
-                AudioSegment(
-                    id=f"{toc.content_position}_{i}",
-                    text=content.text,
-                    audio_path=None,
-                    duration=None,
-                    start_time=None,
-                    end_time=None,
+        for index, (title, text) in enumerate(self.chapters):
+            segment = AudioSegment(
+                id=f"{index}_0",
+                text=text,
+                audio_path=None,
+                duration=None,
+                start_time=None,
+                end_time=None,
+            )
+            chapters.append(
+                ChapterAudio(
+                    chapter_index=index,
+                    title=title,
+                    segments=[segment],
+                    combined_audio_path=None,
+                    total_duration=None,
                 )
-                for i, content in enumerate(chapter_contents)
-            ]
-
-            # 创建章节音频信息
-            chapter_audio = ChapterAudio(
-                chapter_index=toc.content_position,
-                title=toc.title,
-                segments=segments,
-                combined_audio_path=None,
-                total_duration=None,
             )
-            chapters.append(chapter_audio)
 
         return AudioBook(
-            book_id=str(hash(self.book.metadata.title)),
+            book_id=self.book_title,
             config=self.config,
             chapters=chapters,
             total_duration=None,
         )
 
-    async def convert(self):
-        """执行转换"""
+    async def convert(self, output_file: str) -> AudioBook:
+        """执行转换，所有章节成功后才封装输出文件"""
+        self.workdir.mkdir(parents=True, exist_ok=True)
         self.audio_book.status = AudioStatus.PROCESSING
-        try:
-            for chapter in self.audio_book.chapters:
+        semaphore = asyncio.Semaphore(max(1, self.config.max_concurrency))
+
+        async def run(chapter: ChapterAudio):
+            async with semaphore:
                 await self._convert_chapter(chapter)
-                self.audio_book.status = AudioStatus.COMPLETED
+
+        await asyncio.gather(*(run(chapter) for chapter in self.audio_book.chapters))
+
+        failed = [c for c in self.audio_book.chapters if c.status != AudioStatus.COMPLETED]
+        if failed:
+            self.audio_book.status = AudioStatus.FAILED
+            self.audio_book.error_message = f"{len(failed)} 个章节合成失败，重新运行将只合成这些章节"
+            return self.audio_book
+
+        try:
+            markers = chapter_markers([(c.title, c.total_duration or 0.0) for c in self.audio_book.chapters])
+            await asyncio.to_thread(
+                assemble_audiobook,
+                [str(c.combined_audio_path) for c in self.audio_book.chapters],
+                markers,
+                output_file,
+                self.config.format,
+                self.book_title,
+            )
+            subtitle_path = Path(output_file).with_suffix(".srt")
+            subtitle_path.write_text(
+                merge_srt([c.subtitle_srt for c in self.audio_book.chapters], [m.start for m in markers]),
+                encoding="utf-8",
+            )
         except Exception as e:
             self.audio_book.status = AudioStatus.FAILED
             self.audio_book.error_message = str(e)
+            return self.audio_book
+
+        self.audio_book.total_duration = markers[-1].end if markers else 0.0
+        self.audio_book.output_path = Path(output_file)
+        self.audio_book.status = AudioStatus.COMPLETED
+        return self.audio_book
 
     async def _convert_chapter(self, chapter: ChapterAudio):
         """转换单个章节"""
@@ -153,7 +354,6 @@ class AudioBookConverter:
         try:
             for segment in chapter.segments:
                 await self._convert_segment(segment)
-                # 合并章节音频
             await self._combine_chapter_segments(chapter)
             chapter.status = AudioStatus.COMPLETED
         except Exception as e:
@@ -161,28 +361,80 @@ class AudioBookConverter:
             chapter.error_message = str(e)
 
     async def _convert_segment(self, segment: AudioSegment):
-        """转换单个音频片段"""
-        # TTS转换实现...
-        pass
+        """转换单个音频片段，工作目录中已有结果时直接复用"""
+        from book2tts.audio_utils import get_audio_duration
+        from book2tts.edgetts import EdgeTTS
+
+        audio_path = self.workdir / f"segment_{segment.id}.mp3"
+        subtitle_path = self.workdir / f"segment_{segment.id}.vtt"
+        if not (audio_path.exists() and audio_path.stat().st_size > 0):
+            segment.status = AudioStatus.PROCESSING
+            result = await EdgeTTS(voice_name=self.config.voice, rate=self.config.rate).synthesize_long_text_with_subtitles(
+                text=segment.text,
+                output_file=str(audio_path),
+                subtitle_file=str(subtitle_path),
+            )
+            if not result.get("audio_generated", False):
+                raise RuntimeError(result.get("error") or "音频生成失败")
+
+        segment.audio_path = audio_path
+        segment.duration = get_audio_duration(str(audio_path), segment.text)
+        segment.subtitle_srt = _vtt_to_srt(subtitle_path.read_text(encoding="utf-8")) if subtitle_path.exists() else ""
+        segment.status = AudioStatus.COMPLETED
 
     async def _combine_chapter_segments(self, chapter: ChapterAudio):
-        """合并章节内的音频片段"""
-        # 音频合并实现...
-        pass
+        """合并章节内的音频片段和字幕"""
+        offsets = []
+        position = 0.0
+        for segment in chapter.segments:
+            segment.start_time = position
+            segment.end_time = position + (segment.duration or 0.0)
+            offsets.append(position)
+            position = segment.end_time
+
+        if len(chapter.segments) == 1:
+            chapter.combined_audio_path = chapter.segments[0].audio_path
+        else:
+            combined = self.workdir / f"chapter_{chapter.chapter_index}.mp3"
+            await asyncio.to_thread(
+                _concat_audio, [str(s.audio_path) for s in chapter.segments], str(combined)
+            )
+            chapter.combined_audio_path = combined
+        chapter.total_duration = position
+        chapter.subtitle_srt = merge_srt([s.subtitle_srt for s in chapter.segments], offsets)
 
 
-# 扩展Book类，添加音频相关功能
-@dataclass
-class Book:
-    metadata: Metadata
-    table_of_contents: List[TocEntry]
-    content: List[Content]
-    audio_books: List[AudioBook] = []  # 支持多个不同配置的音频版本
-
-    def create_audio_book(self, config: AudioConfig) -> AudioBook:
-        """创建新的有声书版本"""
-        converter = AudioBookConverter(self, config)
-        if self.audio_books is None:
-            self.audio_books = []
-            self.audio_books.append(converter.audio_book)
-        return converter.audio_book
+def _vtt_to_srt(vtt: str) -> str:
+    """WebVTT 转 SRT：去掉文件头，时间戳的小数点换成逗号。"""
+    blocks = []
+    for block in re.split(r"\n\s*\n", (vtt or "").replace("\r\n", "\n").strip()):
+        lines = [line for line in block.split("\n") if line.strip()]
+        timing = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        if timing is None:
+            continue
+        time_line = _SRT_TIME_RE.sub(
+            lambda m: _format_srt_time(
+                int(m.group(1)) * 3600 + int(m.group(2)) * 60 + int(m.group(3)) + int(m.group(4)) / 1000
+            ),
+            re.sub(r"(?<![\d:])(\d{2}:\d{2}[.,]\d{3})", r"00:\1", lines[timing]),
+        )
+        blocks.append("\n".join([time_line] + lines[timing + 1:]))
+    return "".join(f"{i}\n{block}\n\n" for i, block in enumerate(blocks, 1))
+
+
+def _concat_audio(input_files: Sequence[str], output_file: str) -> None:
+    temp_dir = tempfile.mkdtemp(prefix="audiobook_concat_")
+    try:
+        concat_path = os.path.join(temp_dir, "concat.txt")
+        with open(concat_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(_concat_list_line(path) for path in input_files) + "\n")
+        result = subprocess.run(
+            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", concat_path, "-c", "copy", output_file],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise AudioAssemblyError(f"ffmpeg 合并章节音频失败: {result.stderr.strip()[-500:]}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
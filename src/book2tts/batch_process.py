@@ -11,10 +11,19 @@ import zipfile
 
 from book2tts.pdf import (
     extract_text_by_page,
+    extract_text_by_page_range,
     extract_img_by_page,
     save_img,
     extract_img_vector_by_page,
-    open_pdf,
+    lease_pdf,
+)
+from book2tts.ocr import ocr_pdf_pages
+from book2tts.page_cleaner import (
+    PAGE_SEPARATOR,
+    clean_pages,
+    passes_quality_checks,
+    skip_llm_enabled,
+    strip_noise_enabled,
 )
 from book2tts.tts import (
     edge_tts_volices,
@@ -354,6 +363,33 @@ def init_batch_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
             
         add_task_log(task, f"错误: {error_message}")
     
+    def ocr_scanned_pages(task, page_texts, progress_callback=None):
+        """对扫描版PDF的指定页面并发执行OCR，识别结果按页写入 page_texts"""
+        ak = os.getenv("VOLC_AK")
+        sk = os.getenv("VOLC_SK")
+        if not ak or not sk:
+            set_error_detail(task, "OCR服务未配置", "扫描版PDF需要OCR识别，请设置环境变量 VOLC_AK 和 VOLC_SK。")
+            if progress_callback:
+                progress_callback(f"任务 {task['id']} 错误: OCR服务未配置")
+            return False
+        
+        task["status"] = "OCR识别中"
+        page_range = range(task["start_page"], task["end_page"])
+        cached_count = 0
+        for done, (i, ocr_result) in enumerate(ocr_pdf_pages(ak, sk, task["file"], page_range), start=1):
+            if "error" in ocr_result:
+                add_task_log(task, f"警告: 页面 {i} OCR识别失败: {ocr_result['error']}")
+                continue
+            page_texts[i] = ocr_result["text"]
+            if ocr_result["cached"]:
+                cached_count += 1
+            add_task_log(task, f"已识别页面 {i}{'（缓存）' if ocr_result['cached'] else ''} ({done}/{len(page_range)})")
+            if progress_callback:
+                progress_callback(f"正在处理任务 {task['id']}: OCR识别 {done}/{len(page_range)} 页")
+        
+        add_task_log(task, f"OCR识别完成，共 {len(page_range)} 页，其中 {cached_count} 页使用缓存")
+        return True
+    
     def process_batch_task(task, progress_callback=None):
         task["attempt_count"] += 1
         log_message = f"开始处理任务 (尝试 #{task['attempt_count']})"
@@ -388,25 +424,18 @@ def init_batch_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
                 # Use a local variable for book_toc to avoid conflicts with global
                 local_book_toc = []
                 try:
-                    # Use open_pdf function which has built-in caching
-                    pdf_doc = open_pdf(file_path)
-                    
+                    # 这里只读取页数和目录，页面内容在校验页面范围后按范围读取
+                    with lease_pdf(file_path) as pdf_doc:
+                        page_count = len(pdf_doc)
+                        toc = pdf_doc.get_toc()
+                    # 占位，只有任务范围内的页面会被填充
+                    local_book_toc = [""] * page_count
+
                     if task["pdf_img"]:
-                        if task["pdf_img_vector"]:
-                            add_task_log(task, "提取矢量图PDF页面")
-                            local_book_toc = [page.get_pixmap().tobytes() for page in pdf_doc]
-                        else:
-                            add_task_log(task, "提取图像PDF页面")
-                            local_book_toc = [page.get_pixmap().tobytes() for page in pdf_doc]
+                        add_task_log(task, f"扫描版PDF，总页数: {page_count}，将对指定页面进行OCR识别")
                     else:
-                        add_task_log(task, "提取文本PDF页面")
-                        # Extract text directly from the cached PDF document
-                        local_book_toc = [page.get_text() for page in pdf_doc]
-                        # Get TOC if needed
-                        toc = pdf_doc.get_toc()
-                        
-                        add_task_log(task, f"成功读取PDF文件，总页数: {len(local_book_toc)}")
-                        
+                        add_task_log(task, f"成功读取PDF文件，总页数: {page_count}")
+
                         # 如果有目录，记录目录信息
                         if toc:
                             add_task_log(task, f"PDF文件包含目录，共 {len(toc)} 个章节")
@@ -416,61 +445,71 @@ def init_batch_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
                         progress_callback(f"任务 {task['id']} 错误: PDF解析失败 - {str(e)}")
                     return False
                 
-                # Extract text from selected pages
-                if task["pdf_img"]:
-                    # For image PDFs, we would need to implement OCR here
-                    # This is just a placeholder
-                    set_error_detail(task, "图像PDF处理暂不支持批量处理", "当前版本不支持对图像型PDF进行批量OCR处理。\n请使用单篇处理功能，或使用文本型PDF。")
-                    task["status"] = "不支持的操作"
+                # Extract text from selected pages (scanned pages are OCR'd first)
+                results = []
+                pages_processed = 0
+                pages_failed = 0
+                failed_pages = []
+                    
+                # Validate page range
+                if task["start_page"] >= len(local_book_toc) or task["end_page"] > len(local_book_toc):
+                    set_error_detail(task, "页面范围超出PDF总页数", 
+                                    f"指定的页面范围 ({task['start_page']}-{task['end_page']}) 超出了PDF文件的总页数 ({len(local_book_toc)})。\n请调整页面范围重试。\n注意：起始页码和结束页码都已自动加1调整。")
                     if progress_callback:
-                        progress_callback(f"任务 {task['id']}: 图像PDF处理暂不支持批量处理")
+                        progress_callback(f"任务 {task['id']} 错误: 页面范围超出PDF总页数 ({len(local_book_toc)})")
                     return False
-                else:
-                    results = []
-                    pages_processed = 0
-                    pages_failed = 0
-                    failed_pages = []
                     
-                    # Validate page range
-                    if task["start_page"] >= len(local_book_toc) or task["end_page"] > len(local_book_toc):
-                        set_error_detail(task, "页面范围超出PDF总页数", 
-                                        f"指定的页面范围 ({task['start_page']}-{task['end_page']}) 超出了PDF文件的总页数 ({len(local_book_toc)})。\n请调整页面范围重试。\n注意：起始页码和结束页码都已自动加1调整。")
-                        if progress_callback:
-                            progress_callback(f"任务 {task['id']} 错误: 页面范围超出PDF总页数 ({len(local_book_toc)})")
+                if task["pdf_img"]:
+                    if not ocr_scanned_pages(task, local_book_toc, progress_callback):
                         return False
+                else:
+                    add_task_log(task, "提取文本PDF页面")
+                    local_book_toc[task["start_page"]:task["end_page"]] = extract_text_by_page_range(
+                        file_path, task["start_page"], task["end_page"]
+                    )
                     
-                    for i in range(task["start_page"], task["end_page"]):
-                        try:
-                            if i < len(local_book_toc):
-                                text = local_book_toc[i]
-                                if not text or text.strip() == "":
-                                    add_task_log(task, f"警告: 页面 {i} 没有提取到文本内容")
-                                    pages_failed += 1
-                                    failed_pages.append(i)
-                                    continue
+                for i in range(task["start_page"], task["end_page"]):
+                    try:
+                        if i < len(local_book_toc):
+                            text = local_book_toc[i]
+                            if not text or text.strip() == "":
+                                add_task_log(task, f"警告: 页面 {i} 没有提取到文本内容")
+                                pages_failed += 1
+                                failed_pages.append(i)
+                                continue
                                     
-                                text_lines = text.split("\n")
-                                if len(text_lines) > 1:
-                                    end_idx = len(text_lines) if task["line_num_tail"] == 0 else -task["line_num_tail"]
-                                    text = "\n".join(text_lines[task["line_num_head"]:end_idx])
-                                results.append(text)
-                                pages_processed += 1
-                                add_task_log(task, f"已提取页面 {i} (共 {task['end_page'] - task['start_page']} 页)")
-                        except Exception as e:
-                            add_task_log(task, f"警告: 处理页面 {i} 时出错: {str(e)}")
-                            pages_failed += 1
-                            failed_pages.append(i)
+                            text_lines = text.split("\n")
+                            if len(text_lines) > 1:
+                                end_idx = len(text_lines) if task["line_num_tail"] == 0 else -task["line_num_tail"]
+                                text = "\n".join(text_lines[task["line_num_head"]:end_idx])
+                            results.append(text)
+                            pages_processed += 1
+                            add_task_log(task, f"已提取页面 {i} (共 {task['end_page'] - task['start_page']} 页)")
+                    except Exception as e:
+                        add_task_log(task, f"警告: 处理页面 {i} 时出错: {str(e)}")
+                        pages_failed += 1
+                        failed_pages.append(i)
                             
-                    if pages_processed == 0:
-                        set_error_detail(task, "所有页面处理失败", 
-                                        f"所有指定页面 ({task['start_page']}-{task['end_page']}) 处理失败，无法提取文本。\n请检查PDF文件格式和内容。")
-                        if progress_callback:
-                            progress_callback(f"任务 {task['id']} 错误: 所有页面处理失败")
-                        return False
-                    elif pages_failed > 0:
-                        add_task_log(task, f"警告: {pages_failed} 页处理失败，失败页面: {', '.join(map(str, failed_pages))}")
+                if pages_processed == 0:
+                    set_error_detail(task, "所有页面处理失败", 
+                                    f"所有指定页面 ({task['start_page']}-{task['end_page']}) 处理失败，无法提取文本。\n请检查PDF文件格式和内容。")
+                    if progress_callback:
+                        progress_callback(f"任务 {task['id']} 错误: 所有页面处理失败")
+                    return False
+                elif pages_failed > 0:
+                    add_task_log(task, f"警告: {pages_failed} 页处理失败，失败页面: {', '.join(map(str, failed_pages))}")
+
+                if strip_noise_enabled():
+                    # 页眉页脚、页码和软换行在本地去掉，减少LLM处理的文本量
+                    results, clean_stats = clean_pages(results)
+                    add_task_log(
+                        task,
+                        f"本地清理: 去除页眉页脚 {clean_stats.header_lines} 行、页码 {clean_stats.page_numbers} 个，"
+                        f"合并断行 {clean_stats.joined_lines + clean_stats.hyphenations} 处 "
+                        f"({clean_stats.chars_before} -> {clean_stats.chars_after} 字符)"
+                    )
                     
-                    extracted_text = "\n\n\n".join(results)
+                extracted_text = PAGE_SEPARATOR.join(results)
             
             # If no text was extracted, report an error
             if not extracted_text:
@@ -494,19 +533,27 @@ def init_batch_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
             success_chunks = 0
             failed_chunks = 0
             
+            skip_llm = skip_llm_enabled()
             try:
-                for sub_text in extracted_text.split("\n\n\n"):
+                for sub_text in extracted_text.split(PAGE_SEPARATOR):
                     if not sub_text.strip():
                         continue
                         
                     chunk_count += 1
                     add_task_log(task, f"处理文本块 {chunk_count} (长度: {len(sub_text)} 字符)")
+
+                    if skip_llm and passes_quality_checks(sub_text):
+                        processed_text += sub_text.strip() + "\n\n"
+                        add_task_log(task, f"文本块 {chunk_count} 通过质量检查，跳过LLM")
+                        success_chunks += 1
+                        continue
                     
                     try:
                         result = llm_service.process_text(
                             system_prompt=task["system_prompt"],
                             user_content=sub_text,
-                            temperature=0.7
+                            temperature=0.7,
+                            cache_operation="reformat"
                         )
                         
                         if result.get("success"):
@@ -0,0 +1,262 @@
+"""书籍文本/目录索引。
+
+上传后在后台为每本书生成一次索引文件，请求处理时直接读取其中的片段，
+无需重新打开 PDF / EPUB、解析目录或用 BeautifulSoup 抽取章节正文。
+
+文件布局（小端）::
+
+    magic          8 字节  b"B2TIDX01"
+    page_count     uint32
+    meta_length    uint32
+    offsets        (page_count + 1) × (uint64 字节偏移, uint64 字符偏移)
+    flags          page_count 字节，bit0 表示扫描页
+    meta           UTF-8 JSON（目录、页面列表等）
+    text           所有页面规范化文本的 UTF-8 拼接
+
+读取时通过 mmap 映射整个文件，取某页文本只解码对应的字节区间。
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+INDEX_MAGIC = b"B2TIDX01"
+INDEX_VERSION = 1
+
+_HEADER = struct.Struct("<II")
+_OFFSET = struct.Struct("<QQ")
+
+PAGE_SCANNED = 0x01
+
+# 每个进程最多保持映射的索引文件数
+MAX_OPEN_INDEXES = 16
+
+
+class BookIndexError(Exception):
+    """索引文件不存在、损坏或版本不匹配。"""
+
+
+def normalize_page_text(text: str) -> str:
+    """统一换行并去掉 NUL 等不可见控制字符，不改变正文字符本身。"""
+    if not text:
+        return ""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.replace("\x00", "")
+
+
+def write_book_index(
+    path: str,
+    page_texts: Iterable[str],
+    page_flags: Optional[Sequence[int]] = None,
+    meta: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    写入索引文件，先写临时文件再替换，读取方不会看到写了一半的文件。
+
+    Args:
+        path: 索引文件路径
+        page_texts: 各页文本，写入前做规范化
+        page_flags: 各页标志位（PAGE_SCANNED），缺省为 0
+        meta: 可 JSON 序列化的附加信息（目录、页面列表等）
+
+    Returns:
+        页数
+    """
+    blobs: List[bytes] = []
+    offsets: List[Tuple[int, int]] = [(0, 0)]
+    byte_pos = char_pos = 0
+    for text in page_texts:
+        text = normalize_page_text(text)
+        data = text.encode("utf-8")
+        blobs.append(data)
+        byte_pos += len(data)
+        char_pos += len(text)
+        offsets.append((byte_pos, char_pos))
+
+    page_count = len(blobs)
+    flags = bytes(page_flags) if page_flags is not None else bytes(page_count)
+    if len(flags) != page_count:
+        raise ValueError(f"页面标志数量 {len(flags)} 与页数 {page_count} 不一致")
+
+    meta_bytes = json.dumps(
+        dict(meta or {}, version=INDEX_VERSION), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(_HEADER.pack(page_count, len(meta_bytes)))
+            for offset in offsets:
+                f.write(_OFFSET.pack(*offset))
+            f.write(flags)
+            f.write(meta_bytes)
+            for data in blobs:
+                f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return page_count
+
+
+class BookIndex:
+    """只读的索引文件视图，页面文本按需从 mmap 中解码。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:  # 空文件
+                raise BookIndexError(f"索引文件为空: {path}") from exc
+
+        try:
+            self._parse_header()
+        except Exception:
+            self._mm.close()
+            raise
+        self._meta: Optional[Dict[str, Any]] = None
+        self._href_lookup: Optional[Dict[str, int]] = None
+
+    def _parse_header(self) -> None:
+        mm = self._mm
+        header_end = len(INDEX_MAGIC) + _HEADER.size
+        if len(mm) < header_end or mm[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise BookIndexError(f"不是有效的索引文件: {self.path}")
+
+        self.page_count, meta_length = _HEADER.unpack_from(mm, len(INDEX_MAGIC))
+        self._offsets_start = header_end
+        self._flags_start = self._offsets_start + (self.page_count + 1) * _OFFSET.size
+        self._meta_start = self._flags_start + self.page_count
+        self._text_start = self._meta_start + meta_length
+
+        text_length, _ = _OFFSET.unpack_from(mm, self._offsets_start + self.page_count * _OFFSET.size)
+        if len(mm) != self._text_start + text_length:
+            raise BookIndexError(f"索引文件已损坏: {self.path}")
+
+    def __len__(self) -> int:
+        return self.page_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._mm.close()
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        if self._meta is None:
+            self._meta = json.loads(self._mm[self._meta_start:self._text_start].decode("utf-8"))
+        return self._meta
+
+    @property
+    def toc(self) -> List[Dict[str, Any]]:
+        return self.meta.get("toc") or []
+
+    @property
+    def pages(self) -> List[Dict[str, Any]]:
+        return self.meta.get("pages") or []
+
+    def _offset(self, page_index: int) -> Tuple[int, int]:
+        return _OFFSET.unpack_from(self._mm, self._offsets_start + page_index * _OFFSET.size)
+
+    def _check(self, page_index: int) -> None:
+        if page_index < 0 or page_index >= self.page_count:
+            raise IndexError(f"页码 {page_index} 超出范围，共有 {self.page_count} 页")
+
+    def page_text(self, page_index: int) -> str:
+        """第 page_index 页（从0开始）的文本。"""
+        self._check(page_index)
+        start, _ = self._offset(page_index)
+        end, _ = self._offset(page_index + 1)
+        return self._mm[self._text_start + start:self._text_start + end].decode("utf-8")
+
+    def page_range_text(self, start: int, end: int, separator: str = "\n\n") -> str:
+        """[start, end] 闭区间内各页的非空文本，以 separator 连接。"""
+        texts = (self.page_text(i) for i in range(max(start, 0), min(end, self.page_count - 1) + 1))
+        return separator.join(text for text in texts if text.strip())
+
+    def char_offset(self, page_index: int) -> int:
+        """第 page_index 页在全书文本中的起始字符偏移，page_index 可等于页数（表示全书末尾）。"""
+        if page_index < 0 or page_index > self.page_count:
+            raise IndexError(f"页码 {page_index} 超出范围，共有 {self.page_count} 页")
+        return self._offset(page_index)[1]
+
+    def page_at_char(self, char_offset: int) -> int:
+        """全书字符偏移所在的页码。"""
+        low, high = 0, self.page_count - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self._offset(mid)[1] <= char_offset:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def is_scanned(self, page_index: int) -> bool:
+        self._check(page_index)
+        return bool(self._mm[self._flags_start + page_index] & PAGE_SCANNED)
+
+    def page_index_of(self, href: str) -> Optional[int]:
+        """EPUB 页面 href（不含锚点）对应的页码。"""
+        if self._href_lookup is None:
+            self._href_lookup = {page.get("href"): i for i, page in enumerate(self.pages)}
+        return self._href_lookup.get(href.split("#", 1)[0])
+
+
+# 进程内已映射的索引：path -> (mtime, BookIndex)
+_open_indexes: "OrderedDict[str, Tuple[float, BookIndex]]" = OrderedDict()
+_open_indexes_lock = threading.Lock()
+
+
+def open_book_index(path: str) -> Optional[BookIndex]:
+    """打开索引文件，文件不存在时返回 None；同一文件在进程内复用映射，文件更新后自动重新打开。"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _open_indexes_lock:
+        entry = _open_indexes.get(path)
+        if entry is not None and entry[0] == mtime:
+            _open_indexes.move_to_end(path)
+            return entry[1]
+        if entry is not None:
+            # 旧映射可能仍被其他线程使用，交给垃圾回收关闭
+            del _open_indexes[path]
+
+        index = BookIndex(path)
+        _open_indexes[path] = (mtime, index)
+        while len(_open_indexes) > MAX_OPEN_INDEXES:
+            _open_indexes.popitem(last=False)
+        return index
+
+
+def extract_pdf_pages(pdf_path: str) -> Tuple[List[str], List[int]]:
+    """逐页抽取PDF文本并标记扫描页。"""
+    from book2tts.pdf import is_scanned_pdf_page, lease_pdf
+
+    texts, flags = [], []
+    with lease_pdf(pdf_path) as doc:
+        for page in doc:
+            texts.append(page.get_text())
+            flags.append(PAGE_SCANNED if is_scanned_pdf_page(page) else 0)
+    return texts, flags
+
+
+def extract_epub_pages(ebook) -> Tuple[List[Dict[str, str]], List[str]]:
+    """按 spine 顺序抽取 EPUB 各文档的纯文本，返回 (页面列表, 文本列表)。"""
+    from book2tts.ebook import ebook_pages, get_contents_by_page_range
+
+    return ebook_pages(ebook), get_contents_by_page_range(ebook, 0)
@@ -7,7 +7,7 @@ import logging
 import math
 from typing import Any, Dict, List, Optional
 
-from .llm_service import LLMService
+from .llm_service import LLMService, get_shared_llm_service
 from web.workbench.utils.subtitle_utils import (
     format_srt_time,
     parse_srt_subtitles,
@@ -28,7 +28,7 @@ class ChapterGenerator:
             self.llm_service = llm_service
         else:
             try:
-                self.llm_service = LLMService()
+                self.llm_service = get_shared_llm_service()
             except Exception as exc:  # pylint: disable=broad-except
                 logger.warning("初始化LLMService失败，将使用回退章节: %s", exc)
                 self.llm_service = None
@@ -1,10 +1,14 @@
 import json
 import re
 from typing import Dict, List, Any, Optional
-from .llm_service import LLMService
+from .llm_service import LLMService, get_shared_llm_service
+from .text_chunker import UNIT_CHARS, ChunkBudget, budget_for, split_text
 
 class DialogueService:
     """对话转换服务类，用于将文本内容转换为对话脚本"""
+
+    # LLM 结果缓存中的操作类型
+    CACHE_OPERATION = "dialogue"
     
     # 默认的对话转换提示词模板
     DEFAULT_DIALOGUE_PROMPT = """请将以下文本解析为 JSON 格式的播客对话记录。JSON 结构应包含以下字段：
@@ -88,9 +92,9 @@ class DialogueService:
         初始化对话服务
         
         Args:
-            llm_service: LLM服务实例，如果未提供则创建新实例
+            llm_service: LLM服务实例，如果未提供则使用进程级共享实例
         """
-        self.llm_service = llm_service or LLMService()
+        self.llm_service = llm_service or get_shared_llm_service()
     
     def text_to_dialogue(self, text: str, custom_prompt: Optional[str] = None, temperature: float = 0.3) -> Dict[str, Any]:
         """
@@ -104,18 +108,62 @@ class DialogueService:
         Returns:
             包含转换结果的字典
         """
+        request = self._dialogue_request(text, custom_prompt, temperature)
         try:
-            # 使用自定义提示词或默认提示词
-            system_prompt = custom_prompt or self.DEFAULT_DIALOGUE_PROMPT
-            
             # 调用LLM服务进行文本处理
-            result = self.llm_service.process_text(
-                system_prompt=system_prompt,
-                user_content=text,
-                temperature=temperature
-            )
-            raw_response = result.get("result")
+            result = self.llm_service.process_text(**request)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"对话转换过程中发生错误: {str(e)}",
+                "raw_response": None
+            }
+        return self._dialogue_result(request, result)
+
+    def texts_to_dialogue(
+        self,
+        texts: List[str],
+        custom_prompt: Optional[str] = None,
+        temperature: float = 0.3,
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        并发转换多段文本，最多同时发起 max_concurrency 个 LLM 调用
+        
+        Args:
+            texts: 待转换的文本列表
+            custom_prompt: 自定义提示词（可选）
+            temperature: LLM温度参数
+            max_concurrency: 并发上限（默认取 LLM_MAX_CONCURRENCY）
             
+        Returns:
+            与 texts 顺序一致的转换结果列表，格式同 text_to_dialogue
+        """
+        requests = [self._dialogue_request(text, custom_prompt, temperature) for text in texts]
+        try:
+            results = self.llm_service.process_texts(requests, max_concurrency=max_concurrency)
+        except Exception as e:
+            error = {
+                "success": False,
+                "error": f"对话转换过程中发生错误: {str(e)}",
+                "raw_response": None
+            }
+            return [dict(error) for _ in texts]
+        return [self._dialogue_result(request, result) for request, result in zip(requests, results)]
+
+    def _dialogue_request(self, text: str, custom_prompt: Optional[str], temperature: float) -> Dict[str, Any]:
+        """构造单段文本的 LLM 调用参数（使用自定义提示词或默认提示词）"""
+        return {
+            "system_prompt": custom_prompt or self.DEFAULT_DIALOGUE_PROMPT,
+            "user_content": text,
+            "temperature": temperature,
+            "cache_operation": self.CACHE_OPERATION,
+        }
+
+    def _dialogue_result(self, request: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """把 LLM 返回结果解析为对话数据"""
+        raw_response = result.get("result")
+        try:
             if not result.get("success"):
                 return {
                     "success": False,
@@ -124,29 +172,36 @@ class DialogueService:
                 }
             
             # 解析LLM返回的JSON格式结果
-            llm_response = raw_response
-            dialogue_data = self._parse_llm_response(llm_response)
+            dialogue_data = self._parse_llm_response(raw_response)
             
             if dialogue_data is None:
+                # 解析失败的结果不应在重试时被缓存命中
+                self.llm_service.forget_cached_text(
+                    self.CACHE_OPERATION,
+                    request["system_prompt"],
+                    request["user_content"],
+                    request["temperature"],
+                )
                 return {
                     "success": False,
                     "error": "无法解析LLM返回的JSON格式数据",
-                    "raw_response": llm_response
+                    "raw_response": raw_response
                 }
             
             return {
                 "success": True,
                 "dialogue_data": dialogue_data,
-                "raw_response": llm_response,
+                "raw_response": raw_response,
                 "usage": result.get("usage"),
                 "model": result.get("model"),
+                "cached": bool(result.get("cached")),
             }
             
         except Exception as e:
             return {
                 "success": False,
                 "error": f"对话转换过程中发生错误: {str(e)}",
-                "raw_response": result.get("result") if 'result' in locals() and isinstance(result, dict) else None
+                "raw_response": raw_response
             }
     
     def _parse_llm_response(self, response: str) -> Optional[Dict[str, Any]]:
@@ -255,41 +310,23 @@ class DialogueService:
                     speakers.add(segment["speaker"])
         return sorted(list(speakers))
     
-    def split_long_text(self, text: str, max_length: int = 3000) -> List[str]:
+    def split_long_text(
+        self,
+        text: str,
+        max_length: Optional[int] = None,
+        budget: Optional[ChunkBudget] = None,
+    ) -> List[str]:
         """
-        将长文本分割为适合LLM处理的段落
+        将长文本按段落、句子边界分割为适合LLM处理的段落
         
         Args:
             text: 输入文本
-            max_length: 每段最大长度
+            max_length: 每段最大字符数（兼容旧参数，优先级低于 budget）
+            budget: 分段预算，默认使用对话转换的 token 预算
             
         Returns:
             分割后的文本段落列表
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        chunks = []
-        current_chunk = ""
-        
-        # 按段落分割
-        paragraphs = text.split('\n\n')
-        
-        for paragraph in paragraphs:
-            if len(current_chunk) + len(paragraph) + 2 <= max_length:
-                if current_chunk:
-                    current_chunk += '\n\n'
-                current_chunk += paragraph
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = paragraph
-                else:
-                    # 单个段落太长，强制分割
-                    chunks.append(paragraph[:max_length])
-                    current_chunk = paragraph[max_length:]
-        
-        if current_chunk:
-            chunks.append(current_chunk)
-        
-        return chunks 
+        if budget is None:
+            budget = ChunkBudget(max_length, UNIT_CHARS) if max_length else budget_for("dialogue")
+        return split_text(text, budget) or [text]
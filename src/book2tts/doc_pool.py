@@ -0,0 +1,241 @@
+"""打开的书籍文档句柄池。
+
+PDF / EPUB 文档按 (路径, 修改时间) 复用，文件被替换后自动打开新版本。
+池子按字节预算（以文件大小估算占用）和空闲时长淘汰句柄；使用方通过 lease()
+独占借用一个句柄，同一文档不会被多个线程同时操作。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+logger = logging.getLogger("book2tts.doc_pool")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+# 所有句柄合计的字节预算，默认 512MB
+DEFAULT_POOL_BUDGET = 512 * 1024 * 1024
+# 空闲超过该秒数的句柄被关闭
+DEFAULT_IDLE_SECONDS = 300
+
+
+@dataclass
+class _Handle:
+    doc: Any
+    size: int
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    leases: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    # 通过 get() 交出去、生命周期不受池控制的句柄，淘汰时不主动关闭
+    shared: bool = False
+    retired: bool = False
+
+
+class DocumentPool:
+    """
+    线程安全的文档句柄池。
+
+    Args:
+        opener: 打开文档的函数，参数为路径
+        budget_bytes: 句柄合计字节预算，超出时按最近最少使用淘汰空闲句柄
+        idle_seconds: 空闲超过该秒数的句柄在下次访问时被关闭，0 表示不按空闲淘汰
+        name: 日志和统计中使用的名称
+    """
+
+    def __init__(
+        self,
+        opener: Callable[[str], Any],
+        budget_bytes: Optional[int] = None,
+        idle_seconds: Optional[int] = None,
+        name: str = "documents",
+    ):
+        self.opener = opener
+        self.budget_bytes = (
+            _env_int("DOC_POOL_MAX_BYTES", DEFAULT_POOL_BUDGET) if budget_bytes is None else budget_bytes
+        )
+        self.idle_seconds = (
+            _env_int("DOC_POOL_IDLE_SECONDS", DEFAULT_IDLE_SECONDS) if idle_seconds is None else idle_seconds
+        )
+        self.name = name
+        self._handles: "OrderedDict[Tuple[str, float], _Handle]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._opening: Dict[Tuple[str, float], threading.Event] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # ----- 借用 ------------------------------------------------------------
+
+    @contextmanager
+    def lease(self, path: str) -> Iterator[Any]:
+        """独占借用文档句柄，退出上下文后归还。"""
+        handle = self._acquire(os.fspath(path))
+        try:
+            with handle.lock:
+                yield handle.doc
+        finally:
+            self._release(handle)
+
+    def get(self, path: str) -> Any:
+        """
+        返回共享的文档对象，不加锁。
+
+        仅用于单线程的只读访问（如命令行工具）；并发场景应使用 lease()。
+        """
+        handle = self._acquire(os.fspath(path))
+        handle.shared = True
+        self._release(handle)
+        return handle.doc
+
+    def _acquire(self, path: str) -> _Handle:
+        key = (path, os.path.getmtime(path))
+        while True:
+            with self._lock:
+                handle = self._handles.get(key)
+                if handle is not None:
+                    self._stats["hits"] += 1
+                    handle.leases += 1
+                    handle.last_used = time.monotonic()
+                    self._handles.move_to_end(key)
+                    return handle
+
+                opening = self._opening.get(key)
+                if opening is None:
+                    # 由当前线程负责打开，其他线程等待结果，同一文件不会被重复打开
+                    self._stats["misses"] += 1
+                    self._opening[key] = threading.Event()
+                    self._invalidate_older(path, key)
+                    break
+            opening.wait()
+
+        try:
+            doc = self.opener(path)
+        except BaseException:
+            with self._lock:
+                self._opening.pop(key).set()
+            raise
+
+        handle = _Handle(doc=doc, size=self._estimate_size(path), leases=1)
+        with self._lock:
+            self._handles[key] = handle
+            self._opening.pop(key).set()
+            self._evict_locked()
+        return handle
+
+    def _release(self, handle: _Handle) -> None:
+        with self._lock:
+            handle.leases -= 1
+            handle.last_used = time.monotonic()
+            if handle.retired and handle.leases == 0:
+                self._close(handle)
+            else:
+                self._evict_locked()
+
+    # ----- 淘汰 ------------------------------------------------------------
+
+    @staticmethod
+    def _estimate_size(path: str) -> int:
+        try:
+            return max(os.path.getsize(path), 1)
+        except OSError:
+            return 1
+
+    def _invalidate_older(self, path: str, current_key: Tuple[str, float]) -> None:
+        for key in [k for k in self._handles if k[0] == path and k != current_key]:
+            self._stats["invalidations"] += 1
+            self._retire(key)
+
+    def _retire(self, key: Tuple[str, float]) -> None:
+        handle = self._handles.pop(key)
+        handle.retired = True
+        if handle.leases == 0:
+            self._close(handle)
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        if self.idle_seconds:
+            for key, handle in list(self._handles.items()):
+                if handle.leases == 0 and now - handle.last_used > self.idle_seconds:
+                    self._stats["evictions"] += 1
+                    self._retire(key)
+
+        total = sum(handle.size for handle in self._handles.values())
+        for key, handle in list(self._handles.items()):
+            # 预算之内至少保留最近使用的一个句柄
+            if total <= self.budget_bytes or len(self._handles) <= 1:
+                break
+            if handle.leases:
+                continue
+            total -= handle.size
+            self._stats["evictions"] += 1
+            self._retire(key)
+
+    def _close(self, handle: _Handle) -> None:
+        if handle.shared:
+            # 调用方可能仍持有该对象，交给垃圾回收
+            return
+        close = getattr(handle.doc, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug("关闭文档句柄失败: %s", e)
+
+    def evict_idle(self) -> None:
+        """立即淘汰空闲超时的句柄。"""
+        with self._lock:
+            self._evict_locked()
+
+    def clear(self) -> None:
+        """关闭所有未被借用的句柄，借用中的句柄在归还时关闭。"""
+        with self._lock:
+            for key in list(self._handles):
+                self._retire(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中/淘汰次数及当前占用。"""
+        with self._lock:
+            return dict(
+                self._stats,
+                name=self.name,
+                open=len(self._handles),
+                leased=sum(1 for handle in self._handles.values() if handle.leases),
+                bytes=sum(handle.size for handle in self._handles.values()),
+                budget_bytes=self.budget_bytes,
+            )
+
+
+_pools: Dict[str, Tuple[int, DocumentPool]] = {}
+_pools_lock = threading.Lock()
+
+
+def get_document_pool(name: str, opener: Callable[[str], Any]) -> DocumentPool:
+    """获取进程级共享的句柄池，fork 出的子进程会得到新的池。"""
+    pid = os.getpid()
+    entry = _pools.get(name)
+    if entry is None or entry[0] != pid:
+        with _pools_lock:
+            entry = _pools.get(name)
+            if entry is None or entry[0] != pid:
+                entry = (pid, DocumentPool(opener, name=name))
+                _pools[name] = entry
+    return entry[1]
+
+
+def document_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """当前进程所有句柄池的统计信息。"""
+    pid = os.getpid()
+    return {name: pool.stats() for name, (owner, pool) in list(_pools.items()) if owner == pid}
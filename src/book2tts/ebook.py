@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import mimetypes
 import posixpath
 import re
 import zipfile
+from collections import OrderedDict
 from dataclasses import dataclass
-from functools import lru_cache
 from typing import Dict, Iterable, List, Optional
 from urllib.parse import urldefrag
 from xml.etree import ElementTree as ET
@@ -13,6 +14,16 @@ import fitz  # PyMuPDF
 from bs4 import BeautifulSoup
 from ebooklib import epub
 
+from book2tts.doc_pool import get_document_pool
+from book2tts.epub_assets import AssetInfo
+from book2tts.epub_text import (
+    BACKEND_BS4,
+    BLOCK_LEVEL_TAGS,
+    ParsedDocument,
+    epub_text_backend,
+    normalize_text_lines,
+)
+
 
 ITEM_DOCUMENT = 9
 TEXT_MEDIA_TYPES = {
@@ -22,6 +33,8 @@ TEXT_MEDIA_TYPES = {
     "text/x-oeb1-document",
 }
 CONTAINER_NAMESPACE = {"container": "urn:oasis:names:tc:opendocument:xmlns:container"}
+# 每个 EPUB 句柄缓存的已解析文档数
+MAX_PARSED_DOCUMENTS = 8
 OPF_NAMESPACE = {
     "opf": "http://www.idpf.org/2007/opf",
     "dc": "http://purl.org/dc/elements/1.1/",
@@ -101,12 +114,14 @@ class PyMuPdfEpubAdapter:
 
     def __init__(self, filepath: str):
         self.filepath = filepath
-        self.doc = fitz.open(filepath)
+        # 打开 zip 只读取中央目录；PyMuPDF 文档（需要排版整本书）、OPF 清单和目录都在首次使用时才加载
         self._zip = zipfile.ZipFile(filepath, "r")
+        self._doc = None
+        self._package_loaded = False
         self._opf_path: Optional[str] = None
         self._opf_dir: str = ""
-        self.title: str = ""
-        self.language: str = ""
+        self._title: str = ""
+        self._language: str = ""
 
         self._items: List[EpubResource] = []
         self._items_by_key: Dict[str, EpubResource] = {}
@@ -116,9 +131,33 @@ class PyMuPdfEpubAdapter:
         self._nav_href: Optional[str] = None
         self._ncx_href: Optional[str] = None
         self._toc_cache: Optional[List] = None
+        # 最近解析过的文档，同一章节的多个目录条目共用一棵树
+        self._parsed_documents: "OrderedDict[str, ParsedDocument]" = OrderedDict()
+        # 清单之外按 zip 成员直接访问的资源
+        self._member_resources: Dict[str, EpubResource] = {}
+
+    @property
+    def doc(self):
+        """PyMuPDF 文档，仅在需要按排版页回退抽取文本时打开。"""
+        if self._doc is None:
+            self._doc = fitz.open(self.filepath)
+        return self._doc
+
+    @property
+    def title(self) -> str:
+        self._ensure_package()
+        return self._title
+
+    @property
+    def language(self) -> str:
+        self._ensure_package()
+        return self._language
 
-        self._parse_container()
-        self._parse_package()
+    def _ensure_package(self):
+        if not self._package_loaded:
+            self._parse_container()
+            self._parse_package()
+            self._package_loaded = True
 
     # ----- Parsing helpers -------------------------------------------------
 
@@ -149,10 +188,10 @@ class PyMuPdfEpubAdapter:
         if metadata is not None:
             title_el = metadata.find("dc:title", namespaces=OPF_NAMESPACE)
             if title_el is not None and title_el.text:
-                self.title = title_el.text.strip()
+                self._title = title_el.text.strip()
             language_el = metadata.find("dc:language", namespaces=OPF_NAMESPACE)
             if language_el is not None and language_el.text:
-                self.language = language_el.text.strip()
+                self._language = language_el.text.strip()
 
         manifest = root.find("opf:manifest", namespaces=OPF_NAMESPACE)
         if manifest is None:
@@ -206,10 +245,10 @@ class PyMuPdfEpubAdapter:
                 if ref_type:
                     self._guide_refs[ref_type] = resolved
 
-        if not self.title:
-            self.title = posixpath.basename(self.filepath)
-        if not self.language:
-            self.language = "und"
+        if not self._title:
+            self._title = posixpath.basename(self.filepath)
+        if not self._language:
+            self._language = "und"
 
     def _register_resource(self, resource: EpubResource):
         keys = {resource.zip_path, _normalize_lookup_key(resource.zip_path)}
@@ -226,42 +265,96 @@ class PyMuPdfEpubAdapter:
             if key:
                 self._items_by_key.setdefault(key, resource)
 
+    def close(self):
+        self._parsed_documents.clear()
+        self._zip.close()
+        if self._doc is not None:
+            self._doc.close()
+
     # ----- Public API mirrors ----------------------------------------------
 
     @property
     def items(self) -> Iterable[EpubResource]:
+        self._ensure_package()
         return list(self._items)
 
     def get_item_with_href(self, href: str) -> EpubResource:
         if not href:
             raise KeyError("Empty href")
-        candidates = set()
+        self._ensure_package()
         raw = href.strip()
-        candidates.add(raw)
-        candidates.add(raw.replace("_", "/"))
-        for candidate in list(candidates):
-            lookup_key = _normalize_lookup_key(candidate)
-            candidates.add(lookup_key)
-            fragment_stripped, _ = urldefrag(candidate)
-            candidates.add(fragment_stripped)
-            candidates.add(_normalize_lookup_key(fragment_stripped))
-
-        for candidate in candidates:
-            lookup = _normalize_lookup_key(candidate)
-            resource = self._items_by_key.get(lookup)
+        # 注册时已为每个资源生成了全部规范化键，这里按优先级直接查表
+        for candidate in (_normalize_lookup_key(raw), _normalize_lookup_key(raw.replace("_", "/"))):
+            resource = self._items_by_key.get(candidate)
             if resource:
                 return resource
         raise KeyError(href)
 
+    def get_asset(self, href: str) -> EpubResource:
+        """
+        按 zip 内路径取资源（图片、样式等），命中时不解析 OPF 清单。
+
+        路径不是 zip 成员时回退到清单中的 href 查找。
+        """
+        if not href:
+            raise KeyError("Empty href")
+        member = _normalize_lookup_key(href)
+        resource = self._member_resources.get(member)
+        if resource is not None:
+            return resource
+        if self._package_loaded:
+            resource = self._items_by_key.get(member)
+            if resource is not None:
+                return resource
+        try:
+            self._zip.getinfo(member)
+        except KeyError:
+            return self.get_item_with_href(href)
+        media_type = mimetypes.guess_type(member)[0] or "application/octet-stream"
+        resource = EpubResource(
+            zip_path=member,
+            media_type=media_type,
+            properties="",
+            zip_file=self._zip,
+            original_href=member,
+        )
+        self._member_resources[member] = resource
+        return resource
+
+    def asset_info(self, href: str) -> AssetInfo:
+        """资源的大小、CRC32 和媒体类型，只读取 zip 中央目录，不读取内容。"""
+        resource = self.get_asset(href)
+        info = self._zip.getinfo(resource.zip_path)
+        return AssetInfo(
+            member=resource.zip_path,
+            media_type=resource.media_type or "application/octet-stream",
+            size=info.file_size,
+            crc=info.CRC,
+        )
+
     @property
     def toc(self):
         if self._toc_cache is None:
+            self._ensure_package()
             self._toc_cache = self._build_toc()
         return self._toc_cache
 
     # ----- Content helpers -------------------------------------------------
 
+    def parsed_document(self, item: EpubResource) -> ParsedDocument:
+        """解析文档并缓存最近使用的若干个，重复读取同一章节时不再解析。"""
+        document = self._parsed_documents.get(item.zip_path)
+        if document is not None:
+            self._parsed_documents.move_to_end(item.zip_path)
+            return document
+        document = ParsedDocument(_decode_bytes(item.get_content()), item.media_type)
+        self._parsed_documents[item.zip_path] = document
+        while len(self._parsed_documents) > MAX_PARSED_DOCUMENTS:
+            self._parsed_documents.popitem(last=False)
+        return document
+
     def iter_document_items(self) -> Iterable[EpubResource]:
+        self._ensure_package()
         if self._spine_order:
             for href in self._spine_order:
                 resource = self._items_by_key.get(href)
@@ -277,6 +370,7 @@ class PyMuPdfEpubAdapter:
         normalized = _normalize_lookup_key(href)
         if not normalized:
             return ""
+        self._ensure_package()
 
         if self._spine_order:
             try:
@@ -486,6 +580,7 @@ def traverse_toc(items, toc):
 
 
 def _html_to_plain_text(content: str) -> str:
+    """BeautifulSoup 实现（EPUB_TEXT_BACKEND=bs4），默认使用 epub_text 中的 lxml 实现"""
     soup = BeautifulSoup(content, "html.parser")
 
     for a in soup.find_all("a"):
@@ -494,45 +589,6 @@ def _html_to_plain_text(content: str) -> str:
     for br in soup.find_all("br"):
         br.replace_with("\n")
 
-    block_level_tags = {
-        "address",
-        "article",
-        "aside",
-        "blockquote",
-        "canvas",
-        "dd",
-        "div",
-        "dl",
-        "dt",
-        "fieldset",
-        "figcaption",
-        "figure",
-        "footer",
-        "form",
-        "h1",
-        "h2",
-        "h3",
-        "h4",
-        "h5",
-        "h6",
-        "header",
-        "hgroup",
-        "hr",
-        "li",
-        "main",
-        "nav",
-        "noscript",
-        "ol",
-        "output",
-        "p",
-        "pre",
-        "section",
-        "table",
-        "tfoot",
-        "ul",
-        "video",
-    }
-
     parts: List[str] = []
 
     def walk(node):
@@ -548,40 +604,18 @@ def _html_to_plain_text(content: str) -> str:
                 parts.append("\n")
                 return
 
-            if name in block_level_tags:
+            if name in BLOCK_LEVEL_TAGS:
                 parts.append("\n")
 
             for child in node.children:
                 walk(child)
 
-            if name in block_level_tags:
+            if name in BLOCK_LEVEL_TAGS:
                 parts.append("\n")
 
     walk(soup.body or soup)
 
-    merged = "".join(parts)
-    lines = [line.rstrip() for line in merged.split("\n")]
-
-    while lines and not lines[0].strip():
-        lines.pop(0)
-    while lines and not lines[-1].strip():
-        lines.pop()
-
-    normalized_lines = []
-    blank_pending = False
-    for line in lines:
-        if line.strip():
-            if blank_pending and normalized_lines:
-                normalized_lines.append("")
-            blank_pending = False
-            normalized_lines.append(line)
-        else:
-            blank_pending = True
-
-    if blank_pending and normalized_lines:
-        normalized_lines.append("")
-
-    return "\n".join(normalized_lines)
+    return normalize_text_lines("".join(parts))
 
 
 def _split_href_and_fragment(href: str) -> tuple[str, Optional[str]]:
@@ -664,7 +698,16 @@ def _extract_fragment_html(content_text: str, fragment: Optional[str], end_fragm
     return "".join(nodes_html)
 
 
-def get_content_with_href(book: PyMuPdfEpubAdapter, href: str, end_fragment: Optional[str] = None):
+def _parsed_document(book, item) -> ParsedDocument:
+    parsed = getattr(book, "parsed_document", None)
+    if callable(parsed):
+        return parsed(item)
+    return ParsedDocument(_decode_bytes(item.get_content()), getattr(item, "media_type", None))
+
+
+def get_content_with_href(
+    book: PyMuPdfEpubAdapter, href: str, end_fragment: Optional[str] = None, backend: Optional[str] = None
+):
     base_href, fragment = _split_href_and_fragment(href)
     h = base_href
 
@@ -675,10 +718,12 @@ def get_content_with_href(book: PyMuPdfEpubAdapter, href: str, end_fragment: Opt
         return fallback_text or f"No content found for href: {href}"
 
     try:
-        content_bytes = item.get_content()
-        content_text = _decode_bytes(content_bytes)
-        fragment_html = _extract_fragment_html(content_text, fragment, end_fragment and end_fragment.strip())
-        return _html_to_plain_text(fragment_html)
+        end_fragment = end_fragment and end_fragment.strip()
+        if (backend or epub_text_backend()) == BACKEND_BS4:
+            content_text = _decode_bytes(item.get_content())
+            fragment_html = _extract_fragment_html(content_text, fragment, end_fragment)
+            return _html_to_plain_text(fragment_html)
+        return _parsed_document(book, item).fragment_text(fragment, end_fragment)
     except Exception as exc:  # noqa: BLE001
         fallback_text = book.extract_text_by_href(h)
         return fallback_text or f"Error extracting content: {exc}"
@@ -706,6 +751,27 @@ def ebook_pages(book: PyMuPdfEpubAdapter):
     return pages
 
 
-@lru_cache(maxsize=10)
+def ebook_page_range(book: PyMuPdfEpubAdapter, start: int, end: Optional[int] = None):
+    """spine 中 [start, end) 范围内的文档页面，只列出条目，不读取内容"""
+    pages = ebook_pages(book)
+    return pages[max(start, 0):end]
+
+
+def get_contents_by_page_range(book: PyMuPdfEpubAdapter, start: int, end: Optional[int] = None) -> List[str]:
+    """抽取 [start, end) 范围内各文档页面的纯文本，只解析范围内的文档"""
+    return [get_content_with_href(book, page["href"]) for page in ebook_page_range(book, start, end)]
+
+
+def ebook_pool():
+    """进程内共享的EPUB句柄池"""
+    return get_document_pool("epub", PyMuPdfEpubAdapter)
+
+
+def lease_ebook(filepath):
+    """独占借用EPUB句柄，用法: with lease_ebook(path) as book: ..."""
+    return ebook_pool().lease(filepath)
+
+
 def open_ebook(filepath):
-    return PyMuPdfEpubAdapter(filepath)
+    """返回共享的EPUB对象（不加锁），并发场景请使用 lease_ebook"""
+    return ebook_pool().get(filepath)
@@ -7,6 +7,9 @@ import tempfile
 import ffmpeg
 from typing import Iterator, Optional, Dict, Any, List
 
+from .rate_limiter import get_rate_limiter
+from .text_chunker import UNIT_CHARS, ChunkBudget, budget_for, iter_chunks
+
 
 class EdgeTTS:
     def __init__(self, voice_name: str, rate: str = "+0%"):
@@ -44,6 +47,7 @@ class EdgeTTS:
                 print(f"[synthesize_with_subtitles_v2] Output file: {output_file}")
                 print(f"[synthesize_with_subtitles_v2] Subtitle file: {subtitle_file}")
 
+                await get_rate_limiter("edge_tts").aacquire()
                 communicate = edge_tts.Communicate(
                     text, self.voice_name, rate=self.rate, boundary="WordBoundary"
                 )
@@ -161,7 +165,8 @@ class EdgeTTS:
         text: str,
         output_file: str,
         subtitle_file: str = None,
-        segment_length: int = 2000,
+        segment_length: Optional[int] = None,
+        budget: Optional[ChunkBudget] = None,
         retry_count: int = 3,
         words_in_cue: int = 10,
     ) -> Dict[str, Any]:
@@ -172,7 +177,8 @@ class EdgeTTS:
             text: 文本内容
             output_file: 输出音频文件路径
             subtitle_file: 输出字幕文件路径（可选）
-            segment_length: 段落长度
+            segment_length: 每段最大字符数（兼容旧参数）
+            budget: 分段预算，默认按字节预算切分
             retry_count: 重试次数
             words_in_cue: 每个字幕条目的单词数
 
@@ -189,7 +195,7 @@ class EdgeTTS:
             temp_dir = tempfile.mkdtemp(prefix="long_tts_subtitles_")
 
             # 分段处理文本
-            segments = list(self._text_to_segments(text, segment_length))
+            segments = list(self._text_to_segments(text, segment_length, budget))
             total_segments = len(segments)
 
             if total_segments == 0:
@@ -447,8 +453,6 @@ class EdgeTTS:
 
     def _clean_subtitle_text(self, text: str) -> str:
         """清理字幕文本中的多余空格"""
-        import re
-
         # 去除所有空格
         text = re.sub(r"\s+", "", text)
 
@@ -464,6 +468,7 @@ class EdgeTTS:
             print(f"[_fallback_subtitle_generation] Output file: {output_file}")
             print(f"[_fallback_subtitle_generation] Subtitle file: {subtitle_file}")
 
+            await get_rate_limiter("edge_tts").aacquire()
             communicate = edge_tts.Communicate(
                 text, self.voice_name, boundary="WordBoundary"
             )
@@ -534,6 +539,7 @@ class EdgeTTS:
         """
         for attempt in range(retry_count):
             try:
+                await get_rate_limiter("edge_tts").aacquire()
                 communicate = edge_tts.Communicate(
                     text, self.voice_name, rate=self.rate, boundary="WordBoundary"
                 )
@@ -551,37 +557,28 @@ class EdgeTTS:
 
         return False
 
-    def _text_to_segments(self, text: str, max_length: int = 1000) -> Iterator[str]:
+    def _text_to_segments(
+        self,
+        text: str,
+        max_length: Optional[int] = None,
+        budget: Optional[ChunkBudget] = None,
+    ) -> Iterator[str]:
         """
-        将文本转换为段落迭代器
+        将文本按句子、段落边界转换为段落迭代器
         :param text: 输入文本
-        :param max_length: 每段最大长度
+        :param max_length: 每段最大字符数（兼容旧参数，优先级低于 budget）
+        :param budget: 分段预算，默认使用 edge_tts 的字节预算
         :return: 文本段落迭代器
         """
-        current_segment = []
-        current_length = 0
-
-        # 按句号、感叹号、问号分割
-        sentences = re.split("\n", text)
-
-        for i in range(0, len(sentences), 2):
-            if i + 1 < len(sentences):
-                sentence = sentences[i] + sentences[i + 1]
-            else:
-                sentence = sentences[i]
-
-            sentence_length = len(sentence)
-
-            if current_length + sentence_length > max_length and current_segment:
-                yield "".join(current_segment)
-                current_segment = [sentence]
-                current_length = sentence_length
-            else:
-                current_segment.append(sentence)
-                current_length += sentence_length
-
-        if current_segment:
-            yield "".join(current_segment)
+        if budget is None:
+            budget = (
+                ChunkBudget(max_length, UNIT_CHARS)
+                if max_length
+                else budget_for("edge_tts")
+            )
+        for segment in iter_chunks(text, budget):
+            if segment.strip():
+                yield segment
 
     def _synthesize_to_file(
         self, text: str, output_file: str, retry_count: int = 3
@@ -596,6 +593,7 @@ class EdgeTTS:
 
         for attempt in range(retry_count):
             try:
+                get_rate_limiter("edge_tts").acquire()
                 communicate = edge_tts.Communicate(
                     text, self.voice_name, rate=self.rate, boundary="WordBoundary"
                 )
@@ -628,13 +626,18 @@ class EdgeTTS:
         return
 
     def synthesize_long_text(
-        self, text: str, output_file: str, segment_length: int = 2000
+        self,
+        text: str,
+        output_file: str,
+        segment_length: Optional[int] = None,
+        budget: Optional[ChunkBudget] = None,
     ) -> bool:
         """
         合成长文本
         :param text: 输入文本
         :param output_file: 输出文件路径
-        :param segment_length: 段落长度
+        :param segment_length: 每段最大字符数（兼容旧参数）
+        :param budget: 分段预算，默认按字节预算切分
         :return: 是否成功
         """
         temp_files = []
@@ -643,12 +646,12 @@ class EdgeTTS:
             temp_dir = tempfile.mkdtemp()
             print(f"tmp_dir: {temp_dir}")
             total_segments = sum(
-                1 for _ in self._text_to_segments(text, segment_length)
+                1 for _ in self._text_to_segments(text, segment_length, budget)
             )
 
             # 处理每个文本段落
             for i, segment in enumerate(
-                self._text_to_segments(text, segment_length), 1
+                self._text_to_segments(text, segment_length, budget), 1
             ):
                 # 创建临时文件
                 temp_file = os.path.join(temp_dir, f"segment_{i}.mp3")
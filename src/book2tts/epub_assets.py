@@ -0,0 +1,163 @@
+"""EPUB 内资源（图片、样式、字体）的缓存与流式读取。
+
+zip 中央目录里每个成员都记录了内容的 CRC32 和大小，不读取内容就能得到强 ETag，
+也能作为资源地址中的版本号：带版本号的地址内容不会变化，可以长期缓存。
+资源按块从 zip 成员流式读取，不整体载入内存；阅读器需要的缩小图片按宽度档位
+缩放一次后写入磁盘缓存。
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+import zipfile
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+# 缩放的目标宽度档位，请求的宽度向上取整到档位，避免同一图片产生过多缓存版本
+IMAGE_WIDTHS = (480, 720, 960, 1280, 1600, 1920)
+
+# 可以缩放的位图格式 -> Pillow 输出格式；SVG 和 GIF（可能是动图）原样返回
+_SCALABLE_IMAGE_TYPES = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/webp": "WEBP",
+}
+_JPEG_QUALITY = 85
+
+
+@dataclass(frozen=True)
+class AssetInfo:
+    """zip 成员的元数据，来自中央目录。"""
+
+    member: str
+    media_type: str
+    size: int
+    crc: int
+
+    @property
+    def version(self) -> str:
+        """内容版本号，用于资源地址。"""
+        return f"{self.crc:08x}{self.size:x}"
+
+
+def asset_etag(book_hash: str, info: AssetInfo, width: Optional[int] = None) -> str:
+    """强 ETag：书籍内容哈希、成员内容校验和及缩放宽度唯一确定响应内容。"""
+    suffix = f"-w{width}" if width else ""
+    return f'"{book_hash}-{info.version}{suffix}"'
+
+
+def scaled_width(requested: Optional[int]) -> Optional[int]:
+    """把请求的宽度归到档位，超过最大档位时取最大档位，无效值返回 None。"""
+    if not requested or requested <= 0:
+        return None
+    for width in IMAGE_WIDTHS:
+        if requested <= width:
+            return width
+    return IMAGE_WIDTHS[-1]
+
+
+def is_scalable_image(media_type: str) -> bool:
+    return media_type in _SCALABLE_IMAGE_TYPES
+
+
+class _MemberStream:
+    """
+    zip 成员的只读流，关闭时同时关闭所属的 zip 文件。
+
+    不提供 tell/seek：压缩成员定位到末尾需要解压全部内容，
+    Content-Length 由调用方按中央目录中的大小设置。
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, member: str):
+        self._archive = archive
+        self._stream = archive.open(member)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._archive.close()
+
+
+def open_asset_stream(epub_path: str, member: str) -> _MemberStream:
+    """
+    打开资源的流式读取。
+
+    使用独立的 zip 句柄，响应发送期间不占用句柄池中的 EPUB 对象。
+    """
+    archive = zipfile.ZipFile(epub_path, "r")
+    try:
+        return _MemberStream(archive, member)
+    except Exception:
+        archive.close()
+        raise
+
+
+def downscale_image(data: bytes, media_type: str, max_width: int) -> Optional[bytes]:
+    """
+    把图片缩小到不超过 max_width 的宽度。
+
+    不是可缩放的位图、本身不超过该宽度或无法解码时返回 None，调用方返回原图。
+    """
+    output_format = _SCALABLE_IMAGE_TYPES.get(media_type)
+    if output_format is None:
+        return None
+
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= max_width:
+                return None
+            height = max(1, round(image.height * max_width / image.width))
+            resized = image.resize((max_width, height), Image.LANCZOS)
+            if output_format == "JPEG" and resized.mode not in ("RGB", "L"):
+                resized = resized.convert("RGB")
+            buffer = io.BytesIO()
+            if output_format == "JPEG":
+                resized.save(buffer, format=output_format, quality=_JPEG_QUALITY, optimize=True)
+            else:
+                resized.save(buffer, format=output_format, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return buffer.getvalue()
+
+
+class AssetImageCache:
+    """缩小后图片的磁盘缓存，按 书籍哈希/成员版本/宽度 存放。"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, book_hash: str, info: AssetInfo, width: int) -> str:
+        extension = os.path.splitext(info.member)[1] or ".img"
+        return os.path.join(self.root, "epub_assets", book_hash[:2], book_hash, f"{info.version}-w{width}{extension}")
+
+    def get_or_scale(self, epub_path: str, book_hash: str, info: AssetInfo, width: int) -> Tuple[Optional[str], int]:
+        """
+        返回 (缓存文件路径, 文件大小)；图片无需缩小时返回 (None, 0)，调用方直接返回原图。
+
+        无需缩小的结果也会记下（写入空文件），之后的请求不再读取和解码原图。
+        """
+        path = self.path(book_hash, info, width)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        if size is not None:
+            return (path, size) if size else (None, 0)
+
+        with zipfile.ZipFile(epub_path, "r") as archive:
+            data = downscale_image(archive.read(info.member), info.media_type, width)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data or b"")
+        os.replace(tmp_path, path)
+        return (path, len(data)) if data else (None, 0)
@@ -0,0 +1,322 @@
+"""整本 EPUB 的章节文本抽取。
+
+按目录把全书划分为首尾相接的章节：每个目录条目从它的锚点开始，到下一个位置更靠后的
+目录条目为止，中间跨越的 spine 文档整篇计入。抽取按 spine 文档分批交给进程池，
+每个文档只解析一次，同一文档内的多个章节片段从同一棵树中切出；结果按目录顺序返回，
+并给出每章在全书文本（章节以 CHAPTER_SEPARATOR 连接）中的字符偏移。
+
+在守护进程中（如 Celery prefork 工作进程）无法创建子进程，此时在当前进程内顺序抽取。
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from book2tts.ebook import _decode_bytes, _split_href_and_fragment, lease_ebook
+from book2tts.epub_text import ParsedDocument
+
+
+logger = logging.getLogger("book2tts.epub_chapters")
+
+CHAPTER_SEPARATOR = "\n\n"
+
+# 文档数少于该值时不启动进程池，进程启动开销超过并行收益
+MIN_PARALLEL_DOCUMENTS = 16
+# 每个工作进程分到的批次数，批次越小负载越均衡，进程间通信越多
+BATCHES_PER_WORKER = 4
+
+# 文档片段类型：整篇、从锚点到文档末尾、两个锚点之间、文档开头到锚点
+SLICE_FULL = "full"
+SLICE_FROM = "from"
+SLICE_RANGE = "range"
+SLICE_PREFIX = "prefix"
+
+# (类型, 起始锚点, 结束锚点)
+DocumentSlice = Tuple[str, Optional[str], Optional[str]]
+
+
+@dataclass
+class ChapterText:
+    """一个目录条目的文本及其在全书文本中的位置 [start, end)。"""
+
+    index: int
+    title: str
+    href: str
+    level: int
+    text: str
+    start: int = 0
+    end: int = 0
+
+
+def _flatten_toc(items, level: int = 0, entries: Optional[List[Tuple[str, str, int]]] = None):
+    """展开目录树为 (标题, href, 层级) 列表，保留锚点。"""
+    entries = [] if entries is None else entries
+    for item in items:
+        if isinstance(item, tuple):
+            section, children = item
+            entries.append((section.title or "", section.href or "", level))
+            _flatten_toc(children, level + 1, entries)
+        else:
+            entries.append((getattr(item, "title", "") or "", getattr(item, "href", "") or "", level))
+    return entries
+
+
+def plan_chapters(book) -> Tuple[List[Dict], List[str]]:
+    """
+    计算各章节由哪些文档片段组成。
+
+    Returns:
+        (章节列表, spine 文档路径列表)；章节包含 title / href / level 和
+        pieces: [(文档下标, DocumentSlice), ...]。没有目录时每个 spine 文档作为一章。
+    """
+    documents = [item.get_name() for item in book.iter_document_items()]
+    document_index = {name: i for i, name in enumerate(documents)}
+
+    positions = []
+    for title, href, level in _flatten_toc(book.toc):
+        base_href, fragment = _split_href_and_fragment(href)
+        try:
+            doc = document_index.get(book.get_item_with_href(base_href).get_name())
+        except KeyError:
+            doc = None
+        if doc is None:
+            # 不在 spine 中的条目（如封面图片、外部链接）跳过
+            continue
+        positions.append((title, href, level, doc, fragment or None))
+
+    if not positions:
+        return [
+            {"title": name, "href": name, "level": 0, "pieces": [(i, (SLICE_FULL, None, None))]}
+            for i, name in enumerate(documents)
+        ], documents
+
+    chapters = []
+    for i, (title, href, level, doc, fragment) in enumerate(positions):
+        # 结束位置：后续第一个位于更靠后文档、或同一文档中不同锚点的条目
+        end_doc, end_fragment = len(documents), None
+        for _, _, _, next_doc, next_fragment in positions[i + 1:]:
+            if next_doc > doc or (next_doc == doc and next_fragment and next_fragment != fragment):
+                end_doc, end_fragment = next_doc, next_fragment
+                break
+
+        if end_doc == doc:
+            pieces = [(doc, (SLICE_RANGE, fragment, end_fragment))]
+        else:
+            pieces = [(doc, (SLICE_FROM, fragment, None) if fragment else (SLICE_FULL, None, None))]
+            pieces.extend((d, (SLICE_FULL, None, None)) for d in range(doc + 1, end_doc))
+            if end_fragment and end_doc < len(documents):
+                pieces.append((end_doc, (SLICE_PREFIX, None, end_fragment)))
+        chapters.append({"title": title, "href": href, "level": level, "pieces": pieces})
+    return chapters, documents
+
+
+def _slice_text(document: ParsedDocument, piece: DocumentSlice) -> str:
+    kind, fragment, end_fragment = piece
+    if kind == SLICE_FULL:
+        return document.text()
+    if kind == SLICE_PREFIX:
+        return document.prefix_text(end_fragment)
+    return document.fragment_text(fragment, end_fragment)
+
+
+def _extract_batch(
+    epub_path: str, batch: Sequence[Tuple[str, Sequence[DocumentSlice]]]
+) -> List[List[str]]:
+    """抽取一批文档的片段文本，在工作进程中执行。"""
+    results = []
+    with lease_ebook(epub_path) as book:
+        for name, pieces in batch:
+            try:
+                item = book.get_item_with_href(name)
+            except KeyError:
+                # 与 get_content_with_href 一致，清单中找不到时按 PyMuPDF 排版页回退
+                fallback_text = book.extract_text_by_href(name) or f"No content found for href: {name}"
+                results.append([fallback_text] * len(pieces))
+                continue
+            # 每个文档只在本批次中使用，不放入句柄的解析缓存
+            document = ParsedDocument(_decode_bytes(item.get_content()), item.media_type)
+            results.append([_slice_text(document, piece) for piece in pieces])
+    return results
+
+
+def _default_workers() -> int:
+    configured = os.environ.get("EPUB_EXTRACT_WORKERS")
+    if configured:
+        try:
+            return max(0, int(configured))
+        except ValueError:
+            pass
+    return min(8, os.cpu_count() or 1)
+
+
+class EpubChapterExtractor:
+    """基于进程池的 EPUB 文档片段抽取服务。"""
+
+    def __init__(self, max_workers: Optional[int] = None, start_method: Optional[str] = None):
+        self.max_workers = _default_workers() if max_workers is None else max(0, max_workers)
+        # pymupdf 不适合在多线程进程中 fork，默认使用 spawn
+        self.start_method = start_method or "spawn"
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.max_workers > 0 and not multiprocessing.current_process().daemon
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._executor
+
+    def extract(
+        self, epub_path: str, requests: Sequence[Tuple[str, Sequence[DocumentSlice]]]
+    ) -> List[List[str]]:
+        """
+        抽取各文档的片段文本。
+
+        Args:
+            epub_path: EPUB 文件路径
+            requests: [(文档路径, [DocumentSlice, ...]), ...]
+
+        Returns:
+            与 requests 一一对应的片段文本列表
+        """
+        epub_path = os.fspath(epub_path)
+        if not self.uses_processes or len(requests) < MIN_PARALLEL_DOCUMENTS:
+            return _extract_batch(epub_path, requests)
+
+        batch_count = min(len(requests), self.max_workers * BATCHES_PER_WORKER)
+        size = -(-len(requests) // batch_count)
+        batches = [requests[i:i + size] for i in range(0, len(requests), size)]
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(_extract_batch, epub_path, batch) for batch in batches]
+            results: List[List[str]] = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        except BrokenProcessPool:
+            # 工作进程异常退出，重建进程池后在当前进程内完成本次抽取
+            logger.warning("EPUB extraction pool broken, falling back to in-process extraction")
+            self.shutdown(executor)
+            return _extract_batch(epub_path, requests)
+
+    def shutdown(self, executor: Optional[ProcessPoolExecutor] = None) -> None:
+        with self._lock:
+            if self._executor is not None and executor in (None, self._executor):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_extractor: Optional[EpubChapterExtractor] = None
+_extractor_pid: Optional[int] = None
+_extractor_lock = threading.Lock()
+
+
+def get_chapter_extractor() -> EpubChapterExtractor:
+    """获取进程级共享的抽取服务，工作进程数由 EPUB_EXTRACT_WORKERS 配置。"""
+    global _extractor, _extractor_pid
+
+    pid = os.getpid()
+    if _extractor is None or _extractor_pid != pid:
+        with _extractor_lock:
+            if _extractor is None or _extractor_pid != pid:
+                _extractor = EpubChapterExtractor()
+                _extractor_pid = pid
+    return _extractor
+
+
+def extract_book_chapters(
+    epub_path: str,
+    indices: Optional[Sequence[int]] = None,
+    extractor: Optional[EpubChapterExtractor] = None,
+) -> List[ChapterText]:
+    """
+    按目录顺序抽取整本书（或指定章节）的文本。
+
+    Args:
+        epub_path: EPUB 文件路径
+        indices: 只抽取这些章节（plan_chapters 中的下标），默认全部
+        extractor: 抽取服务，默认使用进程级共享实例
+
+    Returns:
+        ChapterText 列表，start / end 为各章在所选章节以 CHAPTER_SEPARATOR 连接后的文本中的偏移
+    """
+    with lease_ebook(epub_path) as book:
+        chapters, documents = plan_chapters(book)
+
+    selected = range(len(chapters)) if indices is None else [i for i in indices if 0 <= i < len(chapters)]
+
+    # 同一文档的相同片段只抽取一次
+    slices: Dict[int, List[DocumentSlice]] = {}
+    for i in selected:
+        for doc, piece in chapters[i]["pieces"]:
+            doc_slices = slices.setdefault(doc, [])
+            if piece not in doc_slices:
+                doc_slices.append(piece)
+
+    order = sorted(slices)
+    results = (extractor or get_chapter_extractor()).extract(
+        epub_path, [(documents[doc], slices[doc]) for doc in order]
+    )
+    texts = {
+        (doc, piece): text
+        for doc, doc_texts in zip(order, results)
+        for piece, text in zip(slices[doc], doc_texts)
+    }
+
+    output: List[ChapterText] = []
+    offset = 0
+    for i in selected:
+        chapter = chapters[i]
+        parts = [texts[(doc, piece)] for doc, piece in chapter["pieces"]]
+        text = CHAPTER_SEPARATOR.join(part for part in parts if part.strip())
+        if output:
+            offset += len(CHAPTER_SEPARATOR)
+        output.append(
+            ChapterText(
+                index=i,
+                title=chapter["title"],
+                href=chapter["href"],
+                level=chapter["level"],
+                text=text,
+                start=offset,
+                end=offset + len(text),
+            )
+        )
+        offset += len(text)
+    return output
+
+
+def extract_document_texts(
+    epub_path: str,
+    hrefs: Optional[Sequence[str]] = None,
+    extractor: Optional[EpubChapterExtractor] = None,
+) -> List[str]:
+    """
+    抽取 spine 文档（或指定 href 的文档片段）的纯文本，结果与输入顺序一致。
+
+    href 可以带锚点，此时与 get_content_with_href 一样从锚点取到文档末尾。
+    """
+    if hrefs is None:
+        with lease_ebook(epub_path) as book:
+            hrefs = [item.get_name() for item in book.iter_document_items()]
+
+    requests = []
+    for href in hrefs:
+        base_href, fragment = _split_href_and_fragment(href)
+        piece = (SLICE_FROM, fragment, None) if fragment else (SLICE_FULL, None, None)
+        requests.append((base_href, [piece]))
+    results = (extractor or get_chapter_extractor()).extract(epub_path, requests)
+    return [texts[0] for texts in results]
@@ -0,0 +1,317 @@
+"""EPUB 文档的纯文本抽取。
+
+lxml 后端：每个 XHTML 文档只解析一次，整篇文本和各锚点片段都从同一棵树中切出，
+锚点按 id/name 建一次索引后直接定位，不再为每个目录条目重新解析。
+语义与原有 BeautifulSoup 实现一致：<a> 连同其文字被丢弃，<br> 换行，
+块级元素前后换行，首尾空行去掉、连续空行合并为一个。
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from html.entities import name2codepoint
+from typing import Dict, List, Optional, Set, Union
+
+from lxml import etree
+from lxml import html as lxml_html
+
+
+BLOCK_LEVEL_TAGS = frozenset(
+    {
+        "address",
+        "article",
+        "aside",
+        "blockquote",
+        "canvas",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "fieldset",
+        "figcaption",
+        "figure",
+        "footer",
+        "form",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hgroup",
+        "hr",
+        "li",
+        "main",
+        "nav",
+        "noscript",
+        "ol",
+        "output",
+        "p",
+        "pre",
+        "section",
+        "table",
+        "tfoot",
+        "ul",
+        "video",
+    }
+)
+HEADING_TAGS = frozenset({"h1", "h2", "h3", "h4", "h5", "h6"})
+# 样式和脚本内容不是正文
+SKIPPED_TAGS = frozenset({"script", "style"})
+
+BACKEND_LXML = "lxml"
+BACKEND_BS4 = "bs4"
+
+_XML_DECLARATION_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+# XML 只认识 5 个预定义实体，XHTML 中常见的 &nbsp; 等需要先换成字符引用
+_NAMED_ENTITY_RE = re.compile(r"&([A-Za-z][A-Za-z0-9]*);")
+_XML_ENTITIES = frozenset({"amp", "lt", "gt", "quot", "apos"})
+
+_parsers = threading.local()
+
+
+def epub_text_backend() -> str:
+    """EPUB 文本抽取后端（EPUB_TEXT_BACKEND），默认 lxml，设为 bs4 使用原有实现。"""
+    backend = os.environ.get("EPUB_TEXT_BACKEND", BACKEND_LXML).strip().lower()
+    return backend if backend in (BACKEND_LXML, BACKEND_BS4) else BACKEND_LXML
+
+
+def normalize_text_lines(merged: str) -> str:
+    """去掉行尾空白、首尾空行，连续空行合并为一个。"""
+    lines = [line.rstrip() for line in merged.split("\n")]
+
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+
+    normalized_lines = []
+    blank_pending = False
+    for line in lines:
+        if line.strip():
+            if blank_pending and normalized_lines:
+                normalized_lines.append("")
+            blank_pending = False
+            normalized_lines.append(line)
+        else:
+            blank_pending = True
+
+    return "\n".join(normalized_lines)
+
+
+def _xml_parser() -> etree.XMLParser:
+    # lxml 的解析器对象不能跨线程共用
+    parser = getattr(_parsers, "xml", None)
+    if parser is None:
+        parser = etree.XMLParser(
+            recover=True,
+            remove_comments=True,
+            remove_pis=True,
+            no_network=True,
+            huge_tree=True,
+            encoding="utf-8",
+        )
+        _parsers.xml = parser
+    return parser
+
+
+def _replace_entity(match: "re.Match[str]") -> str:
+    name = match.group(1)
+    if name in _XML_ENTITIES or name not in name2codepoint:
+        return match.group(0)
+    return f"&#{name2codepoint[name]};"
+
+
+def parse_document(content: Union[str, bytes], media_type: Optional[str] = None):
+    """
+    解析 EPUB 中的 XHTML/HTML 文档，返回根元素。
+
+    XHTML 按 XML 解析（可容错），自闭合的 <a id="x"/> 等锚点不会吞掉后续正文；
+    text/html 或 XML 解析失败时按 HTML 解析。
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", errors="replace")
+    content = _XML_DECLARATION_RE.sub("", content, count=1)
+
+    root = None
+    if media_type != "text/html":
+        text = _NAMED_ENTITY_RE.sub(_replace_entity, content) if "&" in content else content
+        try:
+            root = etree.fromstring(text.encode("utf-8"), _xml_parser())
+        except etree.XMLSyntaxError:
+            root = None
+    if root is None:
+        root = lxml_html.document_fromstring(content or "<html></html>")
+    return root
+
+
+def _local_name(element) -> Optional[str]:
+    tag = element.tag
+    if not isinstance(tag, str):
+        return None
+    if tag[0] == "{":
+        tag = tag.rsplit("}", 1)[1]
+    return tag.lower()
+
+
+def _collect_text(element, parts: List[str]) -> None:
+    name = _local_name(element)
+    if name is None or name == "a" or name in SKIPPED_TAGS:
+        return
+    if name == "br":
+        parts.append("\n")
+        return
+
+    block = name in BLOCK_LEVEL_TAGS
+    if block:
+        parts.append("\n")
+    if element.text:
+        parts.append(element.text)
+    for child in element:
+        _collect_text(child, parts)
+        if child.tail:
+            parts.append(child.tail)
+    if block:
+        parts.append("\n")
+
+
+def element_text(element) -> str:
+    """单个元素（不含其 tail）的纯文本。"""
+    parts: List[str] = []
+    _collect_text(element, parts)
+    return normalize_text_lines("".join(parts))
+
+
+class ParsedDocument:
+    """
+    解析一次的 EPUB 文档，可反复取整篇文本或任意锚点区间的文本。
+
+    Args:
+        content: 文档内容，bytes 按 UTF-8 解码（其他编码请先解码为 str）
+        media_type: manifest 中声明的媒体类型，text/html 按 HTML 解析
+    """
+
+    def __init__(self, content: Union[str, bytes], media_type: Optional[str] = None):
+        self.root = parse_document(content, media_type)
+        self._text: Optional[str] = None
+        self._anchors: Optional[Dict[str, Dict[str, list]]] = None
+
+    @property
+    def body(self):
+        body = next(self.root.iter("{*}body"), None)
+        return self.root if body is None else body
+
+    def text(self) -> str:
+        """整篇文档的纯文本。"""
+        if self._text is None:
+            self._text = element_text(self.body)
+        return self._text
+
+    def _anchor_index(self) -> Dict[str, Dict[str, list]]:
+        """id / name / 页内链接 -> 元素列表（文档顺序），首次取片段时建立。"""
+        if self._anchors is None:
+            anchors: Dict[str, Dict[str, list]] = {"id": {}, "name": {}, "href": {}}
+            for element in self.root.iter(etree.Element):
+                attrib = element.attrib
+                if not attrib:
+                    continue
+                for key in ("id", "name"):
+                    value = attrib.get(key)
+                    if value is not None:
+                        anchors[key].setdefault(value, []).append(element)
+                href = attrib.get("href")
+                if href and href.startswith("#") and _local_name(element) == "a":
+                    anchors["href"].setdefault(href[1:], []).append(element)
+            self._anchors = anchors
+        return self._anchors
+
+    def _locate_fragment_start(self, fragment: str):
+        anchors = self._anchor_index()
+        targets = anchors["id"].get(fragment) or anchors["name"].get(fragment) or anchors["href"].get(fragment)
+        if not targets:
+            return None
+        target = targets[0]
+
+        if _local_name(target) in {"a", "span"}:
+            for ancestor in target.iterancestors():
+                if _local_name(ancestor) in HEADING_TAGS:
+                    return ancestor
+            parent = target.getparent()
+            # 避免回退到 <body>/<html> 级别，否则会导致整章被提取
+            if parent is not None and _local_name(parent) not in {"body", "html"}:
+                return parent
+        return target
+
+    def _fragment_stops(self, end_fragment: Optional[str]) -> Set:
+        """包含结束锚点的元素集合（锚点元素及其所有祖先）。"""
+        if not end_fragment or not end_fragment.strip():
+            return set()
+        anchors = self._anchor_index()
+        end_fragment = end_fragment.strip()
+        stops = set()
+        for element in anchors["id"].get(end_fragment, []) + anchors["name"].get(end_fragment, []):
+            stops.add(element)
+            stops.update(element.iterancestors())
+        return stops
+
+    def fragment_text(self, fragment: Optional[str], end_fragment: Optional[str] = None) -> str:
+        """
+        从 fragment 锚点所在元素开始，依次取其后的兄弟元素，直到遇到包含 end_fragment 的元素。
+
+        锚点不存在时返回整篇文本。
+        """
+        if not fragment or not fragment.strip():
+            return self.text()
+        start = self._locate_fragment_start(fragment.strip())
+        if start is None:
+            return self.text()
+
+        stops = self._fragment_stops(end_fragment)
+        parts: List[str] = []
+        current = start
+        while current is not None:
+            if current is not start and current in stops:
+                break
+            _collect_text(current, parts)
+            if current.tail:
+                parts.append(current.tail)
+            current = current.getnext()
+        return normalize_text_lines("".join(parts))
+
+    def prefix_text(self, end_fragment: Optional[str]) -> str:
+        """文档开头到 end_fragment 片段起点之前的文本，与 fragment_text 取到的内容互补。"""
+        if not end_fragment or not end_fragment.strip():
+            return self.text()
+        start = self._locate_fragment_start(end_fragment.strip())
+        body = self.body
+        if start is None or start is body:
+            return self.text()
+        chain = [start] + list(start.iterancestors())
+        if body not in chain:
+            return self.text()
+
+        # 从 body 逐层向下到片段起点，收集每一层中位于起点分支之前的内容
+        path = chain[: chain.index(body) + 1][::-1]
+        parts: List[str] = []
+        for element, next_element in zip(path, path[1:]):
+            if element.text:
+                parts.append(element.text)
+            for child in element:
+                if child is next_element:
+                    break
+                _collect_text(child, parts)
+                if child.tail:
+                    parts.append(child.tail)
+        return normalize_text_lines("".join(parts))
+
+    def fragment_texts(self, ranges) -> List[str]:
+        """批量切分多个 (fragment, end_fragment) 区间，共用同一棵树和锚点索引。"""
+        return [self.fragment_text(fragment, end_fragment) for fragment, end_fragment in ranges]
+
+
+def html_to_plain_text(content: Union[str, bytes], media_type: Optional[str] = None) -> str:
+    """整篇 HTML/XHTML 文档的纯文本。"""
+    return ParsedDocument(content, media_type).text()
@@ -0,0 +1,180 @@
+"""LLM 调用结果缓存，避免重复处理同一段文本时重复付费。
+
+缓存键由 (操作类型, 模型, 系统提示词哈希, 温度, 输入文本哈希) 组成，
+条目带有 TTL，并按条目数量和总字节数做 LRU 淘汰。
+
+默认缓存保存在进程内存中，Web 端在启动时替换为数据库缓存，使所有 Web / Celery 进程共享结果。
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+logger = logging.getLogger("book2tts.llm")
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def estimate_result_size(value: Dict[str, Any]) -> int:
+    """缓存条目的字节数（仅统计结果文本），用于总字节数上限。"""
+    result = value.get("result") or ""
+    return len(result.encode("utf-8")) if isinstance(result, str) else 0
+
+
+class LLMResultCache:
+    """线程安全的进程内 LLM 结果缓存（TTL + LRU）。"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @staticmethod
+    def make_key(
+        operation: str,
+        model: str,
+        system_prompt: str,
+        temperature: float,
+        user_content: str,
+    ) -> str:
+        """生成缓存键，提示词与输入只参与哈希，不以明文保存。"""
+        return "|".join(
+            (
+                operation,
+                model,
+                _hash_text(system_prompt),
+                f"{float(temperature):.3f}",
+                _hash_text(user_content),
+            )
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        size = estimate_result_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (
+                time.monotonic() + self.ttl_seconds,
+                size,
+                copy.deepcopy(value),
+            )
+            self._total_bytes += size
+
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._evictions += 1
+
+    def invalidate(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中等统计信息。"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "scope": "process",
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+
+_default_cache: Optional[LLMResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def llm_cache_options() -> Dict[str, Any]:
+    """从 LLM_CACHE_TTL、LLM_CACHE_MAX_ENTRIES、LLM_CACHE_MAX_BYTES 读取缓存参数。"""
+    return {
+        "ttl_seconds": float(os.environ.get("LLM_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+        "max_entries": int(os.environ.get("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        "max_bytes": int(os.environ.get("LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    }
+
+
+def set_default_llm_cache(cache: Optional[LLMResultCache]) -> None:
+    """替换共享缓存，例如在 Django 启动时切换为数据库缓存。"""
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_llm_cache() -> Optional[LLMResultCache]:
+    """获取共享缓存（默认为进程内缓存）；设置 LLM_CACHE_ENABLED=false 可关闭。"""
+    global _default_cache
+
+    if os.environ.get("LLM_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = LLMResultCache(**llm_cache_options())
+    return _default_cache
@@ -1,9 +1,16 @@
+import asyncio
 import logging
 import os
-from typing import Any, Dict, Optional
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
 
+import httpx
 import litellm
-from litellm import completion
+from litellm import acompletion, completion
+
+from .llm_cache import LLMResultCache, get_default_llm_cache
+from .rate_limiter import get_rate_limiter
 
 
 logger = logging.getLogger("book2tts.llm")
@@ -19,6 +26,19 @@ logger.setLevel(logging.INFO)
 logger.propagate = False
 
 
+# Marker line placed before every page of a multi-page OCR request
+OCR_PAGE_MARKER = "=== PAGE {index} ==="
+_OCR_PAGE_MARKER_RE = re.compile(r"^[ \t]*=+[ \t]*PAGE[ \t]+(\d+)[ \t]*=+[ \t]*$", re.MULTILINE | re.IGNORECASE)
+
+OCR_BATCH_SYSTEM_PROMPT = (
+    "You will receive {count} page images. Each image is preceded by a marker line "
+    "such as '=== PAGE 1 ==='. Transcribe the text of every page in reading order. "
+    "Start each page with its marker line on a line of its own, keep the pages in the "
+    "given order and output nothing besides the markers and the page text. "
+    "If a page contains no text, output only its marker line."
+)
+
+
 # Try to load environment variables from .env file
 try:
     from dotenv import load_dotenv
@@ -37,6 +57,7 @@ class LLMService:
         text_provider: Optional[str] = None,
         ocr_model_name: Optional[str] = None,
         text_model_name: Optional[str] = None,
+        cache: Optional[LLMResultCache] = None,
     ):
         """
         Initialize the LLM service with separate providers for OCR and text processing.
@@ -46,6 +67,7 @@ class LLMService:
             text_provider: The LLM provider name for text processing (default from env or "volcengine")
             ocr_model_name: The specific model name for the OCR provider
             text_model_name: The specific model name for the text provider
+            cache: Result cache for text calls (default: process-wide shared cache)
         """
         # OCR provider setup
         self.ocr_provider = ocr_provider or os.environ.get("OCR_PROVIDER", "volcengine")
@@ -73,6 +95,8 @@ class LLMService:
                 f"{self.text_provider.upper()}_API_KEY environment variable not set"
             )
 
+        self.cache = cache if cache is not None else get_default_llm_cache()
+
     def get_model_name(self, for_ocr: bool = True) -> str:
         """
         Get the full model name with provider and model.
@@ -142,6 +166,41 @@ class LLMService:
         except Exception:
             logger.debug("Failed to log LLM token usage", exc_info=True)
 
+    def _ocr_messages(self, image_data: str) -> List[Dict[str, Any]]:
+        return [
+            {"role": "system", "content": ""},
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_data},
+                    },
+                ],
+            },
+        ]
+
+    def _build_result(
+        self, response: Any, context: str, model_name: str, error: str
+    ) -> Dict[str, Any]:
+        """记录 token 用量并把 litellm 响应转换为统一的结果字典。"""
+        self._log_token_usage(
+            response=response,
+            context=context,
+            fallback_model=model_name,
+        )
+
+        usage_info = self._collect_usage_info(response)
+
+        if response and response.choices and len(response.choices) > 0:
+            return {
+                "success": True,
+                "result": response.choices[0].message.content,
+                "usage": usage_info,
+                "model": getattr(response, "model", model_name),
+            }
+        return {"success": False, "error": error}
+
     def perform_ocr(self, image_data: str, temperature: float = 0.2) -> Dict[str, Any]:
         """
         Perform OCR on an image using the configured LLM.
@@ -155,47 +214,227 @@ class LLMService:
         """
         try:
             model_name = self.get_model_name(for_ocr=True)
-            response = completion(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": ""},
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": image_data},
-                            },
-                        ],
-                    },
-                ],
-                temperature=temperature,
+            with get_rate_limiter("llm"):
+                response = completion(
+                    model=model_name,
+                    messages=self._ocr_messages(image_data),
+                    temperature=temperature,
+                )
+            return self._build_result(
+                response, "OCR", model_name, "Failed to get OCR result from LLM"
             )
 
-            self._log_token_usage(
-                response=response,
-                context="OCR",
-                fallback_model=model_name,
+        except Exception as e:
+            logger.error("LLM OCR call failed: %s", e, exc_info=True)
+            return {"success": False, "error": str(e)}
+
+    async def aperform_ocr(
+        self, image_data: str, temperature: float = 0.2
+    ) -> Dict[str, Any]:
+        """Async variant of :meth:`perform_ocr` backed by ``acompletion``."""
+        try:
+            model_name = self.get_model_name(for_ocr=True)
+            async with get_rate_limiter("llm"):
+                response = await acompletion(
+                    model=model_name,
+                    messages=self._ocr_messages(image_data),
+                    temperature=temperature,
+                )
+            return self._build_result(
+                response, "OCR", model_name, "Failed to get OCR result from LLM"
             )
 
-            usage_info = self._collect_usage_info(response)
+        except Exception as e:
+            logger.error("LLM OCR call failed: %s", e, exc_info=True)
+            return {"success": False, "error": str(e)}
 
-            if response and response.choices and len(response.choices) > 0:
-                return {
+    def _ocr_batch_messages(self, images: Sequence[str]) -> List[Dict[str, Any]]:
+        content: List[Dict[str, Any]] = []
+        for index, image_data in enumerate(images, start=1):
+            content.append({"type": "text", "text": OCR_PAGE_MARKER.format(index=index)})
+            content.append({"type": "image_url", "image_url": {"url": image_data}})
+        return [
+            {"role": "system", "content": OCR_BATCH_SYSTEM_PROMPT.format(count=len(images))},
+            {"role": "user", "content": content},
+        ]
+
+    async def _aperform_ocr_chunk(
+        self, images: Sequence[str], temperature: float
+    ) -> List[Dict[str, Any]]:
+        """OCR one group of pages in a single request, falling back to one call per page."""
+        if len(images) == 1:
+            result = await self.aperform_ocr(images[0], temperature)
+            result["batched"] = False
+            return [result]
+
+        model_name = self.get_model_name(for_ocr=True)
+        try:
+            async with get_rate_limiter("llm"):
+                response = await acompletion(
+                    model=model_name,
+                    messages=self._ocr_batch_messages(images),
+                    temperature=temperature,
+                )
+            result = self._build_result(
+                response, "OCR", model_name, "Failed to get OCR result from LLM"
+            )
+        except Exception as e:
+            logger.error("LLM batched OCR call failed: %s", e, exc_info=True)
+            result = {"success": False, "error": str(e)}
+
+        pages = split_ocr_pages(result.get("result") or "", len(images)) if result["success"] else None
+        if pages is not None:
+            # The request's token usage is reported on its first page only
+            return [
+                {
                     "success": True,
-                    "result": response.choices[0].message.content,
-                    "usage": usage_info,
-                    "model": getattr(response, "model", model_name),
+                    "result": text,
+                    "usage": result["usage"] if index == 0 else None,
+                    "model": result["model"],
+                    "batched": True,
                 }
-            else:
-                return {"success": False, "error": "Failed to get OCR result from LLM"}
+                for index, text in enumerate(pages)
+            ]
 
-        except Exception as e:
-            logger.error("LLM OCR call failed: %s", e, exc_info=True)
-            return {"success": False, "error": str(e)}
+        logger.warning(
+            "Could not split batched OCR response into %s pages, retrying page by page",
+            len(images),
+        )
+        fallback = []
+        for image_data in images:
+            page_result = await self.aperform_ocr(image_data, temperature)
+            page_result["batched"] = False
+            fallback.append(page_result)
+        return fallback
+
+    async def aperform_ocr_batch(
+        self,
+        images: Sequence[str],
+        temperature: float = 0.2,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        OCR several pages, packing up to ``batch_size`` images into each request.
+
+        Pages inside a request are separated by ``OCR_PAGE_MARKER`` lines and the
+        response is split back into pages. If a response cannot be split, that
+        group is retried one page per request.
+
+        Args:
+            images: Base64 data URLs of the page images
+            temperature: The temperature parameter for the LLM (default: 0.2)
+            batch_size: Pages per request (default from ``LLM_OCR_BATCH_SIZE``)
+            max_concurrency: Concurrent requests (default from ``LLM_MAX_CONCURRENCY``)
+
+        Returns:
+            One result per image, in input order, shaped like :meth:`perform_ocr`
+            results plus a ``batched`` flag
+        """
+        size = batch_size or default_ocr_batch_size()
+        chunks = [images[start:start + size] for start in range(0, len(images), size)]
+        chunk_results = await gather_bounded(
+            [lambda chunk=chunk: self._aperform_ocr_chunk(chunk, temperature) for chunk in chunks],
+            max_concurrency,
+        )
+        return [result for chunk in chunk_results for result in chunk]
+
+    def perform_ocr_batch(
+        self,
+        images: Sequence[str],
+        temperature: float = 0.2,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Synchronous wrapper of :meth:`aperform_ocr_batch` for non-async callers."""
+        return run_sync(
+            self.aperform_ocr_batch(images, temperature, batch_size, max_concurrency)
+        )
+
+    def _text_cache_key(
+        self,
+        cache_operation: Optional[str],
+        system_prompt: str,
+        user_content: str,
+        temperature: float,
+    ) -> Optional[str]:
+        if not cache_operation or self.cache is None:
+            return None
+        return self.cache.make_key(
+            cache_operation,
+            self.get_model_name(for_ocr=False),
+            system_prompt,
+            temperature,
+            user_content,
+        )
+
+    def forget_cached_text(
+        self,
+        cache_operation: str,
+        system_prompt: str,
+        user_content: str,
+        temperature: float = 0.7,
+    ) -> bool:
+        """
+        Drop a cached text result, e.g. when the caller could not use it.
+
+        Returns:
+            True if an entry was removed
+        """
+        cache_key = self._text_cache_key(
+            cache_operation, system_prompt, user_content, temperature
+        )
+        if cache_key is None:
+            return False
+        return self.cache.invalidate(cache_key)
+
+    def _get_cached_text(
+        self, cache_key: Optional[str], cache_operation: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        logger.info(
+            "LLM TEXT cache hit operation=%s stats=%s",
+            cache_operation,
+            self.cache.stats(),
+        )
+        cached["cached"] = True
+        cached["usage"] = {
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+        }
+        return cached
+
+    def _finish_text_result(
+        self, response: Any, model_name: str, cache_key: Optional[str]
+    ) -> Dict[str, Any]:
+        result = self._build_result(
+            response, "TEXT", model_name, "Failed to get response from text LLM"
+        )
+        if not result["success"]:
+            return result
+        result["cached"] = False
+        if cache_key is not None and result["result"]:
+            self.cache.set(cache_key, result)
+        return result
+
+    @staticmethod
+    def _text_messages(system_prompt: str, user_content: str) -> List[Dict[str, Any]]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ]
 
     def process_text(
-        self, system_prompt: str, user_content: str, temperature: float = 0.7
+        self,
+        system_prompt: str,
+        user_content: str,
+        temperature: float = 0.7,
+        cache_operation: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Process text using the configured text LLM with given system and user prompts.
@@ -204,42 +443,237 @@ class LLMService:
             system_prompt: The system prompt/instructions
             user_content: The user's prompt content
             temperature: The temperature parameter for the LLM (default: 0.7)
+            cache_operation: Operation name (e.g. "reformat"); when set, results are
+                cached and a hit is returned with ``cached=True`` and zero token usage
 
         Returns:
             Dictionary containing the LLM response or error
         """
         try:
-            model_name = self.get_model_name(for_ocr=False)
-            response = completion(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_content},
-                ],
-                temperature=temperature,
+            cache_key = self._text_cache_key(
+                cache_operation, system_prompt, user_content, temperature
             )
+            cached = self._get_cached_text(cache_key, cache_operation)
+            if cached is not None:
+                return cached
 
-            self._log_token_usage(
-                response=response,
-                context="TEXT",
-                fallback_model=model_name,
-            )
+            model_name = self.get_model_name(for_ocr=False)
+            with get_rate_limiter("llm"):
+                response = completion(
+                    model=model_name,
+                    messages=self._text_messages(system_prompt, user_content),
+                    temperature=temperature,
+                )
+            return self._finish_text_result(response, model_name, cache_key)
 
-            usage_info = self._collect_usage_info(response)
+        except Exception as e:
+            logger.error("LLM TEXT call failed: %s", e, exc_info=True)
+            return {"success": False, "error": str(e)}
 
-            if response and response.choices and len(response.choices) > 0:
-                return {
-                    "success": True,
-                    "result": response.choices[0].message.content,
-                    "usage": usage_info,
-                    "model": getattr(response, "model", model_name),
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "Failed to get response from text LLM",
-                }
+    async def aprocess_text(
+        self,
+        system_prompt: str,
+        user_content: str,
+        temperature: float = 0.7,
+        cache_operation: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Async variant of :meth:`process_text` backed by ``acompletion``."""
+        try:
+            cache_key = self._text_cache_key(
+                cache_operation, system_prompt, user_content, temperature
+            )
+            # 缓存可能由数据库支持，读写放到线程中，不阻塞事件循环
+            cached = await asyncio.to_thread(
+                self._get_cached_text, cache_key, cache_operation
+            )
+            if cached is not None:
+                return cached
+
+            model_name = self.get_model_name(for_ocr=False)
+            async with get_rate_limiter("llm"):
+                response = await acompletion(
+                    model=model_name,
+                    messages=self._text_messages(system_prompt, user_content),
+                    temperature=temperature,
+                )
+            return await asyncio.to_thread(
+                self._finish_text_result, response, model_name, cache_key
+            )
 
         except Exception as e:
             logger.error("LLM TEXT call failed: %s", e, exc_info=True)
             return {"success": False, "error": str(e)}
+
+    async def aprocess_texts(
+        self,
+        requests: Sequence[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Run several text calls concurrently, at most ``max_concurrency`` at a time.
+
+        Args:
+            requests: Keyword arguments for :meth:`aprocess_text`, one dict per call
+            max_concurrency: Concurrency limit (default from ``LLM_MAX_CONCURRENCY``)
+
+        Returns:
+            Results in the same order as ``requests``
+        """
+        return await gather_bounded(
+            [lambda kwargs=kwargs: self.aprocess_text(**kwargs) for kwargs in requests],
+            max_concurrency,
+        )
+
+    def process_texts(
+        self,
+        requests: Sequence[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Synchronous wrapper of :meth:`aprocess_texts` for non-async callers."""
+        return run_sync(self.aprocess_texts(requests, max_concurrency))
+
+
+def split_ocr_pages(content: str, count: int) -> Optional[List[str]]:
+    """
+    Split a batched OCR response on its page markers.
+
+    Returns:
+        The text of pages 1..count, or None unless every page appears exactly once
+        and in order
+    """
+    markers = list(_OCR_PAGE_MARKER_RE.finditer(content))
+    if [int(marker.group(1)) for marker in markers] != list(range(1, count + 1)):
+        return None
+    pages = []
+    for index, marker in enumerate(markers):
+        end = markers[index + 1].start() if index + 1 < len(markers) else len(content)
+        pages.append(content[marker.end():end].strip())
+    return pages
+
+
+def default_ocr_batch_size() -> int:
+    try:
+        return max(1, int(os.environ.get("LLM_OCR_BATCH_SIZE", "4")))
+    except ValueError:
+        return 4
+
+
+def default_max_concurrency() -> int:
+    try:
+        return max(1, int(os.environ.get("LLM_MAX_CONCURRENCY", "4")))
+    except ValueError:
+        return 4
+
+
+async def gather_bounded(
+    factories: Sequence[Callable[[], Awaitable[Any]]],
+    limit: Optional[int] = None,
+) -> List[Any]:
+    """
+    Await coroutine factories with at most ``limit`` running at once.
+
+    Factories are only invoked once a slot is free, so nothing is started
+    before it can actually run. Results keep the input order.
+    """
+    semaphore = asyncio.Semaphore(limit or default_max_concurrency())
+
+    async def run(factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await factory()
+
+    return list(await asyncio.gather(*(run(factory) for factory in factories)))
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop running on a daemon thread.
+
+    Reusing one loop keeps litellm's per-loop async client, and its
+    connection pool, alive across sync calls. A forked child starts its
+    own loop, since the parent's thread does not survive the fork.
+    """
+    global _loop, _loop_pid
+
+    pid = os.getpid()
+    if _loop is None or _loop_pid != pid:
+        with _loop_lock:
+            if _loop is None or _loop_pid != pid:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="llm-event-loop", daemon=True
+                ).start()
+                _loop, _loop_pid = loop, pid
+    return _loop
+
+
+def run_sync(coroutine: Awaitable[Any]) -> Any:
+    """
+    Run a coroutine from sync code on the shared background event loop.
+
+    Works whether or not the caller already has a running loop, but must not
+    be called from a coroutine running on the background loop itself.
+    """
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("run_sync() cannot be called from the LLM event loop")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+_shared_service: Optional[LLMService] = None
+_shared_service_pid: Optional[int] = None
+_shared_service_lock = threading.Lock()
+
+
+def _configure_http_pool() -> None:
+    """
+    Give litellm a pooled sync HTTP client so TLS connections are reused.
+
+    The async client is left to litellm, which caches one client per event
+    loop; sync callers all go through the loop from ``_background_loop``, so
+    that client is reused as well. A single global ``httpx.AsyncClient``
+    would be bound to whichever loop created it.
+    """
+    if getattr(litellm, "client_session", None) is not None:
+        return
+    max_connections = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "20"))
+    litellm.client_session = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=float(os.environ.get("LLM_HTTP_KEEPALIVE", "60")),
+        ),
+        timeout=httpx.Timeout(600.0, connect=10.0),
+    )
+
+
+def get_shared_llm_service() -> LLMService:
+    """
+    Return the process-wide LLMService with pooled HTTP connections.
+
+    The instance is rebuilt after a fork (e.g. Celery prefork workers) so
+    sockets are never shared between processes. Construction errors
+    (missing API keys) propagate and are not cached.
+    """
+    global _shared_service, _shared_service_pid
+
+    pid = os.getpid()
+    if _shared_service is None or _shared_service_pid != pid:
+        with _shared_service_lock:
+            if _shared_service is None or _shared_service_pid != pid:
+                if _shared_service_pid is not None and _shared_service_pid != pid:
+                    # 子进程不能复用父进程的连接
+                    litellm.client_session = None
+                _configure_http_pool()
+                _shared_service = LLMService()
+                _shared_service_pid = pid
+    return _shared_service
@@ -1,10 +1,12 @@
 import azure.cognitiveservices.speech as speechsdk
 import os
-import re
 import time
 import tempfile
 import ffmpeg
-from typing import Iterator
+from typing import Iterator, Optional
+
+from .rate_limiter import get_rate_limiter
+from .text_chunker import UNIT_CHARS, ChunkBudget, budget_for, iter_chunks
 
 
 class LongTTS:
@@ -22,37 +24,28 @@ class LongTTS:
         # self.speech_config.set_speech_synthesis_output_format(
         #    speechsdk.SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm)
 
-    def _text_to_segments(self, text: str, max_length: int = 1000) -> Iterator[str]:
+    def _text_to_segments(
+        self,
+        text: str,
+        max_length: Optional[int] = None,
+        budget: Optional[ChunkBudget] = None,
+    ) -> Iterator[str]:
         """
-        将文本转换为段落迭代器
+        将文本按句子、段落边界转换为段落迭代器
         :param text: 输入文本
-        :param max_length: 每段最大长度
+        :param max_length: 每段最大字符数（兼容旧参数，优先级低于 budget）
+        :param budget: 分段预算，默认使用 azure_tts 的字节预算
         :return: 文本段落迭代器
         """
-        current_segment = []
-        current_length = 0
-
-        # 按句号、感叹号、问号分割
-        sentences = re.split("\n", text)
-
-        for i in range(0, len(sentences), 2):
-            if i + 1 < len(sentences):
-                sentence = sentences[i] + sentences[i + 1]
-            else:
-                sentence = sentences[i]
-
-            sentence_length = len(sentence)
-
-            if current_length + sentence_length > max_length and current_segment:
-                yield "".join(current_segment)
-                current_segment = [sentence]
-                current_length = sentence_length
-            else:
-                current_segment.append(sentence)
-                current_length += sentence_length
-
-        if current_segment:
-            yield "".join(current_segment)
+        if budget is None:
+            budget = (
+                ChunkBudget(max_length, UNIT_CHARS)
+                if max_length
+                else budget_for("azure_tts")
+            )
+        for segment in iter_chunks(text, budget):
+            if segment.strip():
+                yield segment
 
     def _synthesize_to_file(
         self, text: str, output_file: str, retry_count: int = 3
@@ -72,6 +65,7 @@ class LongTTS:
         for attempt in range(retry_count):
             try:
                 # 使用 speak_text_async 替代 speak_ssml_async
+                get_rate_limiter("azure_tts").acquire()
                 result = synthesizer.speak_text_async(text).get()
 
                 if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
@@ -111,13 +105,18 @@ class LongTTS:
         return
 
     def synthesize_long_text(
-        self, text: str, output_file: str, segment_length: int = 2000
+        self,
+        text: str,
+        output_file: str,
+        segment_length: Optional[int] = None,
+        budget: Optional[ChunkBudget] = None,
     ) -> bool:
         """
         合成长文本
         :param text: 输入文本
         :param output_file: 输出文件路径
-        :param segment_length: 段落长度
+        :param segment_length: 每段最大字符数（兼容旧参数）
+        :param budget: 分段预算，默认按字节预算切分
         :return: 是否成功
         """
         temp_files = []
@@ -126,12 +125,12 @@ class LongTTS:
             temp_dir = tempfile.mkdtemp()
             print(f"tmp_dir: {temp_dir}")
             total_segments = sum(
-                1 for _ in self._text_to_segments(text, segment_length)
+                1 for _ in self._text_to_segments(text, segment_length, budget)
             )
 
             # 处理每个文本段落
             for i, segment in enumerate(
-                self._text_to_segments(text, segment_length), 1
+                self._text_to_segments(text, segment_length, budget), 1
             ):
                 # 创建临时文件
                 temp_file = os.path.join(temp_dir, f"segment_{i}.wav")
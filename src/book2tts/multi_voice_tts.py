@@ -10,6 +10,7 @@ import asyncio
 import edge_tts
 from .tts import edge_text_to_speech
 from .long_tts import LongTTS
+from .rate_limiter import get_rate_limiter
 from .edgetts import EdgeTTS
 from .audio_utils import get_audio_duration
 
@@ -172,6 +173,7 @@ class MultiVoiceTTS:
 
         try:
             # 生成音频和字幕
+            await get_rate_limiter("edge_tts").aacquire()
             communicate = edge_tts.Communicate(
                 text, voice_name, boundary="WordBoundary"
             )
@@ -1,14 +1,68 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
 from volcengine.visual.VisualService import VisualService
 import base64
 
+from book2tts.rasterize import RenderSettings, get_rasterizer
+from book2tts.rate_limiter import get_rate_limiter
+
+logger = logging.getLogger("book2tts.ocr")
+
+# OCR 上传图片的渲染配置。扫描页转灰度后用有损格式编码，
+# 体积约为彩色 PNG 的 1/3 ~ 1/6，识别效果基本不变
+OCR_IMAGE_PROFILES = {
+    "png": RenderSettings(dpi=150, image_format="png"),
+    "gray-png": RenderSettings(dpi=150, image_format="png", grayscale=True),
+    "gray-jpeg": RenderSettings(dpi=150, image_format="jpeg", grayscale=True, quality=80),
+    "gray-webp": RenderSettings(dpi=150, image_format="webp", grayscale=True, quality=75),
+}
+
+DEFAULT_OCR_IMAGE_PROFILE = "gray-jpeg"
+
+
+def get_ocr_image_profile(name: Optional[str] = None) -> RenderSettings:
+    """
+    获取OCR图片渲染配置
+
+    未指定名称时读取 OCR_IMAGE_PROFILE；OCR_IMAGE_DPI、OCR_IMAGE_QUALITY 可覆盖
+    配置中的分辨率和压缩质量。
+    """
+    name = name or os.environ.get("OCR_IMAGE_PROFILE") or DEFAULT_OCR_IMAGE_PROFILE
+    profile = OCR_IMAGE_PROFILES.get(name)
+    if profile is None:
+        raise ValueError(
+            f"未知的OCR图片配置: {name}，可选: {', '.join(OCR_IMAGE_PROFILES)}"
+        )
 
-def image_to_base64(image_path):
-    with open(image_path, "rb") as image_file:
+    overrides = {}
+    for field, env in (("dpi", "OCR_IMAGE_DPI"), ("quality", "OCR_IMAGE_QUALITY")):
+        value = os.environ.get(env)
+        if value:
+            try:
+                overrides[field] = int(value)
+            except ValueError:
+                pass
+    return replace(profile, **overrides) if overrides else profile
+
+
+def image_to_base64(image):
+    """图片转 base64，image 可以是图片字节或文件路径"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return base64.b64encode(image).decode("utf-8")
+    with open(image, "rb") as image_file:
         encoded_string = base64.b64encode(image_file.read())
         return encoded_string.decode("utf-8")
 
 
 def ocr_volc(ak, sk, file):
+    """火山引擎通用OCR，file 可以是图片字节（无需落盘）或文件路径"""
     visual_service = VisualService()
     visual_service.set_ak(ak)
     visual_service.set_sk(sk)
@@ -19,14 +73,132 @@ def ocr_volc(ak, sk, file):
     form = dict()
     form["image_base64"] = image_to_base64(file)
 
-    resp = visual_service.ocr_api(action, form)
-    if resp is not None:
-        data = resp.get("data") or {}
-        texts = data.get("line_texts") or []
-        if len(texts) <= 0:
-            print(resp)
+    with get_rate_limiter("ocr_volc"):
+        resp = visual_service.ocr_api(action, form)
+    # 空白页返回空文本并会被缓存，接口错误需抛出异常，避免被当作空白页缓存
+    if resp is None:
+        raise RuntimeError("火山引擎OCR未返回结果")
+    if resp.get("code", 10000) != 10000:
+        raise RuntimeError(f"火山引擎OCR失败: {resp.get('code')} {resp.get('message')}")
+    data = resp.get("data") or {}
+    texts = data.get("line_texts") or []
+    return "\n".join(texts)
+
+
+def _ocr_cache_dir() -> str:
+    return os.environ.get("OCR_CACHE_DIR", "/tmp/book2tts/ocr_cache")
+
+
+def get_cached_ocr_text(image_md5: str) -> Optional[str]:
+    """按图片MD5读取本地OCR缓存（与 Web 端 OCRCache 语义一致）"""
+    try:
+        with open(os.path.join(_ocr_cache_dir(), f"{image_md5}.txt"), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def cache_ocr_text(image_md5: str, text: str) -> None:
+    """写入本地OCR缓存，空结果不缓存；写入失败只记录日志，不影响识别结果"""
+    if not text:
+        return
+    cache_dir = _ocr_cache_dir()
+    path = os.path.join(cache_dir, f"{image_md5}.txt")
+    # 先写临时文件再替换，并发写入同一页时不会读到半个文件；
+    # 同一批次中内容相同的页面（如空白页）会在不同线程里写同一个缓存文件，临时文件名需包含线程
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Failed to write OCR cache %s: %s", path, e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
             pass
-        return "\n".join(texts)
-    else:
-        print(resp)
-        return ""
+
+
+def ocr_image_with_cache(ak, sk, image_data: bytes) -> Dict[str, Any]:
+    """识别单张图片，先查本地缓存；返回 {'text', 'cached', 'image_md5'[, 'error']}"""
+    image_md5 = hashlib.md5(image_data).hexdigest()
+    cached = get_cached_ocr_text(image_md5)
+    if cached is not None:
+        return {"text": cached, "cached": True, "image_md5": image_md5}
+    try:
+        text = ocr_volc(ak, sk, image_data)
+    except Exception as e:
+        return {"text": "", "cached": False, "image_md5": image_md5, "error": str(e)}
+    cache_ocr_text(image_md5, text)
+    return {"text": text or "", "cached": False, "image_md5": image_md5}
+
+
+def _default_ocr_concurrency() -> int:
+    try:
+        return max(1, int(os.environ.get("OCR_CONCURRENCY", "4")))
+    except ValueError:
+        return 4
+
+
+def ocr_pdf_pages(
+    ak,
+    sk,
+    pdf_path: str,
+    page_indices: Iterable[int],
+    profile: Optional[RenderSettings] = None,
+    concurrency: Optional[int] = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    渲染并识别PDF的指定页面，按输入顺序逐页返回
+
+    只渲染给定的页面；OCR 请求在线程池中并发执行，实际请求速率仍受共享的
+    ocr_volc 令牌桶限制。同时在途的页面数有上限，内存占用与页数无关。
+
+    Args:
+        ak: 火山引擎Access Key
+        sk: 火山引擎Secret Key
+        pdf_path: PDF文件路径
+        page_indices: 页码（从0开始）
+        profile: OCR图片渲染配置，默认由 OCR_IMAGE_PROFILE 决定
+        concurrency: 并发OCR请求数，默认读取 OCR_CONCURRENCY（4）
+
+    Yields:
+        (页码, {'text', 'cached', 'image_md5'[, 'error']})
+    """
+    profile = profile or get_ocr_image_profile()
+    concurrency = concurrency or _default_ocr_concurrency()
+    rendered = get_rasterizer().iter_pages(
+        pdf_path, page_indices, profile, return_exceptions=True
+    )
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ocr") as executor:
+        try:
+            for page_index, image_data in rendered:
+                if isinstance(image_data, Exception):
+                    pending.append((page_index, None, str(image_data)))
+                else:
+                    pending.append(
+                        (page_index, executor.submit(ocr_image_with_cache, ak, sk, image_data), None)
+                    )
+                # 队首页面完成或在途页面达到上限时按顺序交付
+                while pending and (
+                    pending[0][1] is None or pending[0][1].done() or len(pending) >= concurrency * 2
+                ):
+                    yield _take_result(pending.popleft())
+
+            while pending:
+                yield _take_result(pending.popleft())
+        finally:
+            rendered.close()
+            for _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
+
+
+def _take_result(entry) -> Tuple[int, Dict[str, Any]]:
+    page_index, future, error = entry
+    if future is None:
+        return page_index, {"text": "", "cached": False, "image_md5": "", "error": error}
+    return page_index, future.result()
@@ -0,0 +1,283 @@
+"""LLM 排版前的本地文本清理。
+
+PDF 抽取出的文本里，页眉页脚、页码和断行在各页之间高度规律，交给 LLM
+去除既耗 token 又不稳定。这里按页面范围做一遍确定性的预处理：
+
+- 统计各页首尾若干行，在足够多页面上重复出现的行视为页眉/页脚
+  （比较前把数字归一，"第 12 页"、"Chapter 3 · 45" 这类带页码的页眉也能识别）
+- 去掉页面首尾单独成行的页码
+- 合并英文行尾连字符断词，以及句子中途的软换行
+
+清理后的文本通过质量检查时，调用方可以直接跳过 LLM 排版。
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 页面之间的分隔：text_by_page 以 "\n\n" 连接以换行结尾的 PDF 页面文本，批量处理也按此切分
+PAGE_SEPARATOR = "\n\n\n"
+
+# 每页首尾参与页眉/页脚检测的非空行数
+EDGE_LINES = 2
+# 至少有这么多页才做重复行检测
+MIN_PAGES_FOR_REPEATS = 3
+# 重复行至少出现在该比例的页面上（奇偶页页眉不同，各占一半左右）
+REPEAT_RATIO = 0.3
+# 超过该长度的行不会是页眉页脚
+MAX_EDGE_LINE_LENGTH = 80
+# 短于典型整行长度该比例的行视为段落结尾或标题，不与下一行合并
+SHORT_LINE_RATIO = 0.6
+
+_PAGE_NUMBER_RE = re.compile(
+    r"""
+    ^[\s\-–—·•\[(（]*
+    (?:
+        (?:page|p\.)\s*\d+(?:\s*(?:/|of)\s*\d+)?
+      | 第\s*[\d一二三四五六七八九十百千零〇]+\s*页(?:\s*[/，,]?\s*共\s*\d+\s*页)?
+      | \d{1,4}(?:\s*/\s*\d{1,4})?
+      | (?-i:[ivxlcdm]{1,7})
+    )
+    [\s\-–—·•\])）]*$
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"\s+")
+_INDENT_RE = re.compile(r"^(?:[ \t]{2,}|　)")
+_HYPHEN_END_RE = re.compile(r"[A-Za-z]-$")
+_TERMINAL_RE = re.compile(r"""[。！？!?；;….:：][”’」』）)\]"']*$""")
+_CJK_RE = re.compile(
+    "[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+# 排版提示词要求去掉的引文标注，残留时仍需交给 LLM
+_CITATION_RE = re.compile(r"\[\d{1,3}\]|［\d{1,3}］|[¹²³⁴⁵⁶⁷⁸⁹⁰]+")
+_WORD_CHAR_RE = re.compile(r"\w", re.UNICODE)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def strip_noise_enabled() -> bool:
+    """是否在 LLM 排版前做本地清理（REFORMAT_STRIP_NOISE，默认开启）。"""
+    return _env_flag("REFORMAT_STRIP_NOISE", True)
+
+
+def skip_llm_enabled() -> bool:
+    """清理后通过质量检查的文本是否跳过 LLM（REFORMAT_SKIP_LLM，默认关闭）。"""
+    return _env_flag("REFORMAT_SKIP_LLM", False)
+
+
+@dataclass
+class CleanStats:
+    """一次清理的统计，可直接写入操作记录的 metadata。"""
+
+    pages: int = 0
+    header_lines: int = 0
+    page_numbers: int = 0
+    hyphenations: int = 0
+    joined_lines: int = 0
+    chars_before: int = 0
+    chars_after: int = 0
+
+    def merge(self, other: "CleanStats") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+def is_page_number(line: str) -> bool:
+    """单独成行的页码：12、- 12 -、第12页、Page 3 of 20、xii 等。"""
+    return bool(_PAGE_NUMBER_RE.match(line.strip()))
+
+
+def _edge_key(line: str) -> str:
+    """页眉页脚比较用的键：数字归一、空白合并、忽略大小写。"""
+    return _SPACES_RE.sub(" ", _DIGITS_RE.sub("#", line.strip())).lower()
+
+
+def _edge_indices(lines: Sequence[str], edge_lines: int) -> Tuple[List[int], List[int]]:
+    """页首和页尾（由外向内）的非空行下标。"""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return filled[:edge_lines], filled[::-1][:edge_lines]
+
+
+def find_repeated_edge_lines(
+    pages_lines: Sequence[Sequence[str]],
+    edge_lines: int = EDGE_LINES,
+    ratio: float = REPEAT_RATIO,
+) -> Tuple[set, set]:
+    """统计在足够多页面的页首/页尾重复出现的行，返回 (页眉键集合, 页脚键集合)。"""
+    if len(pages_lines) < MIN_PAGES_FOR_REPEATS:
+        return set(), set()
+
+    threshold = max(2, math.ceil(len(pages_lines) * ratio))
+    top_counts: Dict[str, int] = {}
+    bottom_counts: Dict[str, int] = {}
+    for lines in pages_lines:
+        top, bottom = _edge_indices(lines, edge_lines)
+        for indices, counts in ((top, top_counts), (bottom, bottom_counts)):
+            # 同一页内重复的键只计一次；纯页码行由页码规则处理，不计入
+            keys = {
+                _edge_key(lines[i])
+                for i in indices
+                if len(lines[i].strip()) <= MAX_EDGE_LINE_LENGTH and not is_page_number(lines[i])
+            }
+            for key in keys:
+                counts[key] = counts.get(key, 0) + 1
+
+    def repeated(counts: Dict[str, int]) -> set:
+        return {key for key, count in counts.items() if count >= threshold}
+
+    return repeated(top_counts), repeated(bottom_counts)
+
+
+def _strip_edges(
+    lines: List[str], headers: set, footers: set, edge_lines: int, stats: CleanStats
+) -> List[str]:
+    """从页面两端向内去掉连续的页眉页脚和页码行，遇到正文即停止。"""
+    drop = set()
+    top, bottom = _edge_indices(lines, edge_lines)
+    for indices, repeated in ((top, headers), (bottom, footers)):
+        for i in indices:
+            if i in drop:
+                break
+            if _edge_key(lines[i]) in repeated:
+                stats.header_lines += 1
+            elif is_page_number(lines[i]):
+                stats.page_numbers += 1
+            else:
+                break
+            drop.add(i)
+    return [line for i, line in enumerate(lines) if i not in drop]
+
+
+def _needs_space(left: str, right: str) -> bool:
+    return not (_CJK_RE.match(left[-1]) or _CJK_RE.match(right[0]))
+
+
+def join_soft_breaks(text: str, stats: Optional[CleanStats] = None) -> str:
+    """
+    合并段落内部的软换行。
+
+    上一行以句末标点结尾、下一行有缩进、或上一行明显短于整行长度（段落末行、标题）时保留换行；
+    英文行尾的连字符断词在下一行以小写字母开头时合并为一个词。空行原样保留。
+    """
+    stats = stats if stats is not None else CleanStats()
+    lines = text.split("\n")
+    lengths = sorted(len(line.strip()) for line in lines if line.strip())
+    if not lengths:
+        return text.strip()
+    # 典型整行长度取上四分位，避免被短行拉低
+    full_length = lengths[(len(lengths) * 3) // 4]
+
+    output: List[str] = []
+    prev_raw = ""
+    for raw in lines:
+        line = raw.strip()
+        prev = output[-1] if output else ""
+        if line and prev:
+            prev_line = prev_raw.strip()
+            if _HYPHEN_END_RE.search(prev) and line[0].islower():
+                output[-1] = prev[:-1] + line
+                stats.hyphenations += 1
+                prev_raw = raw
+                continue
+            soft = not (
+                _TERMINAL_RE.search(prev_line)
+                or _INDENT_RE.match(raw)
+                or len(prev_line) < full_length * SHORT_LINE_RATIO
+            )
+            if soft:
+                output[-1] = prev + (" " if _needs_space(prev, line) else "") + line
+                stats.joined_lines += 1
+                prev_raw = raw
+                continue
+        output.append(line)
+        prev_raw = raw
+    return "\n".join(output).strip()
+
+
+def clean_pages(
+    page_texts: Iterable[str], edge_lines: int = EDGE_LINES
+) -> Tuple[List[str], CleanStats]:
+    """
+    清理一段连续页面的文本。
+
+    Args:
+        page_texts: 各页文本，顺序与原书一致
+        edge_lines: 每页首尾参与页眉页脚检测的非空行数
+
+    Returns:
+        (各页清理后的文本, 统计)
+    """
+    stats = CleanStats()
+    pages_lines = []
+    for text in page_texts:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        stats.pages += 1
+        stats.chars_before += len(text)
+        pages_lines.append(text.split("\n"))
+
+    headers, footers = find_repeated_edge_lines(pages_lines, edge_lines)
+    cleaned = []
+    for lines in pages_lines:
+        lines = _strip_edges(lines, headers, footers, edge_lines, stats)
+        text = join_soft_breaks("\n".join(lines), stats)
+        stats.chars_after += len(text)
+        cleaned.append(text)
+    return cleaned, stats
+
+
+def split_pages(text: str) -> List[str]:
+    """按页面分隔符切分多页文本。"""
+    return text.split(PAGE_SEPARATOR)
+
+
+def clean_text(text: str, edge_lines: int = EDGE_LINES) -> Tuple[str, CleanStats]:
+    """清理以 PAGE_SEPARATOR 连接的多页文本，页数不足时只处理页码和软换行。"""
+    pages, stats = clean_pages(split_pages(text), edge_lines)
+    return PAGE_SEPARATOR.join(page for page in pages if page), stats
+
+
+def quality_issues(text: str) -> List[str]:
+    """
+    检查清理后的文本是否还需要 LLM 排版，返回发现的问题，空列表表示可以直接使用。
+    """
+    issues = []
+    stripped = text.strip()
+    if len(stripped) < 20:
+        return ["too_short"]
+    if "\ufffd" in stripped:
+        issues.append("replacement_chars")
+
+    word_chars = len(_WORD_CHAR_RE.findall(stripped))
+    visible = len(_SPACES_RE.sub("", stripped))
+    if visible and word_chars / visible < 0.6:
+        issues.append("garbled")
+    if _CITATION_RE.search(stripped):
+        issues.append("citations")
+
+    lines = [line.strip() for line in stripped.split("\n") if line.strip()]
+    if any(is_page_number(line) for line in lines):
+        issues.append("page_numbers")
+    # 未以标点结尾的长行说明仍有断行或缺失标点；短行多为标题
+    unterminated = [line for line in lines if len(line) > 30 and not _TERMINAL_RE.search(line)]
+    if unterminated and len(unterminated) / len(lines) > 0.2:
+        issues.append("broken_lines")
+    return issues
+
+
+def passes_quality_checks(text: str) -> bool:
+    return not quality_issues(text)
@@ -0,0 +1,107 @@
+"""PDF 页面图片的磁盘缓存。
+
+页面按尺寸档位渲染为 WebP 或 JPEG，结果按 书籍哈希/页码/档位 持久化到磁盘，
+同一页面只渲染一次。渲染参数确定后文件内容不变，可以直接作为强 ETag 的依据。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Iterable, Optional
+
+from book2tts.pdf import get_page_image_data
+from book2tts.rasterize import RenderSettings, get_rasterizer
+
+
+# 尺寸档位 -> 渲染分辨率（DPI）：thumb 用于页面缩略图条，page 用于常规查看，full 用于放大查看
+PAGE_IMAGE_TIERS = {
+    "thumb": 36,
+    "page": 110,
+    "full": 200,
+}
+
+DEFAULT_PAGE_IMAGE_TIER = "page"
+
+# 输出格式 -> (Content-Type, 压缩质量)
+PAGE_IMAGE_FORMATS = {
+    "webp": ("image/webp", 75),
+    "jpeg": ("image/jpeg", 80),
+}
+
+
+def page_image_settings(tier: str, image_format: str = "webp") -> RenderSettings:
+    """档位和格式对应的渲染参数，未知档位或格式抛出 ValueError。"""
+    if tier not in PAGE_IMAGE_TIERS:
+        raise ValueError(f"未知的页面图片档位: {tier}，可选: {', '.join(PAGE_IMAGE_TIERS)}")
+    if image_format not in PAGE_IMAGE_FORMATS:
+        raise ValueError(f"不支持的页面图片格式: {image_format}")
+    _, quality = PAGE_IMAGE_FORMATS[image_format]
+    return RenderSettings(dpi=PAGE_IMAGE_TIERS[tier], image_format=image_format, quality=quality)
+
+
+class PageImageCache:
+    """按 书籍哈希/页码/档位 存放渲染结果的磁盘缓存。"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, book_hash: str, page_index: int, tier: str, image_format: str) -> str:
+        settings = page_image_settings(tier, image_format)
+        return os.path.join(
+            self.root, book_hash[:2], book_hash, f"{page_index}-{tier}-{settings.cache_key}.{image_format}"
+        )
+
+    @staticmethod
+    def etag(book_hash: str, page_index: int, tier: str, image_format: str) -> str:
+        """强 ETag：书籍内容哈希加渲染参数唯一确定图片内容。"""
+        settings = page_image_settings(tier, image_format)
+        return f'"{book_hash}-{page_index}-{tier}-{settings.cache_key}"'
+
+    def get(self, book_hash: str, page_index: int, tier: str, image_format: str) -> Optional[str]:
+        path = self.path(book_hash, page_index, tier, image_format)
+        return path if os.path.exists(path) else None
+
+    def put(self, book_hash: str, page_index: int, tier: str, image_format: str, data: bytes) -> str:
+        """写入缓存，先写临时文件再替换，并发请求不会读到半个文件。"""
+        path = self.path(book_hash, page_index, tier, image_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def get_or_render(
+        self, pdf_path: str, book_hash: str, page_index: int, tier: str, image_format: str
+    ) -> str:
+        """返回缓存的图片路径，缺失时渲染该页并写入缓存。"""
+        cached = self.get(book_hash, page_index, tier, image_format)
+        if cached:
+            return cached
+        data = get_page_image_data(pdf_path, page_index, settings=page_image_settings(tier, image_format))
+        return self.put(book_hash, page_index, tier, image_format, data)
+
+    def render_missing(
+        self,
+        pdf_path: str,
+        book_hash: str,
+        page_indices: Iterable[int],
+        tier: str = "thumb",
+        image_format: str = "webp",
+    ) -> int:
+        """批量渲染尚未缓存的页面（在渲染进程池中并行），返回新渲染的页数。"""
+        missing = [page for page in page_indices if not self.get(book_hash, page, tier, image_format)]
+        if not missing:
+            return 0
+
+        rendered = 0
+        settings = page_image_settings(tier, image_format)
+        for page_index, data in get_rasterizer().iter_pages(
+            pdf_path, missing, settings, return_exceptions=True
+        ):
+            if isinstance(data, Exception):
+                continue
+            self.put(book_hash, page_index, tier, image_format, data)
+            rendered += 1
+        return rendered
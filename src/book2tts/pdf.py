@@ -4,20 +4,106 @@ import os
 import pymupdf
 import hashlib
 
-from functools import lru_cache
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Callable, List, Optional
 from PIL import Image
 from io import BytesIO
 
+from book2tts.doc_pool import get_document_pool
+from book2tts.rasterize import RenderSettings, get_rasterizer, render_page
+
+
+class LazyPdfPages(Sequence):
+    """
+    按需读取PDF页面的只读序列
+
+    只有被访问到的页面才会抽取文本或渲染图片，处理几页内容的开销与整本书的页数无关。
+    最近访问的页面会被缓存，重复访问不会重新读取。
+    """
+
+    CACHE_SIZE = 32
+
+    def __init__(self, pdf_path: str, loader: Callable[[str, int, int], List], page_count: Optional[int] = None):
+        self.pdf_path = pdf_path
+        self._loader = loader
+        self._page_count = pdf_page_count(pdf_path) if page_count is None else page_count
+        self._cache: "OrderedDict[int, object]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._page_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._page_count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.range(start, stop)
+
+        if index < 0:
+            index += self._page_count
+        if index < 0 or index >= self._page_count:
+            raise IndexError(f"页码 {index} 超出范围，PDF共有 {self._page_count} 页")
+        if index not in self._cache:
+            self._remember(index, self._loader(self.pdf_path, index, index + 1)[0])
+        self._cache.move_to_end(index)
+        return self._cache[index]
+
+    def range(self, start: int, end: int) -> List:
+        """读取 [start, end) 范围内的页面，未缓存的页面一次批量读取。"""
+        start, end = max(start, 0), min(end, self._page_count)
+        values = {i: self._cache[i] for i in range(start, end) if i in self._cache}
+        missing = [i for i in range(start, end) if i not in values]
+        if missing:
+            for offset, value in enumerate(self._loader(self.pdf_path, missing[0], missing[-1] + 1)):
+                values[missing[0] + offset] = value
+                self._remember(missing[0] + offset, value)
+        return [values[i] for i in range(start, end)]
+
+    def _remember(self, index: int, value) -> None:
+        self._cache[index] = value
+        while len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+
+def pdf_page_count(pdf_path) -> int:
+    with lease_pdf(pdf_path) as doc:
+        return len(doc)
+
+
+def get_pdf_toc(pdf_path):
+    """PDF目录，没有目录时返回空列表"""
+    with lease_pdf(pdf_path) as doc:
+        return doc.get_toc()
+
+
+def extract_text_by_page_range(pdf_path, start: int, end: int) -> List[str]:
+    """抽取 [start, end) 范围内各页的文本（页码从0开始）"""
+    with lease_pdf(pdf_path) as doc:
+        end = min(end, len(doc))
+        return [doc[i].get_text() for i in range(max(start, 0), end)]
+
+
+def extract_img_by_page_range(pdf_path, start: int, end: int, settings: RenderSettings = None) -> List[bytes]:
+    """渲染 [start, end) 范围内的页面（默认 72 DPI，PNG），在渲染进程池中并行执行"""
+    end = min(end, pdf_page_count(pdf_path))
+    return [
+        data
+        for _, data in get_rasterizer().iter_pages(
+            pdf_path, range(max(start, 0), end), settings or RenderSettings(dpi=72)
+        )
+    ]
+
 
 def extract_text_by_page(pdf_path):
-    doc = pymupdf.open(pdf_path)
+    """返回目录和按需抽取文本的页面序列"""
     print("pdf text page")
-    toc = doc.get_toc()
+    toc = get_pdf_toc(pdf_path)
     print(toc)
     # 返回目录和页面内容
     return {
         "toc": toc if toc else None,  # 如果没有目录，返回None
-        "pages": [page.get_text() for page in doc]
+        "pages": LazyPdfPages(pdf_path, extract_text_by_page_range),
     }
 
 
@@ -27,9 +113,9 @@ def clean_text(text):
 
 
 def extract_img_by_page(pdf_path):
-    doc = pymupdf.open(pdf_path)
+    """返回按需渲染（72 DPI，PNG）的页面图片序列"""
     print("pdf img page")
-    return [page.get_pixmap().tobytes() for page in doc]
+    return LazyPdfPages(pdf_path, extract_img_by_page_range)
 
 
 def save_img(image_data, img_type: str = ".jpeg"):
@@ -45,17 +131,30 @@ def save_img(image_data, img_type: str = ".jpeg"):
 
 
 def extract_img_vector_by_page(pdf_path):
-    doc = pymupdf.open(pdf_path)
+    """返回按需渲染的页面位图序列（pymupdf 默认 pixmap 即 72 DPI 的 RGB PNG）"""
     print("pdf vector img page")
-    return [page.get_pixmap().tobytes() for page in doc]
+    return LazyPdfPages(pdf_path, extract_img_by_page_range)
+
+
+def pdf_pool():
+    """进程内共享的PDF句柄池"""
+    return get_document_pool("pdf", pymupdf.open)
+
+
+def lease_pdf(pdf_path):
+    """
+    独占借用PDF文档句柄，用法: with lease_pdf(path) as doc: ...
+
+    文件修改后自动打开新版本；多线程访问同一文档时依次进行。
+    """
+    return pdf_pool().lease(pdf_path)
 
 
-@lru_cache(maxsize=10)
 def open_pdf(pdf_path):
-    return pymupdf.open(pdf_path)
+    """返回共享的PDF文档对象（不加锁），并发场景请使用 lease_pdf"""
+    return pdf_pool().get(pdf_path)
 
 
-@lru_cache(maxsize=10)
 def pdf_pages(pdf):
     return list(pdf.pages())
 
@@ -106,9 +205,26 @@ def detect_scanned_pdf(pdf_path, sample_pages: int = 5) -> dict:
     Returns:
         包含检测结果的字典
     """
-    doc = pymupdf.open(pdf_path)
-    total_pages = len(doc)
-    
+    with lease_pdf(pdf_path) as doc:
+        return _detect_scanned_document(doc, sample_pages)
+
+
+def _detect_scanned_document(doc, sample_pages: int) -> dict:
+    return detect_scanned_pages(len(doc), lambda page_idx: is_scanned_pdf_page(doc[page_idx]), sample_pages)
+
+
+def detect_scanned_pages(total_pages: int, is_scanned_page, sample_pages: int = 5) -> dict:
+    """
+    按均匀取样的页面判断PDF是否为扫描版
+
+    Args:
+        total_pages: 总页数
+        is_scanned_page: 判断某页（从0开始）是否为扫描页的函数，可来自已打开的文档或书籍索引
+        sample_pages: 检测的样本页数
+
+    Returns:
+        包含检测结果的字典
+    """
     if total_pages == 0:
         return {
             'is_scanned': False,
@@ -118,10 +234,6 @@ def detect_scanned_pdf(pdf_path, sample_pages: int = 5) -> dict:
             'sample_pages': 0
         }
     
-    # 确定要检测的页面数
-    pages_to_check = min(sample_pages, total_pages)
-    scanned_count = 0
-    
     # 均匀分布取样页面
     if total_pages <= sample_pages:
         page_indices = list(range(total_pages))
@@ -130,11 +242,7 @@ def detect_scanned_pdf(pdf_path, sample_pages: int = 5) -> dict:
         page_indices = [i * step for i in range(sample_pages)]
     
     # 检测每个样本页面
-    for page_idx in page_indices:
-        page = doc[page_idx]
-        if is_scanned_pdf_page(page):
-            scanned_count += 1
-    
+    scanned_count = sum(1 for page_idx in page_indices if is_scanned_page(page_idx))
     scanned_ratio = scanned_count / len(page_indices)
     
     return {
@@ -147,7 +255,12 @@ def detect_scanned_pdf(pdf_path, sample_pages: int = 5) -> dict:
     }
 
 
-def get_page_image_data(pdf_path: str, page_num: int, resolution: int = 150) -> bytes:
+def get_page_image_data(
+    pdf_path: str,
+    page_num: int,
+    resolution: int = 150,
+    settings: RenderSettings = None,
+) -> bytes:
     """
     获取PDF页面的图像数据
     
@@ -155,23 +268,13 @@ def get_page_image_data(pdf_path: str, page_num: int, resolution: int = 150) ->
         pdf_path: PDF文件路径
         page_num: 页码（从0开始）
         resolution: 图像分辨率DPI
+        settings: 完整的渲染参数（格式、灰度、质量），指定时忽略 resolution
     
     Returns:
         图像的字节数据
     """
-    doc = pymupdf.open(pdf_path)
-    if page_num >= len(doc):
-        raise IndexError(f"页码 {page_num} 超出范围，PDF共有 {len(doc)} 页")
-    
-    page = doc[page_num]
-    
-    # 计算缩放矩阵以达到指定分辨率
-    zoom = resolution / 72.0  # 72 DPI是默认分辨率
-    mat = pymupdf.Matrix(zoom, zoom)
-    
-    # 生成页面图像
-    pix = page.get_pixmap(matrix=mat)
-    return pix.tobytes("png")
+    with lease_pdf(pdf_path) as doc:
+        return render_page(doc, page_num, settings or RenderSettings(dpi=resolution))
 
 
 def calculate_image_md5(image_data: bytes) -> str:
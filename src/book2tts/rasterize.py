@@ -0,0 +1,258 @@
+"""PDF 页面渲染服务。
+
+页面渲染是 CPU 密集型操作，放在进程池中并行执行。每个工作进程通过文档句柄池复用已打开的文档，
+同一本书的后续页面无需重新打开文件。渲染结果以迭代器形式逐页返回，
+同时在途的页面数有上限，内存占用与总页数无关。
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import pymupdf
+
+from book2tts.doc_pool import get_document_pool
+
+
+logger = logging.getLogger("book2tts.rasterize")
+
+# 有损格式，quality 参数生效
+LOSSY_FORMATS = ("jpeg", "jpg", "webp")
+
+
+@dataclass(frozen=True)
+class RenderSettings:
+    """页面渲染参数。"""
+
+    dpi: int = 150
+    image_format: str = "png"
+    grayscale: bool = False
+    # 仅对 jpeg / webp 等有损格式生效
+    quality: int = 85
+
+    @property
+    def cache_key(self) -> str:
+        """渲染参数的字符串形式，用于区分缓存条目，如 png@150。"""
+        key = f"{self.image_format}@{self.dpi}"
+        if self.grayscale:
+            key += "-gray"
+        if self.image_format in LOSSY_FORMATS:
+            key += f"-q{self.quality}"
+        return key
+
+
+def _document_pool():
+    # 与 book2tts.pdf 共用同一个句柄池，文件更新后自动重新打开
+    return get_document_pool("pdf", pymupdf.open)
+
+
+def render_page(doc: pymupdf.Document, page_index: int, settings: RenderSettings) -> bytes:
+    """把已打开文档的一页渲染为图片字节。"""
+    if page_index < 0 or page_index >= len(doc):
+        raise IndexError(f"页码 {page_index} 超出范围，PDF共有 {len(doc)} 页")
+
+    zoom = settings.dpi / 72.0  # 72 DPI是默认分辨率
+    pix = doc[page_index].get_pixmap(
+        matrix=pymupdf.Matrix(zoom, zoom),
+        colorspace=pymupdf.csGRAY if settings.grayscale else pymupdf.csRGB,
+    )
+    if settings.image_format in ("jpeg", "jpg"):
+        return pix.tobytes("jpeg", jpg_quality=settings.quality)
+    if settings.image_format == "webp":
+        # pymupdf 不能直接输出 WebP，经由 Pillow 编码
+        return pix.pil_tobytes(format="WEBP", quality=settings.quality, method=4)
+    return pix.tobytes(settings.image_format)
+
+
+def _render_in_worker(pdf_path: str, page_index: int, settings: RenderSettings) -> bytes:
+    with _document_pool().lease(pdf_path) as doc:
+        return render_page(doc, page_index, settings)
+
+
+def _default_workers() -> int:
+    configured = os.environ.get("RASTERIZE_WORKERS")
+    if configured:
+        try:
+            return max(0, int(configured))
+        except ValueError:
+            pass
+    return min(4, os.cpu_count() or 1)
+
+
+class PageRasterizer:
+    """
+    基于进程池的页面渲染服务。
+
+    在守护进程中（如 Celery prefork 工作进程）无法创建子进程，此时自动退化为
+    由一个后台线程顺序渲染，通过有界队列把页面交给调用方，渲染与后续处理仍能重叠。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, start_method: Optional[str] = None):
+        self.max_workers = _default_workers() if max_workers is None else max(0, max_workers)
+        # pymupdf 不适合在多线程进程中 fork，默认使用 spawn
+        self.start_method = start_method or os.environ.get("RASTERIZE_START_METHOD", "spawn")
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.max_workers > 0 and not multiprocessing.current_process().daemon
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._executor
+
+    def iter_pages(
+        self,
+        pdf_path: str,
+        page_indices: Iterable[int],
+        settings: Optional[RenderSettings] = None,
+        max_in_flight: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> Iterator[Tuple[int, Union[bytes, Exception]]]:
+        """
+        按输入顺序逐页渲染。
+
+        Args:
+            pdf_path: PDF文件路径
+            page_indices: 页码（从0开始）
+            settings: 渲染参数
+            max_in_flight: 同时提交给进程池的最大页数，默认为工作进程数的两倍
+            return_exceptions: 为 True 时渲染失败的页面返回异常对象而不是抛出，
+                其余页面继续渲染
+
+        Yields:
+            (页码, 图片字节或异常)
+        """
+        settings = settings or RenderSettings()
+        pdf_path = os.fspath(pdf_path)
+
+        window = max_in_flight or max(self.max_workers, 1) * 2
+
+        if not self.uses_processes:
+            yield from self._iter_in_thread(
+                pdf_path, page_indices, settings, window, return_exceptions
+            )
+            return
+
+        executor = self._get_executor()
+        pending = deque()
+        pages = iter(page_indices)
+        try:
+            while True:
+                while len(pending) < window:
+                    page_index = next(pages, None)
+                    if page_index is None:
+                        break
+                    pending.append(
+                        (page_index, executor.submit(_render_in_worker, pdf_path, page_index, settings))
+                    )
+                if not pending:
+                    return
+                page_index, future = pending.popleft()
+                try:
+                    data = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        # 工作进程异常退出，下次调用时重建进程池
+                        self.shutdown(executor)
+                    if not return_exceptions:
+                        raise
+                    data = e
+                yield page_index, data
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的渲染
+            for _, future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _iter_in_thread(pdf_path, page_indices, settings, window, return_exceptions):
+        """在后台线程中顺序渲染，最多提前渲染 window 页。"""
+        results: "queue.Queue" = queue.Queue(maxsize=window)
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for page_index in page_indices:
+                    try:
+                        # 逐页借用句柄，渲染间隙其他线程也能访问同一文档
+                        data = _render_in_worker(pdf_path, page_index, settings)
+                    except FileNotFoundError:
+                        raise
+                    except Exception as e:  # pylint: disable=broad-except
+                        data = e
+                    if not put((page_index, data)):
+                        return
+            except Exception as e:  # pylint: disable=broad-except
+                put((None, e))
+            finally:
+                put(done)
+
+        producer = threading.Thread(target=produce, name="page-rasterizer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    return
+                page_index, data = item
+                if isinstance(data, Exception) and (page_index is None or not return_exceptions):
+                    raise data
+                yield page_index, data
+        finally:
+            stop.set()
+            producer.join(timeout=1)
+
+    def render(self, pdf_path: str, page_index: int, settings: Optional[RenderSettings] = None) -> bytes:
+        """渲染单页。"""
+        for _, data in self.iter_pages(pdf_path, [page_index], settings):
+            return data
+        raise IndexError(page_index)
+
+    def shutdown(self, executor: Optional[ProcessPoolExecutor] = None) -> None:
+        with self._lock:
+            if self._executor is not None and executor in (None, self._executor):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_rasterizer: Optional[PageRasterizer] = None
+_rasterizer_pid: Optional[int] = None
+_rasterizer_lock = threading.Lock()
+
+
+def get_rasterizer() -> PageRasterizer:
+    """获取进程级共享的渲染服务，工作进程数由 RASTERIZE_WORKERS 配置。"""
+    global _rasterizer, _rasterizer_pid
+
+    pid = os.getpid()
+    if _rasterizer is None or _rasterizer_pid != pid:
+        with _rasterizer_lock:
+            if _rasterizer is None or _rasterizer_pid != pid:
+                _rasterizer = PageRasterizer()
+                _rasterizer_pid = pid
+    return _rasterizer
@@ -0,0 +1,272 @@
+"""令牌桶限流器，OCR、LLM 与 TTS 调用共用。
+
+限流状态保存在可插拔的后端中：默认是进程内存，Web 端在启动时替换为文件锁或数据库后端，
+使 gunicorn 与 Celery 的所有进程共享同一个配额。
+
+实现采用 GCRA（令牌桶的等价形式）：每次获取令牌时在后端原子地“预约”下一个可用时间点，
+随后在锁外睡眠到该时间点。调用方按预约先后依次放行，天然公平，也不需要轮询后端。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger("book2tts.rate_limiter")
+
+# 各调用方的默认速率，格式为 "每秒请求数[/突发容量]"，空字符串表示不限流。
+# 可通过环境变量 RATE_LIMIT_<NAME> 覆盖，例如 RATE_LIMIT_LLM=5/10
+DEFAULT_RATES = {
+    "ocr_volc": "1",
+    "llm": "",
+    "edge_tts": "",
+    "azure_tts": "",
+}
+
+
+class RateLimitTimeout(Exception):
+    """在给定的超时时间内无法获取令牌。"""
+
+
+def gcra_reserve(
+    stored_tat: float, now: float, interval: float, burst: int, cost: float
+) -> Tuple[float, float]:
+    """
+    计算一次预约。
+
+    Args:
+        stored_tat: 后端保存的理论到达时间（theoretical arrival time）
+        now: 当前时间戳
+        interval: 单个令牌的生成间隔（秒）
+        burst: 突发容量
+        cost: 本次消耗的令牌数
+
+    Returns:
+        (新的理论到达时间, 需要等待的秒数)
+    """
+    new_tat = max(stored_tat, now) + cost * interval
+    wait = max(0.0, new_tat - burst * interval - now)
+    return new_tat, wait
+
+
+class RateLimitBackend:
+    """限流状态后端接口。"""
+
+    def reserve(
+        self,
+        key: str,
+        interval: float,
+        burst: int,
+        cost: float,
+        max_wait: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        原子地预约 cost 个令牌。
+
+        Returns:
+            需要等待的秒数；若等待时间超过 max_wait 则不预约并返回 None
+        """
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """进程内后端，仅在单进程内生效，适用于测试和独立运行的脚本。"""
+
+    def __init__(self):
+        self._tats: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key, interval, burst, cost, max_wait=None):
+        with self._lock:
+            new_tat, wait = gcra_reserve(
+                self._tats.get(key, 0.0), time.time(), interval, burst, cost
+            )
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tats[key] = new_tat
+            return wait
+
+
+class FileRateLimitBackend(RateLimitBackend):
+    """
+    基于文件锁的后端，同一台机器上的所有进程共享令牌桶（依赖 fcntl，仅支持 POSIX）。
+
+    每个 key 对应目录下的一个小文件，预约时持有 flock 排他锁读写理论到达时间，
+    锁只覆盖一次读写，等待在锁外进行。
+    """
+
+    def __init__(self, directory: str):
+        if fcntl is None:
+            raise RuntimeError("FileRateLimitBackend requires fcntl (POSIX only)")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".bucket")
+
+    def reserve(self, key, interval, burst, cost, max_wait=None):
+        fd = os.open(self._path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # flock 锁属于打开的文件描述，同一进程内的多个线程也会互斥；关闭文件即释放
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                stored_tat = float(os.pread(fd, 64, 0).decode() or 0)
+            except ValueError:
+                stored_tat = 0.0
+            new_tat, wait = gcra_reserve(stored_tat, time.time(), interval, burst, cost)
+            if max_wait is not None and wait > max_wait:
+                return None
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, repr(new_tat).encode(), 0)
+            return wait
+        finally:
+            os.close(fd)
+
+
+_default_backend: RateLimitBackend = InMemoryRateLimitBackend()
+
+
+def set_default_backend(backend: RateLimitBackend) -> None:
+    """替换全局后端，例如在 Django 启动时切换为文件锁或数据库后端。"""
+    global _default_backend
+    _default_backend = backend
+
+
+def get_default_backend() -> RateLimitBackend:
+    return _default_backend
+
+
+class TokenBucketLimiter:
+    """
+    令牌桶限流器，可作为同步或异步上下文管理器使用::
+
+        with get_rate_limiter("ocr_volc"):
+            ocr_volc(...)
+
+        async with get_rate_limiter("edge_tts"):
+            await communicate.save(...)
+
+    进入上下文时获取一个令牌，退出时不做任何事情。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: Optional[float],
+        burst: int = 1,
+        backend: Optional[RateLimitBackend] = None,
+    ):
+        self.name = name
+        self.rate = rate if rate and rate > 0 else None
+        self.burst = max(1, int(burst))
+        self._backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate is not None
+
+    @property
+    def backend(self) -> RateLimitBackend:
+        return self._backend or get_default_backend()
+
+    def _reserve(self, cost: float, timeout: Optional[float]) -> float:
+        wait = self.backend.reserve(
+            f"book2tts:{self.name}", 1.0 / self.rate, self.burst, cost, timeout
+        )
+        if wait is None:
+            raise RateLimitTimeout(
+                f"rate limit '{self.name}' could not be acquired within {timeout}s"
+            )
+        if wait > 0:
+            logger.debug("Rate limit %s: waiting %.3fs", self.name, wait)
+        return wait
+
+    def acquire(self, cost: float = 1, timeout: Optional[float] = None) -> float:
+        """
+        阻塞直到获得 cost 个令牌。
+
+        Args:
+            cost: 消耗的令牌数
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            实际等待的秒数
+
+        Raises:
+            RateLimitTimeout: 等待时间将超过 timeout
+        """
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(cost, timeout)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, cost: float = 1, timeout: Optional[float] = None) -> float:
+        """acquire 的异步版本，预约在线程中完成，等待时不阻塞事件循环。"""
+        if not self.enabled:
+            return 0.0
+        wait = await asyncio.to_thread(self._reserve, cost, timeout)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+def parse_rate(spec: str) -> Tuple[Optional[float], int]:
+    """解析 "每秒请求数[/突发容量]"，如 "2" 或 "0.5/3"；空值或 0 表示不限流。"""
+    spec = (spec or "").strip()
+    if not spec:
+        return None, 1
+    rate_part, _, burst_part = spec.partition("/")
+    rate = float(rate_part)
+    burst = int(burst_part) if burst_part else 1
+    return (rate if rate > 0 else None), burst
+
+
+_limiters: Dict[str, TokenBucketLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> TokenBucketLimiter:
+    """获取指定调用方的共享限流器，速率来自 RATE_LIMIT_<NAME> 或 DEFAULT_RATES。"""
+    limiter = _limiters.get(name)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            spec = os.environ.get(f"RATE_LIMIT_{name.upper()}", DEFAULT_RATES.get(name, ""))
+            try:
+                rate, burst = parse_rate(spec)
+            except ValueError:
+                logger.warning("Invalid RATE_LIMIT_%s=%r, using default", name.upper(), spec)
+                rate, burst = parse_rate(DEFAULT_RATES.get(name, ""))
+            limiter = TokenBucketLimiter(name, rate, burst)
+            _limiters[name] = limiter
+    return limiter
@@ -4,7 +4,8 @@ import os
 import time
 import gradio as gr
 
-from book2tts.ebook import get_content_with_href, open_ebook, ebook_toc
+from book2tts.ebook import open_ebook, ebook_toc
+from book2tts.epub_chapters import extract_document_texts
 from book2tts.pdf import (
     extract_text_by_page,
     extract_img_by_page,
@@ -17,6 +18,7 @@ from book2tts.tts import (
     azure_long_text_to_speech,
 )
 from book2tts.ocr import ocr_volc
+from book2tts.page_cleaner import PAGE_SEPARATOR, clean_pages, strip_noise_enabled
 from book2tts.llm_service import LLMService
 
 # Global variables to be shared with UI
@@ -138,12 +140,12 @@ def init_single_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
                 if book_type_pdf_img_vector:
                     book_toc = extract_img_vector_by_page(file)
                     dropdown = gr.Dropdown(
-                        choices=[f"page-{i}" for i, _ in enumerate(book_toc)], multiselect=True
+                        choices=[f"page-{i}" for i in range(len(book_toc))], multiselect=True
                     )
                 else:
                     book_toc = extract_img_by_page(file)
                     dropdown = gr.Dropdown(
-                        choices=[f"page-{i}" for i, _ in enumerate(book_toc)], multiselect=True
+                        choices=[f"page-{i}" for i in range(len(book_toc))], multiselect=True
                     )
             else:
                 result = extract_text_by_page(file)
@@ -176,7 +178,7 @@ def init_single_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
                 else:
                     # 如果没有目录，使用原来的页码方式
                     dropdown = gr.Dropdown(
-                        choices=[f"page-{i}" for i, _ in enumerate(book_toc)], multiselect=True
+                        choices=[f"page-{i}" for i in range(len(book_toc))], multiselect=True
                     )
             return dropdown, file.split("/")[-1].split(".")[0].replace(" ", "_")
         elif file.endswith(".epub"):
@@ -289,7 +291,7 @@ def init_single_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
             for i, t in enumerate(book_toc)
             if f"{i}-{t.get('title')}" in value
         ]
-        texts = [get_content_with_href(book, href) or "" for href in hrefs]
+        texts = extract_document_texts(book.filepath, hrefs)
         texts = list(map(lambda v: v or "", texts))
         texts = list(map(lambda v: v.strip(), texts))
 
@@ -358,11 +360,18 @@ def init_single_process_ui(llm_service, DEFAULT_SYSTEM_PROMPT):
 
     def llm_gen(text, line_num_head, line_num_tail, system_prompt):
         results = []
-        for sub_text in text.split("\n\n\n"):
+        sub_texts = [
+            exclude_text(sub_text, line_num_head, line_num_tail)
+            for sub_text in text.split(PAGE_SEPARATOR)
+        ]
+        if strip_noise_enabled():
+            sub_texts, _ = clean_pages(sub_texts)
+        for sub_text in sub_texts:
             result = llm_service.process_text(
                 system_prompt=system_prompt,
-                user_content=exclude_text(sub_text, line_num_head, line_num_tail),
-                temperature=0.7
+                user_content=sub_text,
+                temperature=0.7,
+                cache_operation="reformat"
             )
             if result.get("success"):
                 results.append(result["result"])
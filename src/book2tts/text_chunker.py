@@ -0,0 +1,229 @@
+"""按 token / 字节预算切分文本，供排版、翻译、对话转换和 TTS 共用。
+
+切分在句子、段落边界进行（兼容中英文标点），单次线性扫描完成。
+拼接所有分段即得到原文，调用方可按需 strip。
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+
+UNIT_TOKENS = "tokens"
+UNIT_BYTES = "bytes"
+UNIT_CHARS = "chars"
+
+# 一个分段在遇到段落/句子边界时至少要填满预算的比例，避免产生过碎的分段
+MIN_FILL_RATIO = 0.5
+
+# 句子切分：中英文句末标点（含其后的引号括号）、换行处或文本结尾，连同其后的空白
+_SENTENCE_RE = re.compile(
+    r"""
+    .*?
+    (?:
+        [。！？!?；;…]+[”’」』）)\]"']*
+      | \.(?=\s)
+      | (?=\n)
+      | $
+    )
+    \s*
+    """,
+    re.VERBOSE,
+)
+# 超长句子的次级切分点：中英文逗号、顿号、冒号（句子可能以换行结尾，需跨行匹配到末尾）
+_CLAUSE_RE = re.compile(r".*?(?:[，,、：:]+\s*|\Z)", re.DOTALL)
+_PARAGRAPH_END_RE = re.compile(r"\n[ \t　]*\n\s*$")
+_SENTENCE_END_RE = re.compile(r"""[。！？!?；;….][”’」』）)\]"']*\s*$""")
+
+# CJK 统一表意文字、假名、韩文及全角符号
+_CJK_RE = re.compile(
+    "[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff"
+    "\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+
+# 分段边界强度
+_BOUNDARY_NONE = 0
+_BOUNDARY_SENTENCE = 1
+_BOUNDARY_PARAGRAPH = 2
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：CJK 字符按 1 token，其余字符按 4 个字符 1 token。"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_RE.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+@dataclass(frozen=True)
+class ChunkBudget:
+    """单个分段的预算，unit 取 tokens / bytes / chars。"""
+
+    limit: int
+    unit: str = UNIT_TOKENS
+
+    def __post_init__(self):
+        if self.limit <= 0:
+            raise ValueError("chunk budget limit must be positive")
+        if self.unit not in (UNIT_TOKENS, UNIT_BYTES, UNIT_CHARS):
+            raise ValueError(f"unknown chunk budget unit: {self.unit}")
+
+    def measure(self, text: str) -> int:
+        if self.unit == UNIT_TOKENS:
+            return estimate_tokens(text)
+        if self.unit == UNIT_BYTES:
+            return len(text.encode("utf-8"))
+        return len(text)
+
+    def char_cost(self, char: str) -> float:
+        """单个字符的预算开销，用于超长句子的硬切分。"""
+        if self.unit == UNIT_TOKENS:
+            return 1.0 if _CJK_RE.match(char) else 0.25
+        if self.unit == UNIT_BYTES:
+            return len(char.encode("utf-8"))
+        return 1
+
+    def __str__(self) -> str:
+        return f"{self.limit} {self.unit}"
+
+
+# 各调用方的默认预算，可通过环境变量 CHUNK_BUDGET_<NAME> 覆盖数值
+DEFAULT_BUDGETS = {
+    "reformat": ChunkBudget(1000, UNIT_TOKENS),
+    "translate": ChunkBudget(1000, UNIT_TOKENS),
+    "dialogue": ChunkBudget(1000, UNIT_TOKENS),
+    # Edge TTS 按 SSML 字节计费与限流
+    "edge_tts": ChunkBudget(6000, UNIT_BYTES),
+    "azure_tts": ChunkBudget(3000, UNIT_BYTES),
+}
+
+
+def budget_for(consumer: str) -> ChunkBudget:
+    """获取指定调用方的分段预算。"""
+    budget = DEFAULT_BUDGETS[consumer]
+    override = os.environ.get(f"CHUNK_BUDGET_{consumer.upper()}")
+    if override:
+        try:
+            return ChunkBudget(int(override), budget.unit)
+        except ValueError:
+            pass
+    return budget
+
+
+def _split_pieces(text: str) -> Iterator[Tuple[str, int]]:
+    """按句子切分，返回 (片段, 边界强度)。"""
+    for match in _SENTENCE_RE.finditer(text):
+        piece = match.group(0)
+        if not piece:
+            continue
+        if _PARAGRAPH_END_RE.search(piece):
+            yield piece, _BOUNDARY_PARAGRAPH
+        elif _SENTENCE_END_RE.search(piece):
+            yield piece, _BOUNDARY_SENTENCE
+        else:
+            yield piece, _BOUNDARY_NONE
+
+
+def _split_oversized(piece: str, budget: ChunkBudget) -> Iterator[str]:
+    """把超出预算的单个句子按子句切分，仍超出时按字符硬切。"""
+    current = ""
+    current_cost: float = 0
+    for clause_match in _CLAUSE_RE.finditer(piece):
+        clause = clause_match.group(0)
+        if not clause:
+            continue
+        clause_cost = budget.measure(clause)
+        if clause_cost > budget.limit:
+            if current:
+                yield current
+                current, current_cost = "", 0
+            for char in clause:
+                char_cost = budget.char_cost(char)
+                if current and current_cost + char_cost > budget.limit:
+                    yield current
+                    current, current_cost = "", 0
+                current += char
+                current_cost += char_cost
+            continue
+        if current and current_cost + clause_cost > budget.limit:
+            yield current
+            current, current_cost = "", 0
+        current += clause
+        current_cost += clause_cost
+    if current:
+        yield current
+
+
+def iter_chunks(text: str, budget: ChunkBudget) -> Iterator[str]:
+    """
+    按预算切分文本。
+
+    优先在段落边界切分，其次句子边界；单个句子超出预算时再按子句或字符切分。
+
+    Args:
+        text: 输入文本
+        budget: 分段预算
+
+    Yields:
+        分段文本，顺序拼接后等于原文
+    """
+    if not text:
+        return
+
+    min_fill = budget.limit * MIN_FILL_RATIO
+    pieces: List[str] = []
+    costs: List[int] = []
+    boundaries: List[int] = []
+    total = 0
+
+    for piece, boundary in _split_pieces(text):
+        cost = budget.measure(piece)
+        if cost > budget.limit:
+            # 超长句子：先清空当前分段，再逐段输出
+            if pieces:
+                yield "".join(pieces)
+                pieces, costs, boundaries, total = [], [], [], 0
+            sub_pieces = list(_split_oversized(piece, budget))
+            if not sub_pieces:
+                continue
+            yield from sub_pieces[:-1]
+            piece = sub_pieces[-1]
+            cost = budget.measure(piece)
+
+        while pieces and total + cost > budget.limit:
+            # 选择切分点：满足最小填充的最后一个段落边界，否则最后一个句子边界
+            cut = len(pieces)
+            for strength in (_BOUNDARY_PARAGRAPH, _BOUNDARY_SENTENCE):
+                filled = total
+                found = None
+                for index in range(len(pieces) - 1, -1, -1):
+                    if filled < min_fill:
+                        break
+                    if boundaries[index] >= strength:
+                        found = index + 1
+                        break
+                    filled -= costs[index]
+                if found is not None:
+                    cut = found
+                    break
+
+            yield "".join(pieces[:cut])
+            pieces, costs, boundaries = pieces[cut:], costs[cut:], boundaries[cut:]
+            total = sum(costs)
+
+        pieces.append(piece)
+        costs.append(cost)
+        boundaries.append(boundary)
+        total += cost
+
+    if pieces:
+        yield "".join(pieces)
+
+
+def split_text(text: str, budget: ChunkBudget) -> List[str]:
+    """iter_chunks 的列表形式，去除纯空白分段。"""
+    return [chunk for chunk in iter_chunks(text, budget) if chunk.strip()]
@@ -6,6 +6,7 @@ from functools import lru_cache
 
 from book2tts.long_tts import LongTTS
 from book2tts.edgetts import EdgeTTS
+from book2tts.rate_limiter import get_rate_limiter
 
 
 def azure_text_to_speech(
@@ -26,7 +27,8 @@ def azure_text_to_speech(
     )
 
     # 合成文本并保存到文件
-    result = synthesizer.speak_text_async(text).get()
+    with get_rate_limiter("azure_tts"):
+        result = synthesizer.speak_text_async(text).get()
 
     if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
         return result
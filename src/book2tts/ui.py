@@ -23,7 +23,7 @@ from book2tts.tts import (
     edge_text_to_speech,
     azure_long_text_to_speech,
 )
-from book2tts.llm_service import LLMService
+from book2tts.llm_service import get_shared_llm_service
 from book2tts.single_process import init_single_process_ui
 from book2tts.batch_process import init_batch_process_ui
 
@@ -33,7 +33,7 @@ from book2tts.ocr import ocr_volc
 load_dotenv()
 
 # Initialize LLM service
-llm_service = LLMService()
+llm_service = get_shared_llm_service()
 
 # Global system prompt for text processing
 DEFAULT_SYSTEM_PROMPT = """
@@ -205,9 +205,50 @@ CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
 CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 25 minutes
 CELERY_WORKER_SEND_TASK_EVENTS = True
 
+# 文本转对话时并发调用 LLM 的分段数量
+DIALOGUE_CHUNK_CONCURRENCY = int(os.getenv("DIALOGUE_CHUNK_CONCURRENCY", "4"))
+
 # OCR Configuration
 VOLC_AK = os.getenv("VOLC_AK", "")
 VOLC_SK = os.getenv("VOLC_SK", "")
+
+# 批量OCR与OCR预取使用的识别引擎：volc（火山引擎OCR，逐页请求）或
+# llm（视觉模型，OCR_PROVIDER 指定服务商，每 LLM_OCR_BATCH_SIZE 页打包为一个请求）
+OCR_ENGINE = os.getenv("OCR_ENGINE", "volc")
+
+# 阅读扫描版PDF时，后台低优先级预取后续 N 页的OCR结果，0 表示关闭
+# 预取结果被读取时才扣除积分
+OCR_PREFETCH_PAGES = int(os.getenv("OCR_PREFETCH_PAGES", "0"))
+
+# 自动排版前在本地去除页眉页脚、页码和软换行，减少交给 LLM 的文本量
+REFORMAT_STRIP_NOISE = os.getenv("REFORMAT_STRIP_NOISE", "true").lower() in ("1", "true", "yes", "on")
+# 本地清理后通过质量检查的分段直接输出，不再调用 LLM
+REFORMAT_SKIP_LLM = os.getenv("REFORMAT_SKIP_LLM", "false").lower() in ("1", "true", "yes", "on")
+
+# 书籍文本/目录索引的存放目录，上传后在后台生成，阅读时直接读取其中的页面文本和目录
+BOOK_INDEX_DIR = os.getenv("BOOK_INDEX_DIR", os.path.join(MEDIA_ROOT, "book_index"))
+
+# PDF 页面图片（缩略图/查看图）的磁盘缓存目录，按书籍哈希、页码和尺寸档位存放
+PAGE_IMAGE_CACHE_DIR = os.getenv("PAGE_IMAGE_CACHE_DIR", os.path.join(MEDIA_ROOT, "page_images"))
+
+# 原文查看中 EPUB 图片的最大宽度（像素），更宽的位图缩小后返回，0 表示返回原图
+EPUB_IMAGE_MAX_WIDTH = int(os.getenv("EPUB_IMAGE_MAX_WIDTH", "0"))
+
+# LLM 结果缓存（排版、对话转换等）的存储后端：database（所有 Web / Celery 进程共享）或 memory（仅当前进程）
+# 缓存的有效期与容量通过 LLM_CACHE_TTL、LLM_CACHE_MAX_ENTRIES、LLM_CACHE_MAX_BYTES 配置
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "database")
+
+# OCR / LLM / TTS 调用限流状态的存储后端，file 与 database 使所有 Web / Celery 进程共享配额：
+# file：MEDIA_ROOT 下的文件锁令牌桶（默认，同一台机器上的所有进程共享，不占用数据库写锁）
+# database：数据库中的令牌桶（多台机器共享，适用于 PostgreSQL / MySQL 等支持并发写入的数据库）
+# memory：每个进程各自限流，总速率约为配置值乘以进程数，仅用于测试或单进程运行
+# 各调用方的速率通过 RATE_LIMIT_OCR_VOLC、RATE_LIMIT_LLM 等环境变量配置
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "file")
+RATE_LIMIT_DIR = os.getenv("RATE_LIMIT_DIR", os.path.join(MEDIA_ROOT, "rate_limits"))
+
+# 探索页等音频搜索的后端：auto（SQLite 上使用 FTS5 全文索引，其他数据库用 icontains）、
+# fts5、basic，或自定义后端类的导入路径
+AUDIO_SEARCH_BACKEND = os.getenv("AUDIO_SEARCH_BACKEND", "auto")
 CELERY_TASK_SEND_SENT_EVENT = True
 
 # Database transport settings (only needed for non-eager mode)
@@ -11,47 +11,33 @@ from feedgen.feed import FeedGenerator
 from workbench.models import UserProfile
 
 
-def estimate_audio_duration(audio_file):
-    """使用ffmpeg获取音频文件时长"""
-    if not audio_file:
-        return 300, "0:05:00"  # 默认5分钟
-    
-    # 格式化时长为时:分:秒字符串
-    def format_duration(seconds):
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-        
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{secs:02d}"
-        else:
-            return f"{minutes}:{secs:02d}"
-    
-    try:
-        import ffmpeg
-        # 使用ffmpeg探测文件获取音频信息
-        probe = ffmpeg.probe(audio_file.path)
-        
-        # 查找音频流并获取时长
-        audio_stream = next(
-            (stream for stream in probe["streams"] if stream["codec_type"] == "audio"),
-            None,
-        )
-        
-        if audio_stream is not None:
-            duration_seconds = int(float(audio_stream["duration"]))
-            return duration_seconds, format_duration(duration_seconds)
-    except (ImportError, Exception) as e:
-        # 如果ffmpeg不可用或出错，回退到基于文件大小的估算
-        print(f"使用文件大小估算音频时长: {str(e)}")
-        
-    # 回退方法: 使用文件大小估算时长
-    # 假设平均比特率为128kbps
-    bit_rate = 128 * 1024  # 比特/秒
-    file_size = audio_file.size  # 字节
-    
-    # 估算时长（秒）
-    duration_seconds = int((file_size * 8) / bit_rate)
+# 时长未知时的默认值和按文件大小估算时使用的比特率
+DEFAULT_AUDIO_DURATION = 300
+ESTIMATE_BIT_RATE = 128 * 1024
+
+
+def format_duration(seconds):
+    """格式化时长为时:分:秒字符串"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+def feed_audio_duration(audio_duration=None, file_size=0):
+    """
+    返回 (时长秒数, 格式化时长)。
+    优先使用写入时保存的时长，未知时按保存的文件大小估算，不访问存储也不调用 ffmpeg。
+    """
+    if audio_duration:
+        duration_seconds = int(audio_duration)
+    elif file_size:
+        duration_seconds = int((file_size * 8) / ESTIMATE_BIT_RATE)
+    else:
+        duration_seconds = DEFAULT_AUDIO_DURATION
     return duration_seconds, format_duration(duration_seconds)
 
 
@@ -202,7 +188,8 @@ def create_podcast_feed(title, link, description, language, author_name, image_u
 def add_podcast_entry(feed, title, audio_url, audio_size, link, description, pubdate,
                      author, duration_formatted, duration_seconds, image_url=None,
                      episode_number=None, season_number=None, unique_id=None,
-                     subtitle_url=None, chapters_url=None, chapters_html=None):
+                     subtitle_url=None, chapters_url=None, chapters_html=None,
+                     mime_type='audio/mpeg'):
     """
     向podcast feed添加一个条目（支持字幕）
     """
@@ -215,7 +202,7 @@ def add_podcast_entry(feed, title, audio_url, audio_size, link, description, pub
     
     # 添加音频附件
     if audio_url:
-        fe.enclosure(audio_url, str(audio_size), 'audio/mpeg')
+        fe.enclosure(audio_url, str(audio_size), mime_type or 'audio/mpeg')
     
     # 注释掉字幕附件，RSS feed不需要包含字幕
     # if subtitle_url:
@@ -12,7 +12,7 @@ from django.views.decorators.vary import vary_on_headers
 
 from home.utils.cache_utils import register_rss_cache_key
 from home.utils.rss_utils import (
-    estimate_audio_duration,
+    feed_audio_duration,
     ensure_rss_token,
     clean_xml_output,
     create_podcast_feed,
@@ -55,31 +55,17 @@ def _cache_key_for_host(base_key: str, request) -> str:
 
 def _build_book_season_mapping(audio_items):
     """
-    根据音频项目列表构建书籍到 Season 编号的映射。
+    根据音频列表构建书籍到 Season 编号的映射。
     Season 编号按照每本书第一个音频的创建时间排序。
 
     Args:
-        audio_items: 音频项目列表
+        audio_items: get_unified_audio_content 返回的 AudioListing
 
     Returns:
         dict: {book_id: season_number} 映射
     """
-    from collections import defaultdict
-
-    # 收集每本书的最早创建时间
-    book_earliest_time = {}
-
-    for item in audio_items:
-        book = item.get('book')
-        if not book:
-            continue
-
-        book_id = book.id
-        # 使用创建时间（更稳定，不受后续编辑影响）
-        publish_time = item.get('created_at')
-
-        if book_id not in book_earliest_time or publish_time < book_earliest_time[book_id]:
-            book_earliest_time[book_id] = publish_time
+    # 每本书的最早创建时间在数据库中聚合（更稳定，不受后续编辑影响）
+    book_earliest_time = audio_items.book_first_created()
 
     # 按照最早创建时间排序书籍（升序：最早的 = Season 1）
     sorted_books = sorted(book_earliest_time.items(), key=lambda x: x[1])
@@ -294,14 +280,8 @@ def audio_rss_feed(request, user_id=None):
             reverse('audio_detail', kwargs={'segment_type': item['type'], 'segment_id': item['id']})
         )
         
-        # 处理音频时长
-        if item['type'] == 'dialogue_script' and item.get('audio_duration'):
-            # 对话脚本有精确的时长
-            duration_seconds = int(item['audio_duration'])
-            formatted_duration = f"{duration_seconds//3600:02d}:{(duration_seconds%3600)//60:02d}:{duration_seconds%60:02d}"
-        else:
-            # 估计音频时长
-            duration_seconds, formatted_duration = estimate_audio_duration(item.get('file') if item.get('file') else None)
+        # 音频时长在写入时已保存，未知时按文件大小估算
+        duration_seconds, formatted_duration = feed_audio_duration(item.get('audio_duration'), item['file_size'])
         
         # 尝试获取图片（如果有）或使用书籍的封面图
         item_image_url = None
@@ -310,10 +290,8 @@ def audio_rss_feed(request, user_id=None):
         else:
             item_image_url = _absolute_for_request(request, '/static/images/default_cover.png')
         
-        # 准备简短文本描述
-        description = item['text'] or ''
-        # 截取文本，保留前300个字符
-        short_description = description[:300] + ('...' if len(description) > 300 else '')
+        # 简短文本描述（前300个字符）在写入时已保存
+        short_description = item['excerpt']
 
         chapters_url = None
         chapters_file = item.get('chapters_file')
@@ -327,6 +305,7 @@ def audio_rss_feed(request, user_id=None):
             title=f"{item['book'].name if item['book'] else '对话脚本'} - {item['title']}",
             audio_url=audio_url,
             audio_size=item['file_size'],
+            mime_type=item['mime_type'],
             link=item_link,
             description=short_description,
             pubdate=item['updated_at'],
@@ -457,19 +436,11 @@ def audio_rss_feed_by_book(request, token, book_id):
             reverse('audio_detail', kwargs={'segment_type': item['type'], 'segment_id': item['id']})
         )
         
-        # 处理音频时长
-        if item['type'] == 'dialogue_script' and item.get('audio_duration'):
-            # 对话脚本有精确的时长
-            duration_seconds = int(item['audio_duration'])
-            formatted_duration = f"{duration_seconds//3600:02d}:{(duration_seconds%3600)//60:02d}:{duration_seconds%60:02d}"
-        else:
-            # 估计音频时长
-            duration_seconds, formatted_duration = estimate_audio_duration(item.get('file') if item.get('file') else None)
+        # 音频时长在写入时已保存，未知时按文件大小估算
+        duration_seconds, formatted_duration = feed_audio_duration(item.get('audio_duration'), item['file_size'])
         
-        # 准备简短文本描述
-        description = item['text'] or ''
-        # 截取文本，保留前300个字符
-        short_description = description[:300] + ('...' if len(description) > 300 else '')
+        # 简短文本描述（前300个字符）在写入时已保存
+        short_description = item['excerpt']
 
         chapters_url = None
         chapters_file = item.get('chapters_file')
@@ -483,6 +454,7 @@ def audio_rss_feed_by_book(request, token, book_id):
             title=f"{book.name} - {item['title']}",
             audio_url=audio_url,
             audio_size=item['file_size'],
+            mime_type=item['mime_type'],
             link=item_link,
             description=short_description,
             pubdate=item['updated_at'],
@@ -595,19 +567,11 @@ def audio_rss_feed_by_token(request, token, book_id=None):
             reverse('audio_detail', kwargs={'segment_type': item['type'], 'segment_id': item['id']})
         )
 
-        # 处理音频时长
-        if item['type'] == 'dialogue_script' and item.get('audio_duration'):
-            # 对话脚本有精确的时长
-            duration_seconds = int(item['audio_duration'])
-            formatted_duration = f"{duration_seconds//3600:02d}:{(duration_seconds%3600)//60:02d}:{duration_seconds%60:02d}"
-        else:
-            # 估计音频时长
-            duration_seconds, formatted_duration = estimate_audio_duration(item.get('file') if item.get('file') else None)
+        # 音频时长在写入时已保存，未知时按文件大小估算
+        duration_seconds, formatted_duration = feed_audio_duration(item.get('audio_duration'), item['file_size'])
         
-        # 准备简短文本描述
-        description = item['text'] or ''
-        # 截取文本，保留前300个字符
-        short_description = description[:300] + ('...' if len(description) > 300 else '')
+        # 简短文本描述（前300个字符）在写入时已保存
+        short_description = item['excerpt']
 
         chapters_url = None
         chapters_file = item.get('chapters_file')
@@ -628,6 +592,7 @@ def audio_rss_feed_by_token(request, token, book_id=None):
             title=f"{item['book'].name if item['book'] else '对话脚本'} - {item['title']}",
             audio_url=audio_url,
             audio_size=item['file_size'],
+            mime_type=item['mime_type'],
             link=item_link,
             description=short_description,
             pubdate=item['updated_at'],
@@ -753,11 +718,12 @@ def explore(request):
     # 搜索功能
     search_query = request.GET.get('q', '').strip()
 
-    # 使用数据库搜索获取音频内容
+    # 使用全文索引搜索音频内容，有关键词时按相关度排序
     all_audio_items = get_unified_audio_content(
         published_only=True,
         search_query=search_query,
-        sort_by_publish_time=True
+        sort_by_publish_time=True,
+        order_by_relevance=True,
     )
 
     # 分页配置
@@ -12,6 +12,7 @@ from .models import (
     TTSVoicePreview,
     TTSProviderConfig,
     TranslationCache,
+    AudiobookJob,
 )
 
 
@@ -95,6 +96,14 @@ class OCRCacheAdmin(admin.ModelAdmin):
     text_preview.short_description = "文本预览"
 
 
+@admin.register(AudiobookJob)
+class AudiobookJobAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'book', 'output_format', 'status', 'audio_duration', 'created_at')
+    list_filter = ('status', 'output_format', 'created_at')
+    search_fields = ('title', 'book__name', 'user__username')
+    readonly_fields = ('task_id', 'chapters', 'created_at', 'updated_at', 'completed_at')
+
+
 @admin.register(TTSVoicePreview)
 class TTSVoicePreviewAdmin(admin.ModelAdmin):
     list_display = ('voice_name', 'tts_provider', 'file_link', 'last_generated_at', 'updated_at')
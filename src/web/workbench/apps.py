@@ -1,5 +1,9 @@
+import logging
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class WorkbenchConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
@@ -18,3 +22,28 @@ class WorkbenchConfig(AppConfig):
             # This is a bit of a hack since settings are generally immutable after startup
             # In a production environment, you should add this directly to the settings file
             settings.MIDDLEWARE.append(middleware_path)
+
+        # 限流状态后端：file / database 使所有 Web / Celery 进程共享调用配额，memory 仅在当前进程内生效
+        backend_name = getattr(settings, "RATE_LIMIT_BACKEND", "file")
+        if backend_name == "file":
+            from book2tts.rate_limiter import FileRateLimitBackend, set_default_backend
+
+            try:
+                set_default_backend(FileRateLimitBackend(settings.RATE_LIMIT_DIR))
+            except (RuntimeError, OSError) as e:
+                logger.warning("File rate limit backend unavailable, limiting per process: %s", e)
+        elif backend_name == "database":
+            from book2tts.rate_limiter import set_default_backend
+            from .utils.rate_limit import DatabaseRateLimitBackend
+
+            set_default_backend(DatabaseRateLimitBackend())
+
+        # LLM 结果缓存保存在数据库中，重试或重新提交落到其他进程时同样命中
+        if getattr(settings, "LLM_CACHE_BACKEND", "database") == "database":
+            from book2tts.llm_cache import llm_cache_options, set_default_llm_cache
+            from .utils.llm_cache import DatabaseLLMResultCache
+
+            set_default_llm_cache(DatabaseLLMResultCache(**llm_cache_options()))
+
+        # 注册音频全文索引的同步信号
+        from .utils import search  # noqa: F401
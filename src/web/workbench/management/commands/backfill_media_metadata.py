@@ -0,0 +1,75 @@
+"""
+Django management command to populate denormalized media metadata for existing audio
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from book2tts.audio_utils import get_audio_duration
+from workbench.models import AudioSegment, DialogueScript
+
+
+class Command(BaseCommand):
+    help = (
+        'Populate file size, MIME type, subtitle size, duration, excerpt and chapter count '
+        'for audio segments and dialogue scripts written before these columns existed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every row instead of only rows with missing metadata',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows fetched per database query',
+        )
+        parser.add_argument(
+            '--skip-duration',
+            action='store_true',
+            help='Do not probe audio files with ffmpeg for missing durations',
+        )
+
+    def handle(self, *args, **options):
+        for model in (AudioSegment, DialogueScript):
+            queryset = model.objects.order_by('pk')
+            if not options['all']:
+                queryset = queryset.filter(
+                    Q(mime_type='') | Q(excerpt='') | Q(audio_duration__isnull=True)
+                )
+            updated = failed = 0
+            for instance in queryset.iterator(chunk_size=options['batch_size']):
+                try:
+                    changed = instance.refresh_media_metadata(force=True)
+                    if instance.audio_duration is None and not options['skip_duration']:
+                        duration = self._probe_duration(getattr(instance, instance.AUDIO_FIELD))
+                        if duration:
+                            instance.audio_duration = duration
+                            changed.append('audio_duration')
+                except Exception as exc:  # pylint: disable=broad-except
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} #{instance.pk}: {exc}')
+                    continue
+                if changed:
+                    # 直接更新字段，不经过 save()，避免改动 updated_at 影响列表和RSS排序
+                    model.objects.filter(pk=instance.pk).update(
+                        **{field_name: getattr(instance, field_name) for field_name in changed}
+                    )
+                    updated += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model.__name__}: updated {updated} rows' + (f', {failed} failed' if failed else '')
+            ))
+
+    @staticmethod
+    def _probe_duration(file_field):
+        if not file_field:
+            return None
+        try:
+            path = file_field.path
+        except NotImplementedError:
+            # 远程存储没有本地路径，保留为空，读取时按文件大小估算
+            return None
+        return get_audio_duration(path) or None
@@ -0,0 +1,115 @@
+"""
+Django management command to compare EPUB text extraction backends on a book
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book2tts.ebook import PyMuPdfEpubAdapter, ebook_pages, get_content_with_href
+from book2tts.epub_text import BACKEND_BS4, BACKEND_LXML
+from workbench.models import Books
+
+
+def _toc_hrefs(items, hrefs):
+    for item in items:
+        if isinstance(item, tuple):
+            section, children = item
+            hrefs.append(section.href)
+            _toc_hrefs(children, hrefs)
+        else:
+            hrefs.append(item.href)
+    return hrefs
+
+
+class Command(BaseCommand):
+    help = 'Time EPUB text extraction (every TOC fragment and spine document) with the bs4 and lxml backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'epub',
+            nargs='?',
+            help='EPUB file path (or use --book-id)',
+        )
+        parser.add_argument(
+            '--book-id',
+            type=int,
+            help='Use the EPUB of an uploaded book',
+        )
+        parser.add_argument(
+            '--backends',
+            default=f'{BACKEND_BS4},{BACKEND_LXML}',
+            help='Comma separated backends to compare, the first one is the output baseline',
+        )
+
+    def handle(self, *args, **options):
+        epub_path = self._resolve_epub(options)
+        backends = [name.strip() for name in options['backends'].split(',') if name.strip()]
+        unknown = set(backends) - {BACKEND_BS4, BACKEND_LXML}
+        if unknown:
+            raise CommandError(f"Unknown backends: {', '.join(sorted(unknown))}")
+
+        requests = self._requests(epub_path)
+        self.stdout.write(f'{len(requests)} extractions (TOC fragments and spine documents)')
+
+        results = {}
+        for backend in backends:
+            # 每个后端使用新打开的句柄，避免共用已解析文档的缓存
+            book = PyMuPdfEpubAdapter(epub_path)
+            try:
+                started = time.perf_counter()
+                texts = [
+                    get_content_with_href(book, href, end_fragment=end_fragment, backend=backend)
+                    for href, end_fragment in requests
+                ]
+                elapsed = time.perf_counter() - started
+            finally:
+                book.close()
+            results[backend] = (elapsed, texts)
+
+        baseline_elapsed, baseline_texts = results[backends[0]]
+        self.stdout.write(f"{'backend':<10}{'time':>10}{'speedup':>10}{'chars':>12}{'mismatches':>12}")
+        for backend, (elapsed, texts) in results.items():
+            mismatches = sum(1 for a, b in zip(baseline_texts, texts) if a != b)
+            speedup = baseline_elapsed / elapsed if elapsed else 0
+            self.stdout.write(
+                f"{backend:<10}{elapsed:>9.2f}s{speedup:>9.1f}x"
+                f"{sum(len(text) for text in texts):>12}{mismatches:>12}"
+            )
+
+    def _resolve_epub(self, options):
+        if options['book_id']:
+            try:
+                book = Books.objects.get(pk=options['book_id'])
+            except Books.DoesNotExist:
+                raise CommandError(f"Book {options['book_id']} not found")
+            if book.file_type != '.epub':
+                raise CommandError(f"Book {options['book_id']} is not an EPUB")
+            return book.file.path
+        if not options['epub']:
+            raise CommandError('Either an EPUB path or --book-id is required')
+        if not os.path.exists(options['epub']):
+            raise CommandError(f"File not found: {options['epub']}")
+        return options['epub']
+
+    @staticmethod
+    def _requests(epub_path):
+        """(href, end_fragment) 列表：目录条目截止到同一文档中的下一个锚点，另加每个 spine 文档"""
+        book = PyMuPdfEpubAdapter(epub_path)
+        try:
+            hrefs = _toc_hrefs(book.toc, [])
+            pages = ebook_pages(book)
+        finally:
+            book.close()
+
+        requests = []
+        for i, href in enumerate(hrefs):
+            end_fragment = None
+            if i + 1 < len(hrefs):
+                next_base, _, next_fragment = hrefs[i + 1].partition('#')
+                if next_fragment and next_base == href.split('#', 1)[0]:
+                    end_fragment = next_fragment
+            requests.append((href, end_fragment))
+        requests.extend((page['href'], None) for page in pages)
+        return requests
@@ -0,0 +1,153 @@
+"""
+Django management command to compare OCR image profiles on sample scanned pages
+"""
+
+import difflib
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book2tts.ocr import OCR_IMAGE_PROFILES, get_ocr_image_profile, ocr_volc
+from book2tts.pdf import lease_pdf
+from book2tts.rasterize import render_page
+from workbench.models import Books
+from workbench.utils.ocr_utils import get_ocr_credentials
+
+
+class Command(BaseCommand):
+    help = 'Compare OCR image profiles (size, encode time, OCR latency and accuracy) on sample pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'pdf',
+            nargs='?',
+            help='PDF file path (or use --book-id)',
+        )
+        parser.add_argument(
+            '--book-id',
+            type=int,
+            help='Use the PDF of an uploaded book',
+        )
+        parser.add_argument(
+            '--pages',
+            default='0,1,2',
+            help='Comma separated page indices (0-based), default: 0,1,2',
+        )
+        parser.add_argument(
+            '--profiles',
+            default=','.join(OCR_IMAGE_PROFILES),
+            help='Comma separated profile names to compare',
+        )
+        parser.add_argument(
+            '--reference',
+            default='png',
+            help='Profile whose OCR text is the accuracy baseline, default: png',
+        )
+        parser.add_argument(
+            '--ground-truth',
+            help='Directory with page_<index>.txt reference texts (overrides --reference)',
+        )
+        parser.add_argument(
+            '--skip-ocr',
+            action='store_true',
+            help='Only measure image size and encode time, no OCR API calls',
+        )
+
+    def handle(self, *args, **options):
+        pdf_path = self._resolve_pdf(options)
+        try:
+            pages = [int(page) for page in options['pages'].split(',') if page.strip()]
+        except ValueError:
+            raise CommandError('--pages must be comma separated integers')
+
+        names = [name.strip() for name in options['profiles'].split(',') if name.strip()]
+        try:
+            profiles = {name: get_ocr_image_profile(name) for name in names}
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        ak, sk = get_ocr_credentials()
+        run_ocr = not options['skip_ocr']
+        if run_ocr and not (ak and sk):
+            raise CommandError('OCR credentials are not configured, use --skip-ocr to measure encoding only')
+
+        stats = {}
+        with lease_pdf(pdf_path) as doc:
+            for name, profile in profiles.items():
+                stats[name] = self._measure(doc, pages, profile, ak, sk, run_ocr)
+                self.stdout.write(f'{name} ({profile.cache_key}) done')
+
+        references = self._load_references(options, pages, stats)
+        self._report(stats, references, pages)
+
+    def _resolve_pdf(self, options):
+        if options['book_id']:
+            try:
+                book = Books.objects.get(pk=options['book_id'])
+            except Books.DoesNotExist:
+                raise CommandError(f"Book {options['book_id']} not found")
+            return book.file.path
+        if not options['pdf']:
+            raise CommandError('Either a PDF path or --book-id is required')
+        if not os.path.exists(options['pdf']):
+            raise CommandError(f"File not found: {options['pdf']}")
+        return options['pdf']
+
+    def _measure(self, doc, pages, profile, ak, sk, run_ocr):
+        sizes, encode_times, ocr_times, texts = [], [], [], {}
+        for page_index in pages:
+            started = time.perf_counter()
+            image_data = render_page(doc, page_index, profile)
+            encode_times.append(time.perf_counter() - started)
+            sizes.append(len(image_data))
+
+            if run_ocr:
+                started = time.perf_counter()
+                texts[page_index] = ocr_volc(ak, sk, image_data)
+                ocr_times.append(time.perf_counter() - started)
+
+        return {
+            'size': sum(sizes) / len(sizes),
+            'encode_ms': sum(encode_times) / len(encode_times) * 1000,
+            'ocr_ms': sum(ocr_times) / len(ocr_times) * 1000 if ocr_times else None,
+            'texts': texts,
+        }
+
+    def _load_references(self, options, pages, stats):
+        if options['ground_truth']:
+            references = {}
+            for page_index in pages:
+                path = os.path.join(options['ground_truth'], f'page_{page_index}.txt')
+                if os.path.exists(path):
+                    with open(path, encoding='utf-8') as f:
+                        references[page_index] = f.read()
+            return references
+        reference = stats.get(options['reference'])
+        return reference['texts'] if reference else {}
+
+    def _report(self, stats, references, pages):
+        baseline = stats.get('png') or next(iter(stats.values()))
+        self.stdout.write('')
+        self.stdout.write(f"{'profile':<12}{'avg size':>12}{'ratio':>8}{'encode':>10}{'ocr':>10}{'accuracy':>10}")
+        for name, stat in stats.items():
+            ratio = baseline['size'] / stat['size'] if stat['size'] else 0
+            ocr_ms = f"{stat['ocr_ms']:.0f}ms" if stat['ocr_ms'] is not None else '-'
+            accuracy = self._accuracy(stat['texts'], references, pages)
+            accuracy = f'{accuracy:.1%}' if accuracy is not None else '-'
+            self.stdout.write(
+                f"{name:<12}{stat['size'] / 1024:>10.1f}KB{ratio:>7.1f}x"
+                f"{stat['encode_ms']:>8.0f}ms{ocr_ms:>10}{accuracy:>10}"
+            )
+
+    @staticmethod
+    def _accuracy(texts, references, pages):
+        """与参考文本的字符级相似度（忽略空白），按页平均"""
+        scores = []
+        for page_index in pages:
+            if page_index not in texts or page_index not in references:
+                continue
+            text = ''.join(texts[page_index].split())
+            reference = ''.join(references[page_index].split())
+            scores.append(difflib.SequenceMatcher(None, text, reference, autojunk=False).ratio())
+        return sum(scores) / len(scores) if scores else None
@@ -0,0 +1,118 @@
+"""
+Django management command to measure how much local page cleaning reduces reformat LLM tokens
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book2tts.page_cleaner import PAGE_SEPARATOR, clean_pages, passes_quality_checks
+from book2tts.pdf import extract_text_by_page_range, pdf_page_count
+from book2tts.text_chunker import budget_for, estimate_tokens, iter_chunks
+from workbench.models import Books
+
+
+class Command(BaseCommand):
+    help = 'Compare estimated reformat tokens per page before and after rule-based page cleaning'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'pdf',
+            nargs='?',
+            help='PDF file path (or use --book-id)',
+        )
+        parser.add_argument(
+            '--book-id',
+            type=int,
+            help='Use the PDF of an uploaded book',
+        )
+        parser.add_argument(
+            '--start',
+            type=int,
+            default=0,
+            help='First page index (0-based), default: 0',
+        )
+        parser.add_argument(
+            '--end',
+            type=int,
+            help='Page index after the last page, default: start + 20',
+        )
+        parser.add_argument(
+            '--llm',
+            action='store_true',
+            help='Also send both versions through the reformat LLM and report the real token usage',
+        )
+
+    def handle(self, *args, **options):
+        pdf_path = self._resolve_pdf(options)
+        page_count = pdf_page_count(pdf_path)
+        start = max(options['start'], 0)
+        end = min(options['end'] if options['end'] is not None else start + 20, page_count)
+        if start >= end:
+            raise CommandError(f'Empty page range {start}-{end} (book has {page_count} pages)')
+
+        raw_pages = extract_text_by_page_range(pdf_path, start, end)
+        cleaned_pages, stats = clean_pages(raw_pages)
+        raw_text = PAGE_SEPARATOR.join(raw_pages)
+        cleaned_text = PAGE_SEPARATOR.join(page for page in cleaned_pages if page)
+
+        pages = end - start
+        raw_tokens = estimate_tokens(raw_text)
+        cleaned_tokens = estimate_tokens(cleaned_text)
+        budget = budget_for('reformat')
+        chunks = [chunk for chunk in iter_chunks(cleaned_text, budget) if chunk.strip()]
+        skippable = sum(1 for chunk in chunks if passes_quality_checks(chunk))
+
+        self.stdout.write(f'pages {start}-{end - 1} ({pages} pages)')
+        self.stdout.write(
+            f'removed: {stats.header_lines} header/footer lines, {stats.page_numbers} page numbers, '
+            f'{stats.hyphenations} hyphenations, {stats.joined_lines} soft line breaks'
+        )
+        self.stdout.write(f"{'':<10}{'chars':>10}{'tokens':>10}{'tokens/page':>14}")
+        self.stdout.write(f"{'raw':<10}{len(raw_text):>10}{raw_tokens:>10}{raw_tokens / pages:>14.1f}")
+        self.stdout.write(
+            f"{'cleaned':<10}{len(cleaned_text):>10}{cleaned_tokens:>10}{cleaned_tokens / pages:>14.1f}"
+        )
+        if raw_tokens:
+            self.stdout.write(f'estimated token reduction: {1 - cleaned_tokens / raw_tokens:.1%}')
+        self.stdout.write(f'chunks passing quality checks (LLM can be skipped): {skippable}/{len(chunks)}')
+
+        if options['llm']:
+            raw_usage = self._llm_usage(raw_text, budget)
+            cleaned_usage = self._llm_usage(cleaned_text, budget, skip_clean_chunks=True)
+            self.stdout.write(f"LLM tokens raw: {raw_usage} ({raw_usage / pages:.1f}/page)")
+            self.stdout.write(
+                f"LLM tokens cleaned (skipping chunks that pass checks): {cleaned_usage} "
+                f"({cleaned_usage / pages:.1f}/page)"
+            )
+
+    def _resolve_pdf(self, options):
+        if options['book_id']:
+            try:
+                book = Books.objects.get(pk=options['book_id'])
+            except Books.DoesNotExist:
+                raise CommandError(f"Book {options['book_id']} not found")
+            if book.file_type != '.pdf':
+                raise CommandError(f"Book {options['book_id']} is not a PDF")
+            return book.file.path
+        if not options['pdf']:
+            raise CommandError('Either a PDF path or --book-id is required')
+        if not os.path.exists(options['pdf']):
+            raise CommandError(f"File not found: {options['pdf']}")
+        return options['pdf']
+
+    def _llm_usage(self, text, budget, skip_clean_chunks=False):
+        """按排版分段调用 LLM（不走结果缓存），返回合计 token 数"""
+        from book2tts.llm_service import get_shared_llm_service
+        from workbench.views.text_views import REFORMAT_SYSTEM_PROMPT
+
+        llm_service = get_shared_llm_service()
+        total = 0
+        for chunk in iter_chunks(text, budget):
+            if not chunk.strip() or (skip_clean_chunks and passes_quality_checks(chunk)):
+                continue
+            result = llm_service.process_text(system_prompt=REFORMAT_SYSTEM_PROMPT, user_content=chunk)
+            if not result.get('success'):
+                raise CommandError(f"LLM call failed: {result.get('error')}")
+            total += (result.get('usage') or {}).get('total_tokens') or 0
+        return total
@@ -0,0 +1,32 @@
+"""
+Django management command to rebuild the audio full-text search index
+"""
+
+from django.core.management.base import BaseCommand
+
+from workbench.utils.search import BasicSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the full-text search index for audio segments and dialogue scripts '
+        '(normally kept in sync on save; use after bulk imports or index corruption)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows fetched and inserted per batch',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if isinstance(backend, BasicSearchBackend):
+            self.stdout.write(self.style.WARNING(
+                'The active search backend does not keep an index; nothing to rebuild'
+            ))
+            return
+        total = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} audio items'))
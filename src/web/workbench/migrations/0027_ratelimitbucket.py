@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0026_translationcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='限流器名称', max_length=100, unique=True)),
+                ('tat', models.FloatField(default=0, help_text='理论到达时间（Unix 时间戳）')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0027_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRPageCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_md5', models.CharField(help_text='书籍文件的MD5哈希值', max_length=32)),
+                ('page_index', models.IntegerField(help_text='页码（从0开始）')),
+                ('render_key', models.CharField(help_text='渲染参数，如 png@150', max_length=50)),
+                ('image_md5', models.CharField(db_index=True, help_text='对应OCRCache的图片MD5', max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('book_md5', 'page_index', 'render_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-19 07:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0028_ocrpagecache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OCRPrefetch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_index', models.IntegerField(help_text='页码（从0开始）')),
+                ('image_md5', models.CharField(blank=True, default='', help_text='识别完成后对应的图片MD5，为空表示仍在队列中', max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocr_prefetches', to='workbench.books')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocr_prefetches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'book', 'page_index')},
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.2 on 2026-10-19 08:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0029_ocrprefetch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudiobookJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=500)),
+                ('voice_name', models.CharField(max_length=100)),
+                ('rate', models.CharField(default='+0%', max_length=20)),
+                ('output_format', models.CharField(choices=[('m4b', 'M4B'), ('mp3', 'MP3')], default='m4b', max_length=10)),
+                ('toc_level', models.IntegerField(default=0, help_text='按该层级及以上的目录条目拆分章节（从0开始）')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('processing', '合成中'), ('assembling', '封装中'), ('success', '已完成'), ('failure', '失败')], default='pending', max_length=20)),
+                ('task_id', models.CharField(blank=True, help_text='最近一次运行的任务ID（UserTask.task_id）', max_length=255)),
+                ('audio_file', models.FileField(blank=True, null=True, upload_to='audiobooks/%Y/%m/%d/')),
+                ('subtitle_file', models.FileField(blank=True, null=True, upload_to='subtitles/audiobooks/%Y/%m/%d/', verbose_name='字幕文件')),
+                ('chapters', models.JSONField(blank=True, default=list, help_text='音频章节时间线')),
+                ('audio_duration', models.FloatField(blank=True, help_text='音频时长（秒）', null=True)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audiobook_jobs', to='workbench.books')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audiobook_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AudiobookChapter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField(help_text='章节顺序（从0开始）')),
+                ('title', models.CharField(max_length=500)),
+                ('text', models.TextField()),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('processing', '合成中'), ('success', '已完成'), ('failure', '失败')], default='pending', max_length=20)),
+                ('audio_file', models.FileField(blank=True, null=True, upload_to='audiobooks/chapters/%Y/%m/%d/')),
+                ('subtitle_srt', models.TextField(blank=True, default='')),
+                ('audio_duration', models.FloatField(blank=True, help_text='音频时长（秒）', null=True)),
+                ('points_consumed', models.FloatField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='job_chapters', to='workbench.audiobookjob')),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+                'unique_together': {('job', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.2 on 2026-10-19 08:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0030_audiobookjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audiosegment',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='audioseg_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiosegment',
+            index=models.Index(fields=['book', '-created_at', '-id'], name='audioseg_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiosegment',
+            index=models.Index(fields=['published', '-updated_at', '-id'], name='audioseg_pub_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiosegment',
+            index=models.Index(fields=['user', 'published', '-updated_at', '-id'], name='audioseg_user_pub_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiosegment',
+            index=models.Index(fields=['book', 'published', '-updated_at', '-id'], name='audioseg_book_pub_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dialoguescript',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='dialogue_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dialoguescript',
+            index=models.Index(fields=['book', '-created_at', '-id'], name='dialogue_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dialoguescript',
+            index=models.Index(fields=['published', '-updated_at', '-id'], name='dialogue_pub_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dialoguescript',
+            index=models.Index(fields=['user', 'published', '-updated_at', '-id'], name='dialogue_user_pub_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dialoguescript',
+            index=models.Index(fields=['book', 'published', '-updated_at', '-id'], name='dialogue_book_pub_upd_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0031_audio_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiosegment',
+            name='audio_duration',
+            field=models.FloatField(blank=True, help_text='音频时长（秒）', null=True),
+        ),
+        migrations.AddField(
+            model_name='audiosegment',
+            name='chapter_count',
+            field=models.IntegerField(default=0, help_text='章节数量'),
+        ),
+        migrations.AddField(
+            model_name='audiosegment',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', help_text='列表和RSS使用的文本摘要'),
+        ),
+        migrations.AddField(
+            model_name='audiosegment',
+            name='file_size',
+            field=models.BigIntegerField(default=0, help_text='音频文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='audiosegment',
+            name='mime_type',
+            field=models.CharField(blank=True, default='', help_text='音频MIME类型', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='audiosegment',
+            name='subtitle_size',
+            field=models.BigIntegerField(default=0, help_text='字幕文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='dialoguescript',
+            name='chapter_count',
+            field=models.IntegerField(default=0, help_text='章节数量'),
+        ),
+        migrations.AddField(
+            model_name='dialoguescript',
+            name='excerpt',
+            field=models.TextField(blank=True, default='', help_text='列表和RSS使用的文本摘要'),
+        ),
+        migrations.AddField(
+            model_name='dialoguescript',
+            name='file_size',
+            field=models.BigIntegerField(default=0, help_text='音频文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='dialoguescript',
+            name='mime_type',
+            field=models.CharField(blank=True, default='', help_text='音频MIME类型', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='dialoguescript',
+            name='subtitle_size',
+            field=models.BigIntegerField(default=0, help_text='字幕文件大小（字节）'),
+        ),
+    ]
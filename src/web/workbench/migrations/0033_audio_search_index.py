@@ -0,0 +1,58 @@
+# Generated manually
+
+import logging
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+def create_search_index(apps, schema_editor):
+    """创建 SQLite FTS5 全文索引表并为现有音频建立索引，其他数据库或未编译 FTS5 时跳过"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    from workbench.utils.search import FTS_TABLE, SQLiteFTS5SearchBackend
+
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, body, book_name, "
+                "user_id UNINDEXED, book_id UNINDEXED, published UNINDEXED, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except OperationalError as e:
+            logger.warning("SQLite FTS5 is not available, audio search falls back to icontains: %s", e)
+            return
+        # 标题命中权重最高，其次是书名，再次是正文
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25(5.0, 1.0, 2.0)')")
+
+    SQLiteFTS5SearchBackend().rebuild(
+        apps.get_model('workbench', 'AudioSegment').objects.all(),
+        apps.get_model('workbench', 'DialogueScript').objects.all(),
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from workbench.utils.search import FTS_TABLE
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0032_media_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_search_index,
+            drop_search_index,
+        ),
+    ]
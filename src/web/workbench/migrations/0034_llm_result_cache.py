@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0033_audio_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResultCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_hash', models.CharField(help_text='缓存键的SHA256', max_length=64, unique=True)),
+                ('operation', models.CharField(help_text='操作类型，如 reformat、dialogue', max_length=50)),
+                ('result', models.JSONField(help_text='LLM 调用结果')),
+                ('size', models.IntegerField(default=0, help_text='结果文本的字节数')),
+                ('hit_count', models.IntegerField(default=0, help_text='缓存命中次数')),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='过期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='最后使用时间')),
+            ],
+        ),
+    ]
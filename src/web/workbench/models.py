@@ -44,8 +44,8 @@ class Books(models.Model):
             return False
         
         try:
-            from book2tts.pdf import detect_scanned_pdf
-            detection_result = detect_scanned_pdf(self.file.path)
+            from .utils.book_index import detect_book_scanned
+            detection_result = detect_book_scanned(self)
             
             self.pdf_type = 'scanned' if detection_result['is_scanned'] else 'text'
             self.save(update_fields=['pdf_type', 'updated_at'])
@@ -97,7 +97,114 @@ class Books(models.Model):
         return super().save(*args, **kwargs)
 
 
-class AudioSegment(models.Model):
+# 列表和RSS展示的文本摘要长度
+MEDIA_EXCERPT_LENGTH = 300
+
+# 按文件头识别音频格式（edge-tts 输出的文件扩展名不一定与内容一致）
+_AUDIO_SIGNATURES = [
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'RIFF', 'audio/wav'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/flac'),
+    (4, b'ftyp', 'audio/mp4'),
+]
+
+
+def _sniff_audio_mime(head: bytes) -> str:
+    for offset, signature, mime_type in _AUDIO_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime_type
+    # 无 ID3 标签的 MP3 以帧同步字开头
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return 'audio/mpeg'
+    return ''
+
+
+class MediaMetadataMixin:
+    """
+    音频元数据（文件大小、MIME类型、字幕大小、文本摘要、章节数）在写入时计算并保存为字段，
+    列表、RSS和下载读取字段即可，不再访问存储或调用 ffmpeg。
+    文件字段变化时才读取存储；时长由写入音频的任务设置。
+    """
+    AUDIO_FIELD = 'file'
+    SUBTITLE_FIELD = 'subtitle_file'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._synced_media_names = instance._media_names()
+        return instance
+
+    def _media_names(self):
+        names = {}
+        for field_name in (self.AUDIO_FIELD, self.SUBTITLE_FIELD):
+            value = self.__dict__.get(field_name)
+            names[field_name] = getattr(value, 'name', value) or ''
+        return names
+
+    def media_excerpt_source(self) -> str:
+        return self.text
+
+    def refresh_media_metadata(self, force=False):
+        """
+        重新计算元数据字段，返回发生变化的字段名列表。
+
+        Args:
+            force: 为 True 时即使文件未变化也重新读取存储（回填历史数据）
+        """
+        changed = []
+
+        def assign(field_name, value):
+            if getattr(self, field_name) != value:
+                setattr(self, field_name, value)
+                changed.append(field_name)
+
+        excerpt = self.media_excerpt_source() or ''
+        if len(excerpt) > MEDIA_EXCERPT_LENGTH:
+            excerpt = excerpt[:MEDIA_EXCERPT_LENGTH] + '...'
+        assign('excerpt', excerpt)
+        assign('chapter_count', len(self.chapters or []))
+
+        synced = getattr(self, '_synced_media_names', {})
+        names = self._media_names()
+
+        if force or names[self.AUDIO_FIELD] != synced.get(self.AUDIO_FIELD):
+            audio = getattr(self, self.AUDIO_FIELD)
+            file_size, mime_type = 0, ''
+            if audio:
+                try:
+                    file_size = audio.size
+                    with audio.storage.open(audio.name, 'rb') as f:
+                        mime_type = _sniff_audio_mime(f.read(12)) or 'audio/mpeg'
+                except OSError:
+                    # 文件缺失时保留默认值，可用 backfill_media_metadata 重新计算
+                    pass
+            assign('file_size', file_size)
+            assign('mime_type', mime_type)
+
+        if force or names[self.SUBTITLE_FIELD] != synced.get(self.SUBTITLE_FIELD):
+            subtitle = getattr(self, self.SUBTITLE_FIELD)
+            subtitle_size = 0
+            if subtitle:
+                try:
+                    subtitle_size = subtitle.size
+                except OSError:
+                    pass
+            assign('subtitle_size', subtitle_size)
+
+        return changed
+
+    def save(self, *args, **kwargs):
+        changed = self.refresh_media_metadata()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and changed:
+            kwargs['update_fields'] = list(dict.fromkeys([*update_fields, *changed]))
+        result = super().save(*args, **kwargs)
+        self._synced_media_names = self._media_names()
+        return result
+
+
+class AudioSegment(MediaMetadataMixin, models.Model):
     book = models.ForeignKey(Books, on_delete=models.CASCADE, related_name='audio_segments')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='audio_segments', null=True)
     title = models.CharField(max_length=255)
@@ -112,6 +219,24 @@ class AudioSegment(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
 
+    # 写入文件时计算的元数据
+    audio_duration = models.FloatField(null=True, blank=True, help_text="音频时长（秒）")
+    file_size = models.BigIntegerField(default=0, help_text="音频文件大小（字节）")
+    mime_type = models.CharField(max_length=50, blank=True, default='', help_text="音频MIME类型")
+    subtitle_size = models.BigIntegerField(default=0, help_text="字幕文件大小（字节）")
+    excerpt = models.TextField(blank=True, default='', help_text="列表和RSS使用的文本摘要")
+    chapter_count = models.IntegerField(default=0, help_text="章节数量")
+
+    class Meta:
+        # 统一音频列表按 (时间, id) 倒序做 keyset 分页
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='audioseg_user_created_idx'),
+            models.Index(fields=['book', '-created_at', '-id'], name='audioseg_book_created_idx'),
+            models.Index(fields=['published', '-updated_at', '-id'], name='audioseg_pub_updated_idx'),
+            models.Index(fields=['user', 'published', '-updated_at', '-id'], name='audioseg_user_pub_upd_idx'),
+            models.Index(fields=['book', 'published', '-updated_at', '-id'], name='audioseg_book_pub_upd_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.title} - {self.book.name}"
         
@@ -238,8 +363,10 @@ class TTSProviderConfig(models.Model):
             or 'edge_tts'
         )
 
-class DialogueScript(models.Model):
+class DialogueScript(MediaMetadataMixin, models.Model):
     """对话脚本模型，存储LLM转换后的对话脚本"""
+    AUDIO_FIELD = 'audio_file'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='dialogue_scripts')
     book = models.ForeignKey(Books, on_delete=models.CASCADE, related_name='dialogue_scripts', null=True, blank=True)
     title = models.CharField(max_length=500, help_text="对话脚本标题")
@@ -255,11 +382,26 @@ class DialogueScript(models.Model):
     chapters_html = models.TextField(blank=True, default='', help_text="章节HTML片段")
     published = models.BooleanField(default=False, help_text="是否发布到成品")
 
+    # 写入文件时计算的元数据
+    file_size = models.BigIntegerField(default=0, help_text="音频文件大小（字节）")
+    mime_type = models.CharField(max_length=50, blank=True, default='', help_text="音频MIME类型")
+    subtitle_size = models.BigIntegerField(default=0, help_text="字幕文件大小（字节）")
+    excerpt = models.TextField(blank=True, default='', help_text="列表和RSS使用的文本摘要")
+    chapter_count = models.IntegerField(default=0, help_text="章节数量")
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        # 统一音频列表按 (时间, id) 倒序做 keyset 分页
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='dialogue_user_created_idx'),
+            models.Index(fields=['book', '-created_at', '-id'], name='dialogue_book_created_idx'),
+            models.Index(fields=['published', '-updated_at', '-id'], name='dialogue_pub_updated_idx'),
+            models.Index(fields=['user', 'published', '-updated_at', '-id'], name='dialogue_user_pub_upd_idx'),
+            models.Index(fields=['book', 'published', '-updated_at', '-id'], name='dialogue_book_pub_upd_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
@@ -280,6 +422,10 @@ class DialogueScript(models.Model):
                 speakers.add(segment.get('speaker', ''))
         return list(speakers)
 
+    def media_excerpt_source(self) -> str:
+        speakers = self.speakers
+        return f"🎭 对话脚本 ({self.segment_count}段) - {', '.join(speakers[:3])}{'...' if len(speakers) > 3 else ''}"
+
     def get_voice_settings(self) -> dict:
         """获取脚本内保存的音色配置。"""
         data = self.script_data or {}
@@ -340,6 +486,74 @@ class DialogueSegment(models.Model):
         return f"{self.script.title} - {self.speaker} (#{self.sequence})"
 
 
+class AudiobookJob(models.Model):
+    """整本书有声书任务：按目录拆分章节并行合成，完成后封装为带章节标记的单个文件"""
+    STATUS_CHOICES = [
+        ('pending', '等待中'),
+        ('processing', '合成中'),
+        ('assembling', '封装中'),
+        ('success', '已完成'),
+        ('failure', '失败'),
+    ]
+    FORMAT_CHOICES = [
+        ('m4b', 'M4B'),
+        ('mp3', 'MP3'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='audiobook_jobs')
+    book = models.ForeignKey(Books, on_delete=models.CASCADE, related_name='audiobook_jobs')
+    title = models.CharField(max_length=500, blank=True)
+    voice_name = models.CharField(max_length=100)
+    rate = models.CharField(max_length=20, default='+0%')
+    output_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='m4b')
+    toc_level = models.IntegerField(default=0, help_text="按该层级及以上的目录条目拆分章节（从0开始）")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    task_id = models.CharField(max_length=255, blank=True, help_text="最近一次运行的任务ID（UserTask.task_id）")
+    audio_file = models.FileField(upload_to='audiobooks/%Y/%m/%d/', null=True, blank=True)
+    subtitle_file = models.FileField(upload_to='subtitles/audiobooks/%Y/%m/%d/', null=True, blank=True, verbose_name='字幕文件')
+    chapters = models.JSONField(default=list, blank=True, help_text="音频章节时间线")
+    audio_duration = models.FloatField(null=True, blank=True, help_text="音频时长（秒）")
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.book.name} - 有声书 ({self.status})"
+
+
+class AudiobookChapter(models.Model):
+    """有声书任务中的单个章节，各自独立合成，重试时跳过已完成的章节"""
+    STATUS_CHOICES = [
+        ('pending', '等待中'),
+        ('processing', '合成中'),
+        ('success', '已完成'),
+        ('failure', '失败'),
+    ]
+
+    job = models.ForeignKey(AudiobookJob, on_delete=models.CASCADE, related_name='job_chapters')
+    index = models.IntegerField(help_text="章节顺序（从0开始）")
+    title = models.CharField(max_length=500)
+    text = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    audio_file = models.FileField(upload_to='audiobooks/chapters/%Y/%m/%d/', null=True, blank=True)
+    subtitle_srt = models.TextField(blank=True, default='')
+    audio_duration = models.FloatField(null=True, blank=True, help_text="音频时长（秒）")
+    points_consumed = models.FloatField(default=0)
+    error_message = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['job', 'index']
+        unique_together = ['job', 'index']
+
+    def __str__(self):
+        return f"{self.job_id} #{self.index} {self.title} ({self.status})"
+
+
 class OCRCache(models.Model):
     """OCR缓存模型，基于图片MD5存储OCR识别结果"""
     image_md5 = models.CharField(max_length=32, unique=True, db_index=True, help_text="图片的MD5哈希值")
@@ -355,6 +569,61 @@ class OCRCache(models.Model):
         return f"OCR Cache {self.image_md5[:8]}..."
 
 
+class OCRPageCache(models.Model):
+    """一级OCR缓存：(书籍MD5, 页码, 渲染参数) -> 图片MD5，命中时无需渲染页面"""
+    book_md5 = models.CharField(max_length=32, help_text="书籍文件的MD5哈希值")
+    page_index = models.IntegerField(help_text="页码（从0开始）")
+    render_key = models.CharField(max_length=50, help_text="渲染参数，如 png@150")
+    image_md5 = models.CharField(max_length=32, db_index=True, help_text="对应OCRCache的图片MD5")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['book_md5', 'page_index', 'render_key']
+
+    def __str__(self):
+        return f"OCR Page Cache {self.book_md5[:8]}... p{self.page_index} ({self.render_key})"
+
+
+class OCRPrefetch(models.Model):
+    """预取的OCR页面：后台提前识别、尚未被用户读取的页面，读取时才扣除积分"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ocr_prefetches')
+    book = models.ForeignKey(Books, on_delete=models.CASCADE, related_name='ocr_prefetches')
+    page_index = models.IntegerField(help_text="页码（从0开始）")
+    image_md5 = models.CharField(max_length=32, blank=True, default='', help_text="识别完成后对应的图片MD5，为空表示仍在队列中")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'book', 'page_index']
+
+    def __str__(self):
+        state = 'ready' if self.image_md5 else 'pending'
+        return f"OCR Prefetch {self.book_id} p{self.page_index} ({state})"
+
+
+class RateLimitBucket(models.Model):
+    """限流令牌桶状态，供所有 Web / Celery 进程共享 OCR、LLM、TTS 调用配额"""
+    key = models.CharField(max_length=100, unique=True, help_text="限流器名称")
+    tat = models.FloatField(default=0, help_text="理论到达时间（Unix 时间戳）")
+
+    def __str__(self):
+        return f"RateLimitBucket {self.key}"
+
+
+class LLMResultCacheEntry(models.Model):
+    """LLM 调用结果缓存（排版、对话转换等），所有 Web / Celery 进程共享"""
+    key_hash = models.CharField(max_length=64, unique=True, help_text="缓存键的SHA256")
+    operation = models.CharField(max_length=50, help_text="操作类型，如 reformat、dialogue")
+    result = models.JSONField(help_text="LLM 调用结果")
+    size = models.IntegerField(default=0, help_text="结果文本的字节数")
+    hit_count = models.IntegerField(default=0, help_text="缓存命中次数")
+    expires_at = models.DateTimeField(db_index=True, help_text="过期时间")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, help_text="最后使用时间")
+
+    def __str__(self):
+        return f"LLM Result Cache {self.operation} {self.key_hash[:8]}..."
+
+
 class TranslationCache(models.Model):
     """翻译缓存模型，基于文本MD5+目标语言存储翻译结果"""
     # 语言选择
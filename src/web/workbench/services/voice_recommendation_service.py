@@ -4,6 +4,7 @@ AI音色推荐服务
 """
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from django.conf import settings
 
@@ -91,9 +92,9 @@ class VoiceRecommendationService:
             角色特征字典
         """
         try:
-            from book2tts.llm_service import LLMService
+            from book2tts.llm_service import get_shared_llm_service
 
-            llm_service = LLMService()
+            llm_service = get_shared_llm_service()
 
             system_prompt = """你是一个专业的角色分析助手。请根据角色名称和对话内容分析角色特征，并以严格的JSON格式返回结果。"""
 
@@ -284,12 +285,25 @@ class VoiceRecommendationService:
                     speaker_dialogues[speaker] = []
                 speaker_dialogues[speaker].append(utterance)
 
-        # 为每个说话者推荐音色
-        for speaker, dialogues in speaker_dialogues.items():
-            # 合并对话内容进行分析
-            combined_content = ' '.join(dialogues[:3])  # 取前3句进行分析
+        if not speaker_dialogues:
+            return recommendations
 
-            recommended_voice = self.recommend_voice_for_character(speaker, combined_content)
+        from book2tts.llm_service import default_max_concurrency
+
+        # 为每个说话者推荐音色，各角色的 LLM 分析并发进行
+        with ThreadPoolExecutor(
+            max_workers=min(default_max_concurrency(), len(speaker_dialogues))
+        ) as executor:
+            futures = {
+                # 合并对话内容进行分析，取前3句
+                speaker: executor.submit(
+                    self.recommend_voice_for_character, speaker, ' '.join(dialogues[:3])
+                )
+                for speaker, dialogues in speaker_dialogues.items()
+            }
+
+        for speaker, future in futures.items():
+            recommended_voice = future.result()
             if recommended_voice:
                 recommendations[speaker] = recommended_voice
 
@@ -4,7 +4,7 @@ import tempfile
 import asyncio
 import json
 import hashlib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from celery import shared_task
 from celery.utils.log import get_task_logger
 from django.conf import settings
@@ -13,7 +13,15 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from django.utils import timezone
 
-from .models import Books, AudioSegment, DialogueScript, UserTask, DialogueSegment
+from .models import (
+    Books,
+    AudioSegment,
+    DialogueScript,
+    UserTask,
+    DialogueSegment,
+    AudiobookJob,
+    AudiobookChapter,
+)
 from book2tts.edgetts import EdgeTTS
 from book2tts.audio_utils import get_audio_duration, estimate_audio_duration_from_text
 from home.models import UserQuota, OperationRecord
@@ -25,6 +33,7 @@ from .utils.subtitle_utils import (
     save_chapters_assets,
 )
 from book2tts.chapter_service import ChapterGenerator
+from book2tts.text_chunker import budget_for
 from web.workbench.utils.points_utils import deduct_llm_points
 
 
@@ -36,14 +45,22 @@ def get_dialogue_service():
 
     sys.path.insert(0, os.path.join(settings.BASE_DIR, ".."))
     from book2tts.dialogue_service import DialogueService
-    from book2tts.llm_service import LLMService
+    from book2tts.llm_service import get_shared_llm_service
 
-    return DialogueService, LLMService
+    return DialogueService, get_shared_llm_service
 
 
 # Get a logger instance for the tasks
 logger = get_task_logger(__name__)
 
+# 对话分段缓存格式版本（JSON Lines：首行为头信息，其后每行一个分段结果）
+DIALOGUE_CHUNK_CACHE_VERSION = 2
+# 分段进度写入数据库的最小间隔（秒）
+DIALOGUE_PROGRESS_INTERVAL = 2.0
+
+# 批量OCR任务进度写入间隔（秒）
+OCR_BATCH_PROGRESS_INTERVAL = 2.0
+
 
 def _summarize_llm_usage(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
     usage = usage or {}
@@ -134,6 +151,74 @@ def _read_subtitle_file(file_field) -> str:
     return data.decode("utf-8", errors="replace")
 
 
+def _reset_dialogue_chunk_cache(cache_path: str, chunk_budget: str, total_chunks: int) -> None:
+    """写入新的对话分段缓存头信息，覆盖已有文件"""
+    header = {
+        "version": DIALOGUE_CHUNK_CACHE_VERSION,
+        "chunk_budget": chunk_budget,
+        "total_chunks": total_chunks,
+    }
+    try:
+        with open(cache_path, "w", encoding="utf-8") as cache_file:
+            cache_file.write(json.dumps(header, ensure_ascii=False) + "\n")
+    except OSError as cache_error:
+        logger.warning(
+            "Failed to write dialogue chunk cache %s: %s", cache_path, cache_error
+        )
+
+
+def _append_dialogue_chunk_cache(cache_path: str, record: Dict[str, Any]) -> None:
+    """以追加方式写入单个分段结果，避免每段重写整个缓存文件"""
+    try:
+        with open(cache_path, "a", encoding="utf-8") as cache_file:
+            cache_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as cache_error:
+        logger.warning(
+            "Failed to append dialogue chunk cache %s: %s", cache_path, cache_error
+        )
+
+
+def _load_dialogue_chunk_cache(
+    cache_path: str, chunk_budget: str, total_chunks: int
+) -> Dict[int, List[Dict[str, Any]]]:
+    """读取对话分段缓存，返回 {分段序号: 对话片段列表}"""
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+
+    chunks: Dict[int, List[Dict[str, Any]]] = {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            header_line = cache_file.readline()
+            header = json.loads(header_line) if header_line.strip() else {}
+            if (
+                header.get("version") != DIALOGUE_CHUNK_CACHE_VERSION
+                or header.get("chunk_budget") != chunk_budget
+                or header.get("total_chunks") != total_chunks
+            ):
+                logger.info(
+                    "Ignoring incompatible dialogue chunk cache %s (header: %s)",
+                    cache_path,
+                    header,
+                )
+                return {}
+
+            for line in cache_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时最后一行可能写了一半，忽略即可
+                    continue
+                if isinstance(record, dict) and isinstance(record.get("index"), int):
+                    chunks[record["index"]] = record.get("segments") or []
+    except Exception as cache_error:
+        logger.warning(
+            "Failed to read dialogue chunk cache %s: %s", cache_path, cache_error
+        )
+        return {}
+
+    return chunks
+
+
 def get_client_ip_from_task(task_kwargs):
     """从任务参数中获取客户端IP地址"""
     return task_kwargs.get("ip_address", "127.0.0.1")
@@ -277,13 +362,14 @@ def synthesize_audio_task(
             tts = EdgeTTS(voice_name=voice_name, rate=rate)
 
             # 根据文本长度选择合成方法
-            if len(text) > 3000:  # 长文本使用分段合成
+            tts_budget = budget_for("edge_tts")
+            if tts_budget.measure(text) > tts_budget.limit:  # 长文本使用分段合成
                 synthesis_result = loop.run_until_complete(
                     tts.synthesize_long_text_with_subtitles(
                         text=text,
                         output_file=audio_path,
                         subtitle_file=subtitle_path,
-                        segment_length=2000,
+                        budget=tts_budget,
                         words_in_cue=8,
                     )
                 )
@@ -399,6 +485,7 @@ def synthesize_audio_task(
                     book_page=book_page,
                     chapters=[],
                     published=False,
+                    audio_duration=actual_duration_seconds,
                 )
 
                 # 确保媒体目录存在
@@ -593,8 +680,8 @@ def convert_text_to_dialogue_task(
 
         # 初始化对话服务
         try:
-            DialogueService, LLMService = get_dialogue_service()
-            llm_service = LLMService()
+            DialogueService, get_shared_llm_service = get_dialogue_service()
+            llm_service = get_shared_llm_service()
             dialogue_service = DialogueService(llm_service)
         except Exception as e:
             error_msg = f"LLM服务初始化失败: {str(e)}"
@@ -606,7 +693,7 @@ def convert_text_to_dialogue_task(
         logger.info(f"Processing text of length: {total_length}")
 
         cache_path = None
-        cached_chunks = []
+        cached_chunks = {}
         total_llm_tokens = 0
         total_prompt_tokens = 0
         total_completion_tokens = 0
@@ -620,14 +707,13 @@ def convert_text_to_dialogue_task(
             user_task.save()
 
         # 分段处理逻辑
-        if total_length > 1000:
+        chunk_budget = budget_for("dialogue")
+        text_chunks = dialogue_service.split_long_text(text, budget=chunk_budget)
+        if len(text_chunks) > 1:
             # 长文本分段处理
-            chunk_size = 1000
-            text_chunks = dialogue_service.split_long_text(text, max_length=chunk_size)
             total_chunks = len(text_chunks)
 
             logger.info(f"Split text into {total_chunks} chunks for processing")
-            all_segments = []
 
             media_root = getattr(settings, "MEDIA_ROOT", "") or tempfile.gettempdir()
             cache_root = os.path.join(media_root, "tmp", "dialogue_chunk_cache")
@@ -643,99 +729,107 @@ def convert_text_to_dialogue_task(
             cache_hasher = hashlib.md5()
             cache_hasher.update(str(user_id).encode("utf-8"))
             cache_hasher.update(text.encode("utf-8"))
-            cache_hasher.update(str(chunk_size).encode("utf-8"))
+            cache_hasher.update(str(chunk_budget).encode("utf-8"))
             if custom_prompt:
                 cache_hasher.update(custom_prompt.encode("utf-8"))
             if title:
                 cache_hasher.update(title.encode("utf-8"))
-            cache_filename = f"{cache_hasher.hexdigest()}.json"
+            cache_filename = f"{cache_hasher.hexdigest()}.jsonl"
             cache_path = os.path.join(cache_root, cache_filename)
 
-            if os.path.exists(cache_path):
-                try:
-                    with open(cache_path, "r", encoding="utf-8") as cache_file:
-                        cache_payload = json.load(cache_file)
-                    if cache_payload.get("chunk_size") == chunk_size:
-                        cached_chunks = cache_payload.get("chunks", []) or []
-                        logger.info(
-                            "Loaded %s cached dialogue chunk(s) from %s",
-                            len(cached_chunks),
-                            cache_path,
-                        )
-                    else:
-                        logger.info(
-                            "Ignoring cached dialogue chunks due to chunk_size mismatch (cache: %s, expected: %s)",
-                            cache_payload.get("chunk_size"),
-                            chunk_size,
-                        )
-                        cached_chunks = []
-                except Exception as cache_error:
-                    logger.warning(
-                        "Failed to read dialogue chunk cache %s: %s",
-                        cache_path,
-                        cache_error,
-                    )
-                    cached_chunks = []
+            cached_chunks = _load_dialogue_chunk_cache(
+                cache_path, str(chunk_budget), total_chunks
+            )
+            if not cached_chunks:
+                _reset_dialogue_chunk_cache(
+                    cache_path, str(chunk_budget), total_chunks
+                )
 
-            def persist_chunk_cache():
-                if not cache_path:
-                    return
-                cache_payload = {
-                    "version": 1,
-                    "chunk_size": chunk_size,
-                    "total_chunks": total_chunks,
-                    "chunks": cached_chunks,
-                }
-                try:
-                    with open(cache_path, "w", encoding="utf-8") as cache_file:
-                        json.dump(cache_payload, cache_file, ensure_ascii=False)
-                except Exception as cache_error:
-                    logger.warning(
-                        "Failed to write dialogue chunk cache %s: %s",
-                        cache_path,
-                        cache_error,
-                    )
+            chunk_results = dict(cached_chunks)
+            pending_indexes = [
+                i for i in range(total_chunks) if i not in chunk_results
+            ]
+            last_progress_at = 0.0
+            progress_task = locals().get("user_task")
 
-            for i, chunk in enumerate(text_chunks):
-                progress_percent = int((i / total_chunks) * 100)
-                progress_message = f"正在处理第 {i + 1}/{total_chunks} 段文本..."
+            def report_progress(force=False):
+                nonlocal last_progress_at
+                now = time.monotonic()
+                if not force and now - last_progress_at < DIALOGUE_PROGRESS_INTERVAL:
+                    return
+                last_progress_at = now
 
-                # 更新任务进度
+                done = len(chunk_results)
+                progress_percent = int((done / total_chunks) * 100)
+                progress_message = f"正在处理文本：已完成 {done}/{total_chunks} 段..."
                 self.update_state(
                     state="PROCESSING",
                     meta={
                         "message": progress_message,
                         "progress": progress_percent,
-                        "chunk": i + 1,
+                        "chunk": done,
                         "total_chunks": total_chunks,
                     },
                 )
-                if "user_task" in locals():
-                    user_task.progress_message = progress_message
-                    user_task.metadata["progress"] = progress_percent
-                    user_task.metadata["chunk"] = i + 1
-                    user_task.metadata["total_chunks"] = total_chunks
-                    user_task.save()
-
-                if i < len(cached_chunks):
-                    cached_entry = cached_chunks[i]
-                    cached_segments = []
-                    if isinstance(cached_entry, dict):
-                        cached_segments = cached_entry.get("segments", [])
-                    elif isinstance(cached_entry, list):
-                        cached_segments = cached_entry
-                    all_segments.extend(cached_segments or [])
-                    logger.info(
-                        "Using cached dialogue chunk %s/%s", i + 1, total_chunks
+                if progress_task is not None:
+                    progress_task.progress_message = progress_message
+                    progress_task.metadata["progress"] = progress_percent
+                    progress_task.metadata["chunk"] = done
+                    progress_task.metadata["total_chunks"] = total_chunks
+                    progress_task.save(
+                        update_fields=["progress_message", "metadata", "updated_at"]
                     )
-                    continue
 
-                # 转换当前段
-                result = dialogue_service.text_to_dialogue(
-                    chunk, custom_prompt if custom_prompt else None
+            if cached_chunks:
+                logger.info(
+                    "Loaded %s cached dialogue chunk(s) from %s, %s remaining",
+                    len(cached_chunks),
+                    cache_path,
+                    len(pending_indexes),
+                )
+            report_progress(force=True)
+
+            def record_chunk(index, result):
+                nonlocal total_prompt_tokens, total_completion_tokens, total_llm_tokens
+                usage = result.get("usage") or {}
+                prompt_tokens = usage.get("prompt_tokens") or 0
+                completion_tokens = usage.get("completion_tokens") or 0
+                total_prompt_tokens += prompt_tokens
+                total_completion_tokens += completion_tokens
+                total_llm_tokens += usage.get("total_tokens") or (
+                    prompt_tokens + completion_tokens
                 )
+                model_name = result.get("model")
+                if model_name:
+                    llm_models.add(model_name)
 
-                if not result["success"]:
+                chunk_segments = result["dialogue_data"].get("segments", [])
+                chunk_results[index] = chunk_segments
+                _append_dialogue_chunk_cache(
+                    cache_path, {"index": index, "segments": chunk_segments}
+                )
+
+            max_concurrency = max(
+                1, getattr(settings, "DIALOGUE_CHUNK_CONCURRENCY", 4)
+            )
+            # 每批最多 max_concurrency 段，由 LLM 服务的异步有界并发一次性发出；
+            # 批次之间写入缓存并更新进度，出错时不再发起后续批次
+            for batch_start in range(0, len(pending_indexes), max_concurrency):
+                batch = pending_indexes[batch_start : batch_start + max_concurrency]
+                results = dialogue_service.texts_to_dialogue(
+                    [text_chunks[index] for index in batch],
+                    custom_prompt if custom_prompt else None,
+                    max_concurrency=max_concurrency,
+                )
+
+                # 先把成功的分段写入缓存，以便失败后重试时跳过
+                for i, result in zip(batch, results):
+                    if result["success"]:
+                        record_chunk(i, result)
+
+                for i, result in zip(batch, results):
+                    if result["success"]:
+                        continue
                     raw_response = result.get("raw_response")
                     if raw_response:
                         raw_excerpt = raw_response[:500].replace("\n", " ")
@@ -751,23 +845,14 @@ def convert_text_to_dialogue_task(
                     logger.error(error_msg)
                     raise Exception(error_msg)
 
-                usage = result.get("usage") or {}
-                prompt_tokens = usage.get("prompt_tokens") or 0
-                completion_tokens = usage.get("completion_tokens") or 0
-                total_prompt_tokens += prompt_tokens
-                total_completion_tokens += completion_tokens
-                total_llm_tokens += usage.get("total_tokens") or (
-                    prompt_tokens + completion_tokens
-                )
-                model_name = result.get("model")
-                if model_name:
-                    llm_models.add(model_name)
+                report_progress()
 
-                chunk_segments = result["dialogue_data"].get("segments", [])
-                all_segments.extend(chunk_segments)
+            report_progress(force=True)
 
-                cached_chunks.append({"segments": chunk_segments})
-                persist_chunk_cache()
+            # 按原始顺序重组分段结果
+            all_segments = []
+            for i in range(total_chunks):
+                all_segments.extend(chunk_results.get(i) or [])
 
             # 合并所有段落
             dialogue_data = {
@@ -1469,3 +1554,546 @@ def generate_chapters_task(
 
         self.update_state(state="FAILURE", meta={"error": error_message})
         raise
+
+
+@shared_task(bind=True)
+def batch_ocr_task(
+    self,
+    user_id,
+    book_id,
+    page_nums,
+    ip_address="127.0.0.1",
+    user_agent="",
+):
+    """
+    批量OCR任务：逐页执行 页面缓存检查 → 渲染 → OCR → 持久化。
+
+    渲染在后台进行且提前量有限，内存中只保留少量在途页面；
+    每页完成后即写入OCR缓存，进度与已完成页面记录在 UserTask.result_data 中，
+    任务进行中即可查询部分结果。积分按实际新识别的页面逐页扣除。
+    """
+    from .utils.ocr_utils import get_ocr_credentials, iter_pages_ocr_with_cache, ocr_service_configured
+    from web.workbench.utils.points_utils import deduct_ocr_points
+
+    task_id = self.request.id
+    total_pages = len(page_nums)
+    progress = {
+        "total_pages": total_pages,
+        "completed": 0,
+        "cached_count": 0,
+        "new_ocr_count": 0,
+        "failed_count": 0,
+        "points_consumed": 0,
+        "pages": [],
+    }
+    last_report = 0.0
+
+    def report_progress(status="processing", message=None, force=False, **fields):
+        nonlocal last_report
+        now = time.monotonic()
+        if not force and now - last_report < OCR_BATCH_PROGRESS_INTERVAL:
+            return
+        last_report = now
+        message = message or f"正在识别 {progress['completed']}/{total_pages} 页"
+        UserTask.objects.filter(task_id=task_id).update(
+            status=status,
+            progress_message=message,
+            result_data=progress,
+            updated_at=timezone.now(),
+            **fields,
+        )
+        if status == "processing":
+            self.update_state(
+                state="PROCESSING",
+                meta={"message": message, "completed": progress["completed"], "total": total_pages},
+            )
+
+    user = None
+    book = None
+    try:
+        user = User.objects.get(pk=user_id)
+        book = Books.objects.get(pk=book_id, user=user)
+
+        ak, sk = get_ocr_credentials()
+        if not ocr_service_configured():
+            raise Exception("OCR服务未配置，请联系管理员设置OCR密钥")
+
+        report_progress(message="正在准备OCR识别...", force=True)
+
+        stopped_reason = None
+        pages = iter_pages_ocr_with_cache(book, page_nums, ak, sk)
+        try:
+            for page_num, ocr_result in pages:
+                page_entry = {"page_num": page_num, "cached": bool(ocr_result.get("cached"))}
+                if "error" in ocr_result:
+                    page_entry["error"] = ocr_result["error"]
+                    progress["failed_count"] += 1
+                elif ocr_result.get("cached"):
+                    progress["cached_count"] += 1
+                else:
+                    deduction = deduct_ocr_points(user, 1)
+                    if not deduction["deducted"]:
+                        stopped_reason = "积分不足，已停止后续页面的识别"
+                        break
+                    progress["new_ocr_count"] += 1
+                    progress["points_consumed"] += deduction["points"]
+
+                progress["pages"].append(page_entry)
+                progress["completed"] += 1
+                report_progress()
+        finally:
+            # 提前结束时取消尚未开始的渲染
+            pages.close()
+
+        success_count = progress["completed"] - progress["failed_count"]
+        message = stopped_reason or (
+            f"批量OCR识别完成，成功 {success_count}/{total_pages} 页"
+            + (
+                f"，已扣除{progress['points_consumed']}积分"
+                if progress["new_ocr_count"]
+                else "，全部使用缓存结果"
+            )
+        )
+        final_status = "failure" if stopped_reason else "success"
+
+        OperationRecord.objects.create(
+            user=user,
+            operation_type="ocr_process",
+            operation_object=f"{book.name} - 批量OCR {total_pages}页",
+            operation_detail=message,
+            status="failed" if stopped_reason else "success",
+            metadata={
+                "book_id": book_id,
+                "book_name": book.name,
+                "task_id": task_id,
+                "total_pages": total_pages,
+                "completed_pages": progress["completed"],
+                "new_ocr_pages": progress["new_ocr_count"],
+                "cached_pages": progress["cached_count"],
+                "failed_pages": progress["failed_count"],
+                "points_consumed": progress["points_consumed"],
+            },
+            ip_address=ip_address,
+            user_agent=user_agent,
+        )
+
+        report_progress(
+            status=final_status,
+            message=message,
+            force=True,
+            completed_at=timezone.now(),
+            **({"error_message": stopped_reason} if stopped_reason else {}),
+        )
+
+        result = {
+            "success": not stopped_reason,
+            "message": message,
+            "total_pages": total_pages,
+            "completed": progress["completed"],
+            "cached_count": progress["cached_count"],
+            "new_ocr_count": progress["new_ocr_count"],
+            "failed_count": progress["failed_count"],
+            "points_consumed": progress["points_consumed"],
+        }
+        return result
+
+    except Exception as exc:  # pylint: disable=broad-except
+        error_message = str(exc)
+        logger.error("批量OCR任务失败: %s", error_message, exc_info=True)
+
+        UserTask.objects.filter(task_id=task_id).update(
+            status="failure",
+            error_message=error_message,
+            progress_message="批量OCR识别失败",
+            result_data=progress,
+            completed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if user is not None:
+            OperationRecord.objects.create(
+                user=user,
+                operation_type="ocr_process",
+                operation_object=f"{book.name if book else book_id} - 批量OCR {total_pages}页",
+                operation_detail=f"批量OCR识别失败：{error_message}",
+                status="failed",
+                metadata={
+                    "book_id": book_id,
+                    "task_id": task_id,
+                    "completed_pages": progress["completed"],
+                    "points_consumed": progress["points_consumed"],
+                },
+                ip_address=ip_address,
+                user_agent=user_agent,
+            )
+        raise
+
+
+@shared_task(bind=True, ignore_result=True)
+def prefetch_ocr_pages_task(self, user_id, book_id, page_nums):
+    """
+    预取OCR：在后台识别用户接下来可能阅读的页面并写入OCR缓存。
+
+    识别出的新结果登记在 OCRPrefetch 中，用户实际读取该页时才扣除积分；
+    页面已被缓存（其他请求抢先识别）或识别失败时直接删除登记。
+    """
+    from .models import OCRPrefetch
+    from .utils.ocr_utils import get_ocr_credentials, iter_pages_ocr_with_cache, ocr_service_configured
+
+    prefetches = OCRPrefetch.objects.filter(user_id=user_id, book_id=book_id)
+    try:
+        book = Books.objects.get(pk=book_id, user_id=user_id)
+        ak, sk = get_ocr_credentials()
+        if not ocr_service_configured():
+            raise Exception("OCR服务未配置")
+
+        pages = iter_pages_ocr_with_cache(book, page_nums, ak, sk)
+        try:
+            for page_num, ocr_result in pages:
+                entry = prefetches.filter(page_index=page_num, image_md5="")
+                if "error" in ocr_result or ocr_result.get("cached"):
+                    entry.delete()
+                else:
+                    # 记录已被删除时（用户已读取该页）不再登记
+                    entry.update(image_md5=ocr_result["image_md5"])
+        finally:
+            pages.close()
+
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("OCR预取失败 book=%s pages=%s: %s", book_id, page_nums, exc)
+        prefetches.filter(page_index__in=page_nums, image_md5="").delete()
+
+
+@shared_task(bind=True, ignore_result=True)
+def build_book_index_task(self, book_id):
+    """上传后（或首次读取缺少索引的书籍时）在后台生成书籍文本/目录索引，阅读时直接读取索引而不再解析原文件。"""
+    from .utils.book_index import build_book_index, get_book_index
+
+    try:
+        book = Books.objects.get(pk=book_id)
+    except Books.DoesNotExist:
+        return
+    if get_book_index(book, schedule_missing=False) is not None:
+        # 内容相同的书籍共用索引，或已由其他请求生成
+        return
+
+    try:
+        page_count = build_book_index(book)
+        logger.info("书籍索引已生成 book=%s pages=%s", book_id, page_count)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("书籍索引生成失败 book=%s: %s", book_id, exc)
+
+
+@shared_task(bind=True, ignore_result=True)
+def generate_page_thumbnails_task(self, book_id):
+    """上传后在后台为PDF的每一页生成缩略图，页面列表直接使用磁盘缓存中的图片。"""
+    from book2tts.pdf import lease_pdf
+    from .utils.page_images import book_image_key, get_page_image_cache
+
+    try:
+        book = Books.objects.get(pk=book_id)
+    except Books.DoesNotExist:
+        return
+
+    try:
+        with lease_pdf(book.file.path) as doc:
+            page_count = len(doc)
+        rendered = get_page_image_cache().render_missing(
+            book.file.path, book_image_key(book), range(page_count), tier="thumb", image_format="webp"
+        )
+        logger.info("页面缩略图已生成 book=%s rendered=%s", book_id, rendered)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("页面缩略图生成失败 book=%s: %s", book_id, exc)
+
+
+def _report_audiobook_progress(job, status="processing", message=None, **fields):
+    """按章节完成情况更新有声书任务对应的 UserTask 进度"""
+    counts = {"total": 0, "success": 0, "failure": 0}
+    for chapter_status in job.job_chapters.values_list("status", flat=True):
+        counts["total"] += 1
+        if chapter_status in counts:
+            counts[chapter_status] += 1
+    message = message or f"正在合成章节 {counts['success']}/{counts['total']}"
+    UserTask.objects.filter(task_id=job.task_id).update(
+        status=status,
+        progress_message=message,
+        result_data={
+            "audiobook_job_id": job.id,
+            "total_chapters": counts["total"],
+            "completed_chapters": counts["success"],
+            "failed_chapters": counts["failure"],
+        },
+        updated_at=timezone.now(),
+        **fields,
+    )
+
+
+def _fail_audiobook_job(job, error_message):
+    AudiobookJob.objects.filter(pk=job.pk).update(
+        status="failure", error_message=error_message, updated_at=timezone.now()
+    )
+    _report_audiobook_progress(
+        job,
+        status="failure",
+        message="有声书生成失败",
+        error_message=error_message,
+        completed_at=timezone.now(),
+    )
+    OperationRecord.objects.create(
+        user=job.user,
+        operation_type="audio_create",
+        operation_object=f"{job.book.name} - 有声书",
+        operation_detail=f"有声书生成失败：{error_message}",
+        status="failed",
+        metadata={
+            "book_id": job.book_id,
+            "audiobook_job_id": job.id,
+            "task_id": job.task_id,
+        },
+    )
+
+
+@shared_task(bind=True)
+def audiobook_job_task(self, job_id):
+    """
+    整本书有声书任务：首次运行时按目录拆分章节，
+    然后把尚未完成的章节作为并行子任务分发，全部结束后封装为单个文件。
+
+    各章节独立合成并持久化，失败后重新运行只会合成未完成的章节；
+    章节按文本长度从长到短分发，吞吐量随 worker 数量增加。
+    """
+    from celery import chord, group
+    from django.db.models.functions import Length
+    from .utils.audiobook import split_book_chapters
+
+    job = AudiobookJob.objects.select_related("user", "book").get(pk=job_id)
+    try:
+        if not job.job_chapters.exists():
+            _report_audiobook_progress(job, message="正在按目录拆分章节...")
+            chapters = split_book_chapters(job.book, job.toc_level)
+            if not chapters:
+                raise Exception("未能从书籍中提取到可朗读的文本")
+            AudiobookChapter.objects.bulk_create(
+                AudiobookChapter(job=job, index=index, title=chapter["title"], text=chapter["text"])
+                for index, chapter in enumerate(chapters)
+            )
+
+        AudiobookJob.objects.filter(pk=job.pk).update(
+            status="processing", error_message="", updated_at=timezone.now()
+        )
+        pending_ids = list(
+            job.job_chapters.exclude(status="success")
+            .order_by(Length("text").desc())
+            .values_list("id", flat=True)
+        )
+        _report_audiobook_progress(job)
+
+        if not pending_ids:
+            return assemble_audiobook_task.apply(kwargs={"job_id": job.id}).get()
+
+        # 章节子任务自行记录失败而不抛出异常，保证回调总会执行
+        chord(
+            group(synthesize_audiobook_chapter_task.s(chapter_id) for chapter_id in pending_ids)
+        )(assemble_audiobook_task.si(job_id=job.id))
+        return {"audiobook_job_id": job.id, "dispatched_chapters": len(pending_ids)}
+
+    except Exception as exc:  # pylint: disable=broad-except
+        error_message = str(exc)
+        logger.error("有声书任务失败 job=%s: %s", job_id, error_message, exc_info=True)
+        _fail_audiobook_job(job, error_message)
+        raise
+
+
+@shared_task(bind=True)
+def synthesize_audiobook_chapter_task(self, chapter_id):
+    """合成有声书的单个章节；已完成的章节直接跳过，失败只记录在章节上"""
+    chapter = AudiobookChapter.objects.select_related("job", "job__user").get(pk=chapter_id)
+    if chapter.status == "success" and chapter.audio_file:
+        return {"chapter_id": chapter_id, "status": "skipped"}
+
+    job = chapter.job
+    AudiobookChapter.objects.filter(pk=chapter_id).update(status="processing", error_message="")
+
+    # 各章节并行合成，先在行锁内按预估时长预扣积分，避免多个章节都按同一余额通过检查
+    reserved_points = PointsManager.get_audio_generation_points(
+        estimate_audio_duration_from_text(chapter.text)
+    )
+    with transaction.atomic():
+        user_quota, _ = UserQuota.objects.get_or_create(user=job.user)
+        user_quota = UserQuota.objects.select_for_update().get(pk=user_quota.pk)
+        if not user_quota.consume_points(reserved_points):
+            error_message = f"积分不足。预估需要 {reserved_points} 积分，剩余 {user_quota.points} 积分"
+            AudiobookChapter.objects.filter(pk=chapter_id).update(
+                status="failure", error_message=error_message, points_consumed=0
+            )
+            _report_audiobook_progress(job)
+            return {"chapter_id": chapter_id, "status": "failure", "error": error_message}
+        AudiobookChapter.objects.filter(pk=chapter_id).update(points_consumed=reserved_points)
+
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as audio_file:
+        audio_path = audio_file.name
+    with tempfile.NamedTemporaryFile(suffix=".vtt", delete=False) as subtitle_file:
+        subtitle_path = subtitle_file.name
+
+    try:
+        tts = EdgeTTS(voice_name=job.voice_name, rate=job.rate)
+        tts_budget = budget_for("edge_tts")
+        if tts_budget.measure(chapter.text) > tts_budget.limit:
+            synthesis = tts.synthesize_long_text_with_subtitles(
+                text=chapter.text,
+                output_file=audio_path,
+                subtitle_file=subtitle_path,
+                budget=tts_budget,
+                words_in_cue=8,
+            )
+        else:
+            synthesis = tts.synthesize_with_subtitles_v2(
+                text=chapter.text,
+                output_file=audio_path,
+                subtitle_file=subtitle_path,
+                words_in_cue=8,
+            )
+        synthesis_result = asyncio.run(synthesis)
+        if not synthesis_result.get("audio_generated", False):
+            raise Exception("音频生成失败")
+
+        duration = get_audio_duration(audio_path, chapter.text)
+        srt_content = ""
+        if os.path.exists(subtitle_path) and os.path.getsize(subtitle_path) > 0:
+            with open(subtitle_path, "r", encoding="utf-8") as f:
+                srt_content = convert_vtt_to_srt(f.read())
+        if not srt_content:
+            srt_content = _generate_fallback_subtitle(chapter.text, duration)
+
+        with transaction.atomic():
+            # 按实际时长结算：多退少补，补扣部分不超过当前余额
+            user_quota = UserQuota.objects.select_for_update().get(pk=user_quota.pk)
+            difference = PointsManager.get_audio_generation_points(duration) - reserved_points
+            if difference > 0:
+                difference = min(difference, user_quota.points)
+                user_quota.consume_points(difference)
+            elif difference < 0:
+                user_quota.add_points(-difference)
+            points = reserved_points + difference
+
+            with open(audio_path, "rb") as f:
+                chapter.audio_file.save(
+                    f"audiobook_{job.id}_{chapter.index:04d}.mp3", ContentFile(f.read()), save=False
+                )
+            chapter.subtitle_srt = srt_content
+            chapter.audio_duration = duration
+            chapter.points_consumed = points
+            chapter.status = "success"
+            chapter.error_message = ""
+            chapter.save()
+
+        logger.info("有声书章节合成完成 job=%s chapter=%s duration=%.1fs", job.id, chapter.index, duration)
+        result = {"chapter_id": chapter_id, "status": "success", "audio_duration": duration}
+
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("有声书章节合成失败 job=%s chapter=%s: %s", job.id, chapter.index, exc)
+        # 合成失败退还预扣的积分
+        with transaction.atomic():
+            UserQuota.objects.select_for_update().get(pk=user_quota.pk).add_points(reserved_points)
+            AudiobookChapter.objects.filter(pk=chapter_id).update(
+                status="failure", error_message=str(exc), points_consumed=0
+            )
+        result = {"chapter_id": chapter_id, "status": "failure", "error": str(exc)}
+
+    finally:
+        for path in (audio_path, subtitle_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    _report_audiobook_progress(job)
+    return result
+
+
+@shared_task(bind=True)
+def assemble_audiobook_task(self, job_id):
+    """所有章节结束后封装有声书：拼接音频、写入章节标记并合并字幕"""
+    from book2tts.audiobook import AudioFormat, assemble_audiobook, chapter_markers, merge_srt
+
+    job = AudiobookJob.objects.select_related("user", "book").get(pk=job_id)
+    chapters = list(job.job_chapters.order_by("index"))
+    unfinished = [chapter for chapter in chapters if chapter.status != "success" or not chapter.audio_file]
+    if unfinished:
+        _fail_audiobook_job(
+            job,
+            f"{len(unfinished)}/{len(chapters)} 个章节未能合成（{unfinished[0].title}：{unfinished[0].error_message}），"
+            "重新提交任务将继续合成未完成的章节",
+        )
+        return {"audiobook_job_id": job.id, "status": "failure", "failed_chapters": len(unfinished)}
+
+    try:
+        AudiobookJob.objects.filter(pk=job.pk).update(status="assembling", updated_at=timezone.now())
+        _report_audiobook_progress(job, message="章节已全部合成，正在封装有声书...")
+
+        markers = chapter_markers([(chapter.title, chapter.audio_duration or 0.0) for chapter in chapters])
+        title = job.title or job.book.name
+        with tempfile.TemporaryDirectory(prefix="audiobook_") as temp_dir:
+            output_path = os.path.join(temp_dir, f"audiobook.{job.output_format}")
+            assemble_audiobook(
+                [chapter.audio_file.path for chapter in chapters],
+                markers,
+                output_path,
+                audio_format=AudioFormat(job.output_format),
+                title=title,
+            )
+            if job.audio_file:
+                job.audio_file.delete(save=False)
+            with open(output_path, "rb") as f:
+                job.audio_file.save(
+                    f"audiobook_{job.id}_{int(time.time())}.{job.output_format}",
+                    ContentFile(f.read()),
+                    save=False,
+                )
+
+        job.chapters = [
+            {"title": marker.title, "start_seconds": marker.start, "end_seconds": marker.end}
+            for marker in markers
+        ]
+        job.audio_duration = markers[-1].end
+        job.status = "success"
+        job.error_message = ""
+        job.completed_at = timezone.now()
+        job.save()
+        save_srt_subtitle(
+            job,
+            merge_srt([chapter.subtitle_srt for chapter in chapters], [marker.start for marker in markers]),
+            "subtitle_file",
+        )
+
+        points = sum(chapter.points_consumed for chapter in chapters)
+        message = f"有声书生成完成，共 {len(chapters)} 章，时长 {job.audio_duration:.0f} 秒"
+        _report_audiobook_progress(job, status="success", message=message, completed_at=timezone.now())
+        OperationRecord.objects.create(
+            user=job.user,
+            operation_type="audio_create",
+            operation_object=f"{job.book.name} - 有声书",
+            operation_detail=f"{message}，消耗积分 {points} 分",
+            status="success",
+            metadata={
+                "book_id": job.book_id,
+                "book_name": job.book.name,
+                "audiobook_job_id": job.id,
+                "task_id": job.task_id,
+                "chapters": len(chapters),
+                "actual_duration": job.audio_duration,
+                "consumed_points": points,
+                "voice_name": job.voice_name,
+                "output_format": job.output_format,
+                "file_path": job.audio_file.name,
+            },
+        )
+        return {
+            "audiobook_job_id": job.id,
+            "status": "success",
+            "audio_url": job.audio_file.url,
+            "audio_duration": job.audio_duration,
+        }
+
+    except Exception as exc:  # pylint: disable=broad-except
+        error_message = str(exc)
+        logger.error("有声书封装失败 job=%s: %s", job_id, error_message, exc_info=True)
+        _fail_audiobook_job(job, f"封装有声书失败：{error_message}")
+        raise
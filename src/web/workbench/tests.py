@@ -1,9 +1,11 @@
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from unittest.mock import patch, MagicMock
 import tempfile
 import os
+import io
+import json
 
 from home.models import UserQuota
 from .models import Books, AudioSegment
@@ -244,3 +246,2050 @@ class QuotaTestCase(TestCase):
             if segment.file and os.path.exists(segment.file.path):
                 os.remove(segment.file.path)
             segment.delete()
+
+
+class LLMResultCacheTestCase(SimpleTestCase):
+    """LLM 结果缓存测试"""
+
+    def _make_service(self, cache):
+        from book2tts.llm_service import LLMService
+
+        with patch.dict(os.environ, {'VOLCENGINE_API_KEY': 'test-key'}):
+            return LLMService(cache=cache)
+
+    def _fake_response(self, content):
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = content
+        response.usage = {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+        response.model = 'test-model'
+        return response
+
+    def test_ttl_and_size_bounded_eviction(self):
+        from book2tts.llm_cache import LLMResultCache
+
+        cache = LLMResultCache(ttl_seconds=60, max_entries=2)
+        cache.set('a', {'result': 'A'})
+        cache.set('b', {'result': 'B'})
+        self.assertEqual(cache.get('a')['result'], 'A')
+        cache.set('c', {'result': 'C'})  # 淘汰最久未使用的 b
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c')['result'], 'C')
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+
+        expired = LLMResultCache(ttl_seconds=0)
+        expired.set('a', {'result': 'A'})
+        self.assertIsNone(expired.get('a'))
+        self.assertEqual(expired.stats()['expirations'], 1)
+
+    def test_process_text_hits_cache_per_operation(self):
+        from book2tts.llm_cache import LLMResultCache
+
+        service = self._make_service(LLMResultCache())
+        with patch('book2tts.llm_service.completion', return_value=self._fake_response('formatted')) as mock_completion:
+            first = service.process_text('prompt', 'text', cache_operation='reformat')
+            second = service.process_text('prompt', 'text', cache_operation='reformat')
+            other_op = service.process_text('prompt', 'text', cache_operation='dialogue')
+            uncached = service.process_text('prompt', 'text')
+
+        self.assertEqual(mock_completion.call_count, 3)
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['result'], 'formatted')
+        self.assertEqual(second['usage']['total_tokens'], 0)
+        self.assertFalse(other_op['cached'])
+        self.assertFalse(uncached['cached'])
+
+    def test_unparseable_dialogue_result_is_not_cached(self):
+        from book2tts.dialogue_service import DialogueService
+        from book2tts.llm_cache import LLMResultCache
+
+        cache = LLMResultCache()
+        dialogue_service = DialogueService(self._make_service(cache))
+        with patch('book2tts.llm_service.completion', return_value=self._fake_response('not json')):
+            result = dialogue_service.text_to_dialogue('text')
+
+        self.assertFalse(result['success'])
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+class DatabaseLLMResultCacheTestCase(TestCase):
+    """数据库 LLM 结果缓存测试：结果在进程间共享"""
+
+    def test_results_shared_between_cache_instances(self):
+        from book2tts.llm_service import LLMService
+        from .models import LLMResultCacheEntry
+        from .utils.llm_cache import DatabaseLLMResultCache
+
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = 'formatted'
+        response.usage = {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+        response.model = 'test-model'
+
+        # 两个缓存实例模拟两个进程
+        with patch.dict(os.environ, {'VOLCENGINE_API_KEY': 'test-key'}):
+            first = LLMService(cache=DatabaseLLMResultCache())
+            second = LLMService(cache=DatabaseLLMResultCache())
+        with patch('book2tts.llm_service.completion', return_value=response) as mock_completion:
+            stored = first.process_text('prompt', 'text', cache_operation='reformat')
+            hit = second.process_text('prompt', 'text', cache_operation='reformat')
+
+        self.assertEqual(mock_completion.call_count, 1)
+        self.assertFalse(stored['cached'])
+        self.assertTrue(hit['cached'])
+        self.assertEqual(hit['result'], 'formatted')
+        self.assertEqual(LLMResultCacheEntry.objects.get().operation, 'reformat')
+        stats = first.cache.stats()
+        self.assertEqual((stats['scope'], stats['entries'], stats['hits']), ('shared', 1, 1))
+
+        self.assertTrue(second.forget_cached_text('reformat', 'prompt', 'text'))
+        self.assertFalse(LLMResultCacheEntry.objects.exists())
+
+    def test_ttl_and_lru_eviction(self):
+        from .utils.llm_cache import DatabaseLLMResultCache
+
+        cache = DatabaseLLMResultCache(max_entries=2)
+        cache.set('op|a', {'result': 'A'})
+        cache.set('op|b', {'result': 'B'})
+        self.assertEqual(cache.get('op|a')['result'], 'A')
+        cache.set('op|c', {'result': 'C'})  # 淘汰最久未使用的 b
+
+        self.assertIsNone(cache.get('op|b'))
+        self.assertEqual(cache.get('op|c')['result'], 'C')
+        self.assertEqual(cache.stats()['process']['evictions'], 1)
+
+        expired = DatabaseLLMResultCache(ttl_seconds=0)
+        expired.set('op|d', {'result': 'D'})
+        self.assertIsNone(expired.get('op|d'))
+
+
+class AsyncLLMServiceTestCase(SimpleTestCase):
+    """异步 LLM 调用与共享实例测试"""
+
+    def test_process_texts_bounded_and_ordered(self):
+        import asyncio
+        from book2tts.llm_cache import LLMResultCache
+        from book2tts.llm_service import LLMService
+
+        with patch.dict(os.environ, {'VOLCENGINE_API_KEY': 'test-key'}):
+            service = LLMService(cache=LLMResultCache())
+
+        state = {'running': 0, 'peak': 0}
+
+        async def fake_acompletion(model, messages, temperature):
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            content = messages[1]['content']
+            # 让靠前的请求更晚完成，验证结果仍按输入顺序返回
+            await asyncio.sleep(0.01 * (5 - int(content)))
+            state['running'] -= 1
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = f'out-{content}'
+            response.usage = {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+            return response
+
+        requests = [
+            {'system_prompt': 'p', 'user_content': str(i), 'cache_operation': 'reformat'}
+            for i in range(5)
+        ]
+        with patch('book2tts.llm_service.acompletion', side_effect=fake_acompletion):
+            results = service.process_texts(requests, max_concurrency=2)
+            again = asyncio.run(service.aprocess_text(**requests[0]))
+
+        self.assertEqual([r['result'] for r in results], [f'out-{i}' for i in range(5)])
+        self.assertEqual(state['peak'], 2)
+        self.assertTrue(again['cached'])
+
+    def test_run_sync_reuses_one_background_loop(self):
+        import asyncio
+        from book2tts.llm_service import run_sync
+
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        async def from_other_loop():
+            # 已处于事件循环中（如 ASGI 视图）时同样在后台循环上运行
+            return run_sync(current_loop())
+
+        first = run_sync(current_loop())
+        self.assertIs(run_sync(current_loop()), first)
+        self.assertIs(asyncio.run(from_other_loop()), first)
+        self.assertTrue(first.is_running())
+
+    def test_shared_service_is_reused(self):
+        from book2tts import llm_service
+
+        with patch.dict(os.environ, {'VOLCENGINE_API_KEY': 'test-key'}), \
+                patch.object(llm_service, '_shared_service', None), \
+                patch.object(llm_service.litellm, 'client_session', None):
+            first = llm_service.get_shared_llm_service()
+            second = llm_service.get_shared_llm_service()
+            self.assertIs(first, second)
+            self.assertIsNotNone(llm_service.litellm.client_session)
+            llm_service.litellm.client_session.close()
+
+
+class RateLimiterTestCase(TestCase):
+    """共享令牌桶限流测试"""
+
+    def test_in_memory_bucket_burst_and_timeout(self):
+        from book2tts.rate_limiter import (
+            InMemoryRateLimitBackend, RateLimitTimeout, TokenBucketLimiter,
+        )
+
+        limiter = TokenBucketLimiter('test', rate=10, burst=2, backend=InMemoryRateLimitBackend())
+        with patch('book2tts.rate_limiter.time.sleep') as mock_sleep:
+            with limiter:
+                pass
+            limiter.acquire()
+            mock_sleep.assert_not_called()
+            waited = limiter.acquire()
+
+        self.assertAlmostEqual(waited, 0.1, delta=0.02)
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(timeout=0.05)
+
+        unlimited = TokenBucketLimiter('off', rate=None)
+        self.assertFalse(unlimited.enabled)
+        self.assertEqual(unlimited.acquire(), 0.0)
+
+    def test_async_context_manager(self):
+        import asyncio
+        from book2tts.rate_limiter import InMemoryRateLimitBackend, TokenBucketLimiter
+
+        limiter = TokenBucketLimiter('async', rate=1000, burst=1, backend=InMemoryRateLimitBackend())
+
+        async def run():
+            async with limiter:
+                pass
+            return await limiter.aacquire()
+
+        self.assertGreater(asyncio.run(run()), 0)
+
+    def test_file_backend_reservations_are_shared(self):
+        import shutil
+        from book2tts.rate_limiter import FileRateLimitBackend, TokenBucketLimiter
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # 两个后端实例模拟两个进程，状态只保存在锁文件中
+        first = TokenBucketLimiter('file', rate=1, burst=1, backend=FileRateLimitBackend(directory))
+        second = TokenBucketLimiter('file', rate=1, burst=1, backend=FileRateLimitBackend(directory))
+
+        self.assertEqual(first._reserve(1, None), 0)
+        self.assertAlmostEqual(second._reserve(1, None), 1.0, delta=0.1)
+        self.assertIsNone(first.backend.reserve('book2tts:file', 1.0, 1, 1, max_wait=0.5))
+        self.assertAlmostEqual(second._reserve(1, None), 2.0, delta=0.1)
+
+    def test_database_backend_reservations_are_shared(self):
+        from book2tts.rate_limiter import TokenBucketLimiter
+        from .models import RateLimitBucket
+        from .utils.rate_limit import DatabaseRateLimitBackend
+
+        # 两个后端实例模拟两个进程
+        first = TokenBucketLimiter('db', rate=1, burst=1, backend=DatabaseRateLimitBackend())
+        second = TokenBucketLimiter('db', rate=1, burst=1, backend=DatabaseRateLimitBackend())
+
+        self.assertEqual(first._reserve(1, None), 0)
+        self.assertAlmostEqual(second._reserve(1, None), 1.0, delta=0.1)
+
+        tat = RateLimitBucket.objects.get(key='book2tts:db').tat
+        self.assertIsNone(first.backend.reserve('book2tts:db', 1.0, 1, 1, max_wait=0.5))
+        self.assertEqual(RateLimitBucket.objects.get(key='book2tts:db').tat, tat)
+
+
+class OCRPageCacheTestCase(TestCase):
+    """OCR 页面级缓存测试"""
+
+    def test_cached_page_skips_rendering(self):
+        from book2tts.rasterize import RenderSettings
+        from .utils import ocr_utils
+
+        book = MagicMock(md5_hash='a' * 32)
+        book.file.path = '/tmp/book.pdf'
+        with patch.object(ocr_utils, 'get_page_image_data', return_value=b'png-bytes') as mock_render, \
+                patch.object(ocr_utils, 'ocr_volc', return_value='page text') as mock_ocr:
+            first = ocr_utils.perform_page_ocr_with_cache(book, 3, 'ak', 'sk')
+            second = ocr_utils.perform_page_ocr_with_cache(book, 3, 'ak', 'sk')
+            other_dpi = ocr_utils.perform_page_ocr_with_cache(
+                book, 3, 'ak', 'sk', profile=RenderSettings(dpi=200)
+            )
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertTrue(second['page_cache_hit'])
+        self.assertEqual(second['text'], 'page text')
+        # 不同分辨率需要重新渲染，但图片MD5相同时仍命中二级缓存
+        self.assertEqual(mock_render.call_count, 2)
+        self.assertTrue(other_dpi['cached'])
+        self.assertFalse(other_dpi['page_cache_hit'])
+        self.assertEqual(mock_ocr.call_count, 1)
+
+    def test_blank_page_result_is_cached(self):
+        from .utils import ocr_utils
+
+        book = MagicMock(md5_hash='d' * 32)
+        book.file.path = '/tmp/book.pdf'
+        with patch.object(ocr_utils, 'get_page_image_data', return_value=b'blank-bytes') as mock_render, \
+                patch.object(ocr_utils, 'ocr_volc', return_value='') as mock_ocr:
+            first = ocr_utils.perform_page_ocr_with_cache(book, 0, 'ak', 'sk')
+            second = ocr_utils.perform_page_ocr_with_cache(book, 0, 'ak', 'sk')
+
+        # 空白页识别成功后同样命中页面缓存，不再渲染、识别和计费
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertTrue(second['page_cache_hit'])
+        self.assertEqual(second['text'], '')
+        self.assertEqual(mock_render.call_count, 1)
+        self.assertEqual(mock_ocr.call_count, 1)
+
+    def test_batch_pages_stream_in_order(self):
+        import pymupdf
+        from book2tts.rasterize import PageRasterizer
+        from .utils import ocr_utils
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = os.path.join(tmpdir, 'scan.pdf')
+            doc = pymupdf.open()
+            for i in range(3):
+                doc.new_page().insert_text((72, 72), f'page {i}')
+            doc.save(pdf_path)
+            doc.close()
+
+            book = MagicMock(md5_hash='b' * 32)
+            book.file.path = pdf_path
+            ocr_utils.cache_page_ocr(book.md5_hash, 1, ocr_utils.page_render_key(), 'c' * 32)
+            ocr_utils.cache_ocr_result('c' * 32, 'cached page 1')
+
+            rasterizer = PageRasterizer(max_workers=0)
+            texts = iter(['page 0', 'page 2'])
+            with patch.object(ocr_utils, 'get_rasterizer', return_value=rasterizer), \
+                    patch.object(ocr_utils, 'ocr_volc', side_effect=lambda *args: next(texts)):
+                results = list(ocr_utils.iter_pages_ocr_with_cache(book, [0, 1, 2, 9], 'ak', 'sk'))
+
+        self.assertEqual([page for page, _ in results], [0, 1, 2, 9])
+        self.assertEqual([r.get('text') for _, r in results[:3]], ['page 0', 'cached page 1', 'page 2'])
+        self.assertTrue(results[1][1]['page_cache_hit'])
+        self.assertIn('error', results[3][1])
+
+
+class OCRImageProfileTestCase(TestCase):
+    """OCR 图片配置测试"""
+
+    def test_grayscale_lossy_profile_shrinks_upload(self):
+        import io
+        import pymupdf
+        from PIL import Image, ImageDraw
+        from book2tts.ocr import get_ocr_image_profile
+        from book2tts.rasterize import render_page
+
+        # 模拟扫描页：带底色和噪点的整页图片
+        scan = Image.blend(
+            Image.new('RGB', (620, 877), (236, 228, 210)),
+            Image.effect_noise((620, 877), 24).convert('RGB'),
+            0.15,
+        )
+        draw = ImageDraw.Draw(scan)
+        for i in range(20):
+            draw.text((50, 40 + i * 40), f'line {i} of a scanned page', fill=(30, 30, 30))
+        buffer = io.BytesIO()
+        scan.save(buffer, 'JPEG', quality=90)
+
+        doc = pymupdf.open()
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=buffer.getvalue())
+
+        png = render_page(doc, 0, get_ocr_image_profile('png'))
+        jpeg = render_page(doc, 0, get_ocr_image_profile('gray-jpeg'))
+        webp = render_page(doc, 0, get_ocr_image_profile('gray-webp'))
+        doc.close()
+
+        self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+        self.assertEqual(webp[8:12], b'WEBP')
+        self.assertLess(len(jpeg) * 3, len(png))
+        self.assertLess(len(webp) * 3, len(png))
+
+    def test_profile_env_overrides_and_in_memory_upload(self):
+        from book2tts.ocr import get_ocr_image_profile
+        from .utils import ocr_utils
+
+        with patch.dict(os.environ, {'OCR_IMAGE_PROFILE': 'gray-webp', 'OCR_IMAGE_QUALITY': '60'}):
+            profile = get_ocr_image_profile()
+            self.assertEqual(profile.cache_key, 'webp@150-gray-q60')
+            with self.assertRaises(ValueError):
+                get_ocr_image_profile('tiff')
+
+        with patch.object(ocr_utils, 'ocr_volc', return_value='text') as mock_ocr:
+            ocr_utils.perform_ocr_with_cache(b'jpeg-bytes', 'ak', 'sk')
+        mock_ocr.assert_called_once_with('ak', 'sk', b'jpeg-bytes')
+
+    def test_legacy_page_cache_entries_are_reused(self):
+        from .utils import ocr_utils
+
+        ocr_utils.cache_page_ocr('f' * 32, 0, 'png@150', '1' * 32)
+        ocr_utils.cache_ocr_result('1' * 32, 'legacy text')
+        ocr_utils.cache_page_ocr('f' * 32, 1, 'png@150', '2' * 32)
+        ocr_utils.cache_ocr_result('2' * 32, 'legacy page 1')
+        ocr_utils.cache_page_ocr('f' * 32, 1, 'jpeg@150-gray-q80', '3' * 32)
+        ocr_utils.cache_ocr_result('3' * 32, 'new page 1')
+
+        cached = ocr_utils.get_cached_pages_ocr('f' * 32, [0, 1, 2], 'jpeg@150-gray-q80')
+        self.assertEqual(cached[0]['text'], 'legacy text')
+        self.assertEqual(cached[1]['text'], 'new page 1')
+        self.assertNotIn(2, cached)
+
+
+class LLMBatchOCRTestCase(TestCase):
+    """LLM 视觉模型多页OCR测试"""
+
+    def _service(self):
+        from book2tts.llm_cache import LLMResultCache
+        from book2tts.llm_service import LLMService
+
+        with patch.dict(os.environ, {'VOLCENGINE_API_KEY': 'test-key'}):
+            return LLMService(cache=LLMResultCache())
+
+    @staticmethod
+    def _response(content):
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = content
+        response.usage = {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+        return response
+
+    def test_pages_are_packed_and_split(self):
+        service = self._service()
+        calls = []
+
+        async def fake_acompletion(model, messages, temperature):
+            images = [part['image_url']['url'] for part in messages[1]['content'] if part['type'] == 'image_url']
+            calls.append(images)
+            if len(images) == 1:
+                return self._response(f'text of {images[0]}')
+            return self._response('\n'.join(
+                f'=== PAGE {i} ===\ntext of {url}' for i, url in enumerate(images, start=1)
+            ))
+
+        images = [f'img{i}' for i in range(5)]
+        with patch('book2tts.llm_service.acompletion', side_effect=fake_acompletion):
+            results = service.perform_ocr_batch(images, batch_size=2)
+
+        self.assertEqual([len(call) for call in sorted(calls, key=len, reverse=True)], [2, 2, 1])
+        self.assertEqual([r['result'] for r in results], [f'text of img{i}' for i in range(5)])
+        self.assertEqual([r['batched'] for r in results], [True, True, True, True, False])
+        self.assertIsNotNone(results[0]['usage'])
+        self.assertIsNone(results[1]['usage'])
+
+    def test_unparseable_response_falls_back_to_single_pages(self):
+        from book2tts.llm_service import split_ocr_pages
+
+        self.assertIsNone(split_ocr_pages('=== PAGE 1 ===\na\n=== PAGE 3 ===\nc', 2))
+        self.assertEqual(split_ocr_pages('=== PAGE 1 ===\na\n\n=== PAGE 2 ===\n', 2), ['a', ''])
+
+        service = self._service()
+
+        async def fake_acompletion(model, messages, temperature):
+            images = [part['image_url']['url'] for part in messages[1]['content'] if part['type'] == 'image_url']
+            if len(images) > 1:
+                return self._response('page one and page two merged together')
+            return self._response(f'text of {images[0]}')
+
+        with patch('book2tts.llm_service.acompletion', side_effect=fake_acompletion):
+            results = service.perform_ocr_batch(['a', 'b'], batch_size=4)
+
+        self.assertEqual([r['result'] for r in results], ['text of a', 'text of b'])
+        self.assertFalse(any(r['batched'] for r in results))
+
+    def test_only_cache_misses_are_sent(self):
+        from .utils import ocr_utils
+
+        cached_image = b'\xff\xd8cached'
+        ocr_utils.cache_ocr_result(ocr_utils.calculate_image_md5(cached_image), 'cached text')
+
+        service = MagicMock()
+        service.perform_ocr_batch.return_value = [
+            {'success': True, 'result': 'new text'},
+            {'success': False, 'error': 'boom'},
+        ]
+        images = [cached_image, b'RIFF0000WEBPnew', b'RIFF0000WEBPnew', b'\x89PNGbad']
+        results = ocr_utils.perform_llm_ocr_batch_with_cache(images, llm_service=service)
+
+        sent = service.perform_ocr_batch.call_args[0][0]
+        self.assertEqual(len(sent), 2)
+        self.assertTrue(sent[0].startswith('data:image/webp;base64,'))
+        self.assertTrue(sent[1].startswith('data:image/png;base64,'))
+        self.assertEqual([r['text'] for r in results], ['cached text', 'new text', 'new text', ''])
+        self.assertEqual([r['cached'] for r in results], [True, False, False, False])
+        self.assertIn('error', results[3])
+        self.assertEqual(
+            ocr_utils.get_cached_ocr_result(ocr_utils.calculate_image_md5(images[1])), 'new text'
+        )
+
+    def test_multi_page_ocr_batches_pages_with_llm_engine(self):
+        import pymupdf
+        from django.test import override_settings
+        from book2tts.rasterize import PageRasterizer
+        from .utils import ocr_utils
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = os.path.join(tmpdir, 'scan.pdf')
+            doc = pymupdf.open()
+            for i in range(5):
+                doc.new_page().insert_text((72, 72 + i * 40), f'page {i}')
+            doc.save(pdf_path)
+            doc.close()
+
+            book = MagicMock(md5_hash='d' * 32)
+            book.file.path = pdf_path
+            ocr_utils.cache_page_ocr(book.md5_hash, 2, ocr_utils.page_render_key(), 'e' * 32)
+            ocr_utils.cache_ocr_result('e' * 32, 'cached page 2')
+
+            service = MagicMock()
+            service.perform_ocr_batch.side_effect = lambda urls: [
+                {'success': True, 'result': f'llm text {len(service.perform_ocr_batch.call_args_list)}-{i}'}
+                for i in range(len(urls))
+            ]
+            with override_settings(OCR_ENGINE='llm'), \
+                    patch.dict(os.environ, {'LLM_OCR_BATCH_SIZE': '2', 'VOLCENGINE_API_KEY': 'key'}), \
+                    patch.object(ocr_utils, 'get_rasterizer', return_value=PageRasterizer(max_workers=0)), \
+                    patch('book2tts.llm_service.get_shared_llm_service', return_value=service), \
+                    patch.object(ocr_utils, 'ocr_volc', side_effect=AssertionError('volc called')):
+                self.assertTrue(ocr_utils.ocr_service_configured())
+                results = list(ocr_utils.iter_pages_ocr_with_cache(book, [0, 1, 2, 3, 4], None, None))
+
+        # 未命中的4页分两个请求，缓存页按顺序穿插返回
+        self.assertEqual([len(call[0][0]) for call in service.perform_ocr_batch.call_args_list], [2, 2])
+        self.assertEqual([page for page, _ in results], [0, 1, 2, 3, 4])
+        self.assertEqual(
+            [r['text'] for _, r in results],
+            ['llm text 1-0', 'llm text 1-1', 'cached page 2', 'llm text 2-0', 'llm text 2-1'],
+        )
+        self.assertTrue(results[2][1]['page_cache_hit'])
+        self.assertFalse(results[3][1]['page_cache_hit'])
+        self.assertEqual(ocr_utils.get_cached_page_ocr(book.md5_hash, 3, ocr_utils.page_render_key())['text'], 'llm text 2-0')
+
+
+class ScannedPDFBatchOCRTestCase(SimpleTestCase):
+    """Gradio 批量处理扫描版PDF的并发OCR测试"""
+
+    def test_range_is_ocred_concurrently_in_order_and_cached(self):
+        import threading
+        import pymupdf
+        from book2tts import ocr
+        from book2tts.rasterize import PageRasterizer
+
+        state = {'running': 0, 'peak': 0, 'calls': 0}
+        lock = threading.Lock()
+        # 只有第二个同时在途的请求能放行第一个请求，结果不依赖渲染耗时
+        overlapped = threading.Event()
+
+        def fake_ocr(ak, sk, image_data):
+            with lock:
+                state['running'] += 1
+                state['calls'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+                if state['running'] >= 2:
+                    overlapped.set()
+            overlapped.wait(timeout=5)
+            with lock:
+                state['running'] -= 1
+            return f'text {len(image_data)}'
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = os.path.join(tmpdir, 'scan.pdf')
+            doc = pymupdf.open()
+            for i in range(6):
+                doc.new_page().insert_text((72, 72 + i * 40), f'page {i}')
+            doc.save(pdf_path)
+            doc.close()
+
+            rasterizer = PageRasterizer(max_workers=0)
+            with patch.dict(os.environ, {'OCR_CACHE_DIR': os.path.join(tmpdir, 'cache')}), \
+                    patch.object(ocr, 'get_rasterizer', return_value=rasterizer), \
+                    patch.object(ocr, 'ocr_volc', side_effect=fake_ocr), \
+                    patch.object(rasterizer, 'iter_pages', wraps=rasterizer.iter_pages) as mock_iter:
+                first = list(ocr.ocr_pdf_pages('ak', 'sk', pdf_path, range(1, 5), concurrency=3))
+                second = list(ocr.ocr_pdf_pages('ak', 'sk', pdf_path, range(1, 5), concurrency=3))
+
+        self.assertEqual([page for page, _ in first], [1, 2, 3, 4])
+        self.assertEqual(list(mock_iter.call_args[0][1]), [1, 2, 3, 4])
+        self.assertGreater(state['peak'], 1)
+        self.assertEqual(state['calls'], 4)
+        self.assertTrue(all(r['cached'] for _, r in second))
+        self.assertEqual([r['text'] for _, r in first], [r['text'] for _, r in second])
+
+    def test_identical_pages_cached_concurrently_and_cache_failures_ignored(self):
+        import threading
+        from book2tts import ocr
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch.dict(os.environ, {'OCR_CACHE_DIR': os.path.join(tmpdir, 'cache')}):
+            # 空白页的图片 MD5 相同，批次内多个线程会同时写同一个缓存文件
+            barrier = threading.Barrier(4)
+            errors = []
+
+            def write():
+                barrier.wait()
+                try:
+                    ocr.cache_ocr_text('blank', 'same text')
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=write) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(ocr.get_cached_ocr_text('blank'), 'same text')
+
+            with patch.object(ocr, 'ocr_volc', return_value='text'), \
+                    patch.object(ocr.os, 'replace', side_effect=OSError('disk full')):
+                result = ocr.ocr_image_with_cache('ak', 'sk', b'image')
+            self.assertEqual(result['text'], 'text')
+            self.assertNotIn('error', result)
+            self.assertEqual(os.listdir(os.path.join(tmpdir, 'cache')), ['blank.txt'])
+
+
+class OCRPrefetchTestCase(TestCase):
+    """OCR 预取测试：后台识别后续页面，读取时才扣除积分"""
+
+    def test_prefetched_pages_are_charged_when_read(self):
+        import pymupdf
+        from django.test import override_settings
+        from book2tts.rasterize import PageRasterizer
+        from home.models import PointsConfig
+        from .models import OCRPrefetch
+        from .tasks import prefetch_ocr_pages_task
+        from .utils import ocr_utils
+
+        PointsConfig.objects.update_or_create(
+            operation_type='ocr_processing', defaults={'points_per_unit': 7, 'is_active': True}
+        )
+        user = User.objects.create_user(username='reader', password='pw')
+        self.client.force_login(user)
+        quota, _ = UserQuota.objects.get_or_create(user=user)
+        quota.points = 100
+        quota.save()
+
+        def run_eagerly(kwargs, **options):
+            self.assertEqual(options['priority'], 9)
+            prefetch_ocr_pages_task.apply(kwargs=kwargs)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, OCR_PREFETCH_PAGES=2,
+                                  VOLCENGINE_ACCESS_KEY='ak', VOLCENGINE_SECRET_KEY='sk'):
+            doc = pymupdf.open()
+            for i in range(4):
+                doc.new_page().insert_text((72, 72), f'page {i}')
+            doc.save(os.path.join(media_root, 'scan.pdf'))
+            doc.close()
+            book = Books.objects.create(
+                user=user, name='scan', file_type='.pdf', file='scan.pdf', md5_hash='9' * 32
+            )
+
+            url = reverse('ocr_pdf_page', args=[book.id])
+            with patch.object(ocr_utils, 'get_rasterizer', return_value=PageRasterizer(max_workers=0)), \
+                    patch.object(ocr_utils, 'get_ocr_credentials', return_value=('ak', 'sk')), \
+                    patch.object(ocr_utils, 'ocr_volc', side_effect=lambda ak, sk, image: f'text {len(image)}') as mock_ocr, \
+                    patch.object(prefetch_ocr_pages_task, 'apply_async', side_effect=run_eagerly):
+                first = self.client.post(url, {'page_num': 0}).json()
+                self.assertEqual(first['prefetch_pages'], [1, 2])
+                self.assertEqual(mock_ocr.call_count, 3)
+                quota.refresh_from_db()
+                # 预取的页面尚未被读取，不扣积分
+                self.assertEqual(quota.points, 93)
+                self.assertEqual(OCRPrefetch.objects.exclude(image_md5='').count(), 2)
+
+                second = self.client.post(url, {'page_num': 1}).json()
+                self.assertTrue(second['cached'])
+                self.assertTrue(second['prefetched'])
+                self.assertEqual(second['prefetch_pages'], [3])
+                quota.refresh_from_db()
+                self.assertEqual(quota.points, 86)
+
+                again = self.client.post(url, {'page_num': 1}).json()
+                self.assertFalse(again['prefetched'])
+                self.assertEqual(mock_ocr.call_count, 4)
+                quota.refresh_from_db()
+                self.assertEqual(quota.points, 86)
+
+    def test_pending_prefetch_is_not_billed(self):
+        from .models import OCRPrefetch
+        from .utils.ocr_prefetch import consume_prefetched_page
+
+        user = User.objects.create_user(username='pending-reader', password='pw')
+        book = Books.objects.create(user=user, name='scan', file_type='.pdf', md5_hash='8' * 32)
+        OCRPrefetch.objects.create(user=user, book=book, page_index=1)
+        OCRPrefetch.objects.create(user=user, book=book, page_index=2, image_md5='a' * 32)
+
+        # 仍在队列中的预取记录被删除，但页面缓存并非由它产生，不按新识别计费
+        self.assertFalse(consume_prefetched_page(user, book, 1))
+        self.assertTrue(consume_prefetched_page(user, book, 2))
+        self.assertFalse(OCRPrefetch.objects.filter(user=user, book=book).exists())
+
+
+class BookIndexTestCase(TestCase):
+    """书籍文本/目录索引测试：上传后生成一次，阅读请求直接读取索引"""
+
+    def test_index_file_round_trip(self):
+        from book2tts.book_index import PAGE_SCANNED, BookIndex, BookIndexError, write_book_index
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'book.idx')
+            count = write_book_index(
+                path, ['第一页\r\n', '', 'page three'], [0, PAGE_SCANNED, 0], meta={'toc': [{'title': '一'}]}
+            )
+            self.assertEqual(count, 3)
+
+            with BookIndex(path) as index:
+                self.assertEqual(len(index), 3)
+                self.assertEqual(index.page_text(0), '第一页\n')
+                self.assertEqual(index.page_text(2), 'page three')
+                self.assertTrue(index.is_scanned(1))
+                self.assertFalse(index.is_scanned(2))
+                self.assertEqual([index.char_offset(i) for i in range(4)], [0, 4, 4, 14])
+                self.assertEqual(index.page_at_char(5), 2)
+                self.assertEqual(index.page_range_text(0, 5), '第一页\n\n\npage three')
+                self.assertEqual(index.toc, [{'title': '一'}])
+                with self.assertRaises(IndexError):
+                    index.page_text(3)
+
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) - 1)
+            with self.assertRaises(BookIndexError):
+                BookIndex(path)
+
+    def test_views_read_from_index(self):
+        import pymupdf
+        from django.test import override_settings
+        from .utils.book_index import build_book_index, get_book_index
+        from .utils.book_structure import extract_book_structure
+        from .views import book_views
+
+        user = User.objects.create_user(username='indexer', password='pw')
+        self.client.force_login(user)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, BOOK_INDEX_DIR=os.path.join(media_root, 'index')):
+            doc = pymupdf.open()
+            for i in range(3):
+                doc.new_page().insert_text((72, 72), f'chapter text {i}')
+            doc.set_toc([[1, 'Part 1', 1], [2, 'Section', 2], [1, 'Part 2', 3]])
+            doc.save(os.path.join(media_root, 'book.pdf'))
+            doc.close()
+            book = Books.objects.create(
+                user=user, name='book', file_type='.pdf', file='book.pdf', md5_hash='a' * 32
+            )
+            self.assertIsNone(get_book_index(book))
+            expected_tocs, expected_pages = extract_book_structure(book)
+
+            self.assertEqual(build_book_index(book), 3)
+            index = get_book_index(book)
+            self.assertEqual(index.toc, expected_tocs)
+            self.assertEqual(index.pages, expected_pages)
+            self.assertEqual(index.toc[0]['href'], '1-2')
+
+            with patch.object(book_views, 'lease_pdf', side_effect=AssertionError('book re-parsed')):
+                toc_response = self.client.get(reverse('toc', args=[book.id]))
+                self.assertEqual(toc_response.status_code, 200)
+                self.assertEqual(toc_response.context['tocs'], expected_tocs)
+
+                data = self.client.post(reverse('text_by_page', args=[book.id]), {'names': '1,2'}).json()
+                self.assertEqual(data['texts'], 'chapter text 1\n\n\nchapter text 2\n')
+
+                data = self.client.post(reverse('text_by_toc', args=[book.id]), {'names': '1-2'}).json()
+                self.assertIn('chapter text 0', data['texts'])
+                self.assertIn('chapter text 1', data['texts'])
+
+    def test_upload_schedules_index_build(self):
+        from .utils import book_index
+
+        book = Books(id=42, file_type='.epub', md5_hash='')
+        with patch.object(book_index.transaction, 'on_commit') as on_commit, \
+                patch('workbench.tasks.build_book_index_task.delay') as delay:
+            book_index.schedule_book_index(book)
+            on_commit.call_args[0][0]()
+        delay.assert_called_once_with(42)
+        self.assertTrue(book_index.book_index_path(book).endswith('book-42.idx'))
+
+    def test_missing_index_is_built_once_and_scan_flags_are_read(self):
+        import pymupdf
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .tasks import build_book_index_task
+        from .utils import book_index
+
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user(username='legacy', password='pw')
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, BOOK_INDEX_DIR=os.path.join(media_root, 'index')):
+            doc = pymupdf.open()
+            for i in range(4):
+                doc.new_page().insert_text((72, 72), f'page {i}')
+            doc.save(os.path.join(media_root, 'legacy.pdf'))
+            doc.close()
+            # 引入索引之前上传的书籍没有索引
+            book = Books.objects.create(
+                user=user, name='legacy', file_type='.pdf', file='legacy.pdf', md5_hash='c' * 32
+            )
+
+            with patch.object(book_index, 'schedule_book_index') as schedule:
+                self.assertIsNone(book_index.get_book_index(book))
+                self.assertIsNone(book_index.get_book_index(book))
+                self.assertIsNone(book_index.get_book_index(book, schedule_missing=False))
+            schedule.assert_called_once_with(book)
+
+            build_book_index_task.apply(args=[book.id])
+            with patch.object(book_index, 'build_book_index') as build:
+                build_book_index_task.apply(args=[book.id])
+            build.assert_not_called()
+
+            # 有索引时扫描检测直接读取逐页标志，不再打开PDF，结果与直接检测一致
+            from book2tts.pdf import detect_scanned_pdf
+
+            expected = detect_scanned_pdf(book.file.path)
+            with patch('book2tts.pdf.lease_pdf', side_effect=AssertionError('pdf reopened')):
+                result = book_index.detect_book_scanned(book)
+                self.assertTrue(book.detect_and_update_pdf_type())
+            self.assertEqual(result, expected)
+            self.assertEqual(book.pdf_type, 'scanned' if expected['is_scanned'] else 'text')
+
+
+class DocumentPoolTestCase(SimpleTestCase):
+    """文档句柄池测试：按 (路径, 修改时间) 复用，字节预算和空闲淘汰，独占借用"""
+
+    class FakeDoc:
+        def __init__(self, path):
+            self.path = path
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    def _make_file(self, directory, name, size):
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_reuse_invalidation_and_budget(self):
+        from book2tts.doc_pool import DocumentPool
+
+        pool = DocumentPool(self.FakeDoc, budget_bytes=150, idle_seconds=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            first = self._make_file(tmp, 'a.pdf', 100)
+            second = self._make_file(tmp, 'b.pdf', 100)
+
+            with pool.lease(first) as doc:
+                opened = doc
+            with pool.lease(first) as doc:
+                self.assertIs(doc, opened)
+            self.assertEqual(pool.stats()['hits'], 1)
+            self.assertEqual(pool.stats()['misses'], 1)
+
+            # 文件被替换后打开新版本，旧句柄关闭
+            os.utime(first, (1, 1))
+            with pool.lease(first) as doc:
+                self.assertIsNot(doc, opened)
+                replaced = doc
+            self.assertTrue(opened.closed)
+            self.assertEqual(pool.stats()['invalidations'], 1)
+
+            # 超出字节预算时淘汰最久未用的空闲句柄，借用中的句柄不受影响
+            with pool.lease(second) as doc:
+                self.assertTrue(replaced.closed)
+                self.assertFalse(doc.closed)
+            stats = pool.stats()
+            self.assertEqual(stats['open'], 1)
+            self.assertEqual(stats['bytes'], 100)
+            self.assertEqual(stats['evictions'], 1)
+
+    def test_idle_eviction_and_shared_handles(self):
+        from book2tts.doc_pool import DocumentPool
+
+        pool = DocumentPool(self.FakeDoc, budget_bytes=10 ** 6, idle_seconds=60)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._make_file(tmp, 'a.epub', 10)
+            shared = pool.get(path)
+            with pool.lease(path) as doc:
+                leased = doc
+            self.assertIs(shared, leased)
+
+            with patch('book2tts.doc_pool.time.monotonic', return_value=10 ** 9):
+                pool.evict_idle()
+            self.assertEqual(pool.stats()['open'], 0)
+            # get() 交出的对象可能仍被调用方使用，淘汰时不主动关闭
+            self.assertFalse(shared.closed)
+
+    def test_lease_is_exclusive(self):
+        import threading
+        import time
+        from book2tts.doc_pool import DocumentPool
+
+        pool = DocumentPool(self.FakeDoc, budget_bytes=10 ** 6, idle_seconds=0)
+        active, overlaps = [], []
+
+        def worker(path):
+            for _ in range(20):
+                with pool.lease(path):
+                    active.append(1)
+                    if len(active) > 1:
+                        overlaps.append(1)
+                    time.sleep(0.001)
+                    active.pop()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._make_file(tmp, 'a.pdf', 10)
+            threads = [threading.Thread(target=worker, args=(path,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(pool.stats()['misses'], 1)
+        self.assertEqual(pool.stats()['hits'], 79)
+
+
+class PageImageTestCase(TestCase):
+    """页面图片接口测试：二进制输出、尺寸档位、ETag/304 和磁盘缓存"""
+
+    def test_binary_page_image_with_etag(self):
+        import pymupdf
+        from django.test import override_settings
+        from book2tts.rasterize import PageRasterizer
+        from .tasks import generate_page_thumbnails_task
+
+        user = User.objects.create_user(username='viewer', password='pw')
+        self.client.force_login(user)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, PAGE_IMAGE_CACHE_DIR=os.path.join(media_root, 'images')):
+            doc = pymupdf.open()
+            for i in range(3):
+                doc.new_page().insert_text((72, 72), f'page {i}')
+            doc.save(os.path.join(media_root, 'book.pdf'))
+            doc.close()
+            book = Books.objects.create(
+                user=user, name='book', file_type='.pdf', file='book.pdf', md5_hash='b' * 32
+            )
+            url = reverse('page_image', args=[book.id, 1])
+
+            response = self.client.get(url, {'tier': 'full'}, HTTP_ACCEPT='image/webp,*/*')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/webp')
+            self.assertIn('immutable', response['Cache-Control'])
+            full = b''.join(response.streaming_content)
+            self.assertTrue(full.startswith(b'RIFF'))
+            etag = response['ETag']
+
+            with patch('book2tts.page_images.get_page_image_data', side_effect=AssertionError('re-rendered')):
+                cached = self.client.get(url, {'tier': 'full'}, HTTP_ACCEPT='image/webp')
+                self.assertEqual(b''.join(cached.streaming_content), full)
+
+                not_modified = self.client.get(
+                    url, {'tier': 'full'}, HTTP_ACCEPT='image/webp', HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], etag)
+
+            thumb = self.client.get(url, {'tier': 'thumb'}, HTTP_ACCEPT='image/png')
+            self.assertEqual(thumb['Content-Type'], 'image/jpeg')
+            self.assertNotEqual(thumb['ETag'], etag)
+            self.assertLess(len(b''.join(thumb.streaming_content)), len(full))
+
+            self.assertEqual(self.client.get(reverse('page_image', args=[book.id, 9])).status_code, 404)
+            self.assertEqual(self.client.get(url, {'tier': 'huge'}).status_code, 400)
+
+            data = self.client.get(reverse('get_page_image', args=[book.id, 1])).json()
+            self.assertEqual(data['image_url'], f'{url}?tier=full')
+
+            with patch('book2tts.page_images.get_rasterizer', return_value=PageRasterizer(max_workers=0)):
+                generate_page_thumbnails_task.apply(kwargs={'book_id': book.id})
+            thumbs = os.listdir(os.path.join(media_root, 'images', 'bb', 'b' * 32))
+            self.assertEqual(len([name for name in thumbs if '-thumb-' in name and name.endswith('.webp')]), 3)
+
+
+class PageRangeExtractionTestCase(SimpleTestCase):
+    """按页面范围抽取测试：只读取/渲染需要的页面"""
+
+    def test_pdf_pages_are_extracted_lazily(self):
+        import pymupdf
+        from book2tts import pdf
+        from book2tts.rasterize import PageRasterizer
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = os.path.join(tmpdir, 'book.pdf')
+            doc = pymupdf.open()
+            for i in range(8):
+                doc.new_page().insert_text((72, 72), f'page {i}')
+            doc.set_toc([[1, 'Start', 1]])
+            doc.save(pdf_path)
+            doc.close()
+
+            self.assertEqual(pdf.extract_text_by_page_range(pdf_path, 2, 4), ['page 2\n', 'page 3\n'])
+            self.assertEqual(len(pdf.extract_text_by_page_range(pdf_path, 6, 20)), 2)
+
+            with patch.object(pdf, 'extract_text_by_page_range', wraps=pdf.extract_text_by_page_range) as loader:
+                result = pdf.extract_text_by_page(pdf_path)
+                pages = result['pages']
+                self.assertEqual(result['toc'], [[1, 'Start', 1]])
+                self.assertEqual(len(pages), 8)
+                loader.assert_not_called()
+
+                self.assertEqual(pages[5], 'page 5\n')
+                self.assertEqual(pages[3:6], ['page 3\n', 'page 4\n', 'page 5\n'])
+                self.assertEqual(pages[-1], 'page 7\n')
+                # 已缓存的第5页不再读取，第3-4页一次读取
+                self.assertEqual(
+                    [call.args[1:] for call in loader.call_args_list], [(5, 6), (3, 5), (7, 8)]
+                )
+
+            rasterizer = PageRasterizer(max_workers=0)
+            with patch.object(pdf, 'get_rasterizer', return_value=rasterizer), \
+                    patch.object(rasterizer, 'iter_pages', wraps=rasterizer.iter_pages) as mock_iter:
+                images = pdf.extract_img_by_page(pdf_path)
+                self.assertEqual(len(images), 8)
+                mock_iter.assert_not_called()
+                self.assertTrue(images[6].startswith(b'\x89PNG'))
+                self.assertEqual(list(mock_iter.call_args[0][1]), [6])
+
+    def test_epub_page_range(self):
+        from book2tts import ebook
+
+        book = MagicMock()
+        book.iter_document_items.return_value = [
+            MagicMock(get_name=MagicMock(return_value=f'ch{i}.xhtml')) for i in range(5)
+        ]
+        with patch.object(ebook, 'get_content_with_href', side_effect=lambda b, href: f'text of {href}') as content:
+            texts = ebook.get_contents_by_page_range(book, 1, 3)
+        self.assertEqual(texts, ['text of ch1.xhtml', 'text of ch2.xhtml'])
+        self.assertEqual(content.call_count, 2)
+        self.assertEqual([p['href'] for p in ebook.ebook_page_range(book, 3)], ['ch3.xhtml', 'ch4.xhtml'])
+
+
+class PageCleanerTestCase(TestCase):
+    """排版前本地清理测试：页眉页脚、页码、断行及跳过 LLM"""
+
+    PAGES = [
+        "THE GREAT BOOK\n"
+        "Alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu and\n"
+        "the line keeps going until the margin where the word is split in a fa-\n"
+        "shion that only layout explains, so the sentence ends here at last.\n"
+        "- 11 -\n",
+        "Chapter One 12\n"
+        "Nu xi omicron pi rho sigma tau upsilon phi chi psi omega and then the\n"
+        "text continues on this second page with yet another ordinary sentence.\n"
+        "- 12 -\n",
+        "THE GREAT BOOK\n"
+        "Some other words appear on the third page to make the body different,\n"
+        "and they finish the paragraph before the page number below.\n"
+        "- 13 -\n",
+        "Chapter One 14\n"
+        "The fourth page opens with a sentence that wraps over two physical\n"
+        "lines in the extracted text, which the cleaner should merge again.\n"
+        "第 14 页\n",
+    ]
+
+    def test_clean_pages_strips_repeated_edges_and_page_numbers(self):
+        from book2tts.page_cleaner import clean_pages, is_page_number, passes_quality_checks
+
+        cleaned, stats = clean_pages(self.PAGES)
+        self.assertEqual(stats.header_lines, 4)
+        self.assertEqual(stats.page_numbers, 4)
+        self.assertEqual(stats.hyphenations, 1)
+        self.assertEqual(
+            cleaned[0],
+            "Alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu and "
+            "the line keeps going until the margin where the word is split in a fashion "
+            "that only layout explains, so the sentence ends here at last.",
+        )
+        self.assertNotIn("Chapter One", cleaned[3])
+        self.assertLess(stats.chars_after, stats.chars_before)
+        self.assertTrue(all(passes_quality_checks(page) for page in cleaned))
+
+        self.assertTrue(is_page_number("Page 3 of 20"))
+        self.assertTrue(is_page_number("xii"))
+        self.assertFalse(is_page_number("I"))
+
+    def test_short_lines_and_cjk_joining(self):
+        from book2tts.page_cleaner import clean_text, quality_issues
+
+        text, stats = clean_text(
+            "第一章 开始\n"
+            "这是一段很长的中文正文，需要在这里换行然后继续写下去，直到页面的右边\n"
+            "界为止，然后是下一行的内容。\n"
+            "12\n"
+        )
+        self.assertEqual(
+            text, "第一章 开始\n这是一段很长的中文正文，需要在这里换行然后继续写下去，直到页面的右边界为止，然后是下一行的内容。"
+        )
+        self.assertEqual(stats.page_numbers, 1)
+        self.assertIn("citations", quality_issues(text + "[1]"))
+        self.assertIn("too_short", quality_issues("短"))
+
+    def test_format_text_stream_skips_llm_for_clean_chunks(self):
+        from django.test import override_settings
+        from home.models import OperationRecord
+        from book2tts.page_cleaner import PAGE_SEPARATOR
+        from .views import text_views
+
+        user = User.objects.create_user(username='cleaner', password='pw')
+        llm = MagicMock()
+        texts = PAGE_SEPARATOR.join(self.PAGES)
+        with patch('book2tts.llm_service.get_shared_llm_service', return_value=llm), \
+                patch.object(text_views, 'deduct_llm_points'), \
+                patch.object(text_views.time, 'sleep'), \
+                override_settings(REFORMAT_STRIP_NOISE=True, REFORMAT_SKIP_LLM=True):
+            events = ''.join(text_views.format_text_stream(user, texts))
+
+        llm.process_text.assert_not_called()
+        self.assertIn('event: complete', events)
+        self.assertNotIn('THE GREAT BOOK', events)
+        record = OperationRecord.objects.get(user=user)
+        self.assertEqual(record.metadata['llm_skipped_chunks'], record.metadata['chunks_processed'])
+        self.assertEqual(record.metadata['noise_stripped']['page_numbers'], 4)
+
+
+class EpubTextExtractionTestCase(SimpleTestCase):
+    """EPUB 正文抽取测试：lxml 后端与 BeautifulSoup 实现输出一致，且每个文档只解析一次"""
+
+    CHAPTER = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>t</title></head><body>'
+        '<h1 id="c1">Chapter&nbsp;One</h1>'
+        '<p>First <em>para</em> &amp; more<br/>next line <a href="#n1">[1]</a>tail</p>'
+        '<h2><a id="s1"/>Section A</h2>'
+        '<p>Body of section A.</p><div><ul><li>one</li><li>two</li></ul></div>'
+        '<h2><span id="s2">Section B</span></h2>'
+        '<p>Body of section B.</p>'
+        '</body></html>'
+    )
+
+    def _book(self):
+        from book2tts.ebook import EpubResource
+
+        item = MagicMock(spec=EpubResource)
+        item.zip_path = 'ch1.xhtml'
+        item.media_type = 'application/xhtml+xml'
+        item.get_content.return_value = self.CHAPTER.encode('utf-8')
+        book = MagicMock(spec=['get_item_with_href', 'extract_text_by_href'])
+        book.get_item_with_href.return_value = item
+        return book, item
+
+    def test_lxml_backend_matches_bs4(self):
+        from book2tts.ebook import get_content_with_href
+
+        book, _ = self._book()
+        requests = [('ch1.xhtml', None), ('ch1.xhtml#c1', 's1'), ('ch1.xhtml#s1', 's2'),
+                    ('ch1.xhtml#s2', None), ('ch1.xhtml#missing', None)]
+        for href, end_fragment in requests:
+            expected = get_content_with_href(book, href, end_fragment, backend='bs4')
+            self.assertEqual(get_content_with_href(book, href, end_fragment, backend='lxml'), expected, href)
+
+        self.assertEqual(
+            get_content_with_href(book, 'ch1.xhtml#s1', 's2', backend='lxml'),
+            'Section A\n\nBody of section A.\n\none\n\ntwo',
+        )
+        self.assertIn('Chapter\xa0One', get_content_with_href(book, 'ch1.xhtml', backend='lxml'))
+
+    def test_adapter_parses_each_document_once(self):
+        from collections import OrderedDict
+        from book2tts import ebook
+        from book2tts.epub_text import ParsedDocument
+
+        _, item = self._book()
+        adapter = ebook.PyMuPdfEpubAdapter.__new__(ebook.PyMuPdfEpubAdapter)
+        adapter._parsed_documents = OrderedDict()
+        adapter.get_item_with_href = MagicMock(return_value=item)
+        with patch.object(ebook, 'ParsedDocument', wraps=ParsedDocument) as parsed:
+            texts = [
+                ebook.get_content_with_href(adapter, href, end, backend='lxml')
+                for href, end in (('ch1.xhtml#c1', 's1'), ('ch1.xhtml#s1', 's2'), ('ch1.xhtml#s2', None))
+            ]
+        self.assertEqual(parsed.call_count, 1)
+        self.assertEqual(texts[2], 'Section B\n\nBody of section B.')
+
+
+class EpubAdapterLazyLoadingTestCase(SimpleTestCase):
+    """EPUB 句柄延迟加载测试：读取资源不解析清单、不打开排版文档"""
+
+    def _write_epub(self, path):
+        from ebooklib import epub
+
+        book = epub.EpubBook()
+        book.set_identifier('lazy')
+        book.set_title('Lazy Book')
+        book.set_language('en')
+        chapter = epub.EpubHtml(title='One', file_name='text/ch1.xhtml', lang='en')
+        chapter.content = '<html><body><h1>One</h1><p>Chapter text.</p></body></html>'
+        style = epub.EpubItem(uid='style', file_name='styles/main.css', media_type='text/css', content=b'p{}')
+        book.add_item(chapter)
+        book.add_item(style)
+        book.toc = [epub.Link('text/ch1.xhtml', 'One', 'one')]
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = [chapter]
+        epub.write_epub(path, book)
+
+    def test_asset_access_skips_package_and_layout(self):
+        from book2tts.ebook import PyMuPdfEpubAdapter
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'book.epub')
+            self._write_epub(path)
+            with patch('book2tts.ebook.fitz.open', side_effect=AssertionError('layout opened')):
+                book = PyMuPdfEpubAdapter(path)
+                asset = book.get_asset('/EPUB/styles/main.css')
+                self.assertEqual(asset.get_content(), b'p{}')
+                self.assertEqual(asset.media_type, 'text/css')
+                self.assertFalse(book._package_loaded)
+
+                self.assertEqual(book.title, 'Lazy Book')
+                self.assertTrue(book._package_loaded)
+                item = book.get_item_with_href('text/ch1.xhtml#top')
+                self.assertEqual(item.get_name(), 'EPUB/text/ch1.xhtml')
+                self.assertIs(book.get_item_with_href('EPUB_text_ch1.xhtml'), item)
+                self.assertIs(book.get_asset('EPUB/text/ch1.xhtml'), item)
+                self.assertTrue(book.toc)
+                self.assertIsNone(book._doc)
+                book.close()
+
+
+class EpubChapterExtractionTestCase(SimpleTestCase):
+    """整本 EPUB 章节抽取测试：章节按目录顺序首尾相接，跨文档和同文档锚点都正确切分"""
+
+    def _write_epub(self, path):
+        from ebooklib import epub
+
+        book = epub.EpubBook()
+        book.set_identifier('chapters')
+        book.set_title('Chapters')
+        book.set_language('en')
+        ch1 = epub.EpubHtml(title='One', file_name='ch1.xhtml', lang='en')
+        ch1.content = (
+            '<html><body><h1 id="one">One</h1><p>Intro.</p>'
+            '<h2 id="one-a">One A</h2><p>Text A.</p></body></html>'
+        )
+        ch2 = epub.EpubHtml(title='Two', file_name='ch2.xhtml', lang='en')
+        ch2.content = '<html><body><p>Tail of one A.</p><h1 id="two">Two</h1><p>Text two.</p></body></html>'
+        ch3 = epub.EpubHtml(title='Three', file_name='ch3.xhtml', lang='en')
+        ch3.content = '<html><body><h1>Three</h1><p>Text three.</p></body></html>'
+        for chapter in (ch1, ch2, ch3):
+            book.add_item(chapter)
+        book.toc = [
+            (epub.Section('One', 'ch1.xhtml#one'), [epub.Link('ch1.xhtml#one-a', 'One A', 'one-a')]),
+            epub.Link('ch2.xhtml#two', 'Two', 'two'),
+            epub.Link('ch3.xhtml', 'Three', 'three'),
+        ]
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = [ch1, ch2, ch3]
+        epub.write_epub(path, book)
+
+    def test_chapters_follow_toc_with_offsets(self):
+        from book2tts.epub_chapters import (
+            CHAPTER_SEPARATOR,
+            EpubChapterExtractor,
+            extract_book_chapters,
+            extract_document_texts,
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'book.epub')
+            self._write_epub(path)
+            extractor = EpubChapterExtractor(max_workers=0)
+            chapters = extract_book_chapters(path, extractor=extractor)
+
+            self.assertEqual([c.title for c in chapters], ['One', 'One A', 'Two', 'Three'])
+            self.assertEqual([c.level for c in chapters], [0, 1, 0, 0])
+            self.assertEqual(chapters[0].text, 'One\n\nIntro.')
+            self.assertEqual(chapters[1].text, 'One A\n\nText A.\n\nTail of one A.')
+            self.assertEqual(chapters[2].text, 'Two\n\nText two.')
+            self.assertEqual(chapters[3].text, 'Three\n\nText three.')
+
+            full_text = CHAPTER_SEPARATOR.join(c.text for c in chapters)
+            for chapter in chapters:
+                self.assertEqual(full_text[chapter.start:chapter.end], chapter.text)
+
+            selected = extract_book_chapters(path, indices=[2, 1], extractor=extractor)
+            self.assertEqual([c.index for c in selected], [2, 1])
+            self.assertEqual(selected[1].start, len(selected[0].text) + len(CHAPTER_SEPARATOR))
+
+            texts = extract_document_texts(path, ['EPUB/ch2.xhtml#two', 'EPUB/ch3.xhtml'], extractor=extractor)
+            self.assertEqual(texts, ['Two\n\nText two.', 'Three\n\nText three.'])
+
+    def test_daemon_process_extracts_in_process(self):
+        from book2tts.epub_chapters import EpubChapterExtractor
+
+        extractor = EpubChapterExtractor(max_workers=4)
+        self.assertTrue(extractor.uses_processes)
+        with patch('multiprocessing.current_process') as current:
+            current.return_value.daemon = True
+            self.assertFalse(extractor.uses_processes)
+        self.assertFalse(EpubChapterExtractor(max_workers=0).uses_processes)
+
+
+class EpubAssetCachingTestCase(TestCase):
+    """EPUB 资源接口测试：内容 ETag、304、带版本号地址长期缓存、流式读取和图片缩小"""
+
+    def _write_epub(self, path):
+        from ebooklib import epub
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, format='PNG')
+        book = epub.EpubBook()
+        book.set_identifier('assets')
+        book.set_title('Assets')
+        book.set_language('en')
+        chapter = epub.EpubHtml(title='One', file_name='ch1.xhtml', lang='en')
+        chapter.content = '<html><body><h1>One</h1><img src="images/big.png"/></body></html>'
+        image = epub.EpubItem(uid='big', file_name='images/big.png', media_type='image/png', content=buffer.getvalue())
+        book.add_item(chapter)
+        book.add_item(image)
+        book.toc = [epub.Link('ch1.xhtml', 'One', 'one')]
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = [chapter]
+        epub.write_epub(path, book)
+        return buffer.getvalue()
+
+    def test_asset_caching_headers_and_scaling(self):
+        from bs4 import BeautifulSoup
+        from django.test import override_settings
+        from PIL import Image
+
+        user = User.objects.create_user(username='reader', password='pw')
+        self.client.force_login(user)
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, PAGE_IMAGE_CACHE_DIR=os.path.join(media_root, 'images'),
+                                  EPUB_IMAGE_MAX_WIDTH=700):
+            original = self._write_epub(os.path.join(media_root, 'book.epub'))
+            book = Books.objects.create(
+                user=user, name='book', file_type='.epub', file='book.epub', md5_hash='c' * 32
+            )
+
+            html = self.client.post(
+                reverse('get_original_content', args=[book.id]),
+                data=json.dumps({'content_ids': ['EPUB/ch1.xhtml']}),
+                content_type='application/json',
+            ).json()['html']
+            asset_url = BeautifulSoup(html, 'html.parser').find('img')['src']
+            self.assertIn('&v=', asset_url)
+            self.assertIn('&w=700', asset_url)
+
+            url = reverse('get_epub_asset', args=[book.id])
+            plain = self.client.get(url, {'href': 'EPUB/images/big.png'})
+            self.assertEqual(plain.status_code, 200)
+            self.assertEqual(plain['Cache-Control'], 'private, no-cache')
+            self.assertEqual(int(plain['Content-Length']), len(original))
+            self.assertEqual(b''.join(plain.streaming_content), original)
+            self.assertIn('Last-Modified', plain)
+
+            with patch('book2tts.ebook.EpubResource.get_content', side_effect=AssertionError('content read')):
+                not_modified = self.client.get(
+                    url, {'href': 'EPUB/images/big.png'}, HTTP_IF_NONE_MATCH=plain['ETag']
+                )
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], plain['ETag'])
+
+            scaled = self.client.get(asset_url)
+            self.assertIn('immutable', scaled['Cache-Control'])
+            self.assertNotEqual(scaled['ETag'], plain['ETag'])
+            with Image.open(io.BytesIO(b''.join(scaled.streaming_content))) as image:
+                self.assertEqual(image.size, (720, 360))
+
+            self.assertEqual(self.client.get(url, {'href': 'EPUB/images/missing.png'}).status_code, 404)
+
+
+class AudiobookJobTestCase(TestCase):
+    """整本书有声书任务测试：按目录拆分、章节并行合成、封装章节标记与字幕合并、失败后续跑"""
+
+    def test_ffmetadata_and_merged_subtitles(self):
+        from book2tts.audiobook import build_ffmetadata, chapter_markers, merge_srt
+
+        markers = chapter_markers([('第一章', 2.5), ('A=B;C', 1.25)])
+        self.assertEqual([(m.start, m.end) for m in markers], [(0.0, 2.5), (2.5, 3.75)])
+        metadata = build_ffmetadata(markers, title='书')
+        self.assertTrue(metadata.startswith(';FFMETADATA1'))
+        self.assertIn('START=2500\nEND=3750\ntitle=A\\=B\\;C', metadata)
+
+        srt = merge_srt(
+            ['1\n00:00:00,000 --> 00:00:01,000\n一\n', '1\n00:00:00,500 --> 00:00:01,000\n二\n'],
+            [0.0, 2.5],
+        )
+        self.assertIn('2\n00:00:03,000 --> 00:00:03,500\n二', srt)
+
+    def test_job_fans_out_chapters_assembles_and_resumes(self):
+        import subprocess
+        import pymupdf
+        from django.test import override_settings
+        from home.models import PointsConfig
+        from book2tts import audiobook
+        from . import tasks
+        from django.core.cache import cache
+        from .models import AudiobookJob, UserTask
+
+        PointsConfig.objects.update_or_create(
+            operation_type='audio_generation', defaults={'points_per_unit': 1, 'is_active': True}
+        )
+        # 积分配置会被缓存，避免影响其他测试
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user(username='listener', password='pw')
+        quota, _ = UserQuota.objects.get_or_create(user=user)
+        quota.points = 1000
+        quota.save()
+
+        failing = {'第二章'}
+        synthesized = []
+
+        class FakeTTS:
+            def __init__(self, voice_name, rate):
+                pass
+
+            async def synthesize_with_subtitles_v2(self, text, output_file, subtitle_file, words_in_cue):
+                if any(text.startswith(title) for title in failing):
+                    raise RuntimeError('network error')
+                synthesized.append(text.split('\n')[0])
+                with open(output_file, 'wb') as f:
+                    f.write(b'mp3')
+                with open(subtitle_file, 'w', encoding='utf-8') as f:
+                    f.write('WEBVTT\n\n00:00:00.000 --> 00:00:01.000\n' + text[:3] + '\n')
+                return {'audio_generated': True}
+
+        commands = []
+
+        def fake_ffmpeg(command, **kwargs):
+            with open(command[command.index('-i') + 3], encoding='utf-8') as f:
+                commands.append((command, f.read()))
+            with open(command[-1], 'wb') as f:
+                f.write(b'm4b')
+            return subprocess.CompletedProcess(command, 0, '', '')
+
+        def eager_chord(header):
+            return lambda body: ([sig.apply() for sig in header.tasks], body.apply())
+
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, BOOK_INDEX_DIR=os.path.join(media_root, 'index')):
+            doc = pymupdf.open()
+            for text in ('前言', '第一章 正文一', '第一节 正文二', '第二章 正文三'):
+                doc.new_page().insert_text((72, 72), text, fontname='china-s')
+            doc.set_toc([[1, '第一章', 2], [2, '第一节', 3], [1, '第二章', 4]])
+            doc.save(os.path.join(media_root, 'book.pdf'))
+            doc.close()
+            book = Books.objects.create(
+                user=user, name='book', file_type='.pdf', file='book.pdf', md5_hash='f' * 32
+            )
+
+            self.client.force_login(user)
+            with patch('workbench.views.audiobook_views.schedule_audiobook_job') as schedule:
+                response = self.client.post(
+                    reverse('start_audiobook_job', args=[book.id]),
+                    {'voice_name': 'zh-CN-XiaoxiaoNeural'},
+                ).json()
+            job = AudiobookJob.objects.get(pk=response['job_id'])
+            schedule.assert_called_once_with(job, response['task_id'])
+
+            with patch.object(tasks, 'EdgeTTS', FakeTTS), \
+                    patch.object(tasks, 'get_audio_duration', return_value=2.0), \
+                    patch.object(audiobook.subprocess, 'run', side_effect=fake_ffmpeg), \
+                    patch('celery.chord', eager_chord):
+                tasks.audiobook_job_task.apply(kwargs={'job_id': job.id})
+
+                job.refresh_from_db()
+                self.assertEqual(job.status, 'failure')
+                self.assertEqual(
+                    list(job.job_chapters.values_list('title', 'status')),
+                    [('第一章', 'success'), ('第二章', 'failure')],
+                )
+                # 前言并入第一章，第一节并入所属章节
+                first = job.job_chapters.get(index=0)
+                self.assertIn('前言', first.text)
+                self.assertIn('正文二', first.text)
+                self.assertEqual(commands, [])
+
+                failing.clear()
+                resumed = self.client.post(reverse('resume_audiobook_job', args=[job.id])).json()
+                self.assertEqual(resumed['remaining_chapters'], 1)
+                job.refresh_from_db()
+                tasks.audiobook_job_task.apply(kwargs={'job_id': job.id})
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'success')
+            self.assertEqual(len(synthesized), 2)
+            self.assertEqual(job.chapters[1], {'title': '第二章', 'start_seconds': 2.0, 'end_seconds': 4.0})
+            self.assertEqual(job.audio_duration, 4.0)
+            command, metadata = commands[0]
+            self.assertIn('-map_chapters', command)
+            self.assertTrue(command[-1].endswith('.m4b'))
+            self.assertIn('START=2000\nEND=4000\ntitle=第二章', metadata)
+            with job.subtitle_file.open('rb') as f:
+                self.assertIn('00:00:02,000 --> 00:00:03,000', f.read().decode('utf-8'))
+
+            quota.refresh_from_db()
+            self.assertEqual(quota.points, 996)
+            self.assertEqual(UserTask.objects.get(task_id=job.task_id).status, 'success')
+
+            status = self.client.get(reverse('audiobook_job_status', args=[job.id])).json()
+            self.assertEqual(status['completed_chapters'], 2)
+            self.assertTrue(status['audio_url'].endswith('.m4b'))
+
+    def test_parallel_chapters_cannot_overdraw_points(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+        from home.models import PointsConfig
+        from home.utils import PointsManager
+        from book2tts.audio_utils import estimate_audio_duration_from_text
+        from . import tasks
+        from .models import AudiobookChapter, AudiobookJob
+
+        PointsConfig.objects.update_or_create(
+            operation_type='audio_generation', defaults={'points_per_unit': 1, 'is_active': True}
+        )
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user(username='thrifty', password='pw')
+        book = Books.objects.create(user=user, name='book', file_type='.pdf', file='book.pdf', md5_hash='e' * 32)
+        job = AudiobookJob.objects.create(user=user, book=book, title='book', voice_name='v')
+        text = '正文 ' * 200
+        chapters = [
+            AudiobookChapter.objects.create(job=job, index=index, title=f'第{index + 1}章', text=text)
+            for index in range(3)
+        ]
+        estimated = PointsManager.get_audio_generation_points(estimate_audio_duration_from_text(text))
+        actual = PointsManager.get_audio_generation_points(1.0)
+        self.assertGreater(estimated, actual)
+        # 余额只够一个章节的预估积分
+        quota, _ = UserQuota.objects.get_or_create(user=user)
+        quota.points = estimated
+        quota.save()
+
+        nested = []
+
+        class FakeTTS:
+            def __init__(self, voice_name, rate):
+                # 第一个章节合成期间其他章节也在运行（模拟并行的 worker）
+                if not nested:
+                    nested.append(None)
+                    nested[0] = tasks.synthesize_audiobook_chapter_task.apply(args=[chapters[1].id]).get()
+
+            async def synthesize_with_subtitles_v2(self, text, output_file, subtitle_file, words_in_cue):
+                with open(output_file, 'wb') as f:
+                    f.write(b'mp3')
+                return {'audio_generated': True}
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch.object(tasks, 'EdgeTTS', FakeTTS), \
+                patch.object(tasks, 'get_audio_duration', return_value=1.0):
+            first = tasks.synthesize_audiobook_chapter_task.apply(args=[chapters[0].id]).get()
+
+            self.assertEqual(first['status'], 'success')
+            self.assertEqual(nested[0]['status'], 'failure')
+            for chapter in chapters:
+                chapter.refresh_from_db()
+            self.assertEqual(chapters[0].points_consumed, actual)
+            self.assertEqual(chapters[1].status, 'failure')
+            self.assertIn('积分不足', chapters[1].error_message)
+            self.assertEqual(chapters[1].points_consumed, 0)
+            self.assertFalse(chapters[1].audio_file)
+            # 按实际时长结算后退还多预扣的积分
+            quota.refresh_from_db()
+            self.assertEqual(quota.points, estimated - actual)
+
+            # 合成失败时退还预扣的积分
+            with patch.object(FakeTTS, 'synthesize_with_subtitles_v2', side_effect=RuntimeError('network error')):
+                quota.points = estimated
+                quota.save()
+                failed = tasks.synthesize_audiobook_chapter_task.apply(args=[chapters[2].id]).get()
+            self.assertEqual(failed['status'], 'failure')
+            quota.refresh_from_db()
+            self.assertEqual(quota.points, estimated)
+
+
+class AudioListingTestCase(TestCase):
+    """统一音频列表测试：SQL 排序与分页、keyset 游标、只加载当前页、按书籍聚合"""
+
+    def _create_library(self, media_root):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import DialogueScript
+
+        os.makedirs(os.path.join(media_root, 'audio'))
+        for name in ('a.mp3', 'd.mp3'):
+            with open(os.path.join(media_root, 'audio', name), 'wb') as f:
+                f.write(b'x' * 10)
+
+        user = User.objects.create_user(username='library', email='library@example.com', password='pw')
+        books = [
+            Books.objects.create(user=user, name=f'book{i}', file_type='.pdf', file=f'b{i}.pdf', md5_hash=str(i) * 32)
+            for i in range(2)
+        ]
+        base = timezone.now()
+        for i in range(7):
+            segment = AudioSegment.objects.create(
+                user=user, book=books[i % 2], title=f'segment {i}', text=f'text {i}',
+                book_page=str(i), file='audio/a.mp3', published=i != 3,
+            )
+            # 两条记录共享时间戳，检验同一时间下的稳定顺序
+            stamp = base - timedelta(minutes=i // 2)
+            AudioSegment.objects.filter(pk=segment.pk).update(created_at=stamp, updated_at=stamp)
+        for i in range(3):
+            script = DialogueScript.objects.create(
+                user=user, book=books[0] if i else None, title=f'dialogue {i}', original_text=f'dialogue text {i}',
+                script_data={'segments': [{'speaker': 'A'}]}, audio_file='audio/d.mp3', published=True,
+            )
+            DialogueScript.objects.filter(pk=script.pk).update(created_at=base - timedelta(minutes=i), updated_at=base)
+        return user, books
+
+    def test_listing_orders_and_pages_in_sql(self):
+        from django.core.paginator import Paginator
+        from django.test import override_settings
+        from .views.audio_views import get_unified_audio_content
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            user, books = self._create_library(media_root)
+
+            for sort_by_publish_time in (False, True):
+                listing = get_unified_audio_content(user=user, published_only=False, sort_by_publish_time=sort_by_publish_time)
+                field = 'updated_at' if sort_by_publish_time else 'created_at'
+                items = list(listing)
+                self.assertEqual(len(items), 10)
+                self.assertEqual(listing.count(), 10)
+                keys = [(item[field], item['type'] == 'dialogue_script', item['id']) for item in items]
+                self.assertEqual(keys, sorted(keys, reverse=True))
+
+                paged = []
+                for number in Paginator(listing, 3).page_range:
+                    paged.extend(Paginator(listing, 3).page(number).object_list)
+                self.assertEqual([(i['type'], i['id']) for i in paged], [(i['type'], i['id']) for i in items])
+
+                cursor, walked = None, []
+                while True:
+                    page, cursor = listing.page_after(cursor, limit=4)
+                    walked.extend(page)
+                    if cursor is None:
+                        break
+                self.assertEqual([(i['type'], i['id']) for i in walked], [(i['type'], i['id']) for i in items])
+
+            # 无关联书籍的对话脚本归入虚拟书籍；公开列表中跳过
+            listing = get_unified_audio_content(user=user, published_only=False)
+            unlinked = [item for item in listing if item['type'] == 'dialogue_script' and item['title'] == 'dialogue 0']
+            self.assertEqual(unlinked[0]['book'].file_type, '.virtual')
+            public = get_unified_audio_content(published_only=True, sort_by_publish_time=True)
+            self.assertEqual(public.count(), 8)
+            self.assertNotIn('dialogue 0', [item['title'] for item in public])
+
+            # 每页查询数与列表长度无关：排序键 UNION 一次，两类记录各加载一次
+            with self.assertNumQueries(3):
+                page = listing[2:5]
+            self.assertEqual(len(page), 3)
+
+            searched = get_unified_audio_content(user=user, published_only=False, search_query='dialogue text 2')
+            self.assertEqual([item['title'] for item in searched], ['dialogue 2'])
+
+    def test_aggregated_view_and_book_details(self):
+        from django.test import override_settings
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            user, books = self._create_library(media_root)
+            self.client.force_login(user)
+
+            response = self.client.get(reverse('aggregated_audio_segments'))
+            self.assertEqual(response.status_code, 200)
+            counts = {name: data['segment_count'] for name, data in response.context['books_with_ids'].items()}
+            self.assertEqual(counts, {'book0': 6, 'book1': 3, '📢 对话脚本集': 1})
+            segment = AudioSegment.objects.filter(book=books[1]).first()
+            self.assertEqual(response.context['audio_book_map'][segment.id], books[1].id)
+            self.assertContains(response, 'id="audio-book-map"')
+
+            details = self.client.get(reverse('book_details_htmx', args=[books[0].id]), {'page_size': 5, 'page': 2})
+            self.assertEqual(details.context['total_segments'], 6)
+            self.assertEqual(len(details.context['segments']), 1)
+
+            from django.db.models.fields.files import FieldFile
+            from unittest.mock import PropertyMock
+            from .models import UserProfile
+
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+            # 大小、时长和MIME类型读取写入时保存的字段，不访问存储
+            with patch.object(FieldFile, 'size', new_callable=PropertyMock, side_effect=AssertionError('storage stat')):
+                feed = self.client.get(reverse('token_audio_rss_feed', args=[profile.rss_token]))
+            self.assertEqual(feed.status_code, 200)
+            xml = feed.content.decode('utf-8')
+            self.assertEqual(xml.count('<item>'), 9)
+            self.assertIn('length="10" type="audio/mpeg"', xml)
+            self.assertEqual(self.client.get(reverse('explore'), {'q': 'segment'}).status_code, 200)
+
+
+class MediaMetadataTestCase(TestCase):
+    """媒体元数据字段测试：写入时计算、随字段更新、回填命令、读取路径不访问存储"""
+
+    def test_metadata_written_once_and_backfilled(self):
+        from django.core.files.base import ContentFile
+        from django.core.management import call_command
+        from django.test import override_settings
+        from .models import DialogueScript
+        from .utils.subtitle_utils import save_srt_subtitle
+
+        user = User.objects.create_user(username='media', password='pw')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            book = Books.objects.create(user=user, name='book', file_type='.pdf', file='b.pdf', md5_hash='m' * 32)
+            segment = AudioSegment(user=user, book=book, title='t', text='字' * 400, book_page='1', audio_duration=3.5)
+            # edge-tts 输出 MP3，文件扩展名为 .wav
+            segment.file.save('a.wav', ContentFile(b'ID3' + b'\0' * 97))
+            segment.refresh_from_db()
+            self.assertEqual((segment.file_size, segment.mime_type, segment.audio_duration), (100, 'audio/mpeg', 3.5))
+            self.assertEqual(segment.excerpt, '字' * 300 + '...')
+
+            save_srt_subtitle(segment, '1\n00:00:00,000 --> 00:00:01,000\n字\n', 'subtitle_file')
+            segment.chapters = [{'title': 'a'}, {'title': 'b'}]
+            segment.save(update_fields=['chapters'])
+            segment.refresh_from_db()
+            self.assertEqual(segment.chapter_count, 2)
+            self.assertGreater(segment.subtitle_size, 0)
+
+            script = DialogueScript.objects.create(
+                user=user, book=book, title='d', original_text='x',
+                script_data={'segments': [{'speaker': 'A'}, {'speaker': 'A'}]},
+            )
+            script.audio_file.save('d.wav', ContentFile(b'RIFF' + b'\0' * 4 + b'WAVE'))
+            script.refresh_from_db()
+            self.assertEqual((script.file_size, script.mime_type), (12, 'audio/wav'))
+            self.assertEqual(script.excerpt, '🎭 对话脚本 (2段) - A')
+
+            # 模拟迁移前写入的行
+            AudioSegment.objects.filter(pk=segment.pk).update(
+                file_size=0, mime_type='', excerpt='', chapter_count=0, subtitle_size=0, audio_duration=None
+            )
+            updated_at = AudioSegment.objects.get(pk=segment.pk).updated_at
+            out = io.StringIO()
+            with patch('workbench.management.commands.backfill_media_metadata.get_audio_duration', return_value=7):
+                call_command('backfill_media_metadata', stdout=out)
+            self.assertIn('AudioSegment: updated 1 rows', out.getvalue())
+            segment = AudioSegment.objects.get(pk=segment.pk)
+            self.assertEqual(
+                (segment.file_size, segment.mime_type, segment.chapter_count, segment.audio_duration),
+                (100, 'audio/mpeg', 2, 7),
+            )
+            self.assertGreater(segment.subtitle_size, 0)
+            self.assertEqual(segment.updated_at, updated_at)
+
+    def test_feed_duration_uses_saved_columns(self):
+        from home.utils.rss_utils import feed_audio_duration
+
+        self.assertEqual(feed_audio_duration(3725.4, 0), (3725, '1:02:05'))
+        self.assertEqual(feed_audio_duration(None, 16 * 1024 * 60), (60, '1:00'))
+        self.assertEqual(feed_audio_duration(None, 0), (300, '5:00'))
+
+
+class AudioSearchTestCase(TestCase):
+    """音频全文搜索测试：FTS5 二元组分词、相关度排序与高亮、信号同步索引、icontains 后端与重建命令"""
+
+    def _create_segment(self, user, book, title, text, published=True):
+        return AudioSegment.objects.create(
+            user=user, book=book, title=title, text=text, book_page='1',
+            file='audio/a.mp3', published=published,
+        )
+
+    def _create_library(self):
+        user = User.objects.create_user(username='searcher', email='searcher@example.com', password='pw')
+        book = Books.objects.create(user=user, name='科技读本', file_type='.pdf', file='s.pdf', md5_hash='s' * 32)
+        segments = {
+            'title_hit': self._create_segment(user, book, '人工智能简史', '从图灵测试讲起'),
+            'body_hit': self._create_segment(user, book, '第二章', '这一章讨论人工智能的伦理问题，Hello world'),
+            'draft': self._create_segment(user, book, '人工智能草稿', '未发布', published=False),
+            'other': self._create_segment(user, book, '烹饪', '红烧肉的做法'),
+        }
+        return user, book, segments
+
+    def _search(self, query, **kwargs):
+        from .views.audio_views import get_unified_audio_content
+
+        listing = get_unified_audio_content(search_query=query, order_by_relevance=True, **kwargs)
+        return [(item['type'], item['id']) for item in listing]
+
+    def _fts_rows(self):
+        from django.db import connection
+        from .utils.search import FTS_TABLE
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+            return cursor.fetchone()[0]
+
+    def test_tokenizer_splits_cjk_into_bigrams(self):
+        from .utils.search import build_match_query, tokenize_for_index
+
+        self.assertEqual(tokenize_for_index('你好世界, Hello-World 甲'), '你好 好世 世界 界 hello world 甲')
+        self.assertEqual(build_match_query('好世界 Hel'), '"好世 世界" "hel"*')
+        self.assertEqual(build_match_query('界'), '"界"*')
+        self.assertEqual(build_match_query('，。！'), '')
+
+    def test_explore_ranks_matches_and_highlights_snippets(self):
+        user, book, segments = self._create_library()
+
+        response = self.client.get(reverse('explore'), {'q': '人工智能'})
+        self.assertEqual(response.status_code, 200)
+        items = list(response.context['audio_segments'])
+        # 标题命中排在正文命中之前，未发布的不出现
+        self.assertEqual([item['id'] for item in items], [segments['title_hit'].id, segments['body_hit'].id])
+        self.assertIn('<mark>人工智能</mark>的伦理问题', items[1]['snippet'])
+        self.assertContains(response, '<mark>人工智能</mark>', html=False)
+
+        # 单字、英文前缀和书名都能命中
+        self.assertEqual(len(self._search('智')), 2)
+        self.assertEqual(self._search('hel'), [('audio_segment', segments['body_hit'].id)])
+        self.assertEqual(len(self._search('科技读本')), 3)
+        self.assertEqual(len(self._search('科技读本', user=user, published_only=False)), 4)
+        self.assertEqual(self._search('不存在的词'), [])
+
+        # 按相关度排序的 keyset 游标与页码分页结果一致
+        from .views.audio_views import get_unified_audio_content
+
+        listing = get_unified_audio_content(search_query='科技读本', order_by_relevance=True)
+        cursor, walked = None, []
+        while True:
+            page, cursor = listing.page_after(cursor, limit=1)
+            walked.extend((item['type'], item['id']) for item in page)
+            if cursor is None:
+                break
+        self.assertEqual(walked, self._search('科技读本'))
+
+    def test_index_follows_saves_and_deletes(self):
+        from .models import DialogueScript
+
+        user, book, segments = self._create_library()
+        self.assertEqual(self._fts_rows(), 4)
+
+        segments['body_hit'].published = False
+        segments['body_hit'].save()
+        self.assertEqual(self._search('人工智能'), [('audio_segment', segments['title_hit'].id)])
+
+        segments['title_hit'].delete()
+        self.assertEqual(self._fts_rows(), 3)
+        self.assertEqual(self._search('人工智能'), [])
+
+        book.name = '新书名'
+        book.save()
+        self.assertEqual(len(self._search('新书名')), 1)
+        self.assertEqual(self._search('科技读本'), [])
+
+        script = DialogueScript.objects.create(
+            user=user, book=book, title='访谈', original_text='关于量子计算的对话',
+            script_data={'segments': [{'speaker': 'A'}]}, published=True,
+        )
+        # 还没有音频的对话脚本不建索引
+        self.assertEqual(self._search('量子计算'), [])
+        script.audio_file = 'audio/d.mp3'
+        script.save()
+        self.assertEqual(self._search('量子计算'), [('dialogue_script', script.id)])
+
+    def test_basic_backend_and_rebuild_command(self):
+        from django.core.management import call_command
+        from django.db import connection
+        from .utils.search import FTS_TABLE, BasicSearchBackend, set_search_backend
+
+        user, book, segments = self._create_library()
+        expected = sorted(self._search('人工智能'))
+
+        set_search_backend(BasicSearchBackend())
+        self.addCleanup(set_search_backend, None)
+        self.assertEqual(sorted(self._search('人工智能')), expected)
+        set_search_backend(None)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        self.assertEqual(self._search('人工智能'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 audio items', out.getvalue())
+        self.assertEqual(sorted(self._search('人工智能')), expected)
+
+
+class BatchOCRTaskTestCase(TestCase):
+    """批量OCR后台任务测试"""
+
+    def test_batch_job_streams_pages_and_charges_new_ocr_only(self):
+        import uuid
+        import pymupdf
+        from django.test import override_settings
+        from book2tts.rasterize import PageRasterizer
+        from .models import UserTask
+        from .tasks import batch_ocr_task
+        from .utils import ocr_utils
+
+        from home.models import PointsConfig
+
+        PointsConfig.objects.update_or_create(
+            operation_type='ocr_processing', defaults={'points_per_unit': 7, 'is_active': True}
+        )
+        user = User.objects.create_user(username='ocruser', password='pw')
+        quota, _ = UserQuota.objects.get_or_create(user=user)
+        quota.points = 100
+        quota.save()
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            doc = pymupdf.open()
+            for i in range(3):
+                doc.new_page().insert_text((72, 72), f'page {i}')
+            doc.save(os.path.join(media_root, 'scan.pdf'))
+            doc.close()
+
+            book = Books.objects.create(
+                user=user, name='scan', file_type='.pdf', file='scan.pdf', md5_hash='d' * 32
+            )
+            ocr_utils.cache_page_ocr(book.md5_hash, 0, ocr_utils.page_render_key(), 'e' * 32)
+            ocr_utils.cache_ocr_result('e' * 32, 'cached page 0')
+
+            task_id = str(uuid.uuid4())
+            UserTask.objects.create(user=user, task_id=task_id, task_type='batch_ocr', book=book)
+            texts = iter(['page 1', 'page 2'])
+            with patch.object(ocr_utils, 'get_rasterizer', return_value=PageRasterizer(max_workers=0)), \
+                    patch.object(ocr_utils, 'get_ocr_credentials', return_value=('ak', 'sk')), \
+                    patch.object(ocr_utils, 'ocr_volc', side_effect=lambda *args: next(texts)), \
+                    patch.object(batch_ocr_task, 'update_state'):
+                result = batch_ocr_task.apply(
+                    kwargs={'user_id': user.id, 'book_id': book.id, 'page_nums': [0, 1, 2]},
+                    task_id=task_id,
+                ).get()
+
+            self.assertEqual(result['new_ocr_count'], 2)
+            self.assertEqual(result['cached_count'], 1)
+            quota.refresh_from_db()
+            self.assertEqual(result['points_consumed'], 14)
+            self.assertEqual(quota.points, 86)
+
+            self.client.force_login(user)
+            response = self.client.get(reverse('ocr_batch_results', args=[book.id, task_id]))
+            data = response.json()
+            self.assertEqual(data['task_status'], 'success')
+            self.assertEqual(
+                [r['text'] for r in data['results']], ['cached page 0', 'page 1', 'page 2']
+            )
+
+
+class DialogueChunkConversionTestCase(TestCase):
+    """文本转对话分段并发转换测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='dialogueuser', password='testpass123')
+        self.media_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _run(self, text, fail_on=None):
+        import asyncio
+        from book2tts.dialogue_service import DialogueService
+        from book2tts.llm_cache import LLMResultCache
+        from book2tts.llm_service import LLMService
+        from . import tasks
+
+        calls = []
+        state = {'running': 0, 'peak': 0}
+
+        async def fake_acompletion(model, messages, temperature):
+            content = messages[1]['content']
+            calls.append(content)
+            index = int(content.split()[0])
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            # 让靠前的分段更晚完成，验证结果按原顺序重组
+            await asyncio.sleep(0.01 * (5 - index % 5))
+            state['running'] -= 1
+            if fail_on is not None and index == fail_on:
+                raise RuntimeError('boom')
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = json.dumps(
+                {'segments': [{'speaker': '旁白', 'utterance': str(index), 'type': 'narration'}]}
+            )
+            response.usage = {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+            response.model = 'test-model'
+            return response
+
+        # 结果缓存立即过期，重试时跳过的分段只能来自分段缓存
+        with patch.dict(os.environ, {'VOLCENGINE_API_KEY': 'test-key'}):
+            llm_service = LLMService(cache=LLMResultCache(ttl_seconds=0))
+
+        with self.settings(MEDIA_ROOT=self.media_root, DIALOGUE_CHUNK_CONCURRENCY=3), \
+                patch.object(tasks, 'get_dialogue_service', return_value=(DialogueService, lambda: llm_service)), \
+                patch('book2tts.llm_service.acompletion', side_effect=fake_acompletion), \
+                patch.object(tasks, 'deduct_llm_points'), \
+                patch.object(tasks.convert_text_to_dialogue_task, 'update_state'):
+            result = tasks.convert_text_to_dialogue_task.apply(
+                args=(self.user.id, text, 'Test Dialogue')
+            )
+        return result, calls, state['peak']
+
+    def test_chunks_reassembled_in_order_and_resumed_from_cache(self):
+        from .models import DialogueScript
+
+        text = '\n\n'.join(f"{i} " + '字' * 900 for i in range(8))
+
+        failed, first_calls, peak = self._run(text, fail_on=5)
+        self.assertTrue(failed.failed())
+        self.assertTrue(any(call.startswith('5 ') for call in first_calls))
+        self.assertEqual(peak, 3)  # 分段并发受 DIALOGUE_CHUNK_CONCURRENCY 限制
+
+        succeeded, retry_calls, _ = self._run(text)
+        self.assertTrue(succeeded.successful())
+        self.assertLess(len(retry_calls), 8)  # 已完成的分段来自追加式缓存
+
+        script = DialogueScript.objects.get(id=succeeded.result['script_id'])
+        utterances = [segment['utterance'] for segment in script.script_data['segments']]
+        self.assertEqual(utterances, [str(i) for i in range(8)])
+
+
+class TextChunkerTestCase(SimpleTestCase):
+    """按 token/字节预算切分文本测试"""
+
+    def test_chunks_are_lossless_and_within_budget(self):
+        from book2tts.text_chunker import ChunkBudget, iter_chunks
+
+        text = '第一章\n\n' + '这是一句比较长的中文句子，用来测试切分。' * 200 + '\n\n' + 'An English sentence. ' * 300
+        for budget in (ChunkBudget(500, 'tokens'), ChunkBudget(2000, 'bytes'), ChunkBudget(300, 'chars')):
+            chunks = list(iter_chunks(text, budget))
+            self.assertEqual(''.join(chunks), text)
+            self.assertTrue(all(budget.measure(chunk) <= budget.limit for chunk in chunks))
+            # 非最后分段都在句末或段落处结束
+            for chunk in chunks[:-1]:
+                self.assertRegex(chunk.rstrip(), r'[。.章]$')
+
+    def test_token_budget_packs_latin_text_fuller_than_cjk(self):
+        from book2tts.text_chunker import ChunkBudget, split_text
+
+        budget = ChunkBudget(1000, 'tokens')
+        cjk_chunks = split_text('中文句子。' * 2000, budget)
+        latin_chunks = split_text('Latin words here. ' * 2000, budget)
+        self.assertLess(max(len(c) for c in cjk_chunks) * 3, max(len(c) for c in latin_chunks))
+
+    def test_prefers_paragraph_boundary_and_splits_oversized_sentence(self):
+        from book2tts.text_chunker import ChunkBudget, iter_chunks
+
+        text = '甲。' * 20 + '\n\n' + '乙。' * 10
+        self.assertEqual(list(iter_chunks(text, ChunkBudget(60, 'chars')))[0], '甲。' * 20 + '\n\n')
+
+        oversized = '长' * 250
+        chunks = list(iter_chunks(oversized, ChunkBudget(100, 'chars')))
+        self.assertEqual([len(c) for c in chunks], [100, 100, 50])
+
+    def test_oversized_sentence_before_paragraph_break_is_lossless(self):
+        from book2tts.text_chunker import budget_for, iter_chunks
+
+        budget = budget_for('reformat')
+        for sentence in ('这是一个很长的句子，' * 120 + '最后的半句没有标点', '这是一个很长的句子' * 120):
+            text = sentence + '\n\n下一段。'
+            chunks = list(iter_chunks(text, budget))
+            self.assertEqual(''.join(chunks), text)
+            self.assertTrue(all(budget.measure(chunk) <= budget.limit for chunk in chunks))
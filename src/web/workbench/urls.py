@@ -15,6 +15,7 @@ from .views import (
     update_pdf_type,
     detect_scanned_pdf,
     get_page_image,
+    page_image,
     check_page_audio_status,
     delete_book,
     get_original_content,
@@ -29,6 +30,7 @@ from .views.translation_views import (
     translation_cache_cleanup,
     translation_cache_stats_api,
     translation_cache_bulk_delete,
+    llm_cache_stats_api,
 )
 from .views.audio_views import (
     task_queue,
@@ -60,6 +62,12 @@ from .views.ocr_views import (
     detect_pdf_scanned,
     ocr_pdf_page,
     ocr_pdf_pages_batch,
+    ocr_batch_results,
+)
+from .views.audiobook_views import (
+    start_audiobook_job,
+    resume_audiobook_job,
+    audiobook_job_status,
 )
 
 urlpatterns = [
@@ -115,6 +123,7 @@ urlpatterns = [
     path("book/<int:book_id>/update-pdf-type/", update_pdf_type, name="update_pdf_type"),
     path("book/<int:book_id>/detect-scanned/", detect_scanned_pdf, name="detect_scanned_pdf"),
     path("book/<int:book_id>/page-image/<int:page_number>/", get_page_image, name="get_page_image"),
+    path("book/<int:book_id>/page-image/<int:page_number>/file/", page_image, name="page_image"),
     path("book/<int:book_id>/check-audio-status/", check_page_audio_status, name="check_page_audio_status"),
     path("book/<int:book_id>/delete/", delete_book, name="delete_book"),
     # 任务队列相关路由
@@ -149,6 +158,12 @@ urlpatterns = [
     # OCR功能路由
     path("book/<int:book_id>/ocr/page/", ocr_pdf_page, name="ocr_pdf_page"),
     path("book/<int:book_id>/ocr/batch/", ocr_pdf_pages_batch, name="ocr_pdf_pages_batch"),
+    path("book/<int:book_id>/ocr/batch/<str:task_id>/", ocr_batch_results, name="ocr_batch_results"),
+
+    # 整本书有声书
+    path("book/<int:book_id>/audiobook/", start_audiobook_job, name="start_audiobook_job"),
+    path("audiobook/<int:job_id>/", audiobook_job_status, name="audiobook_job_status"),
+    path("audiobook/<int:job_id>/resume/", resume_audiobook_job, name="resume_audiobook_job"),
 
     # 翻译缓存管理路由 (工作台管理员)
     path("translation-cache/", translation_cache_list, name="translation_cache_list"),
@@ -157,4 +172,5 @@ urlpatterns = [
     path("translation-cache/cleanup/", translation_cache_cleanup, name="translation_cache_cleanup"),
     path("translation-cache/stats/", translation_cache_stats_api, name="translation_cache_stats"),
     path("translation-cache/bulk-delete/", translation_cache_bulk_delete, name="translation_cache_bulk_delete"),
+    path("llm-cache/stats/", llm_cache_stats_api, name="llm_cache_stats"),
 ]
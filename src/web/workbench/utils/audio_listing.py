@@ -0,0 +1,292 @@
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from django.db.models import F, IntegerField, Min, Q, Value
+
+from ..models import AudioSegment, DialogueScript
+from .search import KIND_AUDIO_SEGMENT, KIND_DIALOGUE_SCRIPT, get_search_backend, highlight_snippet
+
+# UNION 中按 KIND_* 区分两类音频，同一时间戳下按 (kind, id) 倒序保证顺序稳定
+KIND_NAMES = {
+    KIND_AUDIO_SEGMENT: 'audio_segment',
+    KIND_DIALOGUE_SCRIPT: 'dialogue_script',
+}
+
+# 迭代整个列表（RSS）时每批加载的行数
+ITER_BATCH_SIZE = 200
+
+# 按时间排序时为 (时间, kind, id)，按相关度排序时为 (相关度得分, kind, id)
+SortKey = Tuple[Union[datetime, float], int, int]
+
+
+def encode_cursor(key: SortKey) -> str:
+    """把排序键编码为 URL 安全的游标"""
+    sort_at, kind, item_id = key
+    sort_value = sort_at.isoformat() if isinstance(sort_at, datetime) else repr(float(sort_at))
+    raw = f"{sort_value}|{kind}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, ranked: bool = False) -> Optional[SortKey]:
+    """解析游标，格式错误时返回 None（从第一页开始）；ranked 表示按相关度排序的游标"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        sort_at, kind, item_id = raw.split('|')
+        sort_value = float(sort_at) if ranked else datetime.fromisoformat(sort_at)
+        return sort_value, int(kind), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_or_create_dialogue_virtual_book(user):
+    """获取或创建对话脚本虚拟书籍"""
+    from ..models import Books
+
+    virtual_book, created = Books.objects.get_or_create(
+        user=user,
+        name="📢 对话脚本集",
+        defaults={
+            'file_type': '.virtual',
+            'file': None,  # 虚拟书籍无文件
+        }
+    )
+    return virtual_book
+
+
+def segment_item(segment) -> Dict:
+    """AudioSegment 的统一列表格式"""
+    return {
+        'id': segment.id,
+        'type': 'audio_segment',
+        'title': segment.title,
+        'text': segment.text,
+        'book_page': segment.book_page,
+        'file_url': segment.file.url if segment.file else None,
+        'file_size': segment.file_size,
+        'mime_type': segment.mime_type,
+        'audio_duration': segment.audio_duration,
+        'excerpt': segment.excerpt,
+        'chapter_count': segment.chapter_count,
+        'published': segment.published,
+        'created_at': segment.created_at,
+        'updated_at': segment.updated_at,
+        'book': segment.book,
+        'user': segment.user,
+        # 为了兼容性添加的字段
+        'file': segment.file,
+        'subtitle_file': segment.subtitle_file,
+        'chapters': segment.chapters or [],
+        'chapters_file': segment.chapters_file,
+        'chapters_html': segment.chapters_html,
+    }
+
+
+def script_item(script, book) -> Dict:
+    """DialogueScript 的统一列表格式，book 为归属书籍（无关联书籍时为虚拟书籍）"""
+    return {
+        'id': script.id,
+        'type': 'dialogue_script',
+        'title': script.title,
+        'text': script.media_excerpt_source(),
+        'original_text': script.original_text,
+        'book_page': f"对话音频 ({len(script.speakers)}个角色)",
+        'file_url': script.audio_file.url if script.audio_file else None,
+        'file_size': script.file_size,
+        'mime_type': script.mime_type,
+        'excerpt': script.excerpt,
+        'chapter_count': script.chapter_count,
+        'published': script.published,
+        'created_at': script.created_at,
+        'updated_at': script.updated_at,
+        'book': book,
+        'user': script.user,
+        # 对话脚本特有字段
+        'audio_duration': script.audio_duration,
+        'speakers': script.speakers,
+        'segment_count': script.segment_count,
+        # 为了兼容性添加的字段
+        'file': script.audio_file,
+        'subtitle_file': script.subtitle_file,
+        'chapters': script.chapters or [],
+        'chapters_file': script.chapters_file,
+        'chapters_html': script.chapters_html,
+    }
+
+
+class AudioListing:
+    """
+    统一音频列表（AudioSegment + DialogueScript）的数据库层查询。
+
+    过滤、排序和分页都在 SQL 中完成：先对两张表的排序键做 UNION ALL 取出当前页，
+    再只为这一页的行加载模型对象。可直接交给 Paginator（按页码分页），
+    也可通过 page_after() 按游标做 keyset 分页，迭代时按批次 keyset 读取。
+
+    搜索通过 utils.search 的搜索后端完成（SQLite 上为 FTS5 全文索引），
+    order_by_relevance=True 且后端支持时按相关度排序，每项附带高亮摘要 snippet。
+    """
+
+    def __init__(self, user=None, book=None, published_only=True, search_query=None, sort_by_publish_time=False,
+                 order_by_relevance=False):
+        self.user = user
+        self.book = book
+        self.published_only = published_only
+        self.search_query = search_query
+        # 按更新时间排序（公开页面和RSS使用），否则按创建时间排序（成品页使用）
+        self.order_field = 'updated_at' if sort_by_publish_time else 'created_at'
+
+        segment_filter = Q()
+        script_filter = Q(audio_file__isnull=False)
+        if user:
+            segment_filter &= Q(user=user)
+            script_filter &= Q(user=user)
+        else:
+            # 不指定用户时没有虚拟书籍可归属，跳过无关联书籍的对话脚本
+            script_filter &= Q(book__isnull=False)
+        if book:
+            segment_filter &= Q(book=book)
+            script_filter &= Q(book=book)
+        if published_only:
+            segment_filter &= Q(published=True)
+            script_filter &= Q(published=True)
+        search_backend = get_search_backend()
+        if search_query:
+            segment_filter &= search_backend.filter_q(KIND_AUDIO_SEGMENT, search_query)
+            script_filter &= search_backend.filter_q(KIND_DIALOGUE_SCRIPT, search_query)
+        self.search_backend = search_backend if search_query and order_by_relevance and search_backend.ranked else None
+
+        self.segments = AudioSegment.objects.filter(segment_filter)
+        self.scripts = DialogueScript.objects.filter(script_filter)
+        self._count = None
+        self._virtual_book = None
+
+    # -- 排序键查询 --
+
+    def _keys_queryset(self, queryset, kind: int, after: Optional[SortKey]):
+        if after is not None:
+            sort_at, after_kind, after_id = after
+            # (sort_at, kind, id) 倒序排列，取严格小于游标的行
+            newer = Q(**{f'{self.order_field}__lt': sort_at})
+            if kind < after_kind:
+                newer |= Q(**{self.order_field: sort_at})
+            elif kind == after_kind:
+                newer |= Q(**{self.order_field: sort_at, 'id__lt': after_id})
+            queryset = queryset.filter(newer)
+        return (
+            queryset.order_by()
+            .annotate(sort_at=F(self.order_field), kind=Value(kind, output_field=IntegerField()))
+            .values_list('sort_at', 'kind', 'id')
+        )
+
+    def _page_keys(self, offset: int, limit: int, after: Optional[SortKey] = None) -> List[SortKey]:
+        if self.search_backend is not None:
+            return self.search_backend.ranked_keys(
+                self.search_query,
+                user_id=self.user.id if self.user else None,
+                book_id=self.book.id if self.book else None,
+                published_only=self.published_only,
+                after=after,
+                offset=offset,
+                limit=limit,
+            )
+        union = self._keys_queryset(self.segments, KIND_AUDIO_SEGMENT, after).union(
+            self._keys_queryset(self.scripts, KIND_DIALOGUE_SCRIPT, after), all=True
+        )
+        return list(union.order_by('-sort_at', '-kind', '-id')[offset:offset + limit])
+
+    # -- 加载当前页 --
+
+    def _dialogue_book(self, script):
+        if script.book_id:
+            return script.book
+        if self.user and not self.book:
+            if self._virtual_book is None:
+                self._virtual_book = get_or_create_dialogue_virtual_book(self.user)
+            return self._virtual_book
+        return None
+
+    def _materialize(self, keys: Sequence[SortKey]) -> List[Dict]:
+        segment_ids = [item_id for _, kind, item_id in keys if kind == KIND_AUDIO_SEGMENT]
+        script_ids = [item_id for _, kind, item_id in keys if kind == KIND_DIALOGUE_SCRIPT]
+        segments = AudioSegment.objects.select_related('book', 'user').in_bulk(segment_ids) if segment_ids else {}
+        scripts = DialogueScript.objects.select_related('book', 'user').in_bulk(script_ids) if script_ids else {}
+
+        items = []
+        for _, kind, item_id in keys:
+            if kind == KIND_AUDIO_SEGMENT:
+                segment = segments.get(item_id)
+                if segment is not None:
+                    items.append(segment_item(segment))
+            else:
+                script = scripts.get(item_id)
+                if script is not None:
+                    items.append(script_item(script, self._dialogue_book(script)))
+        if self.search_query:
+            for item in items:
+                item['snippet'] = highlight_snippet(item.get('original_text') or item['text'], self.search_query)
+        return items
+
+    # -- 公共接口 --
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = self.segments.count() + self.scripts.count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        return self.segments.exists() or self.scripts.exists()
+
+    def __getitem__(self, key):
+        """按偏移切片（供 Paginator 使用），只加载切片内的行"""
+        if isinstance(key, int):
+            items = self[key:key + 1]
+            if not items:
+                raise IndexError(key)
+            return items[0]
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else self.count()
+        if key.step not in (None, 1) or start < 0 or stop < 0:
+            raise ValueError("AudioListing 只支持非负、步长为1的切片")
+        if stop <= start:
+            return []
+        return self._materialize(self._page_keys(start, stop - start))
+
+    def page_after(self, cursor: Optional[str] = None, limit: int = 20) -> Tuple[List[Dict], Optional[str]]:
+        """
+        keyset 分页：返回游标之后的一页和下一页游标（没有更多时为 None）。
+        耗时与列表总长度和翻页深度无关。
+        """
+        keys = self._page_keys(0, limit + 1, decode_cursor(cursor, ranked=self.search_backend is not None))
+        next_cursor = encode_cursor(keys[limit - 1]) if len(keys) > limit else None
+        return self._materialize(keys[:limit]), next_cursor
+
+    def __iter__(self):
+        after = None
+        while True:
+            keys = self._page_keys(0, ITER_BATCH_SIZE, after)
+            yield from self._materialize(keys)
+            if len(keys) < ITER_BATCH_SIZE:
+                return
+            after = keys[-1]
+
+    def book_first_created(self) -> Dict[int, datetime]:
+        """每本书第一个音频的创建时间 {book_id: created_at}，无关联书籍的对话脚本计入虚拟书籍"""
+        earliest: Dict[int, datetime] = {}
+        for queryset in (self.segments, self.scripts):
+            rows = queryset.order_by().values('book_id').annotate(first_created=Min('created_at'))
+            for row in rows:
+                book_id = row['book_id']
+                if book_id is None:
+                    if not (self.user and not self.book):
+                        continue
+                    if self._virtual_book is None:
+                        self._virtual_book = get_or_create_dialogue_virtual_book(self.user)
+                    book_id = self._virtual_book.id
+                if book_id not in earliest or row['first_created'] < earliest[book_id]:
+                    earliest[book_id] = row['first_created']
+        return earliest
@@ -0,0 +1,117 @@
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+from django.db import transaction
+
+from book2tts.audio_utils import estimate_audio_duration_from_text
+from book2tts.epub_chapters import extract_book_chapters
+from book2tts.page_cleaner import clean_pages
+from book2tts.pdf import extract_text_by_page_range, get_pdf_toc, pdf_page_count
+
+from .book_index import get_book_index
+
+
+logger = logging.getLogger(__name__)
+
+# 没有目录的PDF按固定页数拆分章节
+PAGES_PER_CHAPTER = 20
+
+
+def _merge_deeper_levels(entries: Sequence[Tuple[str, int, str]], toc_level: int) -> List[Dict[str, str]]:
+    """层级深于 toc_level 的目录条目并入前一个章节，返回非空章节 [{'title', 'text'}]"""
+    chapters: List[Dict[str, str]] = []
+    for title, level, text in entries:
+        if level > toc_level and chapters:
+            if text.strip():
+                chapters[-1]['text'] = "\n\n".join(part for part in (chapters[-1]['text'], text) if part)
+            continue
+        chapters.append({'title': title, 'text': text})
+    return [chapter for chapter in chapters if chapter['text'].strip()]
+
+
+def _pdf_page_texts(book, book_index, start: int, end: int) -> List[str]:
+    """[start, end) 范围内各页文本，有索引时直接读取索引"""
+    if book_index is not None:
+        return [book_index.page_text(i) for i in range(max(start, 0), min(end, len(book_index)))]
+    return extract_text_by_page_range(book.file.path, start, end)
+
+
+def _pdf_range_text(book, book_index, start: int, end: int) -> str:
+    # 朗读前去掉页眉页脚、页码和断行
+    cleaned, _ = clean_pages(_pdf_page_texts(book, book_index, start, end))
+    return "\n\n".join(text for text in cleaned if text.strip())
+
+
+def _pdf_chapters(book, toc_level: int) -> List[Dict[str, str]]:
+    book_index = get_book_index(book)
+    page_count = len(book_index) if book_index is not None else pdf_page_count(book.file.path)
+
+    # PDF 目录层级从1开始，页码从1开始
+    entries = sorted(
+        (
+            (max(page, 1) - 1, level - 1, title)
+            for level, title, page, *_ in get_pdf_toc(book.file.path)
+            if level - 1 <= toc_level and page <= page_count
+        ),
+        key=lambda entry: entry[0],
+    )
+    if not entries:
+        return [
+            {
+                'title': f"第{start + 1}-{min(start + PAGES_PER_CHAPTER, page_count)}页",
+                'text': _pdf_range_text(book, book_index, start, start + PAGES_PER_CHAPTER),
+            }
+            for start in range(0, page_count, PAGES_PER_CHAPTER)
+        ]
+
+    chapters = []
+    for i, (start, level, title) in enumerate(entries):
+        # 第一个目录条目之前的页面（封面、前言等）并入第一章
+        start = 0 if i == 0 else start
+        end = entries[i + 1][0] if i + 1 < len(entries) else page_count
+        chapters.append((title, level, _pdf_range_text(book, book_index, start, end) if end > start else ""))
+    return _merge_deeper_levels(chapters, toc_level)
+
+
+def _epub_chapters(book, toc_level: int) -> List[Dict[str, str]]:
+    chapters = extract_book_chapters(book.file.path)
+    return _merge_deeper_levels(
+        [(chapter.title, chapter.level, chapter.text) for chapter in chapters], toc_level
+    )
+
+
+def split_book_chapters(book, toc_level: int = 0) -> List[Dict[str, str]]:
+    """
+    按目录拆分整本书的章节文本
+
+    Args:
+        book: Books 实例（PDF 或 EPUB）
+        toc_level: 按该层级及以上的目录条目拆分（从0开始），更深的条目并入所属章节
+
+    Returns:
+        [{'title': 标题, 'text': 文本}, ...]，按书中顺序，不含空章节（如扫描页）
+    """
+    if book.file_type == '.pdf':
+        return _pdf_chapters(book, toc_level)
+    if book.file_type == '.epub':
+        return _epub_chapters(book, toc_level)
+    raise ValueError(f"不支持为 {book.file_type} 文件生成有声书")
+
+
+def estimate_chapters_duration(texts) -> float:
+    """按文本估算合成后的总时长（秒）"""
+    return sum(estimate_audio_duration_from_text(text) for text in texts)
+
+
+def schedule_audiobook_job(job, task_id: str) -> None:
+    """在事务提交后排队运行有声书任务（首次运行或失败后续跑）"""
+
+    def _start_task():
+        from ..tasks import audiobook_job_task
+
+        try:
+            audiobook_job_task.apply_async(kwargs={'job_id': job.id}, task_id=task_id)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Failed to queue audiobook job %s: %s", job.id, e)
+
+    transaction.on_commit(_start_task)
@@ -0,0 +1,105 @@
+import logging
+import os
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from book2tts.book_index import (
+    BookIndex,
+    BookIndexError,
+    extract_pdf_pages,
+    open_book_index,
+    write_book_index,
+)
+from book2tts.ebook import ebook_pages, lease_ebook
+from book2tts.epub_chapters import extract_document_texts
+from .book_structure import extract_book_structure
+
+
+logger = logging.getLogger(__name__)
+
+# 缺少索引时自动排队生成，同一本书在该时间内只排队一次
+INDEX_BUILD_DEDUP_SECONDS = 3600
+
+
+def book_index_path(book) -> str:
+    """书籍索引文件路径，按文件内容的MD5命名，内容相同的书籍共用一份索引"""
+    name = book.md5_hash or f"book-{book.id}"
+    return os.path.join(settings.BOOK_INDEX_DIR, f"{name}.idx")
+
+
+def get_book_index(book, schedule_missing: bool = True) -> Optional[BookIndex]:
+    """
+    读取书籍索引，尚未生成或已损坏时返回 None，调用方回退到直接解析文件。
+
+    schedule_missing 为 True 时为缺少索引的书籍（如引入索引前上传的书籍）排队生成一次，
+    之后的请求即可直接读取索引。
+    """
+    if book.file_type not in (".pdf", ".epub"):
+        return None
+    path = book_index_path(book)
+    try:
+        book_index = open_book_index(path)
+    except (BookIndexError, OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable book index for book %s: %s", book.id, e)
+        book_index = None
+    if book_index is not None:
+        return book_index
+    if schedule_missing and cache.add(f"book_index_build:{path}", True, INDEX_BUILD_DEDUP_SECONDS):
+        schedule_book_index(book)
+    return None
+
+
+def detect_book_scanned(book, sample_pages: int = 5) -> dict:
+    """检测PDF是否为扫描版：优先读取索引中的逐页扫描标志，没有索引时打开PDF检测"""
+    from book2tts.pdf import detect_scanned_pages, detect_scanned_pdf
+
+    book_index = get_book_index(book)
+    if book_index is not None:
+        return detect_scanned_pages(len(book_index), book_index.is_scanned, sample_pages)
+    return detect_scanned_pdf(book.file.path, sample_pages)
+
+
+def build_book_index(book) -> int:
+    """
+    解析书籍并生成索引：各页规范化文本、带页面范围的目录树、每页是否为扫描页
+
+    Returns:
+        索引中的页数
+    """
+    tocs, pages = extract_book_structure(book)
+    if book.file_type == ".pdf":
+        texts, flags = extract_pdf_pages(book.file.path)
+    elif book.file_type == ".epub":
+        with lease_ebook(book.file.path) as ebook:
+            page_hrefs = [page["href"] for page in ebook_pages(ebook)]
+        # 各文档在进程池中并行抽取；Celery 工作进程内无法创建子进程时在当前进程内完成
+        texts = extract_document_texts(book.file.path, page_hrefs)
+        flags = None
+    else:
+        raise ValueError(f"不支持为 {book.file_type} 文件生成索引")
+
+    return write_book_index(
+        book_index_path(book),
+        texts,
+        flags,
+        meta={"file_type": book.file_type, "toc": tocs, "pages": pages},
+    )
+
+
+def schedule_book_index(book) -> None:
+    """在事务提交后排队生成书籍索引，失败时不影响上传流程"""
+    if book.file_type not in (".pdf", ".epub"):
+        return
+
+    def _start_task():
+        from ..tasks import build_book_index_task
+
+        try:
+            build_book_index_task.delay(book.id)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Failed to queue book index build for book %s: %s", book.id, e)
+
+    transaction.on_commit(_start_task)
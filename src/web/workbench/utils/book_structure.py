@@ -0,0 +1,319 @@
+from ebooklib import epub
+
+from book2tts.ebook import ebook_pages, lease_ebook
+from book2tts.pdf import lease_pdf
+
+
+def traverse_toc_with_level(items, toc, level=0):
+    """
+    遍历目录结构并保留层级信息
+    基于原始 ebook_toc 的 traverse_toc 函数，添加层级支持
+    参数:
+        items: epub的目录项或其他目录结构
+        toc: 目标列表，用于存储处理后的目录项
+        level: 当前层级，从0开始
+    """
+    for item in items:
+        if isinstance(item, tuple):
+            section, children = item
+            href = section.href or ""
+            base_href, fragment = (href.split("#", 1) + [None])[:2]
+            toc.append({
+                "title": section.title,
+                "href": href,
+                "base_href": base_href,
+                "fragment": fragment,
+                "level": level,
+                "has_children": bool(children)
+            })
+            # 递归处理子目录，层级加1
+            traverse_toc_with_level(children, toc, level + 1)
+        elif isinstance(item, epub.Link):
+            href = item.href or ""
+            base_href, fragment = (href.split("#", 1) + [None])[:2]
+            toc.append({
+                "title": item.title,
+                "href": href,
+                "base_href": base_href,
+                "fragment": fragment,
+                "level": level,
+                "has_children": False
+            })
+    return
+
+
+
+def ebook_toc_with_level(book):
+    """
+    获取epub书籍的目录结构，保留层级信息
+    基于原始 ebook_toc 函数，添加层级支持
+    """
+    tocs = []
+    traverse_toc_with_level(book.toc, tocs)
+
+    result = []
+
+    for t in tocs:
+        href = (t.get("href") or "").strip()
+        base_href = (t.get("base_href") or "").strip()
+
+        if not base_href:
+            base_href = href.split("#", 1)[0] if href else ""
+
+        fragment = t.get("fragment")
+        if fragment is None:
+            parts = href.split("#", 1)
+            fragment = parts[1] if len(parts) > 1 else None
+
+        normalized_href = base_href or href
+        if fragment:
+            normalized_href = f"{base_href}#{fragment}" if base_href else f"#{fragment}"
+
+        t["base_href"] = base_href
+        t["fragment"] = fragment
+        t["href"] = normalized_href or href
+
+        result.append(t)
+    return result
+
+
+def build_epub_fragment_successors(toc_entries):
+    """按 base_href 排序 fragment，返回每个条目的后续 fragment 信息"""
+    successors = {}
+    grouped = {}
+
+    for entry in toc_entries:
+        href = entry.get("href")
+        base_href = entry.get("base_href") or (href.split("#", 1)[0] if href else "")
+        grouped.setdefault(base_href, []).append(entry)
+
+    for entries in grouped.values():
+        # entries 已按原有 TOC 顺序排列
+        total = len(entries)
+        for idx, entry in enumerate(entries):
+            current_href = entry.get("href")
+            if not current_href:
+                continue
+
+            next_fragment = None
+            next_href = None
+            if idx + 1 < total:
+                next_entry = entries[idx + 1]
+                next_href = next_entry.get("href")
+                next_fragment = next_entry.get("fragment")
+
+            successors[current_href] = {
+                "next_fragment": next_fragment,
+                "next_href": next_href,
+            }
+
+    return successors
+
+
+def annotate_toc_children(flat_tocs):
+    """根据层级信息标记目录项是否包含子节点"""
+    if not flat_tocs:
+        return flat_tocs
+
+    total = len(flat_tocs)
+
+    for index, entry in enumerate(flat_tocs):
+        level = entry.get("level", 0) or 0
+
+        # 如果已有 has_children 设置，沿用并仅在未知时计算
+        has_children = entry.get("has_children")
+        if has_children is None:
+            has_children = False
+
+        if not has_children:
+            # 查找后续第一个层级 <= 当前层级的项，判断是否存在子节点
+            for next_index in range(index + 1, total):
+                next_level = flat_tocs[next_index].get("level", 0) or 0
+                if next_level <= level:
+                    break
+                has_children = True
+                break
+
+        entry["has_children"] = has_children
+
+    return flat_tocs
+
+
+def calculate_toc_page_ranges(toc_list, total_pages):
+    """
+    计算TOC条目的页面范围
+    参数:
+        toc_list: 原始TOC列表，格式为 [[level, title, start_page], ...]
+        total_pages: PDF总页数
+    返回:
+        处理后的TOC列表，每个条目包含 [level, title, start_page, end_page]
+    """
+    if not toc_list:
+        return []
+
+    toc_with_ranges = []
+
+    for i, toc in enumerate(toc_list):
+        level, title, start_page = toc[0], toc[1], toc[2]
+
+        # 找到结束页：查找下一个同级别或更高级别的条目
+        end_page = total_pages  # 默认到文档末尾
+
+        for j in range(i + 1, len(toc_list)):
+            next_toc = toc_list[j]
+            next_level = next_toc[0]
+            next_start_page = next_toc[2]
+
+            # 如果找到同级别或更高级别的条目，结束页为其起始页减1
+            if next_level <= level:
+                end_page = next_start_page - 1
+                break
+
+        # 确保结束页不小于起始页
+        end_page = max(start_page, end_page)
+
+        toc_with_ranges.append([level, title, start_page, end_page])
+
+    return toc_with_ranges
+
+
+def calculate_epub_toc_page_ranges(toc_list, all_pages, fragment_successors=None):
+    """
+    计算EPUB TOC条目的页面范围
+    参数:
+        toc_list: TOC列表，格式为 [{"title": str, "href": str, "level": int}, ...]
+        all_pages: 所有页面列表，格式为 [{"title": str, "href": str}, ...]
+        fragment_successors: 片段边界映射，用于确定锚点范围
+    返回:
+        处理后的TOC列表，每个条目包含页面范围信息
+    """
+    if not toc_list or not all_pages:
+        return []
+
+    fragment_successors = fragment_successors or {}
+    
+    # 创建页面href到索引的映射，支持锚点和基础href
+    page_href_to_index = {}
+    for idx, page in enumerate(all_pages):
+        page_href = page.get("href", "")
+        base = page_href.split("#")[0]
+        if page_href not in page_href_to_index:
+            page_href_to_index[page_href] = idx
+        if base not in page_href_to_index:
+            page_href_to_index[base] = idx
+    
+    toc_with_ranges = []
+    
+    for i, toc in enumerate(toc_list):
+        title = toc["title"]
+        href = toc.get("href", "")
+        base_href = toc.get("base_href") or href.split("#")[0]
+        level = toc["level"]
+
+        # 找到当前TOC条目对应的页面索引
+        start_page_index = page_href_to_index.get(base_href)
+        if start_page_index is None:
+            # 如果找不到对应页面，跳过这个TOC条目
+            continue
+        
+        # 找到结束页面索引：查找下一个同级别或更高级别的条目
+        end_page_index = len(all_pages) - 1  # 默认到文档末尾
+        
+        for j in range(i + 1, len(toc_list)):
+            next_toc = toc_list[j]
+            next_level = next_toc["level"]
+            next_href = next_toc.get("base_href") or next_toc.get("href", "").split("#")[0]
+
+            # 如果找到同级别或更高级别的条目
+            if next_level <= level:
+                next_page_index = page_href_to_index.get(next_href)
+                if next_page_index is not None:
+                    end_page_index = next_page_index - 1
+                    break
+        
+        # 确保结束页面索引不小于起始页面索引
+        end_page_index = max(start_page_index, end_page_index)
+        
+        # 获取页面范围内的所有页面href
+        page_hrefs = [all_pages[idx]["href"] for idx in range(start_page_index, end_page_index + 1)]
+        
+        next_fragment_info = fragment_successors.get(href, {})
+
+        toc_with_ranges.append({
+            "title": title,
+            "href": href,
+            "page_refs": ",".join(page_hrefs),  # 使用逗号分隔的多个页面href
+            "base_href": base_href,
+            "start_page_index": start_page_index,
+            "end_page_index": end_page_index,
+            "level": level,
+            "page_count": len(page_hrefs),
+            "has_children": toc.get("has_children"),
+            "fragment": toc.get("fragment"),
+            "next_fragment": next_fragment_info.get("next_fragment"),
+            "next_href": next_fragment_info.get("next_href"),
+        })
+
+    return toc_with_ranges
+
+
+def _pdf_toc_entries(pbook):
+    """PDF目录（含页面范围），层级从0开始"""
+    toc_list = pbook.get_toc()
+    total_pages = len(pbook)
+    toc_with_ranges = calculate_toc_page_ranges(toc_list, total_pages)
+
+    tocs = [
+        {
+            "title": f"{toc[1]}",
+            "href": f"{toc[2]}-{toc[3]}",
+            "start_page": toc[2],
+            "end_page": toc[3],
+            "level": toc[0] - 1 if toc[0] > 0 else 0  # PDF层级从1开始，转换为从0开始
+        } for toc in toc_with_ranges
+    ]
+    annotate_toc_children(tocs)
+    return tocs
+
+
+def _epub_toc_entries(ebook, all_pages):
+    """EPUB目录（含页面范围和锚点信息）"""
+    toc_list = ebook_toc_with_level(ebook)
+    fragment_successors = build_epub_fragment_successors(toc_list)
+    toc_with_ranges = calculate_epub_toc_page_ranges(toc_list, all_pages, fragment_successors)
+
+    tocs = [
+        {
+            "title": toc.get("title"),
+            "href": toc.get("href"),  # 保留原始href用于展示和定位
+            "page_refs": toc.get("page_refs"),
+            "base_href": toc.get("base_href"),
+            "level": toc.get("level", 0),
+            "start_page_index": toc.get("start_page_index"),
+            "end_page_index": toc.get("end_page_index"),
+            "page_count": toc.get("page_count", 1),
+            "has_children": toc.get("has_children"),
+            "fragment": toc.get("fragment"),
+            "next_fragment": toc.get("next_fragment"),
+            "next_href": toc.get("next_href"),
+        }
+        for toc in toc_with_ranges
+    ]
+    annotate_toc_children(tocs)
+    return tocs
+
+
+def extract_book_structure(book):
+    """解析书籍文件，返回 (目录列表, 页面列表)"""
+    if book.file_type == ".pdf":
+        with lease_pdf(book.file.path) as pbook:
+            pages = [
+                {"title": f"第{page.number+1}页", "href": page.number}
+                for page in pbook.pages()
+            ]
+            return _pdf_toc_entries(pbook), pages
+    elif book.file_type == ".epub":
+        with lease_ebook(book.file.path) as ebook:
+            all_pages = ebook_pages(ebook)
+            return _epub_toc_entries(ebook, all_pages), all_pages
+    return [], []
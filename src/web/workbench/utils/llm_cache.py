@@ -0,0 +1,123 @@
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from book2tts.llm_cache import LLMResultCache, estimate_result_size
+from ..models import LLMResultCacheEntry
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class DatabaseLLMResultCache(LLMResultCache):
+    """
+    基于数据库的 LLM 结果缓存，所有 Web / Celery 进程共享，重试或重新提交落到其他进程时同样命中。
+
+    TTL、条目数与总字节数上限的语义与进程内缓存一致（按最后使用时间淘汰）。
+    命中次数、条目数和字节数是全局统计；未命中、过期与淘汰次数只统计当前进程。
+    """
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = timezone.now()
+        entry = LLMResultCacheEntry.objects.filter(key_hash=_hash_key(key)).first()
+        if entry is None:
+            self._count(misses=1)
+            return None
+        if entry.expires_at <= now:
+            entry.delete()
+            self._count(misses=1, expirations=1)
+            return None
+
+        LLMResultCacheEntry.objects.filter(pk=entry.pk).update(
+            hit_count=F("hit_count") + 1, last_used_at=now
+        )
+        self._count(hits=1)
+        return entry.result
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        size = estimate_result_size(value)
+        if size > self.max_bytes:
+            return
+        now = timezone.now()
+        try:
+            LLMResultCacheEntry.objects.update_or_create(
+                key_hash=_hash_key(key),
+                defaults={
+                    "operation": key.split("|", 1)[0][:50],
+                    "result": value,
+                    "size": size,
+                    "hit_count": 0,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                    "last_used_at": now,
+                },
+            )
+            self._evict(now)
+        except Exception as e:
+            # 写缓存失败不影响本次调用结果
+            logger.warning("Failed to store LLM result cache entry: %s", e)
+
+    def invalidate(self, key: str) -> bool:
+        deleted, _ = LLMResultCacheEntry.objects.filter(key_hash=_hash_key(key)).delete()
+        return deleted > 0
+
+    def clear(self) -> None:
+        LLMResultCacheEntry.objects.all().delete()
+
+    def stats(self) -> Dict[str, Any]:
+        totals = LLMResultCacheEntry.objects.aggregate(
+            entries=Count("id"), bytes=Sum("size"), hits=Sum("hit_count")
+        )
+        with self._lock:
+            lookups = self._hits + self._misses
+            process = {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+        return {
+            "scope": "shared",
+            "hits": totals["hits"] or 0,
+            "entries": totals["entries"],
+            "bytes": totals["bytes"] or 0,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "process": process,
+        }
+
+    def _count(self, hits: int = 0, misses: int = 0, expirations: int = 0, evictions: int = 0) -> None:
+        with self._lock:
+            self._hits += hits
+            self._misses += misses
+            self._expirations += expirations
+            self._evictions += evictions
+
+    def _evict(self, now) -> None:
+        """删除过期条目，再按最后使用时间淘汰超出条目数或总字节数上限的条目"""
+        expired, _ = LLMResultCacheEntry.objects.filter(expires_at__lte=now).delete()
+        totals = LLMResultCacheEntry.objects.aggregate(entries=Count("id"), bytes=Sum("size"))
+        excess_entries = totals["entries"] - self.max_entries
+        excess_bytes = (totals["bytes"] or 0) - self.max_bytes
+        if excess_entries <= 0 and excess_bytes <= 0:
+            self._count(expirations=expired)
+            return
+
+        doomed = []
+        for pk, size in LLMResultCacheEntry.objects.order_by("last_used_at", "id").values_list("id", "size").iterator():
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+            doomed.append(pk)
+            excess_entries -= 1
+            excess_bytes -= size
+        evicted, _ = LLMResultCacheEntry.objects.filter(pk__in=doomed).delete()
+        self._count(expirations=expired, evictions=evicted)
@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from book2tts.pdf import lease_pdf
+from home.models import UserQuota
+from home.utils import PointsManager
+from ..models import OCRPrefetch
+from .ocr_utils import get_cached_pages_ocr, page_render_key
+
+
+logger = logging.getLogger(__name__)
+
+# 预取任务的 Celery 优先级（Redis 中数字越大优先级越低），不抢占用户主动发起的任务
+OCR_PREFETCH_PRIORITY = 9
+
+# 排队超过该时长仍未完成的预取记录视为失效（如 worker 重启），允许重新预取
+OCR_PREFETCH_STALE_AFTER = timedelta(minutes=10)
+
+
+def prefetch_page_count() -> int:
+    """每次预取的后续页数，由 OCR_PREFETCH_PAGES 配置，0 表示关闭"""
+    return max(0, int(getattr(settings, 'OCR_PREFETCH_PAGES', 0) or 0))
+
+
+def schedule_ocr_prefetch(user, book, page_num: int) -> List[int]:
+    """
+    用户读取第 page_num 页后，在后台预取其后的若干页
+
+    已有页面缓存或已在预取中的页面会被跳过；用户积分不足以支付这些页面时不预取。
+    预取本身不扣除积分，结果被读取时再由 consume_prefetched_page 计费。
+
+    Returns:
+        实际加入队列的页码
+    """
+    count = prefetch_page_count()
+    if count <= 0 or book.file_type != '.pdf':
+        return []
+
+    try:
+        with lease_pdf(book.file.path) as doc:
+            total_pages = len(doc)
+        candidates = list(range(page_num + 1, min(page_num + 1 + count, total_pages)))
+        if not candidates:
+            return []
+
+        cached = get_cached_pages_ocr(book.md5_hash, candidates, page_render_key())
+        candidates = [page for page in candidates if page not in cached]
+        if not candidates:
+            return []
+
+        quota = UserQuota.objects.filter(user=user).first()
+        if quota is None or not quota.can_consume_points(PointsManager.get_ocr_processing_points(len(candidates))):
+            return []
+
+        OCRPrefetch.objects.filter(
+            user=user, book=book, image_md5='',
+            created_at__lt=timezone.now() - OCR_PREFETCH_STALE_AFTER,
+        ).delete()
+
+        queued = []
+        for page in candidates:
+            try:
+                _, created = OCRPrefetch.objects.get_or_create(user=user, book=book, page_index=page)
+            except IntegrityError:
+                # 并发请求已为该页创建了记录
+                created = False
+            if created:
+                queued.append(page)
+        if not queued:
+            return []
+
+        from ..tasks import prefetch_ocr_pages_task
+
+        prefetch_ocr_pages_task.apply_async(
+            kwargs={'user_id': user.id, 'book_id': book.id, 'page_nums': queued},
+            priority=OCR_PREFETCH_PRIORITY,
+        )
+        return queued
+
+    except Exception as e:
+        # 预取失败不影响当前页面的读取
+        logger.warning("Failed to schedule OCR prefetch for book %s page %s: %s", book.id, page_num, e)
+        return []
+
+
+def consume_prefetched_page(user, book, page_num: int) -> bool:
+    """
+    用户读取某页后调用，该页有本用户已完成的预取记录时返回 True
+
+    调用方在结果来自缓存且返回 True 时按新识别计费。记录随即删除，同一页不会重复计费；
+    仍在队列中的预取记录（image_md5 为空）同样删除但不计费，该页的缓存结果并非由本次预取产生，
+    预取任务完成后发现记录已不存在，不会再次登记。
+    """
+    records = OCRPrefetch.objects.filter(user=user, book=book, page_index=page_num)
+    completed, _ = records.exclude(image_md5='').delete()
+    records.delete()
+    return completed > 0
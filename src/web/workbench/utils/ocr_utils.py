@@ -1,35 +1,37 @@
 import hashlib
-import tempfile
-import time
-import threading
-from typing import Optional, Dict, Any
+import os
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Sequence, Tuple
 from django.conf import settings
-from book2tts.ocr import ocr_volc
-from ..models import OCRCache
+from book2tts.ocr import get_ocr_image_profile, image_to_base64, ocr_volc
+from book2tts.pdf import get_page_image_data
+from book2tts.rasterize import RenderSettings, get_rasterizer
+from ..models import OCRCache, OCRPageCache
 
 
-# 全局QPS控制器
-class OCRRateLimiter:
-    def __init__(self):
-        self.last_request_time = 0
-        self.lock = threading.Lock()
-        self.min_interval = 1.0  # 最小请求间隔1秒
-    
-    def wait_if_needed(self):
-        """如果需要，等待以遵守QPS限制"""
-        with self.lock:
-            current_time = time.time()
-            time_since_last = current_time - self.last_request_time
-            
-            if time_since_last < self.min_interval:
-                wait_time = self.min_interval - time_since_last
-                time.sleep(wait_time)
-            
-            self.last_request_time = time.time()
+# 引入OCR图片配置之前使用的渲染参数（彩色 PNG, 150 DPI）。
+# 这些页面的识别结果仍然可用，查找页面缓存时作为后备，避免重复扣费
+LEGACY_PAGE_RENDER_KEYS = ('png@150',)
+
+
+def get_ocr_engine() -> str:
+    """多页OCR使用的识别引擎：volc（火山引擎OCR，逐页请求）或 llm（视觉模型，多页打包为一个请求）"""
+    return getattr(settings, 'OCR_ENGINE', 'volc')
+
+
+def ocr_service_configured() -> bool:
+    """多页OCR所用引擎的凭据是否已配置"""
+    if get_ocr_engine() == 'llm':
+        provider = os.environ.get('OCR_PROVIDER', 'volcengine')
+        return bool(os.environ.get(f'{provider.upper()}_API_KEY'))
+    ak, sk = get_ocr_credentials()
+    return bool(ak and sk)
 
 
-# 全局限流器实例
-_rate_limiter = OCRRateLimiter()
+def get_ocr_credentials() -> Tuple[Optional[str], Optional[str]]:
+    """获取火山引擎OCR密钥 (ak, sk)"""
+    ak = getattr(settings, 'VOLC_AK', None) or getattr(settings, 'VOLCENGINE_ACCESS_KEY', None)
+    sk = getattr(settings, 'VOLC_SK', None) or getattr(settings, 'VOLCENGINE_SECRET_KEY', None)
+    return ak, sk
 
 
 def calculate_image_md5(image_data: bytes) -> str:
@@ -39,13 +41,6 @@ def calculate_image_md5(image_data: bytes) -> str:
     return hash_md5.hexdigest()
 
 
-def save_temp_image(image_data: bytes, suffix: str = '.jpg') -> str:
-    """保存临时图片文件并返回文件路径"""
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
-        temp_file.write(image_data)
-        return temp_file.name
-
-
 def get_cached_ocr_result(image_md5: str) -> Optional[str]:
     """从缓存中获取OCR结果"""
     try:
@@ -92,25 +87,11 @@ def perform_ocr_with_cache(image_data: bytes, ak: str, sk: str, source_type: str
         }
     
     try:
-        # 缓存未命中，执行OCR识别
-        temp_image_path = save_temp_image(image_data)
-        
-        # QPS控制：等待必要的时间间隔
-        _rate_limiter.wait_if_needed()
-        
-        # 调用OCR API
-        ocr_text = ocr_volc(ak, sk, temp_image_path)
-        
-        # 清理临时文件
-        import os
-        try:
-            os.unlink(temp_image_path)
-        except:
-            pass
+        # 缓存未命中，直接上传内存中的图片（ocr_volc 内部经由共享令牌桶限流）
+        ocr_text = ocr_volc(ak, sk, image_data)
         
-        # 缓存结果
-        if ocr_text:
-            cache_ocr_result(image_md5, ocr_text, source_type)
+        # 缓存结果，空白页的空文本同样缓存，避免重复识别和计费
+        cache_ocr_result(image_md5, ocr_text or '', source_type)
         
         return {
             'text': ocr_text or '',
@@ -127,43 +108,259 @@ def perform_ocr_with_cache(image_data: bytes, ak: str, sk: str, source_type: str
         }
 
 
-def perform_batch_ocr_with_cache(image_data_list: list, ak: str, sk: str, source_type: str = 'page_image') -> list:
+def _image_data_url(image_data: bytes) -> str:
+    """图片字节转为 data URL，按文件头识别格式"""
+    if image_data[:2] == b'\xff\xd8':
+        mime = 'image/jpeg'
+    elif image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP':
+        mime = 'image/webp'
+    else:
+        mime = 'image/png'
+    return f"data:{mime};base64,{image_to_base64(image_data)}"
+
+
+def perform_llm_ocr_batch_with_cache(
+    images: Sequence[bytes],
+    source_type: str = 'page_image',
+    llm_service=None,
+) -> List[Dict[str, Any]]:
     """
-    批量执行OCR识别，自动遵守QPS限制
-    
+    使用 LLM 视觉模型批量OCR识别多张图片，带缓存
+
+    先按图片MD5查询OCR缓存，只有未命中的图片（同批次中相同图片只算一张）
+    才会被打包发送给模型，每个请求包含多页。
+
     Args:
-        image_data_list: 图片数据列表 [{'data': bytes, 'page_num': int}, ...]
-        ak: 火山引擎Access Key  
-        sk: 火山引擎Secret Key
+        images: 图片二进制数据列表
         source_type: 来源类型
-    
+        llm_service: LLMService 实例，默认使用进程内共享实例
+
     Returns:
-        OCR结果列表
+        与 images 一一对应的结果，格式同 perform_ocr_with_cache
     """
+    image_md5s = [calculate_image_md5(image_data) for image_data in images]
+    texts = dict(
+        OCRCache.objects.filter(image_md5__in=set(image_md5s)).values_list('image_md5', 'ocr_text')
+    )
+    cached_md5s = set(texts)
+
+    # 未命中的图片，按首次出现的位置去重
+    misses = {}
+    for image_data, image_md5 in zip(images, image_md5s):
+        if image_md5 not in texts and image_md5 not in misses:
+            misses[image_md5] = image_data
+
+    errors = {}
+    if misses:
+        if llm_service is None:
+            from book2tts.llm_service import get_shared_llm_service
+            llm_service = get_shared_llm_service()
+        llm_results = llm_service.perform_ocr_batch(
+            [_image_data_url(image_data) for image_data in misses.values()]
+        )
+        for image_md5, llm_result in zip(misses, llm_results):
+            if llm_result.get('success'):
+                texts[image_md5] = llm_result.get('result') or ''
+                cache_ocr_result(image_md5, texts[image_md5], source_type)
+            else:
+                errors[image_md5] = llm_result.get('error') or 'LLM OCR失败'
+
     results = []
-    
-    for item in image_data_list:
-        image_data = item['data']
-        page_num = item.get('page_num', 0)
-        
-        try:
-            # 执行OCR（已内置QPS控制）
-            result = perform_ocr_with_cache(image_data, ak, sk, source_type)
-            result['page_num'] = page_num
-            results.append(result)
-            
-        except Exception as e:
-            results.append({
-                'page_num': page_num,
-                'text': '',
-                'cached': False,
-                'image_md5': '',
-                'error': str(e)
-            })
-    
+    for image_md5 in image_md5s:
+        result = {
+            'text': texts.get(image_md5, ''),
+            'cached': image_md5 in cached_md5s,
+            'image_md5': image_md5,
+        }
+        if image_md5 in errors:
+            result['error'] = errors[image_md5]
+        results.append(result)
     return results
 
 
+def page_render_key(profile: Optional[RenderSettings] = None) -> str:
+    """页面渲染参数的缓存键，渲染参数变化时图片不同，需要区分"""
+    return (profile or get_ocr_image_profile()).cache_key
+
+
+def _lookup_render_keys(render_key: str) -> List[str]:
+    """查找页面缓存时依次尝试的渲染键：当前配置优先，其次是旧的默认配置"""
+    return [render_key] + [key for key in LEGACY_PAGE_RENDER_KEYS if key != render_key]
+
+
+def get_cached_page_ocr(book_md5: str, page_index: int, render_key: str) -> Optional[Dict[str, str]]:
+    """按 (书籍MD5, 页码, 渲染参数) 查找OCR结果，无需渲染页面"""
+    return get_cached_pages_ocr(book_md5, [page_index], render_key).get(page_index)
+
+
+def get_cached_pages_ocr(book_md5: str, page_indices: Iterable[int], render_key: str) -> Dict[int, Dict[str, str]]:
+    """批量查找多页的页面缓存，返回 {页码: {'text', 'image_md5'}}"""
+    if not book_md5:
+        return {}
+    render_keys = _lookup_render_keys(render_key)
+    entries = OCRPageCache.objects.filter(
+        book_md5=book_md5, page_index__in=list(page_indices), render_key__in=render_keys
+    ).values_list('page_index', 'render_key', 'image_md5')
+    # 同一页有多个渲染键时取优先级最高的
+    page_md5s = {}
+    for page_index, key, image_md5 in sorted(entries, key=lambda entry: render_keys.index(entry[1]), reverse=True):
+        page_md5s[page_index] = image_md5
+    if not page_md5s:
+        return {}
+    texts = dict(
+        OCRCache.objects.filter(image_md5__in=set(page_md5s.values())).values_list('image_md5', 'ocr_text')
+    )
+    return {
+        page_index: {'text': texts[image_md5], 'image_md5': image_md5}
+        for page_index, image_md5 in page_md5s.items()
+        if image_md5 in texts
+    }
+
+
+def cache_page_ocr(book_md5: str, page_index: int, render_key: str, image_md5: str) -> None:
+    """记录页面到图片MD5的映射"""
+    if not book_md5 or not image_md5:
+        return
+    OCRPageCache.objects.update_or_create(
+        book_md5=book_md5,
+        page_index=page_index,
+        render_key=render_key,
+        defaults={'image_md5': image_md5},
+    )
+
+
+def perform_page_ocr_with_cache(
+    book,
+    page_index: int,
+    ak: str,
+    sk: str,
+    profile: Optional[RenderSettings] = None,
+    source_type: str = 'page_image',
+) -> Dict[str, Any]:
+    """
+    对PDF页面执行OCR识别，带两级缓存
+
+    先按 (书籍MD5, 页码, 渲染参数) 查找，命中时不渲染页面；
+    未命中时渲染页面，再按图片MD5去重。
+
+    Args:
+        book: Books 实例
+        page_index: 页码（从0开始）
+        ak: 火山引擎Access Key
+        sk: 火山引擎Secret Key
+        profile: OCR图片渲染配置，默认由 OCR_IMAGE_PROFILE 决定
+        source_type: 来源类型
+
+    Returns:
+        同 perform_ocr_with_cache，额外包含 page_cache_hit 字段
+    """
+    profile = profile or get_ocr_image_profile()
+    render_key = page_render_key(profile)
+    cached = get_cached_page_ocr(book.md5_hash, page_index, render_key)
+    if cached is not None:
+        return {
+            'text': cached['text'],
+            'cached': True,
+            'image_md5': cached['image_md5'],
+            'page_cache_hit': True,
+        }
+
+    image_data = get_page_image_data(book.file.path, page_index, settings=profile)
+    result = perform_ocr_with_cache(image_data, ak, sk, source_type)
+    result['page_cache_hit'] = False
+
+    # 识别成功（含空白页的空文本）时建立映射
+    if 'error' not in result:
+        cache_page_ocr(book.md5_hash, page_index, render_key, result['image_md5'])
+
+    return result
+
+
+def iter_pages_ocr_with_cache(
+    book,
+    page_indices: Iterable[int],
+    ak: str,
+    sk: str,
+    profile: Optional[RenderSettings] = None,
+    source_type: str = 'page_image',
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    批量OCR识别PDF页面，逐页返回结果
+
+    页面缓存命中的页直接返回；其余页面交给渲染进程池并行渲染，
+    按顺序流式取回后执行OCR，内存中只保留少量在途页面。
+    OCR_ENGINE 为 llm 时，每 LLM_OCR_BATCH_SIZE 个未命中的页面打包为一个视觉模型请求。
+
+    Yields:
+        (页码, OCR结果)，按输入顺序返回，结果格式同 perform_page_ocr_with_cache；
+        页面渲染失败时结果包含 error 字段
+    """
+    profile = profile or get_ocr_image_profile()
+    render_key = page_render_key(profile)
+    page_indices = list(page_indices)
+    cached_pages = get_cached_pages_ocr(book.md5_hash, page_indices, render_key)
+
+    if get_ocr_engine() == 'llm':
+        from book2tts.llm_service import default_ocr_batch_size
+
+        batch_size = default_ocr_batch_size()
+
+        def ocr_images(images):
+            return perform_llm_ocr_batch_with_cache(images, source_type)
+    else:
+        batch_size = 1
+
+        def ocr_images(images):
+            return [perform_ocr_with_cache(images[0], ak, sk, source_type)]
+
+    pending = [page_index for page_index in page_indices if page_index not in cached_pages]
+    rendered = get_rasterizer().iter_pages(
+        book.file.path, pending, profile, return_exceptions=True
+    ) if pending else iter(())
+
+    # 等待识别的页面：(页码, 图片数据或已确定的结果)，保持输入顺序
+    buffered: List[Tuple[int, Any]] = []
+
+    def flush():
+        images = [item for _, item in buffered if isinstance(item, bytes)]
+        ocr_results = iter(ocr_images(images) if images else ())
+        for page_index, item in buffered:
+            if isinstance(item, bytes):
+                item = next(ocr_results)
+                item['page_cache_hit'] = False
+                if 'error' not in item:
+                    cache_page_ocr(book.md5_hash, page_index, render_key, item['image_md5'])
+            yield page_index, item
+        buffered.clear()
+
+    for page_index in page_indices:
+        cached = cached_pages.get(page_index)
+        if cached is not None:
+            buffered.append((page_index, {
+                'text': cached['text'],
+                'cached': True,
+                'image_md5': cached['image_md5'],
+                'page_cache_hit': True,
+            }))
+        else:
+            _, image_data = next(rendered)
+            if isinstance(image_data, Exception):
+                buffered.append((page_index, {
+                    'text': '',
+                    'cached': False,
+                    'image_md5': '',
+                    'error': str(image_data),
+                }))
+            else:
+                buffered.append((page_index, image_data))
+
+        # 没有待识别的图片时立即交付，否则凑满一批再请求
+        if sum(1 for _, item in buffered if isinstance(item, bytes)) in (0, batch_size):
+            yield from flush()
+
+    yield from flush()
+
+
 def clear_ocr_cache(days_old: int = 30) -> int:
     """清理旧的OCR缓存记录"""
     from django.utils import timezone
@@ -171,17 +368,20 @@ def clear_ocr_cache(days_old: int = 30) -> int:
     
     cutoff_date = timezone.now() - timedelta(days=days_old)
     deleted_count, _ = OCRCache.objects.filter(created_at__lt=cutoff_date).delete()
+    OCRPageCache.objects.filter(created_at__lt=cutoff_date).delete()
     return deleted_count
 
 
 def get_ocr_cache_stats() -> Dict[str, int]:
     """获取OCR缓存统计信息"""
     total_entries = OCRCache.objects.count()
+    page_entries = OCRPageCache.objects.count()
     page_image_entries = OCRCache.objects.filter(source_type='page_image').count()
     manual_upload_entries = OCRCache.objects.filter(source_type='manual_upload').count()
     
     return {
         'total': total_entries,
         'page_images': page_image_entries,
-        'manual_uploads': manual_upload_entries
+        'manual_uploads': manual_upload_entries,
+        'page_keys': page_entries,
     }
\ No newline at end of file
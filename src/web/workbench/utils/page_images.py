@@ -0,0 +1,53 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from book2tts.epub_assets import AssetImageCache
+from book2tts.page_images import PageImageCache
+
+
+logger = logging.getLogger(__name__)
+
+# 缩略图生成任务的 Celery 优先级（Redis 中数字越大优先级越低）
+PAGE_THUMBNAIL_PRIORITY = 9
+
+
+def get_page_image_cache() -> PageImageCache:
+    return PageImageCache(settings.PAGE_IMAGE_CACHE_DIR)
+
+
+def get_asset_image_cache() -> AssetImageCache:
+    """EPUB 内缩小后图片的缓存，与页面图片共用缓存目录"""
+    return AssetImageCache(settings.PAGE_IMAGE_CACHE_DIR)
+
+
+def book_image_key(book) -> str:
+    """页面图片缓存的书籍标识，按文件内容的MD5区分，内容相同的书籍共用缓存"""
+    return book.md5_hash or f"book-{book.id}"
+
+
+def preferred_image_format(request) -> str:
+    """浏览器支持 WebP 时返回 webp，否则回退到 jpeg"""
+    requested = request.GET.get('format')
+    if requested in ('webp', 'jpeg'):
+        return requested
+    return 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+
+
+def schedule_page_thumbnails(book) -> None:
+    """在事务提交后排队生成全部页面的缩略图，失败时不影响上传流程"""
+    if book.file_type != '.pdf':
+        return
+
+    def _start_task():
+        from ..tasks import generate_page_thumbnails_task
+
+        try:
+            generate_page_thumbnails_task.apply_async(
+                kwargs={'book_id': book.id}, priority=PAGE_THUMBNAIL_PRIORITY
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Failed to queue page thumbnails for book %s: %s", book.id, e)
+
+    transaction.on_commit(_start_task)
@@ -116,3 +116,28 @@ def deduct_llm_points(
             'token_units': token_units,
             'reason': 'exception',
         }
+
+
+def deduct_ocr_points(user, page_count: int = 1):
+    """按页扣除 OCR 积分（不写操作记录，由调用方汇总记录）。
+
+    Args:
+        user: Django 用户对象。
+        page_count: 实际执行 OCR 的页数。
+
+    Returns:
+        dict: deducted / points / remaining
+    """
+    points_required = PointsManager.get_ocr_processing_points(page_count)
+    if points_required <= 0:
+        return {'deducted': True, 'points': 0, 'remaining': None}
+
+    with transaction.atomic():
+        quota, _ = UserQuota.objects.get_or_create(user=user)
+        quota = UserQuota.objects.select_for_update().get(pk=quota.pk)
+        deducted = quota.consume_points(points_required)
+        return {
+            'deducted': deducted,
+            'points': points_required if deducted else 0,
+            'remaining': quota.points,
+        }
@@ -0,0 +1,50 @@
+import time
+from typing import Optional, Set
+
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+
+from book2tts.rate_limiter import RateLimitBackend
+from ..models import RateLimitBucket
+
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """
+    基于数据库的限流后端，所有 Web / Celery 进程共享同一个令牌桶。
+
+    每次预约只执行一条 UPDATE（在事务内持有行锁）和一次读取，等待在事务外进行。
+    """
+
+    def __init__(self):
+        self._known_keys: Set[str] = set()
+
+    def _ensure_bucket(self, key: str) -> None:
+        if key not in self._known_keys:
+            RateLimitBucket.objects.get_or_create(key=key)
+            self._known_keys.add(key)
+
+    def reserve(
+        self,
+        key: str,
+        interval: float,
+        burst: int,
+        cost: float,
+        max_wait: Optional[float] = None,
+    ) -> Optional[float]:
+        self._ensure_bucket(key)
+        now = time.time()
+        with transaction.atomic():
+            bucket = RateLimitBucket.objects.filter(key=key)
+            next_tat = Greatest(F('tat'), Value(now, output_field=FloatField())) + cost * interval
+            if not bucket.update(tat=next_tat):
+                # 记录已被删除（如清理数据），重新创建
+                RateLimitBucket.objects.get_or_create(key=key)
+                bucket.update(tat=next_tat)
+            new_tat = RateLimitBucket.objects.filter(key=key).values_list('tat', flat=True).get()
+            wait = max(0.0, new_tat - burst * interval - now)
+            if max_wait is not None and wait > max_wait:
+                # 放弃预约，回滚本次 UPDATE
+                transaction.set_rollback(True)
+                return None
+        return wait
@@ -0,0 +1,343 @@
+import logging
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from ..models import AudioSegment, Books, DialogueScript
+
+
+logger = logging.getLogger(__name__)
+
+# 统一音频列表中区分两类音频的常量，全文索引的 rowid = id * 2 + kind
+KIND_AUDIO_SEGMENT = 0
+KIND_DIALOGUE_SCRIPT = 1
+
+FTS_TABLE = 'workbench_audio_fts'
+
+# 中日韩文字没有空格分词，按连续字符切成二元组建索引
+_CJK = (
+    '\u3040-\u30ff'  # 日文假名
+    '\u3400-\u4dbf'  # CJK 扩展A
+    '\u4e00-\u9fff'  # CJK 统一汉字
+    '\uac00-\ud7af'  # 韩文音节
+    '\uf900-\ufaff'  # CJK 兼容汉字
+    '\U00020000-\U0002ebef'  # CJK 扩展B-F
+)
+_TOKEN_RE = re.compile(rf'([{_CJK}]+)|((?:(?![{_CJK}])[^\W_])+)')
+
+SearchKey = Tuple[float, int, int]
+
+
+def _cjk_tokens(run: str) -> List[str]:
+    """
+    连续汉字切成重叠二元组，并补上末尾单字。
+    这样每个字都是某个词元的开头，单字查询用前缀匹配即可命中。
+    """
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize_for_index(text: str) -> str:
+    """把文本转换为以空格分隔的词元，交给 FTS5 unicode61 分词器建索引"""
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text or ''):
+        if cjk:
+            tokens.extend(_cjk_tokens(cjk))
+        else:
+            tokens.append(word.lower())
+    return ' '.join(tokens)
+
+
+def build_match_query(query: str) -> str:
+    """
+    把用户输入转换为 FTS5 MATCH 表达式，所有词之间为 AND 关系：
+    多字汉字按二元组组成短语，单字和英文单词做前缀匹配（接近原来 icontains 的效果）。
+    没有可搜索的字符时返回空字符串。
+    """
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(query or ''):
+        if cjk and len(cjk) > 1:
+            terms.append('"{}"'.format(' '.join(cjk[i:i + 2] for i in range(len(cjk) - 1))))
+        else:
+            terms.append('"{}"*'.format((cjk or word.lower()).replace('"', '""')))
+    return ' '.join(terms)
+
+
+def highlight_snippet(text: str, query: str, length: int = 160) -> str:
+    """截取第一个命中词附近的文本，命中词用 <mark> 包裹，返回已转义的 HTML"""
+    text = text or ''
+    terms = sorted({term.lower() for pair in _TOKEN_RE.findall(query or '') for term in pair if term}, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE) if terms else None
+
+    first = pattern.search(text) if pattern else None
+    start = max(0, first.start() - length // 4) if first else 0
+    window = text[start:start + length]
+
+    parts = ['…'] if start > 0 else []
+    position = 0
+    for match in (pattern.finditer(window) if pattern else ()):
+        parts.append(escape(window[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group(0))}</mark>')
+        position = match.end()
+    parts.append(escape(window[position:]))
+    if start + length < len(text):
+        parts.append('…')
+    return mark_safe(''.join(parts))
+
+
+class SearchBackend:
+    """音频全文搜索后端接口"""
+
+    # 是否支持按相关度排序（ranked_keys）
+    ranked = False
+
+    def filter_q(self, kind: int, query: str) -> Q:
+        """返回限制到匹配行的过滤条件，kind 指定 AudioSegment 或 DialogueScript"""
+        raise NotImplementedError
+
+    def ranked_keys(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        book_id: Optional[int] = None,
+        published_only: bool = True,
+        after: Optional[SearchKey] = None,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> List[SearchKey]:
+        """按相关度返回匹配行的 (score, kind, id)，score 越小越相关"""
+        raise NotImplementedError
+
+    def index(self, kind: int, instance) -> None:
+        """新增或更新一行的索引"""
+
+    def remove(self, kind: int, item_id: int) -> None:
+        """删除一行的索引"""
+
+    def update_book_name(self, book_id: int, name: str) -> None:
+        """书名变化时同步索引中的书名"""
+
+    def rebuild(self, segments=None, scripts=None, batch_size: int = 500) -> int:
+        """重建整个索引，返回索引的行数"""
+        return 0
+
+
+class BasicSearchBackend(SearchBackend):
+    """
+    不依赖数据库扩展的后端：直接用 icontains 过滤，无需维护索引。
+    在 FTS5 不可用或非 SQLite 数据库上使用。
+    """
+
+    def filter_q(self, kind: int, query: str) -> Q:
+        body_field = 'text' if kind == KIND_AUDIO_SEGMENT else 'original_text'
+        return (
+            Q(title__icontains=query)
+            | Q(**{f'{body_field}__icontains': query})
+            | Q(book__name__icontains=query)
+        )
+
+
+class SQLiteFTS5SearchBackend(SearchBackend):
+    """
+    SQLite FTS5 后端。
+
+    索引表 workbench_audio_fts（见迁移 0033）保存预先切好的词元（title、body、book_name 三列，
+    bm25 权重 5:1:2），以及用于过滤的 user_id、book_id、published 非索引列。
+    由模型的 post_save / post_delete 信号同步，写入与业务数据在同一事务中。
+    """
+
+    ranked = True
+
+    def filter_q(self, kind: int, query: str) -> Q:
+        match = build_match_query(query)
+        if not match:
+            return BasicSearchBackend().filter_q(kind, query)
+        return Q(id__in=RawSQL(
+            f"SELECT rowid / 2 FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid %% 2 = %s",
+            (match, kind),
+        ))
+
+    def ranked_keys(self, query, user_id=None, book_id=None, published_only=True, after=None, offset=0, limit=20):
+        match = build_match_query(query)
+        if not match:
+            return []
+        conditions = [f"{FTS_TABLE} MATCH %s"]
+        params = [match]
+        if user_id is not None:
+            conditions.append("user_id = %s")
+            params.append(user_id)
+        else:
+            # 与 AudioListing 一致：不指定用户时跳过无关联书籍的对话脚本
+            conditions.append(f"(rowid %% 2 = {KIND_AUDIO_SEGMENT} OR book_id IS NOT NULL)")
+        if book_id is not None:
+            conditions.append("book_id = %s")
+            params.append(book_id)
+        if published_only:
+            conditions.append("published = 1")
+        if after is not None:
+            score, kind, item_id = after
+            conditions.append("(rank > %s OR (rank = %s AND rowid > %s))")
+            params.extend([score, score, item_id * 2 + kind])
+
+        sql = (
+            f"SELECT rank, rowid FROM {FTS_TABLE} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY rank, rowid LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit, offset])
+            return [(score, rowid % 2, rowid // 2) for score, rowid in cursor.fetchall()]
+
+    @staticmethod
+    def _row(kind: int, instance) -> Optional[tuple]:
+        if kind == KIND_AUDIO_SEGMENT:
+            body = instance.text
+        elif instance.audio_file:
+            body = instance.original_text
+        else:
+            # 还没有音频的对话脚本不出现在列表中，也不建索引
+            return None
+        book = instance.book if instance.book_id else None
+        return (
+            instance.pk * 2 + kind,
+            tokenize_for_index(instance.title),
+            tokenize_for_index(body),
+            tokenize_for_index(book.name if book else ''),
+            instance.user_id,
+            instance.book_id,
+            int(instance.published),
+        )
+
+    def _insert(self, cursor, rows: Iterable[tuple]) -> None:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, body, book_name, user_id, book_id, published) "
+            f"VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+    def index(self, kind, instance):
+        row = self._row(kind, instance)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [instance.pk * 2 + kind])
+            if row is not None:
+                self._insert(cursor, [row])
+
+    def remove(self, kind, item_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [item_id * 2 + kind])
+
+    def update_book_name(self, book_id, name):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {FTS_TABLE} SET book_name = %s WHERE book_id = %s",
+                [tokenize_for_index(name), book_id],
+            )
+
+    def rebuild(self, segments=None, scripts=None, batch_size=500):
+        if segments is None:
+            segments = AudioSegment.objects.all()
+        if scripts is None:
+            scripts = DialogueScript.objects.all()
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            for kind, queryset in ((KIND_AUDIO_SEGMENT, segments), (KIND_DIALOGUE_SCRIPT, scripts)):
+                rows = []
+                for instance in queryset.select_related('book').order_by('pk').iterator(chunk_size=batch_size):
+                    row = self._row(kind, instance)
+                    if row is not None:
+                        rows.append(row)
+                    if len(rows) >= batch_size:
+                        self._insert(cursor, rows)
+                        total += len(rows)
+                        rows = []
+                self._insert(cursor, rows)
+                total += len(rows)
+            # 批量写入后合并索引段，提高查询速度
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return total
+
+
+_backend: Optional[SearchBackend] = None
+
+
+def _fts_table_exists() -> bool:
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def get_search_backend() -> SearchBackend:
+    """
+    按 AUDIO_SEARCH_BACKEND 配置返回搜索后端：
+    auto（默认，SQLite 且索引表存在时用 FTS5，否则 icontains）、fts5、basic，
+    或自定义后端类的导入路径（如为 PostgreSQL 实现的后端）。
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    name = getattr(settings, 'AUDIO_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        if connection.vendor != 'sqlite' or not _fts_table_exists():
+            # 不缓存，迁移完成后无需重启即可切换到 FTS5
+            return BasicSearchBackend()
+        _backend = SQLiteFTS5SearchBackend()
+    elif name == 'fts5':
+        _backend = SQLiteFTS5SearchBackend()
+    elif name == 'basic':
+        _backend = BasicSearchBackend()
+    else:
+        _backend = import_string(name)()
+    return _backend
+
+
+def set_search_backend(backend: Optional[SearchBackend]) -> None:
+    """替换全局搜索后端，传 None 时按配置重新选择"""
+    global _backend
+    _backend = backend
+
+
+def _sync_index(action, *args) -> None:
+    """索引写入失败不影响业务数据的保存，可通过 rebuild_search_index 命令修复"""
+    try:
+        with transaction.atomic():
+            action(*args)
+    except DatabaseError as e:
+        logger.warning("Failed to update audio search index: %s", e)
+
+
+@receiver(post_save, sender=AudioSegment)
+def index_audio_segment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _sync_index(get_search_backend().index, KIND_AUDIO_SEGMENT, instance)
+
+
+@receiver(post_save, sender=DialogueScript)
+def index_dialogue_script(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _sync_index(get_search_backend().index, KIND_DIALOGUE_SCRIPT, instance)
+
+
+@receiver(post_delete, sender=AudioSegment)
+def unindex_audio_segment(sender, instance, **kwargs):
+    _sync_index(get_search_backend().remove, KIND_AUDIO_SEGMENT, instance.pk)
+
+
+@receiver(post_delete, sender=DialogueScript)
+def unindex_dialogue_script(sender, instance, **kwargs):
+    _sync_index(get_search_backend().remove, KIND_DIALOGUE_SCRIPT, instance.pk)
+
+
+@receiver(post_save, sender=Books)
+def reindex_book_name(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if created or raw or (update_fields is not None and 'name' not in update_fields):
+        return
+    _sync_index(get_search_backend().update_book_name, instance.pk, instance.name)
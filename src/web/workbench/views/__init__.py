@@ -13,6 +13,7 @@ from .book_views import (
     update_pdf_type,
     detect_scanned_pdf,
     get_page_image,
+    page_image,
     check_page_audio_status,
     delete_book,
 )
@@ -54,6 +55,7 @@ __all__ = [
     'update_pdf_type',
     'detect_scanned_pdf',
     'get_page_image',
+    'page_image',
     'check_page_audio_status',
     'delete_book',
     
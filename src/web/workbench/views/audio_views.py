@@ -4,7 +4,6 @@ import tempfile
 import asyncio
 import re
 import json
-from collections import defaultdict
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
@@ -17,7 +16,7 @@ from django.db import transaction
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import Count, Max
 from filelock import FileLock, Timeout
 
 from ..models import (
@@ -29,6 +28,7 @@ from ..models import (
     TTSProviderConfig,
     TTS_PROVIDER_CHOICES,
 )
+from ..utils.audio_listing import AudioListing, get_or_create_dialogue_virtual_book
 from ..tasks import synthesize_audio_task, start_audio_synthesis_on_commit, generate_chapters_task
 from book2tts.tts import edge_tts_volices, azure_text_to_speech
 from book2tts.edgetts import EdgeTTS
@@ -96,24 +96,12 @@ async def _synthesize_edge_preview(voice_name: str, preview_text: str, output_fi
     )
 
 
-def get_or_create_dialogue_virtual_book(user):
-    """获取或创建对话脚本虚拟书籍"""
-    virtual_book_name = "📢 对话脚本集"
-    virtual_book, created = Books.objects.get_or_create(
-        user=user,
-        name=virtual_book_name,
-        defaults={
-            'file_type': '.virtual',
-            'file': None,  # 虚拟书籍无文件
-        }
-    )
-    return virtual_book
-
-
-def get_unified_audio_content(user=None, book=None, published_only=True, search_query=None, sort_by_publish_time=False):
+def get_unified_audio_content(user=None, book=None, published_only=True, search_query=None, sort_by_publish_time=False,
+                              order_by_relevance=False):
     """
     统一获取音频内容（AudioSegment + DialogueScript）
-    返回统一格式的数据列表
+    返回 AudioListing：过滤、排序和分页在数据库中完成，切片或迭代时才加载对应的行，
+    每行为统一格式的字典
 
     Args:
         user: 用户对象，None表示所有用户
@@ -121,132 +109,16 @@ def get_unified_audio_content(user=None, book=None, published_only=True, search_
         published_only: 是否只获取已发布的音频
         search_query: 搜索关键词
         sort_by_publish_time: 是否按发布时间排序（True：按发布时间，False：按更新时间+ID）
+        order_by_relevance: 有搜索关键词时按相关度排序（搜索后端支持时）
     """
-    audio_items = []
-
-    # 构建查询条件
-    audio_filter = Q()
-    dialogue_filter = Q()
-
-    if user:
-        audio_filter &= Q(user=user)
-        dialogue_filter &= Q(user=user)
-
-    if book:
-        audio_filter &= Q(book=book)
-        dialogue_filter &= Q(book=book)
-
-    if published_only:
-        audio_filter &= Q(published=True)
-        dialogue_filter &= Q(published=True)
-
-    # 搜索功能 - 在数据库层面进行搜索
-    if search_query:
-        # 对于音频片段，搜索标题、内容和书籍名称
-        audio_search_filter = Q(title__icontains=search_query) | Q(text__icontains=search_query) | Q(book__name__icontains=search_query)
-        audio_filter &= audio_search_filter
-
-        # 对于对话脚本，搜索标题、原始文本和书籍名称
-        dialogue_search_filter = Q(title__icontains=search_query) | Q(original_text__icontains=search_query) | Q(book__name__icontains=search_query)
-        dialogue_filter &= dialogue_search_filter
-    
-    # 获取传统音频片段
-    if sort_by_publish_time:
-        # 按更新时间排序（公开视频和RSS使用）
-        audio_segments = AudioSegment.objects.filter(audio_filter).order_by('-updated_at', '-id')
-    else:
-        # 按创建时间排序（成品页使用）
-        audio_segments = AudioSegment.objects.filter(audio_filter).order_by('-created_at', '-id')
-
-    for segment in audio_segments:
-        # 确保AudioSegment有有效的book
-        if not segment.book or not segment.book.id:
-            continue
-
-        audio_items.append({
-            'id': segment.id,
-            'type': 'audio_segment',
-            'title': segment.title,
-            'text': segment.text,
-            'book_page': segment.book_page,
-            'file_url': segment.file.url if segment.file else None,
-            'file_size': segment.file.size if segment.file else 0,
-            'published': segment.published,
-            'created_at': segment.created_at,
-            'updated_at': segment.updated_at,
-            'book': segment.book,
-            'user': segment.user,
-            # 为了兼容性添加的字段
-            'file': segment.file,
-            'subtitle_file': segment.subtitle_file,  # 添加字幕文件支持
-            'chapters': segment.chapters or [],
-            'chapters_file': segment.chapters_file,
-            'chapters_html': segment.chapters_html,
-        })
-
-    # 获取对话脚本
-    if sort_by_publish_time:
-        # 按更新时间排序（公开视频和RSS使用）
-        dialogue_scripts = DialogueScript.objects.filter(
-            dialogue_filter & Q(audio_file__isnull=False)
-        ).order_by('-updated_at', '-id')
-    else:
-        # 按创建时间排序（成品页使用）
-        dialogue_scripts = DialogueScript.objects.filter(
-            dialogue_filter & Q(audio_file__isnull=False)
-        ).order_by('-created_at', '-id')
-    
-    # 如果有用户指定且有无关联书籍的对话脚本，创建虚拟书籍
-    virtual_book = None
-    if user and not book:  # 只有在不指定特定书籍时才需要虚拟书籍
-        # 检查是否有无关联书籍的对话脚本
-        unlinked_scripts = dialogue_scripts.filter(book__isnull=True)
-        if unlinked_scripts.exists():
-            virtual_book = get_or_create_dialogue_virtual_book(user)
-    
-    for script in dialogue_scripts:
-        # 确定归属的书籍：如果没有关联书籍且有虚拟书籍，则使用虚拟书籍
-        target_book = script.book if script.book else virtual_book
-        
-        # 如果仍然没有book或book无效，跳过该对话脚本
-        if not target_book or not target_book.id:
-            continue
-            
-        audio_items.append({
-            'id': script.id,
-            'type': 'dialogue_script',
-            'title': script.title,
-            'text': f"🎭 对话脚本 ({script.segment_count}段) - {', '.join(script.speakers[:3])}{'...' if len(script.speakers) > 3 else ''}",
-            'original_text': script.original_text,  # 添加原始文本字段
-            'book_page': f"对话音频 ({len(script.speakers)}个角色)",
-            'file_url': script.audio_file.url if script.audio_file else None,
-            'file_size': script.audio_file.size if script.audio_file else 0,
-            'published': script.published,
-            'created_at': script.created_at,
-            'updated_at': script.updated_at,
-            'book': target_book,  # 确保总是有有效的book对象
-            'user': script.user,
-            # 对话脚本特有字段
-            'audio_duration': script.audio_duration,
-            'speakers': script.speakers,
-            'segment_count': script.segment_count,
-            # 为了兼容性添加的字段
-            'file': script.audio_file,
-            'subtitle_file': script.subtitle_file,  # 添加字幕文件支持
-            'chapters': script.chapters or [],
-            'chapters_file': script.chapters_file,
-            'chapters_html': script.chapters_html,
-        })
-    
-    # 根据排序策略进行内存排序
-    if sort_by_publish_time:
-        # 按更新时间排序（公开视频和RSS使用）
-        audio_items.sort(key=lambda x: (x['updated_at'], x['id']), reverse=True)
-    else:
-        # 按创建时间排序（成品页使用）
-        audio_items.sort(key=lambda x: (x['created_at'], x['id']), reverse=True)
-    
-    return audio_items
+    return AudioListing(
+        user=user,
+        book=book,
+        published_only=published_only,
+        search_query=search_query,
+        sort_by_publish_time=sort_by_publish_time,
+        order_by_relevance=order_by_relevance,
+    )
 
 
 def get_client_ip(request):
@@ -268,79 +140,53 @@ def get_user_agent(request):
 def aggregated_audio_segments(request):
     """Display aggregated audio segments grouped by book, including dialogue audio"""
     
-    # Get the current user's audio segments, ordered by created_at descending
-    audio_segments = AudioSegment.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Get published dialogue scripts
-    dialogue_scripts = DialogueScript.objects.filter(
-        user=request.user, 
-        published=True, 
-        audio_file__isnull=False
-    ).order_by('-created_at')
-
-    # Get or create virtual book for dialogue scripts without book association
-    virtual_book = get_or_create_dialogue_virtual_book(request.user)
-
-    # Aggregate by book
-    aggregated_data = defaultdict(list)
-    book_ids = {}  # Track book IDs for each book name
-    
-    # Add traditional audio segments
-    for segment in audio_segments:
-        book_data = {
-            "id": segment.id,
-            "type": "audio_segment",
-            "title": segment.title,
-            "text": segment.text,
-            "book_page": segment.book_page,
-            "file_url": segment.file.url,
-            "published": segment.published,
-            "created_at": segment.created_at
-        }
-        aggregated_data[segment.book.name].append(book_data)
-        book_ids[segment.book.name] = segment.book.id  # Store book ID
-    
-    # Add dialogue audio - 统一数据格式，确保都关联到真实的Book对象
-    for script in dialogue_scripts:
-        # 确定归属的书籍
-        target_book = script.book if script.book else virtual_book
-        book_name = target_book.name
-        
-        # 转换为与AudioSegment一致的数据格式
-        book_data = {
-            "id": script.id,
-            "type": "dialogue_script",
-            "title": script.title,
-            "text": f"🎭 对话脚本 ({script.segment_count}段) - {', '.join(script.speakers[:3])}{'...' if len(script.speakers) > 3 else ''}",
-            "book_page": f"对话音频 ({len(script.speakers)}个角色)",
-            "file_url": script.audio_file.url,
-            "published": script.published,
-            "created_at": script.created_at,
-            # 保留对话脚本特有的字段，但不影响通用处理
-            "audio_duration": script.audio_duration,
-            "speakers": script.speakers,
-            "segment_count": script.segment_count,
-            "subtitle_file": script.subtitle_file,  # 添加字幕文件支持
-        }
-        aggregated_data[book_name].append(book_data)
-        book_ids[book_name] = target_book.id  # 始终关联真实的Book ID
-        
-    # Sort each book's segments by created_at descending
-    for book_name in aggregated_data:
-        aggregated_data[book_name].sort(key=lambda x: x['created_at'], reverse=True)
-        
-    # Prepare data structure with book IDs
+    # 按书籍聚合：数量和最近创建时间在数据库中统计，不加载音频记录本身
+    segment_books = (
+        AudioSegment.objects.filter(user=request.user)
+        .order_by()
+        .values('book_id')
+        .annotate(count=Count('id'), latest=Max('created_at'))
+    )
+    script_books = (
+        DialogueScript.objects.filter(user=request.user, published=True, audio_file__isnull=False)
+        .order_by()
+        .values('book_id')
+        .annotate(count=Count('id'), latest=Max('created_at'))
+    )
+
+    book_stats = {}
+    virtual_book = None
+    for row in list(segment_books) + list(script_books):
+        book_id = row['book_id']
+        if book_id is None:
+            # 无关联书籍的对话脚本归入虚拟书籍
+            virtual_book = virtual_book or get_or_create_dialogue_virtual_book(request.user)
+            book_id = virtual_book.id
+        stats = book_stats.setdefault(book_id, {'count': 0, 'latest': row['latest']})
+        stats['count'] += row['count']
+        stats['latest'] = max(stats['latest'], row['latest'])
+
+    # 锚点跳转（#audio-123）只需要音频ID到书籍的映射
+    audio_book_map = {
+        audio_id: book_id
+        for book_id, audio_id in AudioSegment.objects.filter(user=request.user).values_list('book_id', 'id')
+    }
+    for book_id, audio_id in DialogueScript.objects.filter(
+        user=request.user, published=True, audio_file__isnull=False
+    ).values_list('book_id', 'id'):
+        audio_book_map.setdefault(audio_id, book_id or virtual_book.id)
+
+    book_names = dict(Books.objects.filter(id__in=book_stats).values_list('id', 'name'))
     books_with_ids = {}
-    for book_name, segments in aggregated_data.items():
-        books_with_ids[book_name] = {
-            "segments": segments,
-            "book_id": book_ids[book_name]  # 所有Book ID都是真实的
+    for book_id, stats in sorted(book_stats.items(), key=lambda item: item[1]['latest'], reverse=True):
+        books_with_ids[book_names[book_id]] = {
+            "book_id": book_id,
+            "segment_count": stats['count'],
         }
 
-    # Convert to standard dictionary and pass to template
     context = {
         "books_with_ids": books_with_ids,
-        "aggregated_data": dict(aggregated_data)
+        "audio_book_map": audio_book_map,
     }
     return render(request, "aggregated_audio_segments.html", context)
 
@@ -0,0 +1,152 @@
+from django.shortcuts import get_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_exempt
+from django.http import JsonResponse
+from django.db import transaction
+from django.urls import reverse
+import uuid
+
+from ..models import AudiobookJob, Books, UserTask
+from ..utils.audiobook import schedule_audiobook_job
+from home.models import UserQuota
+
+
+def _create_job_task(job):
+    """为有声书任务的一次运行创建 UserTask 记录并在提交后排队"""
+    task_id = str(uuid.uuid4())
+    UserTask.objects.create(
+        user=job.user,
+        task_id=task_id,
+        task_type='audiobook',
+        book=job.book,
+        title=f'有声书: {job.title or job.book.name}',
+        status='pending',
+        progress_message='有声书任务等待执行中...',
+        metadata={
+            'book_id': job.book_id,
+            'audiobook_job_id': job.id,
+            'voice_name': job.voice_name,
+            'output_format': job.output_format,
+        },
+    )
+    job.task_id = task_id
+    job.status = 'pending'
+    job.error_message = ''
+    job.save(update_fields=['task_id', 'status', 'error_message', 'updated_at'])
+    schedule_audiobook_job(job, task_id)
+    return task_id
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def start_audiobook_job(request, book_id):
+    """提交整本书有声书任务：按目录拆分章节并行合成，封装为带章节标记的 M4B/MP3"""
+    book = get_object_or_404(Books, pk=book_id, user=request.user)
+    if book.file_type not in ('.pdf', '.epub'):
+        return JsonResponse({
+            "status": "error",
+            "message": "只支持为PDF或EPUB文件生成有声书"
+        }, status=400)
+
+    voice_name = request.POST.get('voice_name', '').strip()
+    if not voice_name:
+        return JsonResponse({"status": "error", "message": "缺少voice_name参数"}, status=400)
+
+    output_format = request.POST.get('output_format', 'm4b')
+    if output_format not in dict(AudiobookJob.FORMAT_CHOICES):
+        return JsonResponse({"status": "error", "message": f"不支持的输出格式: {output_format}"}, status=400)
+
+    try:
+        toc_level = max(int(request.POST.get('toc_level', 0)), 0)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "toc_level必须是整数"}, status=400)
+
+    # 各章节合成前会按文本长度再检查积分，这里只拦截积分已用完的情况
+    user_quota, created = UserQuota.objects.get_or_create(user=request.user)
+    if user_quota.points <= 0:
+        return JsonResponse({
+            "status": "error",
+            "message": f"积分不足，当前剩余：{user_quota.points}积分"
+        }, status=400)
+
+    with transaction.atomic():
+        job = AudiobookJob.objects.create(
+            user=request.user,
+            book=book,
+            title=request.POST.get('title', '').strip() or book.name,
+            voice_name=voice_name,
+            rate=request.POST.get('rate', '+0%'),
+            output_format=output_format,
+            toc_level=toc_level,
+        )
+        task_id = _create_job_task(job)
+
+    return JsonResponse({
+        "status": "success",
+        "job_id": job.id,
+        "task_id": task_id,
+        "status_url": reverse('audiobook_job_status', args=[job.id]),
+        "message": "有声书任务已提交，正在后台按章节合成..."
+    })
+
+
+@login_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def resume_audiobook_job(request, job_id):
+    """续跑失败的有声书任务，已完成的章节不会重新合成"""
+    job = get_object_or_404(AudiobookJob, pk=job_id, user=request.user)
+    if job.status != 'failure':
+        return JsonResponse({
+            "status": "error",
+            "message": "只有失败的有声书任务可以续跑"
+        }, status=400)
+
+    with transaction.atomic():
+        job.job_chapters.exclude(status='success').update(status='pending', error_message='')
+        task_id = _create_job_task(job)
+
+    return JsonResponse({
+        "status": "success",
+        "job_id": job.id,
+        "task_id": task_id,
+        "remaining_chapters": job.job_chapters.exclude(status='success').count(),
+        "message": "有声书任务已重新提交，将继续合成未完成的章节"
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def audiobook_job_status(request, job_id):
+    """查询有声书任务的章节进度与结果"""
+    job = get_object_or_404(AudiobookJob.objects.select_related('book'), pk=job_id, user=request.user)
+    chapters = [
+        {
+            'index': chapter['index'],
+            'title': chapter['title'],
+            'status': chapter['status'],
+            'audio_duration': chapter['audio_duration'],
+            'error_message': chapter['error_message'],
+        }
+        for chapter in job.job_chapters.values('index', 'title', 'status', 'audio_duration', 'error_message')
+    ]
+
+    return JsonResponse({
+        "status": "success",
+        "job_id": job.id,
+        "book_id": job.book_id,
+        "title": job.title,
+        "job_status": job.status,
+        "output_format": job.output_format,
+        "error_message": job.error_message,
+        "total_chapters": len(chapters),
+        "completed_chapters": sum(1 for chapter in chapters if chapter['status'] == 'success'),
+        "failed_chapters": sum(1 for chapter in chapters if chapter['status'] == 'failure'),
+        "chapters": chapters,
+        "audio_url": job.audio_file.url if job.audio_file else None,
+        "subtitle_url": job.subtitle_file.url if job.subtitle_file else None,
+        "audio_duration": job.audio_duration,
+        "markers": job.chapters,
+    })
@@ -5,18 +5,30 @@ from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
 from django.core.paginator import Paginator
 from django.conf import settings
 from django.db import transaction
 
 from ..forms import UploadFileForm
 from ..models import Books, TTSProviderConfig
-from book2tts.ebook import open_ebook, ebook_toc, get_content_with_href, ebook_pages
-from book2tts.pdf import open_pdf, detect_scanned_pdf, get_page_image_data
-from ..utils.ocr_utils import perform_ocr_with_cache
+from book2tts.ebook import lease_ebook, ebook_toc, get_content_with_href
+from book2tts.pdf import lease_pdf, detect_scanned_pdf
+from ..utils.ocr_utils import perform_page_ocr_with_cache
+from ..utils.ocr_prefetch import consume_prefetched_page, schedule_ocr_prefetch
+from ..utils.book_index import detect_book_scanned, get_book_index, schedule_book_index
+from ..utils.book_structure import extract_book_structure
+from ..utils.page_images import (
+    book_image_key,
+    get_asset_image_cache,
+    get_page_image_cache,
+    preferred_image_format,
+    schedule_page_thumbnails,
+)
+from book2tts.page_images import DEFAULT_PAGE_IMAGE_TIER, PAGE_IMAGE_FORMATS, PAGE_IMAGE_TIERS
+from book2tts.epub_assets import asset_etag, is_scalable_image, open_asset_stream, scaled_width
 from home.models import UserQuota, OperationRecord
-from ebooklib import epub
 from bs4 import BeautifulSoup
 from urllib.parse import quote
 import posixpath
@@ -130,179 +142,6 @@ def deduct_points_for_ocr(user, num_non_cached_images, auto_ocr=False):
         return False
 
 
-def traverse_toc_with_level(items, toc, level=0):
-    """
-    遍历目录结构并保留层级信息
-    基于原始 ebook_toc 的 traverse_toc 函数，添加层级支持
-    参数:
-        items: epub的目录项或其他目录结构
-        toc: 目标列表，用于存储处理后的目录项
-        level: 当前层级，从0开始
-    """
-    for item in items:
-        if isinstance(item, tuple):
-            section, children = item
-            href = section.href or ""
-            base_href, fragment = (href.split("#", 1) + [None])[:2]
-            toc.append({
-                "title": section.title,
-                "href": href,
-                "base_href": base_href,
-                "fragment": fragment,
-                "level": level,
-                "has_children": bool(children)
-            })
-            # 递归处理子目录，层级加1
-            traverse_toc_with_level(children, toc, level + 1)
-        elif isinstance(item, epub.Link):
-            href = item.href or ""
-            base_href, fragment = (href.split("#", 1) + [None])[:2]
-            toc.append({
-                "title": item.title,
-                "href": href,
-                "base_href": base_href,
-                "fragment": fragment,
-                "level": level,
-                "has_children": False
-            })
-    return
-
-
-
-def ebook_toc_with_level(book):
-    """
-    获取epub书籍的目录结构，保留层级信息
-    基于原始 ebook_toc 函数，添加层级支持
-    """
-    tocs = []
-    traverse_toc_with_level(book.toc, tocs)
-
-    result = []
-
-    for t in tocs:
-        href = (t.get("href") or "").strip()
-        base_href = (t.get("base_href") or "").strip()
-
-        if not base_href:
-            base_href = href.split("#", 1)[0] if href else ""
-
-        fragment = t.get("fragment")
-        if fragment is None:
-            parts = href.split("#", 1)
-            fragment = parts[1] if len(parts) > 1 else None
-
-        normalized_href = base_href or href
-        if fragment:
-            normalized_href = f"{base_href}#{fragment}" if base_href else f"#{fragment}"
-
-        t["base_href"] = base_href
-        t["fragment"] = fragment
-        t["href"] = normalized_href or href
-
-        result.append(t)
-    return result
-
-
-def build_epub_fragment_successors(toc_entries):
-    """按 base_href 排序 fragment，返回每个条目的后续 fragment 信息"""
-    successors = {}
-    grouped = {}
-
-    for entry in toc_entries:
-        href = entry.get("href")
-        base_href = entry.get("base_href") or (href.split("#", 1)[0] if href else "")
-        grouped.setdefault(base_href, []).append(entry)
-
-    for entries in grouped.values():
-        # entries 已按原有 TOC 顺序排列
-        total = len(entries)
-        for idx, entry in enumerate(entries):
-            current_href = entry.get("href")
-            if not current_href:
-                continue
-
-            next_fragment = None
-            next_href = None
-            if idx + 1 < total:
-                next_entry = entries[idx + 1]
-                next_href = next_entry.get("href")
-                next_fragment = next_entry.get("fragment")
-
-            successors[current_href] = {
-                "next_fragment": next_fragment,
-                "next_href": next_href,
-            }
-
-    return successors
-
-
-def annotate_toc_children(flat_tocs):
-    """根据层级信息标记目录项是否包含子节点"""
-    if not flat_tocs:
-        return flat_tocs
-
-    total = len(flat_tocs)
-
-    for index, entry in enumerate(flat_tocs):
-        level = entry.get("level", 0) or 0
-
-        # 如果已有 has_children 设置，沿用并仅在未知时计算
-        has_children = entry.get("has_children")
-        if has_children is None:
-            has_children = False
-
-        if not has_children:
-            # 查找后续第一个层级 <= 当前层级的项，判断是否存在子节点
-            for next_index in range(index + 1, total):
-                next_level = flat_tocs[next_index].get("level", 0) or 0
-                if next_level <= level:
-                    break
-                has_children = True
-                break
-
-        entry["has_children"] = has_children
-
-    return flat_tocs
-
-
-def calculate_toc_page_ranges(toc_list, total_pages):
-    """
-    计算TOC条目的页面范围
-    参数:
-        toc_list: 原始TOC列表，格式为 [[level, title, start_page], ...]
-        total_pages: PDF总页数
-    返回:
-        处理后的TOC列表，每个条目包含 [level, title, start_page, end_page]
-    """
-    if not toc_list:
-        return []
-
-    toc_with_ranges = []
-
-    for i, toc in enumerate(toc_list):
-        level, title, start_page = toc[0], toc[1], toc[2]
-
-        # 找到结束页：查找下一个同级别或更高级别的条目
-        end_page = total_pages  # 默认到文档末尾
-
-        for j in range(i + 1, len(toc_list)):
-            next_toc = toc_list[j]
-            next_level = next_toc[0]
-            next_start_page = next_toc[2]
-
-            # 如果找到同级别或更高级别的条目，结束页为其起始页减1
-            if next_level <= level:
-                end_page = next_start_page - 1
-                break
-
-        # 确保结束页不小于起始页
-        end_page = max(start_page, end_page)
-
-        toc_with_ranges.append([level, title, start_page, end_page])
-
-    return toc_with_ranges
-
-
 def parse_and_deduplicate_page_ranges(names_list):
     """
     解析页面范围并去重
@@ -327,84 +166,30 @@ def parse_and_deduplicate_page_ranges(names_list):
     return sorted(all_pages)
 
 
-def calculate_epub_toc_page_ranges(toc_list, all_pages, fragment_successors=None):
-    """
-    计算EPUB TOC条目的页面范围
-    参数:
-        toc_list: TOC列表，格式为 [{"title": str, "href": str, "level": int}, ...]
-        all_pages: 所有页面列表，格式为 [{"title": str, "href": str}, ...]
-        fragment_successors: 片段边界映射，用于确定锚点范围
-    返回:
-        处理后的TOC列表，每个条目包含页面范围信息
-    """
-    if not toc_list or not all_pages:
-        return []
+def load_book_structure(book, book_index=None):
+    """获取书籍的目录和页面列表，优先读取上传后生成的索引"""
+    book_index = book_index or get_book_index(book)
+    if book_index is not None:
+        return book_index.toc, book_index.pages
+    return extract_book_structure(book)
 
-    fragment_successors = fragment_successors or {}
-    
-    # 创建页面href到索引的映射，支持锚点和基础href
-    page_href_to_index = {}
-    for idx, page in enumerate(all_pages):
-        page_href = page.get("href", "")
-        base = page_href.split("#")[0]
-        if page_href not in page_href_to_index:
-            page_href_to_index[page_href] = idx
-        if base not in page_href_to_index:
-            page_href_to_index[base] = idx
-    
-    toc_with_ranges = []
-    
-    for i, toc in enumerate(toc_list):
-        title = toc["title"]
-        href = toc.get("href", "")
-        base_href = toc.get("base_href") or href.split("#")[0]
-        level = toc["level"]
-
-        # 找到当前TOC条目对应的页面索引
-        start_page_index = page_href_to_index.get(base_href)
-        if start_page_index is None:
-            # 如果找不到对应页面，跳过这个TOC条目
-            continue
-        
-        # 找到结束页面索引：查找下一个同级别或更高级别的条目
-        end_page_index = len(all_pages) - 1  # 默认到文档末尾
-        
-        for j in range(i + 1, len(toc_list)):
-            next_toc = toc_list[j]
-            next_level = next_toc["level"]
-            next_href = next_toc.get("base_href") or next_toc.get("href", "").split("#")[0]
-
-            # 如果找到同级别或更高级别的条目
-            if next_level <= level:
-                next_page_index = page_href_to_index.get(next_href)
-                if next_page_index is not None:
-                    end_page_index = next_page_index - 1
-                    break
-        
-        # 确保结束页面索引不小于起始页面索引
-        end_page_index = max(start_page_index, end_page_index)
-        
-        # 获取页面范围内的所有页面href
-        page_hrefs = [all_pages[idx]["href"] for idx in range(start_page_index, end_page_index + 1)]
-        
-        next_fragment_info = fragment_successors.get(href, {})
-
-        toc_with_ranges.append({
-            "title": title,
-            "href": href,
-            "page_refs": ",".join(page_hrefs),  # 使用逗号分隔的多个页面href
-            "base_href": base_href,
-            "start_page_index": start_page_index,
-            "end_page_index": end_page_index,
-            "level": level,
-            "page_count": len(page_hrefs),
-            "has_children": toc.get("has_children"),
-            "fragment": toc.get("fragment"),
-            "next_fragment": next_fragment_info.get("next_fragment"),
-            "next_href": next_fragment_info.get("next_href"),
-        })
 
-    return toc_with_ranges
+def read_pdf_page_text(book, page_index, book_index=None):
+    """读取PDF单页文本（从0开始），有索引时直接取索引中的片段"""
+    if book_index is not None and 0 <= page_index < len(book_index):
+        return book_index.page_text(page_index)
+    with lease_pdf(book.file.path) as pbook:
+        return pbook[page_index].get_text()
+
+
+def read_epub_page_text(book, href, book_index=None):
+    """读取EPUB整篇文档的文本；带锚点的 href 需要按片段截取，不走索引"""
+    if book_index is not None and '#' not in href:
+        page_index = book_index.page_index_of(href)
+        if page_index is not None:
+            return book_index.page_text(page_index)
+    with lease_ebook(book.file.path) as ebook:
+        return get_content_with_href(ebook, href)
 
 
 @login_required
@@ -412,77 +197,19 @@ def index(request, book_id):
     """Display book index with table of contents and pages"""
     book = get_object_or_404(Books, pk=book_id)
     default_tts_provider = TTSProviderConfig.get_default_provider()
-    if book.file_type == ".pdf":
-        pbook = open_pdf(book.file.path)
-        # 计算TOC页面范围
-        toc_list = pbook.get_toc()
-        total_pages = len(list(pbook.pages()))
-        toc_with_ranges = calculate_toc_page_ranges(toc_list, total_pages)
-        
-        tocs = [
-            {
-                "title": f"{toc[1]}", 
-                "href": f"{toc[2]}-{toc[3]}",
-                "start_page": toc[2],
-                "end_page": toc[3],
-                "level": toc[0] - 1 if toc[0] > 0 else 0  # PDF层级从1开始，转换为从0开始
-            } for toc in toc_with_ranges
-        ]
-        annotate_toc_children(tocs)
-
-        return render(
-            request,
-            "index.html",
-            {
-                "book": book,  # Pass the entire book object for access to pdf_type
-                "book_id": book.id,
-                "title": book.name,  # Always use the database book name
-                "tocs": tocs,
-                "pages": [
-                    {"title": f"第{page.number+1}页", "href": page.number}
-                    for page in pbook.pages()
-                ],
-                "default_tts_provider": default_tts_provider,
-            },
-        )
-    elif book.file_type == ".epub":
-        ebook = open_ebook(book.file.path)
-        all_pages = ebook_pages(ebook)
-        toc_list = ebook_toc_with_level(ebook)
-        fragment_successors = build_epub_fragment_successors(toc_list)
-        toc_with_ranges = calculate_epub_toc_page_ranges(toc_list, all_pages, fragment_successors)
-        
-        tocs = [
-            {
-                "title": toc.get("title"),
-                "href": toc.get("href"),  # 保留原始href用于展示和定位
-                "page_refs": toc.get("page_refs"),
-                "base_href": toc.get("base_href"),
-                "level": toc.get("level", 0),
-                "start_page_index": toc.get("start_page_index"),
-                "end_page_index": toc.get("end_page_index"),
-                "page_count": toc.get("page_count", 1),
-                "has_children": toc.get("has_children"),
-                "fragment": toc.get("fragment"),
-                "next_fragment": toc.get("next_fragment"),
-                "next_href": toc.get("next_href"),
-            }
-            for toc in toc_with_ranges
-        ]
-        annotate_toc_children(tocs)
-
-        return render(
-            request,
-            "index.html",
-            {
-                "book": book,  # Pass the entire book object for access to pdf_type
-                "book_id": book.id,
-                "title": book.name,  # Always use the database book name
-                "tocs": tocs,
-                "pages": all_pages,
-                "default_tts_provider": default_tts_provider,
-            },
-        )
+    tocs, pages = load_book_structure(book)
+    return render(
+        request,
+        "index.html",
+        {
+            "book": book,  # Pass the entire book object for access to pdf_type
+            "book_id": book.id,
+            "title": book.name,  # Always use the database book name
+            "tocs": tocs,
+            "pages": pages,
+            "default_tts_provider": default_tts_provider,
+        },
+    )
 
 
 @login_required
@@ -496,6 +223,9 @@ def upload(request):
                 instance = form.save(commit=False)
                 instance.setkw(request.user)
                 instance.save()
+                # 后台生成文本/目录索引和页面缩略图，之后的阅读请求直接读取
+                schedule_book_index(instance)
+                schedule_page_thumbnails(instance)
 
                 # 成功上传后跳转到书籍详情页
                 return redirect(reverse("index", args=[instance.id]))
@@ -543,100 +273,33 @@ def my_upload_list(request):
 def toc(request, book_id):
     """Display book table of contents"""
     book = get_object_or_404(Books, pk=book_id)
-
-    if book.file_type == ".pdf":
-        pbook = open_pdf(book.file.path)
-        # 计算TOC页面范围
-        toc_list = pbook.get_toc()
-        total_pages = len(list(pbook.pages()))
-        toc_with_ranges = calculate_toc_page_ranges(toc_list, total_pages)
-        
-        tocs = [
-            {
-                "title": f"{toc[1]}", 
-                "href": f"{toc[2]}-{toc[3]}",
-                "start_page": toc[2],
-                "end_page": toc[3],
-                "level": toc[0] - 1 if toc[0] > 0 else 0  # PDF层级从1开始，转换为从0开始
-            } for toc in toc_with_ranges
-        ]
-        annotate_toc_children(tocs)
-
-        return render(
-            request,
-            "toc.html",
-            {
-                "book_id": book.id,
-                "title": book.name,  # Already using database book name
-                "tocs": tocs,
-            },
-        )
-    elif book.file_type == ".epub":
-        ebook = open_ebook(book.file.path)
-        all_pages = ebook_pages(ebook)
-        toc_list = ebook_toc_with_level(ebook)
-        fragment_successors = build_epub_fragment_successors(toc_list)
-        toc_with_ranges = calculate_epub_toc_page_ranges(toc_list, all_pages, fragment_successors)
-        
-        tocs = [
-            {
-                "title": toc.get("title"), 
-                "href": toc.get("href"),
-                "page_refs": toc.get("page_refs"),
-                "base_href": toc.get("base_href"),
-                "level": toc.get("level", 0),
-                "start_page_index": toc.get("start_page_index"),
-                "end_page_index": toc.get("end_page_index"),
-                "page_count": toc.get("page_count", 1),
-                "has_children": toc.get("has_children"),
-                "fragment": toc.get("fragment"),
-                "next_fragment": toc.get("next_fragment"),
-                "next_href": toc.get("next_href"),
-            }
-            for toc in toc_with_ranges
-        ]
-        annotate_toc_children(tocs)
-
-        return render(
-            request,
-            "toc.html",
-            {
-                "book_id": book.id,
-                "title": book.name,  # Use database book name instead of ebook.title
-                "tocs": tocs,
-            },
-        )
+    tocs, _ = load_book_structure(book)
+    return render(
+        request,
+        "toc.html",
+        {
+            "book_id": book.id,
+            "title": book.name,  # Use database book name instead of ebook.title
+            "tocs": tocs,
+        },
+    )
 
 
 @login_required
 def pages(request, book_id):
     """Display book pages list"""
     book = get_object_or_404(Books, pk=book_id)
-    if book.file_type == ".pdf":
-        pbook = open_pdf(book.file.path)
-        return render(
-            request,
-            "pages.html",
-            {
-                "book_id": book.id,
-                "title": book.name,  # Already using database book name
-                "pages": [
-                    {"title": f"第{page.number+1}页", "href": page.number}
-                    for page in pbook.pages()
-                ],
-            },
-        )
-    elif book.file_type == ".epub":
-        ebook = open_ebook(book.file.path)
-        return render(
-            request,
-            "pages.html",
-            {
-                "book_id": book.id,
-                "title": book.name,  # Use database book name instead of ebook.title
-                "pages": ebook_pages(ebook),
-            },
-        )
+    _, book_pages = load_book_structure(book)
+    return render(
+        request,
+        "pages.html",
+        {
+            "book_id": book.id,
+            "title": book.name,  # Use database book name instead of ebook.title
+            "pages": book_pages,
+            "show_thumbnails": book.file_type == ".pdf",
+        },
+    )
 
 
 @login_required
@@ -675,18 +338,15 @@ def text_by_toc(request, book_id):
     combined_texts = []
     ocr_results = []  # Store OCR metadata
     non_cached_count = 0  # Track non-cached OCR results for point deduction
-    ebook = None
     seen_epub_targets = set()
     epub_toc_lookup = {}
     epub_toc_lookup_by_base = {}
 
+    book_index = get_book_index(book)
+
     if book.file_type == ".epub":
         try:
-            ebook = open_ebook(book.file.path)
-            all_pages = ebook_pages(ebook)
-            toc_list = ebook_toc_with_level(ebook)
-            fragment_successors = build_epub_fragment_successors(toc_list)
-            toc_with_ranges = calculate_epub_toc_page_ranges(toc_list, all_pages, fragment_successors)
+            toc_with_ranges, _ = load_book_structure(book, book_index)
 
             for entry in toc_with_ranges:
                 href_key = entry.get("href")
@@ -697,7 +357,6 @@ def text_by_toc(request, book_id):
                 if base_key and base_key not in epub_toc_lookup_by_base:
                     epub_toc_lookup_by_base[base_key] = entry
         except Exception:  # noqa: BLE001
-            ebook = None
             epub_toc_lookup = {}
             epub_toc_lookup_by_base = {}
 
@@ -729,8 +388,7 @@ def text_by_toc(request, book_id):
 
                             # PDF TOC页面编号从1开始，转换为从0开始的索引
                             page_index = page_num - 1
-                            image_data = get_page_image_data(book.file.path, page_index)
-                            ocr_result = perform_ocr_with_cache(image_data, ak, sk, 'page_image')
+                            ocr_result = perform_page_ocr_with_cache(book, page_index, ak, sk)
 
                             if 'error' not in ocr_result:
                                 text_content = ocr_result.get('text', '')
@@ -747,10 +405,8 @@ def text_by_toc(request, book_id):
                                 })
                             else:
                                 # Fall back to regular text extraction on OCR error
-                                pbook = open_pdf(book.file.path)
                                 # PDF TOC页面编号从1开始，转换为从0开始的索引
-                                page_index = int(single_name) - 1
-                                text_content = pbook[page_index].get_text()
+                                text_content = read_pdf_page_text(book, int(single_name) - 1, book_index)
                                 ocr_results.append({
                                     'page': single_name,
                                     'error': ocr_result['error'],
@@ -758,10 +414,8 @@ def text_by_toc(request, book_id):
                                 })
                         except Exception as ocr_error:
                             # Fall back to regular text extraction on OCR error
-                            pbook = open_pdf(book.file.path)
                             # PDF TOC页面编号从1开始，转换为从0开始的索引
-                            page_index = int(single_name) - 1
-                            text_content = pbook[page_index].get_text()
+                            text_content = read_pdf_page_text(book, int(single_name) - 1, book_index)
                             ocr_results.append({
                                 'page': single_name,
                                 'error': str(ocr_error),
@@ -769,10 +423,8 @@ def text_by_toc(request, book_id):
                             })
                     else:
                         # OCR not configured, use regular extraction
-                        pbook = open_pdf(book.file.path)
                         # PDF TOC页面编号从1开始，转换为从0开始的索引
-                        page_index = int(single_name) - 1
-                        text_content = pbook[page_index].get_text()
+                        text_content = read_pdf_page_text(book, int(single_name) - 1, book_index)
                         if use_ocr_auto:
                             ocr_results.append({
                                 'page': single_name,
@@ -781,19 +433,14 @@ def text_by_toc(request, book_id):
                             })
                 else:
                     # Regular text extraction
-                    pbook = open_pdf(book.file.path)
                     # 经过去重处理后，single_name现在是单页编号
                     # PDF TOC页面编号从1开始，转换为从0开始的索引
-                    page_index = int(single_name) - 1
-                    text_content = pbook[page_index].get_text()
+                    text_content = read_pdf_page_text(book, int(single_name) - 1, book_index)
 
             except Exception as e:
                 text_content = f"Error extracting text: {str(e)}"
         elif book.file_type == ".epub":
             try:
-                if ebook is None:
-                    ebook = open_ebook(book.file.path)
-
                 page_ref = single_name.strip()
                 if not page_ref:
                     continue
@@ -830,7 +477,11 @@ def text_by_toc(request, book_id):
                 for page_href in page_hrefs:
                     effective_href = page_ref if first_page and fragment else page_href
                     end_fragment = next_fragment if first_page else None
-                    page_text = get_content_with_href(ebook, effective_href, end_fragment=end_fragment)
+                    if end_fragment:
+                        with lease_ebook(book.file.path) as ebook:
+                            page_text = get_content_with_href(ebook, effective_href, end_fragment=end_fragment)
+                    else:
+                        page_text = read_epub_page_text(book, effective_href, book_index)
                     if page_text.strip():
                         page_texts.append(page_text)
                     first_page = False
@@ -924,7 +575,9 @@ def text_by_page(request, book_id):
                 "available_points": points_check['available_points']
             }, status=402)
     
+    book_index = get_book_index(book)
     non_cached_count = 0  # Track non-cached OCR results for point deduction
+    last_ocr_page = None  # Last page read via OCR, used to prefetch the following pages
     
     for page_name in names:
         page_text = ""
@@ -939,28 +592,30 @@ def text_by_page(request, book_id):
                     if ak and sk:
                         try:
                             page_num = int(page_name)
-                            # Get page image data and perform OCR
-                            image_data = get_page_image_data(book.file.path, page_num)
-                            ocr_result = perform_ocr_with_cache(image_data, ak, sk, 'page_image')
+                            # Perform OCR (page cache is checked before rendering)
+                            ocr_result = perform_page_ocr_with_cache(book, page_num, ak, sk)
                             
                             if 'error' not in ocr_result:
                                 page_text = ocr_result.get('text', '')
                                 is_cached = ocr_result.get('cached', False)
+                                # Prefetched results are charged when they are first read
+                                prefetched = consume_prefetched_page(request.user, book, page_num)
+                                last_ocr_page = page_num
                                 
                                 # Count non-cached results for point deduction
-                                if not is_cached and use_ocr_auto:
+                                if (not is_cached or prefetched) and use_ocr_auto:
                                     non_cached_count += 1
                                 
                                 ocr_results.append({
                                     'page': page_name,
                                     'cached': is_cached,
+                                    'prefetched': prefetched,
                                     'image_md5': ocr_result.get('image_md5', ''),
                                     'auto_ocr': use_ocr_auto  # Mark if OCR was used automatically
                                 })
                             else:
                                 # Fall back to regular text extraction on OCR error
-                                pbook = open_pdf(book.file.path)
-                                page_text = pbook[int(page_name)].get_text()
+                                page_text = read_pdf_page_text(book, int(page_name), book_index)
                                 ocr_results.append({
                                     'page': page_name,
                                     'error': ocr_result['error'],
@@ -968,8 +623,7 @@ def text_by_page(request, book_id):
                                 })
                         except Exception as ocr_error:
                             # Fall back to regular text extraction on OCR error
-                            pbook = open_pdf(book.file.path)
-                            page_text = pbook[int(page_name)].get_text()
+                            page_text = read_pdf_page_text(book, int(page_name), book_index)
                             ocr_results.append({
                                 'page': page_name,
                                 'error': str(ocr_error),
@@ -977,8 +631,7 @@ def text_by_page(request, book_id):
                             })
                     else:
                         # OCR not configured, use regular extraction
-                        pbook = open_pdf(book.file.path)
-                        page_text = pbook[int(page_name)].get_text()
+                        page_text = read_pdf_page_text(book, int(page_name), book_index)
                         if use_ocr_auto:
                             # Add note that OCR was suggested but not available
                             ocr_results.append({
@@ -988,8 +641,7 @@ def text_by_page(request, book_id):
                             })
                 else:
                     # Regular text extraction
-                    pbook = open_pdf(book.file.path)
-                    page_text = pbook[int(page_name)].get_text()
+                    page_text = read_pdf_page_text(book, int(page_name), book_index)
                 
                 # Apply line filtering to individual page content
                 if head_cut > 0 or tail_cut > 0 or line_count:
@@ -1014,20 +666,19 @@ def text_by_page(request, book_id):
                 page_text = f"Error extracting text for page {page_name}: {str(e)}"
         elif book.file_type == ".epub":
             try:
-                ebook = open_ebook(book.file.path)
                 # 检查是否是多页面格式（逗号分隔）
                 if ',' in page_name:
                     # 多页面模式：获取多个页面的内容
                     page_hrefs = page_name.split(',')
                     combined_page_texts = []
                     for href in page_hrefs:
-                        individual_page_text = get_content_with_href(ebook, href.strip())
+                        individual_page_text = read_epub_page_text(book, href.strip(), book_index)
                         if individual_page_text.strip():  # 只添加非空页面
                             combined_page_texts.append(individual_page_text)
                     page_text = "\n\n".join(combined_page_texts)
                 else:
                     # 单页面模式（保持向后兼容）
-                    page_text = get_content_with_href(ebook, page_name)
+                    page_text = read_epub_page_text(book, page_name, book_index)
                 
                 # Apply line filtering to combined page content
                 if head_cut > 0 or tail_cut > 0 or line_count:
@@ -1060,6 +711,11 @@ def text_by_page(request, book_id):
     if use_ocr_auto and non_cached_count > 0:
         deduct_points_for_ocr(request.user, non_cached_count, auto_ocr=True)
     
+    # Queue OCR for the next pages in the background (opt-in via OCR_PREFETCH_PAGES)
+    prefetch_pages = []
+    if last_ocr_page is not None:
+        prefetch_pages = schedule_ocr_prefetch(request.user, book, last_ocr_page)
+    
     # Prepare response data
     response_data = {
         "status": "success",
@@ -1075,10 +731,14 @@ def text_by_page(request, book_id):
         if ocr_results:
             response_data["ocr_results"] = ocr_results
             response_data["cached_count"] = sum(1 for r in ocr_results if r.get('cached', False))
+            response_data["prefetch_pages"] = prefetch_pages
             
             # Add points information for automatic OCR
             if use_ocr_auto:
-                non_cached_count = sum(1 for r in ocr_results if not r.get('cached', False) and 'error' not in r)
+                non_cached_count = sum(
+                    1 for r in ocr_results
+                    if (not r.get('cached', False) or r.get('prefetched')) and 'error' not in r
+                )
                 if non_cached_count > 0:
                     from home.utils import PointsManager
                     response_data["points_deducted"] = PointsManager.get_ocr_processing_points(non_cached_count)
@@ -1089,6 +749,91 @@ def text_by_page(request, book_id):
     return JsonResponse(response_data)
 
 
+def _collect_epub_html_segments(ebook, book_id, flattened_ids):
+    """按章节标识取出 EPUB 原始 HTML，图片地址改写为资源接口"""
+    html_segments = []
+    seen_sources = set()
+
+    for identifier in flattened_ids:
+        if not identifier:
+            continue
+
+        base_identifier = identifier.split('#')[0]
+        candidates = [base_identifier]
+        if '_' in base_identifier:
+            candidates.append(base_identifier.replace('_', '/'))
+
+        content_found = False
+        for candidate in candidates:
+            candidate = candidate.strip()
+            if not candidate or candidate in seen_sources:
+                continue
+            try:
+                item = ebook.get_item_with_href(candidate)
+            except KeyError:
+                item = None
+
+            if item:
+                try:
+                    raw_content = item.get_content()
+                    if isinstance(raw_content, bytes):
+                        html = raw_content.decode('utf-8', errors='ignore')
+                    else:
+                        html = raw_content
+
+                    soup = BeautifulSoup(html, 'html.parser')
+
+                    for img in soup.find_all('img'):
+                        src = img.get('src')
+                        if not src or src.startswith('data:') or src.startswith('http'):
+                            continue
+
+                        base_dir = posixpath.dirname(candidate)
+                        normalized_src = posixpath.normpath(posixpath.join(base_dir, src)) if base_dir else src
+
+                        asset_href = None
+                        try:
+                            ebook.get_item_with_href(normalized_src)
+                            asset_href = normalized_src
+                        except KeyError:
+                            try:
+                                ebook.get_item_with_href(src)
+                                asset_href = src
+                            except KeyError:
+                                continue
+
+                        asset_url = f"{reverse('get_epub_asset', args=[book_id])}?href={quote(asset_href)}"
+                        try:
+                            # 带上内容版本号，浏览器可以长期缓存而不必每次验证
+                            asset_url += f"&v={ebook.asset_info(asset_href).version}"
+                        except KeyError:
+                            pass
+                        if settings.EPUB_IMAGE_MAX_WIDTH:
+                            asset_url += f"&w={settings.EPUB_IMAGE_MAX_WIDTH}"
+                        img['src'] = asset_url
+
+                    html_segments.append(f'<article data-source="{candidate}">{soup.decode()}</article>')
+                    seen_sources.add(candidate)
+                    content_found = True
+                    break
+                except Exception:
+                    continue
+
+        if not content_found:
+            fallback_id = base_identifier.replace('_', '/')
+            try:
+                fallback_html = get_content_with_href(ebook, fallback_id)
+                if fallback_html and fallback_id not in seen_sources:
+                    html_segments.append(
+                        f'<article data-source="{fallback_id}"><pre>{fallback_html}</pre></article>'
+                    )
+                    seen_sources.add(fallback_id)
+            except Exception:
+                continue
+
+    return html_segments
+
+
 @login_required
 @require_http_methods(["POST"])
 def get_original_content(request, book_id):
@@ -1177,86 +922,14 @@ def get_original_content(request, book_id):
 
     if file_type == '.epub':
         try:
-            ebook = open_ebook(book.file.path)
+            with lease_ebook(book.file.path) as ebook:
+                html_segments = _collect_epub_html_segments(ebook, book_id, flattened_ids)
         except Exception as exc:
             return JsonResponse({
                 'status': 'error',
                 'message': f'加载书籍失败: {exc}'
             }, status=500)
 
-        html_segments = []
-        seen_sources = set()
-
-        for identifier in flattened_ids:
-            if not identifier:
-                continue
-
-            base_identifier = identifier.split('#')[0]
-            candidates = [base_identifier]
-            if '_' in base_identifier:
-                candidates.append(base_identifier.replace('_', '/'))
-
-            content_found = False
-            for candidate in candidates:
-                candidate = candidate.strip()
-                if not candidate or candidate in seen_sources:
-                    continue
-                try:
-                    item = ebook.get_item_with_href(candidate)
-                except KeyError:
-                    item = None
-
-                if item:
-                    try:
-                        raw_content = item.get_content()
-                        if isinstance(raw_content, bytes):
-                            html = raw_content.decode('utf-8', errors='ignore')
-                        else:
-                            html = raw_content
-
-                        soup = BeautifulSoup(html, 'html.parser')
-
-                        for img in soup.find_all('img'):
-                            src = img.get('src')
-                            if not src or src.startswith('data:') or src.startswith('http'):
-                                continue
-
-                            base_dir = posixpath.dirname(candidate)
-                            normalized_src = posixpath.normpath(posixpath.join(base_dir, src)) if base_dir else src
-
-                            asset_href = None
-                            try:
-                                ebook.get_item_with_href(normalized_src)
-                                asset_href = normalized_src
-                            except KeyError:
-                                try:
-                                    ebook.get_item_with_href(src)
-                                    asset_href = src
-                                except KeyError:
-                                    continue
-
-                            asset_url = f"{reverse('get_epub_asset', args=[book_id])}?href={quote(asset_href)}"
-                            img['src'] = asset_url
-
-                        html_segments.append(f'<article data-source="{candidate}">{soup.decode()}</article>')
-                        seen_sources.add(candidate)
-                        content_found = True
-                        break
-                    except Exception:
-                        continue
-
-            if not content_found:
-                fallback_id = base_identifier.replace('_', '/')
-                try:
-                    fallback_html = get_content_with_href(ebook, fallback_id)
-                    if fallback_html and fallback_id not in seen_sources:
-                        html_segments.append(
-                            f'<article data-source="{fallback_id}"><pre>{fallback_html}</pre></article>'
-                        )
-                        seen_sources.add(fallback_id)
-                except Exception:
-                    continue
-
         if not html_segments:
             return JsonResponse({
                 'status': 'error',
@@ -1278,8 +951,15 @@ def get_original_content(request, book_id):
 
 
 @login_required
-@require_http_methods(["GET"])
+@require_http_methods(["GET", "HEAD"])
 def get_epub_asset(request, book_id):
+    """
+    返回 EPUB 内的图片、样式等资源
+
+    ETag 取自 zip 中央目录里成员的 CRC32 和大小，判断 304 不读取资源内容；
+    地址中的版本号 v 与当前内容一致时允许长期缓存，否则浏览器每次都需要重新验证。
+    资源从 zip 成员流式读取，?w= 指定宽度时位图按宽度档位缩小（结果缓存在磁盘上）。
+    """
     book = get_object_or_404(Books, pk=book_id)
 
     if book.user and book.user != request.user and not (request.user.is_staff or request.user.is_superuser):
@@ -1292,28 +972,72 @@ def get_epub_asset(request, book_id):
     if not href:
         return JsonResponse({'status': 'error', 'message': '缺少资源路径参数'}, status=400)
 
+    normalized_href = href.lstrip('/')
+
     try:
-        ebook = open_ebook(book.file.path)
+        with lease_ebook(book.file.path) as ebook:
+            info = None
+            for candidate in (normalized_href, href):
+                try:
+                    # 按 zip 成员直接查找，冷启动时不加载 OPF 清单和排版文档
+                    info = ebook.asset_info(candidate)
+                    break
+                except KeyError:
+                    continue
     except Exception as exc:
         return JsonResponse({'status': 'error', 'message': f'加载书籍失败: {exc}'}, status=500)
-
-    normalized_href = href.lstrip('/')
+    if info is None:
+        return JsonResponse({'status': 'error', 'message': '资源未找到'}, status=404)
 
     try:
-        item = ebook.get_item_with_href(normalized_href)
-    except KeyError:
-        try:
-            item = ebook.get_item_with_href(href)
-        except KeyError:
-            return JsonResponse({'status': 'error', 'message': '资源未找到'}, status=404)
+        requested_width = int(request.GET.get('w') or 0)
+    except ValueError:
+        requested_width = 0
+    width = scaled_width(requested_width) if is_scalable_image(info.media_type) else None
+
+    book_key = book_image_key(book)
+    etag = asset_etag(book_key, info, width)
+    if request.GET.get('v') == info.version:
+        # 地址带有当前内容的版本号，内容变化时地址也会变化
+        cache_control = 'private, max-age=31536000, immutable'
+    else:
+        cache_control = 'private, no-cache'
+    cache_headers = {
+        'ETag': etag,
+        # 书籍文件上传后不再改动
+        'Last-Modified': http_date(book.created_at.timestamp()),
+        'Cache-Control': cache_control,
+        'Vary': 'Cookie',
+    }
 
-    try:
-        content = item.get_content()
-    except Exception as exc:
-        return JsonResponse({'status': 'error', 'message': f'读取资源失败: {exc}'}, status=500)
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        not_modified = etag in parse_etags(if_none_match) or '*' in parse_etags(if_none_match)
+    else:
+        modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        not_modified = modified_since is not None and int(book.created_at.timestamp()) <= modified_since
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            scaled_path, scaled_size = (None, 0)
+            if width:
+                scaled_path, scaled_size = get_asset_image_cache().get_or_scale(
+                    book.file.path, book_key, info, width
+                )
+            if scaled_path:
+                response = FileResponse(open(scaled_path, 'rb'), content_type=info.media_type)
+            else:
+                stream = open_asset_stream(book.file.path, info.member)
+                response = FileResponse(stream, content_type=info.media_type)
+                response['Content-Length'] = info.size
+        except Exception as exc:
+            return JsonResponse({'status': 'error', 'message': f'读取资源失败: {exc}'}, status=500)
 
-    content_type = getattr(item, 'media_type', '') or 'application/octet-stream'
-    return HttpResponse(content, content_type=content_type)
+    for header, value in cache_headers.items():
+        response[header] = value
+    return response
 
 
 @login_required
@@ -1439,10 +1163,8 @@ def detect_scanned_pdf(request, book_id):
         return JsonResponse({"status": "error", "message": "This is not a PDF file"}, status=400)
     
     try:
-        from book2tts.pdf import detect_scanned_pdf as detect_scanned
-        
-        # Perform detection
-        result = detect_scanned(book.file.path, sample_pages=5)
+        # Perform detection (reads the per-page flags from the book index when available)
+        result = detect_book_scanned(book, sample_pages=5)
         
         # Update book's pdf_type if it was previously unknown
         if book.pdf_type == 'unknown':
@@ -1479,29 +1201,63 @@ def get_page_image(request, book_id, page_number):
     if book.file_type != ".pdf":
         return JsonResponse({"status": "error", "message": "This is not a PDF file"}, status=400)
     
-    try:
-        from book2tts.pdf import get_page_image_data
-        import base64
-        
-        # Convert page_number to int
-        page_num = int(page_number)
-        
-        # Get page image data
-        image_data = get_page_image_data(book.file.path, page_num, resolution=200)  # Higher resolution for viewing
-        
-        # Convert to base64 for web display
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        
-        return JsonResponse({
-            "status": "success",
-            "image_data": f"data:image/png;base64,{image_base64}",
-            "page_number": page_num,
-            "book_name": book.name
-        })
-    
-    except Exception as e:
-        print(f"Error getting page image: {str(e)}")
-        return JsonResponse({"status": "error", "message": f"获取页面图片失败: {str(e)}"}, status=500)
+    # 图片通过可缓存的二进制接口获取，这里只返回地址
+    image_url = f"{reverse('page_image', args=[book.id, page_number])}?tier=full"
+    return JsonResponse({
+        "status": "success",
+        "image_data": image_url,
+        "image_url": image_url,
+        "page_number": page_number,
+        "book_name": book.name
+    })
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def page_image(request, book_id, page_number):
+    """
+    返回PDF页面的二进制图片（WebP，不支持时为JPEG）
+
+    ?tier=thumb|page|full 选择尺寸档位。渲染结果持久化在磁盘缓存中，
+    响应带强 ETag 和长期 Cache-Control，浏览器重复请求时返回 304。
+    """
+    book = get_object_or_404(Books, pk=book_id)
+
+    if book.user != request.user:
+        return JsonResponse({"status": "error", "message": "You don't have permission to access this book"}, status=403)
+
+    if book.file_type != ".pdf":
+        return JsonResponse({"status": "error", "message": "This is not a PDF file"}, status=400)
+
+    tier = request.GET.get('tier', DEFAULT_PAGE_IMAGE_TIER)
+    if tier not in PAGE_IMAGE_TIERS:
+        return JsonResponse({"status": "error", "message": f"Unknown tier: {tier}"}, status=400)
+
+    image_format = preferred_image_format(request)
+    book_key = book_image_key(book)
+    cache = get_page_image_cache()
+    etag = cache.etag(book_key, page_number, tier, image_format)
+    cache_headers = {
+        "ETag": etag,
+        # 需要登录才能访问，只允许浏览器缓存；内容由 ETag 唯一确定，不会变化
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Vary": "Accept, Cookie",
+    }
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            path = cache.get_or_render(book.file.path, book_key, page_number, tier, image_format)
+        except IndexError:
+            return JsonResponse({"status": "error", "message": "Page not found"}, status=404)
+        except Exception as e:
+            return JsonResponse({"status": "error", "message": f"获取页面图片失败: {str(e)}"}, status=500)
+        response = FileResponse(open(path, 'rb'), content_type=PAGE_IMAGE_FORMATS[image_format][0])
+
+    for header, value in cache_headers.items():
+        response[header] = value
+    return response
 
 
 @login_required
@@ -6,10 +6,18 @@ from django.http import JsonResponse
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.urls import reverse
+import uuid
 
-from ..models import Books
-from ..utils.ocr_utils import perform_ocr_with_cache, perform_batch_ocr_with_cache
-from book2tts.pdf import detect_scanned_pdf, get_page_image_data
+from ..models import Books, UserTask
+from ..utils.ocr_utils import (
+    get_cached_pages_ocr,
+    ocr_service_configured,
+    page_render_key,
+    perform_page_ocr_with_cache,
+)
+from ..utils.ocr_prefetch import consume_prefetched_page, schedule_ocr_prefetch
+from ..utils.book_index import detect_book_scanned
 from home.models import UserQuota, OperationRecord
 from home.utils import PointsManager
 
@@ -39,7 +47,7 @@ def detect_pdf_scanned(request, book_id):
     
     try:
         # 检测PDF是否为扫描版
-        detection_result = detect_scanned_pdf(book.file.path)
+        detection_result = detect_book_scanned(book)
         
         return JsonResponse({
             "status": "success",
@@ -63,6 +71,7 @@ def detect_pdf_scanned(request, book_id):
 def ocr_pdf_page(request, book_id):
     """对PDF页面执行OCR识别"""
     book = get_object_or_404(Books, pk=book_id, user=request.user)
+    ip_address, user_agent = _get_client_meta(request)
     
     if book.file_type != ".pdf":
         return JsonResponse({
@@ -110,11 +119,8 @@ def ocr_pdf_page(request, book_id):
                 "message": f"积分不足，OCR单页需要{required_points}积分，当前剩余：{user_quota.points}积分"
             }, status=400)
         
-        # 获取页面图像数据
-        image_data = get_page_image_data(book.file.path, page_num)
-        
-        # 执行OCR识别（带缓存和QPS控制）
-        ocr_result = perform_ocr_with_cache(image_data, ak, sk, 'page_image')
+        # 执行OCR识别（先查页面缓存，未命中再渲染页面；带QPS控制）
+        ocr_result = perform_page_ocr_with_cache(book, page_num, ak, sk)
         
         if 'error' in ocr_result:
             OperationRecord.objects.create(
@@ -136,8 +142,10 @@ def ocr_pdf_page(request, book_id):
                 "message": f"OCR识别失败: {ocr_result['error']}"
             }, status=500)
 
-        # 如果使用了缓存结果，不扣除积分
-        if not ocr_result.get('cached', False):
+        # 如果使用了缓存结果，不扣除积分；但本用户预取的结果在此时计费
+        prefetched = consume_prefetched_page(request.user, book, page_num)
+        billable = not ocr_result.get('cached', False) or prefetched
+        if billable:
             try:
                 with transaction.atomic():
                     # 确保使用最新的配额数据
@@ -196,7 +204,7 @@ def ocr_pdf_page(request, book_id):
         points_per_page = ocr_config['points_per_unit']
 
         # 确保使用最新的积分值
-        if not ocr_result.get('cached', False):
+        if billable:
             user_quota.refresh_from_db()
         remaining_points = user_quota.points
 
@@ -204,7 +212,7 @@ def ocr_pdf_page(request, book_id):
             user=request.user,
             operation_type='ocr_process',
             operation_object=f'{book.name} - 第{page_num}页',
-            operation_detail='OCR识别成功（使用缓存结果）' if ocr_result.get('cached', False) else f'OCR识别成功，消耗{points_consumed}积分，剩余{remaining_points}积分',
+            operation_detail='OCR识别成功（使用缓存结果）' if not billable else f'OCR识别成功，消耗{points_consumed}积分，剩余{remaining_points}积分',
             status='success',
             metadata={
                 'book_id': book_id,
@@ -213,6 +221,7 @@ def ocr_pdf_page(request, book_id):
                 'points_consumed': points_consumed,
                 'remaining_points': remaining_points,
                 'cached': ocr_result.get('cached', False),
+                'prefetched': prefetched,
                 'image_md5': ocr_result.get('image_md5'),
             },
             ip_address=ip_address,
@@ -225,9 +234,11 @@ def ocr_pdf_page(request, book_id):
             "text": ocr_result['text'],
             "cached": ocr_result['cached'],
             "image_md5": ocr_result['image_md5'],
-            "message": "OCR识别完成" + ("（使用缓存结果，不消耗积分）" if ocr_result['cached'] else f"，已扣除{points_per_page}积分"),
-            "remaining_points": remaining_points if not ocr_result.get('cached', False) else None,
-            "points_per_page": points_per_page
+            "message": "OCR识别完成" + ("（使用缓存结果，不消耗积分）" if not billable else f"，已扣除{points_per_page}积分"),
+            "remaining_points": remaining_points if billable else None,
+            "points_per_page": points_per_page,
+            "prefetched": prefetched,
+            "prefetch_pages": schedule_ocr_prefetch(request.user, book, page_num),
         })
         
     except IndexError as e:
@@ -266,7 +277,7 @@ def ocr_pdf_page(request, book_id):
 @csrf_exempt
 @require_http_methods(["POST"]) 
 def ocr_pdf_pages_batch(request, book_id):
-    """批量对PDF页面执行OCR识别（自动QPS控制）"""
+    """提交批量PDF页面OCR识别任务（后台执行，自动QPS控制）"""
     book = get_object_or_404(Books, pk=book_id, user=request.user)
     ip_address, user_agent = _get_client_meta(request)
     
@@ -284,14 +295,11 @@ def ocr_pdf_pages_batch(request, book_id):
             "message": "缺少page_range参数，格式如: 1-5 或 1,3,5"
         }, status=400)
     
-    # 检查OCR配置
-    ak = getattr(settings, 'VOLCENGINE_ACCESS_KEY', None)
-    sk = getattr(settings, 'VOLCENGINE_SECRET_KEY', None)
-    
-    if not ak or not sk:
+    # 检查OCR配置（任务执行时再读取密钥，不经过消息队列传递）
+    if not ocr_service_configured():
         return JsonResponse({
             "status": "error",
-            "message": "OCR服务未配置，请联系管理员设置火山引擎密钥"
+            "message": "OCR服务未配置，请联系管理员设置OCR密钥"
         }, status=500)
     
     try:
@@ -316,8 +324,9 @@ def ocr_pdf_pages_batch(request, book_id):
             if page_num < 0:
                 raise ValueError(f"页码 {page_num} 不能为负数")
         
-        # 计算需要OCR的实际页面数（排除缓存结果）
-        new_pages_count = len(page_nums)
+        # 计算需要OCR的实际页面数（排除页面缓存命中的结果，无需渲染）
+        cached_pages = get_cached_pages_ocr(book.md5_hash, page_nums, page_render_key())
+        new_pages_count = sum(1 for page_num in page_nums if page_num not in cached_pages)
         required_points = PointsManager.get_ocr_processing_points(new_pages_count)
         
         # 检查是否有足够的积分
@@ -327,142 +336,41 @@ def ocr_pdf_pages_batch(request, book_id):
                 "message": f"积分不足，批量OCR需要{required_points}积分（每页{PointsManager.get_points_config('ocr_processing')['points_per_unit']}积分），当前剩余：{user_quota.points}积分"
             }, status=400)
         
-        # 准备图像数据列表
-        image_data_list = []
-        for page_num in page_nums:
-            try:
-                image_data = get_page_image_data(book.file.path, page_num)
-                image_data_list.append({
-                    'data': image_data,
-                    'page_num': page_num
-                })
-            except Exception as e:
-                image_data_list.append({
-                    'data': None,
-                    'page_num': page_num,
-                    'error': str(e)
-                })
-        
-        # 批量OCR识别（自动遵守QPS限制）
-        results = []
-        actual_new_ocr_count = 0
-        for item in image_data_list:
-            if item.get('error'):
-                results.append({
-                    'page_num': item['page_num'],
-                    'text': '',
-                    'cached': False,
-                    'image_md5': '',
-                    'error': item['error']
-                })
-            else:
-                ocr_result = perform_ocr_with_cache(item['data'], ak, sk, 'page_image')
-                ocr_result['page_num'] = item['page_num']
-                
-                # 统计实际新增的OCR（非缓存结果）
-                if not ocr_result.get('cached', False):
-                    actual_new_ocr_count += 1
-                
-                results.append(ocr_result)
-        
-        # 扣除积分（仅扣除实际执行OCR的页面）
-        actual_points_consumed = 0
-        if actual_new_ocr_count > 0:
-            actual_points_consumed = PointsManager.get_ocr_processing_points(actual_new_ocr_count)
-            try:
-                with transaction.atomic():
-                    # 确保使用最新的配额数据
-                    user_quota.refresh_from_db()
-                    
-                    if user_quota.points < actual_points_consumed:
-                        OperationRecord.objects.create(
-                            user=request.user,
-                            operation_type='ocr_process',
-                            operation_object=f'{book.name} - 批量OCR {len(page_nums)}页',
-                            operation_detail='批量OCR识别失败：积分不足',
-                            status='failed',
-                            metadata={
-                                'book_id': book_id,
-                                'book_name': book.name,
-                                'total_pages': len(page_nums),
-                                'new_ocr_pages': actual_new_ocr_count,
-                            },
-                            ip_address=ip_address,
-                            user_agent=user_agent,
-                        )
-                        return JsonResponse({
-                            "status": "error",
-                            "message": "积分不足，无法完成OCR操作"
-                        }, status=400)
-                    
-                    user_quota.consume_points(actual_points_consumed)
-                    user_quota.save()
-                    user_quota.refresh_from_db()
-            except Exception as e:
-                OperationRecord.objects.create(
-                    user=request.user,
-                    operation_type='ocr_process',
-                    operation_object=f'{book.name} - 批量OCR {len(page_nums)}页',
-                    operation_detail=f'批量OCR识别失败：积分扣除异常 {str(e)}',
-                    status='failed',
-                    metadata={
-                        'book_id': book_id,
-                        'book_name': book.name,
-                        'total_pages': len(page_nums),
-                        'new_ocr_pages': actual_new_ocr_count,
-                    },
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                )
-                return JsonResponse({
-                    "status": "error",
-                    "message": f"积分扣除失败：{str(e)}"
-                }, status=500)
+        # 提交后台任务：逐页 缓存检查 → 渲染 → OCR → 持久化，进度与部分结果可随时查询
+        from ..tasks import batch_ocr_task
 
-        remaining_points = user_quota.points
-
-        # 记录操作（无论是否全部来自缓存）
-        OperationRecord.objects.create(
+        task_id = str(uuid.uuid4())
+        UserTask.objects.create(
             user=request.user,
-            operation_type='ocr_process',
-            operation_object=f'{book.name} - 批量OCR {len(page_nums)}页',
-            operation_detail=(
-                '批量OCR识别成功（全部使用缓存结果）'
-                if actual_new_ocr_count == 0
-                else f'批量OCR识别成功，实际消耗{actual_points_consumed}积分（{actual_new_ocr_count}页新识别），剩余{remaining_points}积分'
-            ),
-            status='success',
+            task_id=task_id,
+            task_type='batch_ocr',
+            book=book,
+            title=f'批量OCR: {book.name} {page_range}',
+            status='pending',
+            progress_message='批量OCR任务等待执行中...',
             metadata={
                 'book_id': book_id,
-                'book_name': book.name,
-                'total_pages': len(page_nums),
-                'new_ocr_pages': actual_new_ocr_count,
-                'cached_pages': len(page_nums) - actual_new_ocr_count,
-                'points_consumed': actual_points_consumed,
-                'remaining_points': remaining_points,
+                'page_range': page_range,
+                'page_nums': page_nums,
             },
-            ip_address=ip_address,
-            user_agent=user_agent,
         )
-        
-        # 统计结果
-        success_count = sum(1 for r in results if not r.get('error'))
-        cached_count = sum(1 for r in results if r.get('cached'))
-        
-        # 确保使用最新的积分值（如果执行了OCR操作）
-        if actual_new_ocr_count > 0:
-            user_quota.refresh_from_db()
-        
+        batch_ocr_task.apply_async(
+            kwargs={
+                'user_id': request.user.id,
+                'book_id': book_id,
+                'page_nums': page_nums,
+                'ip_address': ip_address,
+                'user_agent': user_agent,
+            },
+            task_id=task_id,
+        )
+
         return JsonResponse({
             "status": "success",
-            "total_pages": len(results),
-            "success_count": success_count,
-            "cached_count": cached_count,
-            "results": results,
-            "actual_points_consumed": actual_points_consumed if actual_new_ocr_count > 0 else 0,
-            "remaining_points": user_quota.points,
-            "message": f"批量OCR识别完成，成功 {success_count}/{len(results)} 页" + 
-                      (f"，已扣除{actual_points_consumed}积分" if actual_new_ocr_count > 0 else "，全部使用缓存结果")
+            "task_id": task_id,
+            "total_pages": len(page_nums),
+            "results_url": reverse('ocr_batch_results', args=[book_id, task_id]),
+            "message": f"批量OCR任务已提交，共 {len(page_nums)} 页，正在后台处理..."
         })
         
     except ValueError as e:
@@ -495,3 +403,45 @@ def ocr_pdf_pages_batch(request, book_id):
             "status": "error",
             "message": f"批量OCR识别失败: {str(e)}"
         }, status=500)
+
+
+@login_required
+@require_http_methods(["GET"])
+def ocr_batch_results(request, book_id, task_id):
+    """查询批量OCR任务的进度与结果（任务进行中返回已完成页面的部分结果）"""
+    book = get_object_or_404(Books, pk=book_id, user=request.user)
+    user_task = get_object_or_404(
+        UserTask, task_id=task_id, user=request.user, book=book, task_type='batch_ocr'
+    )
+
+    progress = user_task.result_data or {}
+    pages = progress.get('pages', [])
+
+    # 识别文本保存在OCR缓存中，这里按页取回，任务记录只保存每页状态
+    texts = get_cached_pages_ocr(
+        book.md5_hash, [page['page_num'] for page in pages], page_render_key()
+    )
+    results = []
+    for page in pages:
+        cached = texts.get(page['page_num'])
+        results.append({
+            'page_num': page['page_num'],
+            'text': cached['text'] if cached else '',
+            'cached': page.get('cached', False),
+            'image_md5': cached['image_md5'] if cached else '',
+            **({'error': page['error']} if page.get('error') else {}),
+        })
+
+    return JsonResponse({
+        "status": "success",
+        "task_status": user_task.status,
+        "message": user_task.progress_message,
+        "error_message": user_task.error_message,
+        "total_pages": progress.get('total_pages', len(user_task.metadata.get('page_nums', []))),
+        "completed": progress.get('completed', 0),
+        "cached_count": progress.get('cached_count', 0),
+        "new_ocr_count": progress.get('new_ocr_count', 0),
+        "failed_count": progress.get('failed_count', 0),
+        "points_consumed": progress.get('points_consumed', 0),
+        "results": results,
+    })
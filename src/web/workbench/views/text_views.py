@@ -1,14 +1,39 @@
 import logging
 import time
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.http import StreamingHttpResponse, HttpResponse
 
+from book2tts.page_cleaner import CleanStats, clean_text, passes_quality_checks
+from book2tts.text_chunker import budget_for, iter_chunks, split_text
 from home.models import OperationRecord
 from web.workbench.utils.points_utils import deduct_llm_points
 
 
+# System prompt for text formatting
+REFORMAT_SYSTEM_PROMPT = """
+# Role: 我是一个专门用于排版文本内容的 AI 角色
+
+## Goal: 将输入的文本内容，重新排版后输出，只输出排版后的文本内容
+
+## Constrains:
+- 严格保持原有语言，不进行任何语言转换（如中文保持中文，英文保持英文）
+- 输出纯文本
+- 去除页码(数字）之后行的文字
+- 去页首，页尾不相关的文字
+- 去除引文标注（如[1]、[2]、(1)、(2)等数字标注）
+- 去除文本末尾的注释说明（如[1] 弗朗西斯·鲍蒙特...这类详细的注释说明）
+- 缺失的标点符号补全
+- 不去理解输，阐述输入内容，让输入内容，除过排版问题，都保持原样
+
+## outputs
+- 只输出排版后的文本，不要输出任何解释说明
+- 纯文本格式，不适用 markdown 格式
+"""
+
+
 def _get_client_meta(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
@@ -55,35 +80,16 @@ def reformat(request):
 
 def format_text_stream(user, texts, ip_address=None, user_agent=None):
     """Stream formatted text using SSE with proper event handling"""
+    clean_stats = CleanStats()
     try:
         # Initialize LLM service
-        from book2tts.ui import LLMService
-        llm_service = LLMService()
-        
-        # System prompt for text formatting
-        system_prompt = """
-# Role: 我是一个专门用于排版文本内容的 AI 角色
-
-## Goal: 将输入的文本内容，重新排版后输出，只输出排版后的文本内容
-
-## Constrains:
-- 严格保持原有语言，不进行任何语言转换（如中文保持中文，英文保持英文）
-- 输出纯文本
-- 去除页码(数字）之后行的文字
-- 去页首，页尾不相关的文字
-- 去除引文标注（如[1]、[2]、(1)、(2)等数字标注）
-- 去除文本末尾的注释说明（如[1] 弗朗西斯·鲍蒙特...这类详细的注释说明）
-- 缺失的标点符号补全
-- 不去理解输，阐述输入内容，让输入内容，除过排版问题，都保持原样
+        from book2tts.llm_service import get_shared_llm_service
+        llm_service = get_shared_llm_service()
 
-## outputs
-- 只输出排版后的文本，不要输出任何解释说明
-- 纯文本格式，不适用 markdown 格式
-"""
-        
-        total_chars = len(texts)
-        chunk_size = 1000
+        chunk_budget = budget_for('reformat')
         chunk_count = 0
+        cached_chunks = 0
+        skipped_chunks = 0
         total_prompt_tokens = 0
         total_completion_tokens = 0
         total_tokens = 0
@@ -94,18 +100,34 @@ def format_text_stream(user, texts, ip_address=None, user_agent=None):
         # Send start event
         yield "event: start\ndata: Starting text formatting...\n\n"
 
-        for i in range(0, total_chars, chunk_size):
-            chunk = texts[i:i + chunk_size]
+        # 本地先去掉页眉页脚、页码和软换行，LLM 只处理剩余的排版问题
+        source_text = texts
+        if getattr(settings, 'REFORMAT_STRIP_NOISE', True):
+            source_text, clean_stats = clean_text(texts)
+        skip_llm = getattr(settings, 'REFORMAT_SKIP_LLM', False)
+
+        for chunk in iter_chunks(source_text, chunk_budget):
+            if not chunk.strip():
+                continue
             chunk_count += 1
+            if skip_llm and passes_quality_checks(chunk):
+                # 清理后的文本已可直接使用，不再调用 LLM
+                skipped_chunks += 1
+                sse_formatted_text = chunk.strip().replace('\n', '\ndata: ')
+                yield f"event: message\ndata: {sse_formatted_text}\n\n"
+                continue
             result = llm_service.process_text(
-                system_prompt=system_prompt,
+                system_prompt=REFORMAT_SYSTEM_PROMPT,
                 user_content=chunk,
-                temperature=0.7
+                temperature=0.7,
+                cache_operation='reformat'
             )
 
             # 直接提取result字段的文本内容
             if isinstance(result, dict) and result.get('success') and result.get('result'):
                 formatted_text = result['result']
+                if result.get('cached'):
+                    cached_chunks += 1
                 usage = result.get('usage') or {}
                 prompt_tokens = usage.get('prompt_tokens') or 0
                 completion_tokens = usage.get('completion_tokens') or 0
@@ -147,8 +169,11 @@ def format_text_stream(user, texts, ip_address=None, user_agent=None):
         try:
             metadata = {
                 'total_chars': len(texts),
-                'chunk_size': 1000,
+                'chunk_budget': str(budget_for('reformat')),
                 'chunks_processed': chunk_count,
+                'cached_chunks': cached_chunks,
+                'llm_skipped_chunks': skipped_chunks,
+                'noise_stripped': clean_stats.as_dict(),
                 'prompt_tokens': total_prompt_tokens,
                 'completion_tokens': total_completion_tokens,
                 'total_tokens': total_tokens,
@@ -223,10 +248,10 @@ def translate_text_stream(user, texts, target_language, ip_address=None, user_ag
     """Stream translated text using SSE with proper event handling and caching"""
     try:
         # Initialize LLM service
-        from book2tts.ui import LLMService
+        from book2tts.llm_service import get_shared_llm_service
         from ..models import TranslationCache
 
-        llm_service = LLMService()
+        llm_service = get_shared_llm_service()
 
         # Map language codes to display names for system prompt
         language_map = {
@@ -264,47 +289,9 @@ def translate_text_stream(user, texts, target_language, ip_address=None, user_ag
 - 纯文本格式，不使用 markdown 格式
 """
 
-        total_chars = len(texts)
-        chunk_size = 1000
-        estimated_total_chunks = max(1, (total_chars + chunk_size - 1) // chunk_size)
-
-        def iter_line_chunks(text, max_chunk_size):
-            if not text:
-                return
-
-            buffer = []
-            current_len = 0
-
-            for line in text.splitlines(keepends=True):
-                line_len = len(line)
+        text_chunks = split_text(texts, budget_for('translate'))
+        estimated_total_chunks = max(1, len(text_chunks))
 
-                # 针对超长单行，直接按阈值切分
-                if line_len >= max_chunk_size:
-                    if buffer:
-                        yield ''.join(buffer)
-                        buffer = []
-                        current_len = 0
-
-                    start = 0
-                    while start < line_len:
-                        end = start + max_chunk_size
-                        yield line[start:end]
-                        start = end
-                    continue
-
-                # 缓冲区即将超出阈值，则先输出
-                if buffer and current_len + line_len > max_chunk_size:
-                    yield ''.join(buffer)
-                    buffer = []
-                    current_len = 0
-
-                buffer.append(line)
-                current_len += line_len
-
-            if buffer:
-                yield ''.join(buffer)
-
-        chunk_iterator = iter_line_chunks(texts, chunk_size)
         cached_chunks = 0
         new_chunks = 0
         chunk_index = 0
@@ -326,9 +313,7 @@ def translate_text_stream(user, texts, target_language, ip_address=None, user_ag
         )
         last_heartbeat = time.time()
 
-        for chunk in chunk_iterator:
-            if not chunk:
-                continue
+        for chunk in text_chunks:
 
             chunk_index += 1
 
@@ -410,7 +395,7 @@ def translate_text_stream(user, texts, target_language, ip_address=None, user_ag
             success = not error_occurred and error_message is None
             metadata = {
                 'total_chars': len(texts),
-                'chunk_size': 1000,
+                'chunk_budget': str(budget_for('translate')),
                 'total_chunks': chunk_index,
                 'cached_chunks': cached_chunks,
                 'new_chunks': new_chunks,
@@ -8,6 +8,8 @@ from django.contrib import messages
 from django.utils import timezone
 from datetime import timedelta
 
+from book2tts.llm_cache import get_default_llm_cache
+
 from ..models import TranslationCache
 
 
@@ -111,6 +113,23 @@ def translation_cache_stats_api(request):
     return JsonResponse(stats)
 
 
+@staff_member_required
+def llm_cache_stats_api(request):
+    """
+    获取 LLM 结果缓存（排版/对话转换等）的命中统计
+
+    数据库缓存（scope=shared）的条目数、字节数和命中次数为所有进程的合计，
+    process 中的未命中、淘汰等计数只统计响应本次请求的进程；进程内缓存的统计均为当前进程。
+    """
+    llm_cache = get_default_llm_cache()
+    if llm_cache is None:
+        return JsonResponse({'enabled': False})
+
+    stats = llm_cache.stats()
+    stats['enabled'] = True
+    return JsonResponse(stats)
+
+
 @staff_member_required
 @require_http_methods(["POST"])
 def translation_cache_bulk_delete(request):